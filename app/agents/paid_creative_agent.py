@@ -701,7 +701,7 @@ class PaidCreativeAgent(BaseAgent):
     async def _find_stock_image(self, task_data: Dict[str, Any]) -> Dict[str, Any]:
         """Поиск стокового изображения"""
         import os
-        import requests
+        from app.utils.http_clients import get_http_clients
         
         search_query = task_data.get("search_query", "business")
         brief_id = task_data.get("brief_id", "")
@@ -714,18 +714,19 @@ class PaidCreativeAgent(BaseAgent):
             logger.info(f"🔍 Searching Unsplash for '{search_query}' with key {masked_key}")
             
             try:
-                response = requests.get(
-                    'https://api.unsplash.com/search/photos',
-                    params={
-                        'query': search_query,
-                        'per_page': 1,
-                        'orientation': 'landscape'
-                    },
-                    headers={
-                        'Authorization': f'Client-ID {unsplash_key}'
-                    },
-                    timeout=10
-                )
+                # Общий async клиент: синхронный запрос остановил бы общий event loop процесса
+                async with get_http_clients().async_client(timeout=10) as client:
+                    response = await client.get(
+                        'https://api.unsplash.com/search/photos',
+                        params={
+                            'query': search_query,
+                            'per_page': 1,
+                            'orientation': 'landscape'
+                        },
+                        headers={
+                            'Authorization': f'Client-ID {unsplash_key}'
+                        }
+                    )
                 
                 if response.status_code == 200:
                     data = response.json()
@@ -762,18 +763,18 @@ class PaidCreativeAgent(BaseAgent):
         
         if pexels_key:
             try:
-                response = requests.get(
-                    'https://api.pexels.com/v1/search',
-                    params={
-                        'query': search_query,
-                        'per_page': 1,
-                        'orientation': 'landscape'
-                    },
-                    headers={
-                        'Authorization': pexels_key
-                    },
-                    timeout=10
-                )
+                async with get_http_clients().async_client(timeout=10) as client:
+                    response = await client.get(
+                        'https://api.pexels.com/v1/search',
+                        params={
+                            'query': search_query,
+                            'per_page': 1,
+                            'orientation': 'landscape'
+                        },
+                        headers={
+                            'Authorization': pexels_key
+                        }
+                    )
                 
                 if response.status_code == 200:
                     data = response.json()
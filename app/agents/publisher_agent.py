@@ -5,6 +5,7 @@ PublisherAgent - Публиковщик
 
 import asyncio
 import logging
+import os
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Any
 from dataclasses import dataclass
@@ -14,6 +15,7 @@ from ..orchestrator.workflow_engine import Task, TaskType, TaskPriority
 from ..models.content import ContentPiece, Platform, ContentStatus, PublicationSchedule, ContentMetrics
 from ..mcp.integrations.telegram import TelegramMCP
 from ..mcp.config import get_mcp_config, is_mcp_enabled
+from ..utils.rate_limiter import RateLimit, RateLimitExceeded, rate_limiter
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
@@ -59,6 +61,9 @@ class PublisherAgent(BaseAgent):
         self.publication_queue = []
         self.published_content = {}
         
+        # Сколько секунд публикация может ждать слот в лимитах платформы
+        self.rate_limit_max_wait = float(os.getenv("PUBLISHER_RATE_LIMIT_MAX_WAIT", "30"))
+        
         # MCP интеграции
         self.telegram_mcp = None
         self._initialize_mcp_integrations()
@@ -277,7 +282,7 @@ class PublisherAgent(BaseAgent):
                 )
             
             # Проверяем ограничения
-            if not await self._check_rate_limits(platform):
+            if not await self._check_rate_limits(platform, user_id, account_id):
                 return PublicationResult(
                     success=False,
                     error_message=f"Превышены лимиты для платформы {platform}"
@@ -313,11 +318,50 @@ class PublisherAgent(BaseAgent):
                 error_message=str(e)
             )
     
-    async def _check_rate_limits(self, platform: str) -> bool:
-        """Проверяет лимиты публикации для платформы"""
-        # В MVP просто возвращаем True
-        # В реальной реализации здесь была бы проверка лимитов API
-        return True
+    def _platform_rate_limits(self, platform: str) -> Dict[str, RateLimit]:
+        """Лимиты платформы из PlatformConfig.rate_limits"""
+        limits = self.platform_configs[platform].rate_limits
+        result = {}
+        # Часовой лимит первым: его отказ - самый частый, слот rps тогда не резервируется
+        if limits.get("posts_per_hour"):
+            result["posts"] = RateLimit(rate=limits["posts_per_hour"], period=3600.0)
+        if limits.get("requests_per_second"):
+            result["rps"] = RateLimit(rate=limits["requests_per_second"], period=1.0)
+        return result
+    
+    @staticmethod
+    def _rate_limit_target(user_id: Optional[int], account_id: Optional[int]) -> str:
+        """Чей лимит расходует публикация: аккаунт/канал, канал пользователя по умолчанию или общий бот"""
+        if account_id:
+            return f"account:{account_id}"
+        if user_id:
+            return f"user:{user_id}"
+        return "default"
+    
+    async def _check_rate_limits(self, platform: str, user_id: Optional[int] = None,
+                                 account_id: Optional[int] = None) -> bool:
+        """
+        Ждет слот в лимитах платформы для аккаунта публикации
+        
+        Лимиты (requests_per_second, posts_per_hour) считаются отдельно для
+        каждого аккаунта/канала - занятый аккаунт не задерживает остальных.
+        Слоты резервируются вместе: отказ одного лимита возвращает слот
+        другого. False - только если ждать пришлось бы дольше
+        rate_limit_max_wait.
+        """
+        target = self._rate_limit_target(user_id, account_id)
+        limits = self._platform_rate_limits(platform)
+        try:
+            await rate_limiter.acquire_all(
+                {f"publisher:{platform}:{target}:{name}": limit for name, limit in limits.items()},
+                self.rate_limit_max_wait,
+                # Статистика - по платформе, а не по каждому аккаунту
+                {f"publisher:{platform}:{target}:{name}": f"publisher:{platform}:{name}" for name in limits}
+            )
+            return True
+        except RateLimitExceeded as e:
+            logger.warning(f"Лимиты {platform} для {target} исчерпаны: {e}")
+            return False
     
     async def _validate_content(self, content: ContentPiece, platform: str) -> Dict[str, Any]:
         """Валидирует контент для платформы"""
@@ -982,6 +1026,10 @@ class PublisherAgent(BaseAgent):
                 "supported": True,
                 "max_text_length": config.max_text_length,
                 "rate_limits": config.rate_limits,
+                "throttling": {
+                    name: rate_limiter.get_stats(f"publisher:{platform}:{name}")
+                    for name in self._platform_rate_limits(platform)
+                },
                 "supported_formats": config.supported_formats
             }
         
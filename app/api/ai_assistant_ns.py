@@ -6,12 +6,12 @@ Flask-RESTX namespace: AI Assistant API
 from flask import request
 from flask_restx import Namespace, Resource, fields
 import logging
-import asyncio
 from openai import AsyncOpenAI
 import os
 
 from app.api.routes import jwt_required
 from app.services.ai_assistant_service import AIAssistantService
+from app.utils.event_loop import run_coroutine
 
 logger = logging.getLogger(__name__)
 
@@ -80,7 +80,7 @@ class AnalyzeResource(Resource):
             resource_type = data.get('type') or service.detect_resource_type(url)
             
             # Получаем контент ресурса
-            resource_content = asyncio.run(service.fetch_resource_content(url, resource_type))
+            resource_content = run_coroutine(service.fetch_resource_content(url, resource_type))
             
             if resource_content.get('error'):
                 return {
@@ -89,7 +89,7 @@ class AnalyzeResource(Resource):
                 }, 400
             
             # Анализируем для настроек проекта
-            analysis = asyncio.run(
+            analysis = run_coroutine(
                 service.analyze_for_project_settings(resource_content, resource_type)
             )
             
@@ -160,7 +160,7 @@ class AnalyzeForSurvey(Resource):
             service = AIAssistantService(openai_client)
             
             resource_type = service.detect_resource_type(url)
-            resource_content = asyncio.run(service.fetch_resource_content(url, resource_type))
+            resource_content = run_coroutine(service.fetch_resource_content(url, resource_type))
             
             if resource_content.get('error'):
                 return {
@@ -168,7 +168,7 @@ class AnalyzeForSurvey(Resource):
                     'error': f"Не удалось получить контент: {resource_content.get('error')}"
                 }, 400
             
-            analysis = asyncio.run(
+            analysis = run_coroutine(
                 service.analyze_for_survey(resource_content, resource_type, question_type)
             )
             
@@ -37,6 +37,8 @@ content_source_create_model = content_sources_ns.model('ContentSourceCreate', {
     'post_template': fields.String(description='Шаблон поста', example='{title}\n\n{description}\n\n{url}'),
     'auto_posting_rule_id': fields.Integer(description='ID правила автопостинга'),
     'check_interval_minutes': fields.Integer(description='Интервал проверки (минуты)', default=60),
+    'min_check_interval_minutes': fields.Integer(description='Минимальный интервал адаптивного расписания (минуты)'),
+    'max_check_interval_minutes': fields.Integer(description='Максимальный интервал адаптивного расписания (минуты)'),
     'is_active': fields.Boolean(description='Активен', default=True),
 })
 
@@ -54,6 +56,8 @@ content_source_update_model = content_sources_ns.model('ContentSourceUpdate', {
     'post_template': fields.String(description='Шаблон поста'),
     'auto_posting_rule_id': fields.Integer(description='ID правила автопостинга'),
     'check_interval_minutes': fields.Integer(description='Интервал проверки'),
+    'min_check_interval_minutes': fields.Integer(description='Минимальный интервал проверки'),
+    'max_check_interval_minutes': fields.Integer(description='Максимальный интервал проверки'),
     'is_active': fields.Boolean(description='Активен'),
 })
 
@@ -74,6 +78,10 @@ content_source_response_model = content_sources_ns.model('ContentSourceResponse'
     'post_template': fields.String(description='Шаблон поста'),
     'auto_posting_rule_id': fields.Integer(description='ID правила автопостинга'),
     'check_interval_minutes': fields.Integer(description='Интервал проверки'),
+    'min_check_interval_minutes': fields.Integer(description='Минимальный интервал проверки'),
+    'max_check_interval_minutes': fields.Integer(description='Максимальный интервал проверки'),
+    'change_interval_minutes': fields.Float(description='Оценка интервала между изменениями (минуты)'),
+    'last_change_at': fields.String(description='Последнее изменение'),
     'next_check_at': fields.String(description='Следующая проверка'),
     'last_check_at': fields.String(description='Последняя проверка'),
     'last_check_status': fields.String(description='Статус последней проверки'),
@@ -198,6 +206,8 @@ class ContentSourcesList(Resource):
                 post_template=data.get('post_template'),
                 auto_posting_rule_id=auto_posting_rule_id,
                 check_interval_minutes=data.get('check_interval_minutes', 60),
+                min_check_interval_minutes=data.get('min_check_interval_minutes'),
+                max_check_interval_minutes=data.get('max_check_interval_minutes'),
                 is_active=data.get('is_active', True)
             )
             
@@ -9,6 +9,7 @@ import logging
 from app.database.connection import get_db_session
 from app.services.instagram_account_service import InstagramAccountService
 from app.api.routes import jwt_required
+from app.utils.event_loop import run_coroutine
 
 logger = logging.getLogger(__name__)
 
@@ -77,8 +78,7 @@ class InstagramAccounts(Resource):
 
             db = get_db_session()
             service = InstagramAccountService(db)
-            import asyncio
-            success, message, account = asyncio.run(
+            success, message, account = run_coroutine(
                 service.add_account(user_id, username, password, account_name)
             )
             if success:
@@ -4,7 +4,6 @@ RESTful endpoints для работы с контентом и агентами
 Интегрировано с Flask-RESTX для Swagger UI
 """
 
-import asyncio
 import logging
 import json
 import jwt
@@ -16,7 +15,17 @@ from flask_restx import Namespace, Resource, fields
 from pydantic import ValidationError
 
 from ..orchestrator.main_orchestrator import orchestrator
-from ..database.connection import get_db_session
+from ..orchestrator.content_jobs import content_job_manager, JobQueueFullError, JobStatus, StreamLimitError
+from ..orchestrator.user_orchestrator_factory import UserOrchestratorFactory
+from ..database.connection import get_db_session, get_pool_stats
+from ..utils.event_loop import run_coroutine
+from ..utils.http_clients import get_http_clients
+from ..utils.rate_limiter import rate_limiter
+from ..auth.middleware.jwt import rate_limit_by_user
+from ..auth.services.token_cache import last_used_buffer, token_cache
+from ..billing.middleware.usage_middleware import check_usage_limit, track_usage
+from ..billing.services.quota_engine import get_quota_engine
+from ..billing.services.token_usage_recorder import get_token_usage_recorder
 from ..auth.services.auth_service import AuthService
 from ..auth.utils.email import EmailService
 from .schemas import (
@@ -135,7 +144,9 @@ workflow_status_model = api.model('WorkflowStatus', {
     'completed_tasks': fields.Integer(description='Выполненные задачи'),
     'failed_tasks': fields.Integer(description='Проваленные задачи'),
     'in_progress_tasks': fields.Integer(description='Задачи в процессе'),
-    'progress_percentage': fields.Float(description='Процент выполнения')
+    'progress_percentage': fields.Float(description='Процент выполнения'),
+    'job_status': fields.String(description='Статус фонового выполнения', enum=['queued', 'running', 'completed', 'failed']),
+    'error': fields.String(description='Ошибка фонового выполнения')
 })
 
 # ==================== AGENT MODELS ====================
@@ -383,15 +394,9 @@ health_model = health_ns.model('HealthResponse', {
 
 # ==================== UTILITY FUNCTIONS ====================
 
-def run_async(coro):
-    """Запускает асинхронную функцию в синхронном контексте"""
-    try:
-        loop = asyncio.get_event_loop()
-    except RuntimeError:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-    
-    return loop.run_until_complete(coro)
+def run_async(coro, timeout: float = None):
+    """Запускает асинхронную функцию в синхронном контексте (общий фоновый loop процесса)"""
+    return run_coroutine(coro, timeout=timeout)
 
 
 def handle_validation_error(e: ValidationError) -> tuple:
@@ -432,9 +437,13 @@ def handle_exception(e: Exception) -> tuple:
 
 @api.route('/content/create')
 class ContentCreate(Resource):
-    @api.doc('create_content', description='Создает контент через AI агентов')
+    @api.doc('create_content', description='Создает контент через AI агентов',
+             params={'async': 'true - вернуть 202 с workflow_id и выполнять в фоне'})
     @api.expect(content_request_model, validate=True)
     @jwt_required
+    @rate_limit_by_user(endpoint_class='llm')
+    @check_usage_limit('posts')
+    @track_usage('api_calls')
     def post(self, current_user=None):
         """
         Создает контент через AI агентов
@@ -635,6 +644,14 @@ class ContentCreate(Resource):
             # ВАЖНО: Логируем финальные данные перед отправкой в orchestrator
             logger.info(f"🚀 Отправка в orchestrator: title='{request_data.get('title', '')}', image_source={request_data.get('image_source', 'не указан')}")
 
+            # Асинхронный режим: ?async=true или заголовок Prefer: respond-async
+            async_mode = (
+                request.args.get('async', '').lower() in ('1', 'true', 'yes') or
+                'respond-async' in request.headers.get('Prefer', '')
+            )
+            if async_mode:
+                return _submit_content_job(request_data)
+
             # Запускаем обработку через оркестратор
             result = run_async(orchestrator.process_content_request(request_data))
             
@@ -668,6 +685,77 @@ class ContentCreate(Resource):
             return handle_exception(e)
 
 
+def _submit_content_job(request_data: dict):
+    """Ставит создание контента в фоновую очередь и возвращает 202 с workflow_id"""
+    from flask import make_response, jsonify
+
+    try:
+        job = content_job_manager.submit(orchestrator, request_data)
+    except JobQueueFullError as e:
+        logger.warning(f"Очередь создания контента переполнена: {e}")
+        response = make_response(jsonify({
+            "error": "Service Unavailable",
+            "message": str(e),
+            "status_code": 503,
+            "timestamp": datetime.now().isoformat()
+        }), 503)
+        response.headers['Retry-After'] = '30'
+        return response
+    except Exception as e:
+        logger.error(f"Ошибка постановки создания контента в очередь: {e}")
+        return {
+            "error": "Content Creation Failed",
+            "message": str(e),
+            "status_code": 500,
+            "timestamp": datetime.now().isoformat()
+        }, 500
+
+    base_path = request.path.rsplit('/content/create', 1)[0]
+    status_url = f"{base_path}/workflow/{job.workflow_id}/status"
+
+    response = make_response(jsonify({
+        "success": True,
+        "workflow_id": job.workflow_id,
+        "brief_id": job.brief_id,
+        "status": job.status.value,
+        "status_url": status_url,
+        "events_url": f"{base_path}/workflow/{job.workflow_id}/events",
+        "result_url": f"{base_path}/workflow/{job.workflow_id}/result",
+        "timestamp": datetime.now().isoformat()
+    }), 202)
+    response.headers['Location'] = status_url
+    return response
+
+
+def _get_owned_job(workflow_id: str, current_user: dict, include_stored: bool = False):
+    """
+    Возвращает фоновую задачу, если она принадлежит пользователю
+
+    include_stored - искать задачу и в WorkflowStore (задача другого процесса, без событий)
+    """
+    if include_stored:
+        job = content_job_manager.find_job(workflow_id)
+    else:
+        job = content_job_manager.get_job(workflow_id)
+    if not job:
+        return None, ({
+            "error": "Workflow Not Found",
+            "message": f"Фоновая задача для workflow {workflow_id} не найдена",
+            "status_code": 404,
+            "timestamp": datetime.now().isoformat()
+        }, 404)
+
+    if job.user_id is not None and job.user_id != current_user.get('user_id'):
+        return None, ({
+            "error": "Forbidden",
+            "message": "Нет доступа к этому workflow",
+            "status_code": 403,
+            "timestamp": datetime.now().isoformat()
+        }, 403)
+
+    return job, None
+
+
 @api.route('/content/example')
 class ContentExample(Resource):
     @api.doc('get_content_example', description='Возвращает пример запроса на создание контента')
@@ -702,7 +790,6 @@ class FileUpload(Resource):
             from ..services.storage_service import StorageService
             from ..models.uploads import FileUploadDB
             import uuid
-            import asyncio
             
             user_id = current_user.get('user_id')
             if not user_id:
@@ -760,7 +847,7 @@ class FileUpload(Resource):
             
             # Загружаем файл в GCS
             storage_service = StorageService()
-            upload_result = asyncio.run(
+            upload_result = run_coroutine(
                 storage_service.upload_file(
                     file_content=file_content,
                     filename=filename,
@@ -852,6 +939,11 @@ class WorkflowStatus(Resource):
             status = orchestrator.get_workflow_status(workflow_id)
             
             if status:
+                # Для фонового выполнения добавляем статус задачи
+                job = content_job_manager.find_job(workflow_id)
+                if job:
+                    status["job_status"] = job.status.value
+                    status["error"] = job.error
                 return status, 200
             else:
                 return {
@@ -865,6 +957,95 @@ class WorkflowStatus(Resource):
             return handle_exception(e)
 
 
+@api.route('/workflow/<string:workflow_id>/events')
+class WorkflowEvents(Resource):
+    @api.doc('stream_workflow_events', security='BearerAuth',
+             description='Поток Server-Sent Events с результатами задач фонового workflow')
+    @jwt_required
+    def get(self, workflow_id, current_user=None):
+        """
+        Поток результатов задач workflow (text/event-stream)
+        
+        События: queued, started, task (по каждой задаче), completed / failed.
+        Поддерживает переподключение через заголовок Last-Event-ID.
+        События хранятся в памяти процесса, принявшего POST /content/create;
+        другой gunicorn worker восстанавливает их из WorkflowStore.
+        Поток занимает поток gthread до конца workflow: сверх
+        CONTENT_JOBS_MAX_STREAMS потоков на процесс ответ 503 с Retry-After.
+        """
+        from flask import Response, stream_with_context, make_response, jsonify
+
+        job, error = _get_owned_job(workflow_id, current_user, include_stored=True)
+        if error:
+            return error
+
+        try:
+            last_event_id = int(request.headers.get('Last-Event-ID', 0))
+        except ValueError:
+            last_event_id = 0
+
+        try:
+            events = content_job_manager.open_stream(workflow_id, last_event_id)
+        except StreamLimitError as e:
+            logger.warning(f"Отклонен поток событий workflow {workflow_id}: {e}")
+            response = make_response(jsonify({
+                "error": "Service Unavailable",
+                "message": str(e),
+                "status_code": 503,
+                "timestamp": datetime.now().isoformat()
+            }), 503)
+            response.headers['Retry-After'] = '5'
+            return response
+
+        response = Response(
+            stream_with_context(events),
+            mimetype='text/event-stream'
+        )
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+
+
+@api.route('/workflow/<string:workflow_id>/result')
+class WorkflowResult(Resource):
+    @api.doc('get_workflow_result', security='BearerAuth',
+             description='Результат фонового workflow (202 пока выполняется)')
+    @jwt_required
+    def get(self, workflow_id, current_user=None):
+        """
+        Получает результат фонового создания контента
+        
+        Отвечает любой процесс: задача другого worker читается из WorkflowStore
+        (кроме WORKFLOW_STORE_BACKEND=memory - там только принявший запрос worker).
+        """
+        from flask import make_response, jsonify
+
+        job, error = _get_owned_job(workflow_id, current_user, include_stored=True)
+        if error:
+            return error
+
+        if not job.is_finished:
+            response = make_response(jsonify(job.to_dict()), 202)
+            response.headers['Retry-After'] = '2'
+            return response
+
+        if job.status == JobStatus.FAILED:
+            return {
+                "error": "Content Creation Failed",
+                "message": job.error,
+                "status_code": 500,
+                "timestamp": datetime.now().isoformat()
+            }, 500
+
+        return make_response(jsonify({
+            "success": True,
+            "workflow_id": job.workflow_id,
+            "brief_id": job.brief_id,
+            "result": job.result,
+            "timestamp": datetime.now().isoformat()
+        }), 200)
+
+
 @api.route('/workflow/<string:workflow_id>/cancel')
 class WorkflowCancel(Resource):
     @api.doc('cancel_workflow', description='Отменяет выполнение workflow')
@@ -1023,7 +1204,14 @@ class SystemHealth(Resource):
                     "total_agents": total_agents,
                     "error_agents": error_agents,
                     "active_tasks": system_status["agents"]["active_tasks"],
-                    "completed_tasks": system_status["agents"]["completed_tasks"]
+                    "completed_tasks": system_status["agents"]["completed_tasks"],
+                    "http_pools": get_http_clients().get_stats(),
+                    "rate_limits": rate_limiter.get_stats(),
+                    "auth_cache": {**token_cache.get_stats(), "last_used": last_used_buffer.get_stats()},
+                    "token_usage_writer": get_token_usage_recorder().get_stats(),
+                    "quotas": get_quota_engine().get_stats(),
+                    "user_orchestrators": UserOrchestratorFactory.get_stats(),
+                    "db_pool": get_pool_stats()
                 }
             }
             
@@ -1089,11 +1277,7 @@ class Platforms(Resource):
             logger.info("Запрос списка платформ")
             
             # Получаем статистику платформ от PublisherAgent
-            publisher_agent = None
-            for agent in orchestrator.agent_manager.agents.values():
-                if hasattr(agent, 'get_platform_stats'):
-                    publisher_agent = agent
-                    break
+            publisher_agent = orchestrator.agent_manager.get_agent("publisher_agent")
             
             if publisher_agent:
                 platform_stats = publisher_agent.get_platform_stats()
@@ -1144,11 +1328,7 @@ class PlatformConfig(Resource):
             logger.info(f"Запрос конфигурации платформы: {platform}")
             
             # Получаем конфигурацию платформы
-            publisher_agent = None
-            for agent in orchestrator.agent_manager.agents.values():
-                if hasattr(agent, 'get_platform_stats'):
-                    publisher_agent = agent
-                    break
+            publisher_agent = orchestrator.agent_manager.get_agent("publisher_agent")
             
             if publisher_agent:
                 platform_stats = publisher_agent.get_platform_stats()
@@ -1205,11 +1385,7 @@ class TrendsAnalyze(Resource):
             target_audience = data.get('target_audience', 'general_audience')
             
             # Находим TrendsScoutAgent
-            trends_agent = None
-            for agent in orchestrator.agent_manager.agents.values():
-                if hasattr(agent, 'trend_analyzer'):  # Проверяем, что это TrendsScoutAgent
-                    trends_agent = agent
-                    break
+            trends_agent = orchestrator.agent_manager.get_agent("trends_scout_agent")
             
             if not trends_agent:
                 return {
@@ -1384,11 +1560,7 @@ class ViralTrends(Resource):
         """Получает вирусные тренды"""
         try:
             # Находим TrendsScoutAgent
-            trends_agent = None
-            for agent in orchestrator.agent_manager.agents.values():
-                if hasattr(agent, 'trend_analyzer'):
-                    trends_agent = agent
-                    break
+            trends_agent = orchestrator.agent_manager.get_agent("trends_scout_agent")
             
             if not trends_agent:
                 return {
@@ -2464,8 +2636,7 @@ class AuthSession(Resource):
                     "timestamp": datetime.now().isoformat()
                 }, 404
             
-            session.is_active = False
-            db_session.commit()
+            auth_service.revoke_session(session)
             
             return {
                 "success": True,
@@ -3291,6 +3462,7 @@ class RecommendTone(Resource):
     """AI-рекомендация тональности для опросника"""
     
     @jwt_required
+    @check_usage_limit('api_calls')
     @ai_ns.doc('recommend_tone', security='BearerAuth', description='Генерирует рекомендацию тональности на основе анализа данных пользователя')
     @ai_ns.expect(recommend_tone_request, validate=True)
     @ai_ns.marshal_with(recommend_tone_response, code=200, description='Рекомендация успешно сгенерирована')
@@ -3437,7 +3609,7 @@ class RecommendTone(Resource):
             
             # Генерируем рекомендацию
             logger.info(f"Генерация рекомендации тональности для пользователя {current_user.get('user_id')}")
-            result = asyncio.run(
+            result = run_coroutine(
                 service.recommend_tone(
                     business_type=business_type,
                     niche=niche,
@@ -3500,6 +3672,7 @@ class GenerateQuestions(Resource):
     """Генерация адаптивных вопросов для опросника"""
     
     @jwt_required
+    @check_usage_limit('api_calls')
     @ai_ns.doc('generate_questions', security='BearerAuth', description='Генерирует адаптивные вопросы на основе предыдущих ответов и проанализированных ресурсов')
     @ai_ns.expect(generate_questions_request, validate=False)
     @ai_ns.marshal_with(generate_questions_response, code=200, description='Вопросы успешно сгенерированы')
@@ -3569,7 +3742,7 @@ class GenerateQuestions(Resource):
             service = AIAssistantService(openai_client)
             
             # Генерируем вопросы через AI
-            questions = asyncio.run(
+            questions = run_coroutine(
                 service.generate_adaptive_questions(
                     business_type=business_type,
                     niche=niche,
@@ -3626,6 +3799,8 @@ class GenerateSamplePosts(Resource):
     """Генерация примеров постов"""
     
     @jwt_required
+    @rate_limit_by_user(endpoint_class='llm')
+    @check_usage_limit('api_calls')
     @ai_ns.doc('generate_sample_posts', security='BearerAuth', description='Генерирует примеры постов на основе ниши и типа бизнеса')
     @ai_ns.expect(generate_sample_posts_request, validate=False)
     @ai_ns.marshal_with(generate_sample_posts_response, code=200, description='Примеры постов успешно сгенерированы')
@@ -3683,7 +3858,7 @@ class GenerateSamplePosts(Resource):
             service = AIAssistantService(openai_client)
             
             # Генерируем примеры постов через AI
-            posts = asyncio.run(
+            posts = run_coroutine(
                 service.generate_sample_posts(
                     business_type=business_type,
                     niche=niche,
@@ -3719,8 +3894,8 @@ class GenerateSamplePosts(Resource):
                             'style': image_style
                         }
                         
-                        # ИСПРАВЛЕНИЕ: используем asyncio.run() вместо await, т.к. это синхронный Flask endpoint
-                        generated_image = asyncio.run(multimedia_agent._generate_image(image_task_data))
+                        # Синхронный Flask endpoint: выполняем корутину в общем фоновом loop процесса
+                        generated_image = run_coroutine(multimedia_agent._generate_image(image_task_data))
                         
                         if generated_image and generated_image.image_path:
                             # Сохраняем путь к изображению
@@ -3783,6 +3958,8 @@ class AnalyzeLinks(Resource):
     """Анализ ссылок (сайт и Telegram каналы) для автозаполнения настроек проекта"""
     
     @jwt_required
+    @rate_limit_by_user(endpoint_class='llm')
+    @check_usage_limit('api_calls')
     @ai_ns.doc('analyze_links', security='BearerAuth', description='Анализирует сайт и Telegram каналы для автозаполнения настроек проекта')
     @ai_ns.expect(analyze_links_request, validate=False)
     def post(self, current_user):
@@ -3792,7 +3969,6 @@ class AnalyzeLinks(Resource):
         """
         try:
             from app.services.ai_assistant_service import AIAssistantService
-            import asyncio
             
             data = request.json or {}
             logger.info(f"Анализ ссылок для пользователя {current_user.get('user_id')}, данные: {data}")
@@ -3826,10 +4002,10 @@ class AnalyzeLinks(Resource):
             if website_url:
                 try:
                     resource_type = service.detect_resource_type(website_url)
-                    resource_content = asyncio.run(service.fetch_resource_content(website_url, resource_type))
+                    resource_content = run_coroutine(service.fetch_resource_content(website_url, resource_type))
                     
                     if not resource_content.get('error'):
-                        analysis = asyncio.run(
+                        analysis = run_coroutine(
                             service.analyze_for_project_settings(resource_content, resource_type)
                         )
                         if analysis:
@@ -3848,12 +4024,12 @@ class AnalyzeLinks(Resource):
                 try:
                     telegram_link = telegram_link.strip()
                     resource_type = 'telegram'
-                    resource_content = asyncio.run(service.fetch_resource_content(telegram_link, resource_type))
+                    resource_content = run_coroutine(service.fetch_resource_content(telegram_link, resource_type))
                     
                     logger.info(f"📥 Получен контент для Telegram {telegram_link}: {resource_content}")
                     
                     if not resource_content.get('error'):
-                        analysis = asyncio.run(
+                        analysis = run_coroutine(
                             service.analyze_for_project_settings(resource_content, resource_type)
                         )
                         logger.info(f"📊 Результат анализа Telegram {telegram_link}: {analysis}")
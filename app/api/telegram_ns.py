@@ -9,11 +9,11 @@ Flask-RESTX namespace: Telegram API (Swagger exposure for existing Blueprint rou
 from flask import request
 from flask_restx import Namespace, Resource, fields
 import logging
-import asyncio
 
 from app.database.connection import get_db_session
 from app.services.telegram_channel_service import TelegramChannelService
 from app.api.routes import jwt_required
+from app.utils.event_loop import run_coroutine
 
 logger = logging.getLogger(__name__)
 
@@ -69,7 +69,7 @@ class TelegramBotInfo(Resource):
         try:
             db = get_db_session()
             service = TelegramChannelService(db)
-            bot_info = asyncio.run(service.get_bot_info())
+            bot_info = run_coroutine(service.get_bot_info())
             return {
                 'success': True,
                 'bot': {
@@ -130,7 +130,7 @@ class TelegramChannels(Resource):
             service = TelegramChannelService(db)
             
             # Используем упрощенный метод (автоматическое получение названия из Telegram API)
-            success, message, channel = asyncio.run(
+            success, message, channel = run_coroutine(
                 service.upsert_single_channel(user_id, channel_link, is_active=bool(is_active))
             )
             if success:
@@ -229,8 +229,7 @@ class TelegramChannelItem(Resource):
             # Остальные поля обновляем через сервис
             service = TelegramChannelService(db)
             
-            import asyncio
-            success, message, channel = asyncio.run(
+            success, message, channel = run_coroutine(
                 service.update_channel(
                     user_id=user_id,
                     channel_id=channel_id,
@@ -325,8 +324,7 @@ class TelegramChannelActivate(Resource):
             
             # Если указаны изменения канала - обновляем канал с активацией
             if channel_link or channel_name:
-                import asyncio
-                success, message, channel = asyncio.run(
+                success, message, channel = run_coroutine(
                     service.update_channel(
                         user_id=user_id,
                         channel_id=channel_id,
@@ -376,7 +374,7 @@ class TelegramChannelVerify(Resource):
             if not channel:
                 return {'success': False, 'error': 'Канал не найден'}, 404
 
-            is_verified, chat_info = asyncio.run(
+            is_verified, chat_info = run_coroutine(
                 service.verify_bot_in_channel(channel.chat_id)
             )
 
@@ -441,7 +439,7 @@ class TelegramSingleChannelActivate(Resource):
             db = get_db_session()
             service = TelegramChannelService(db)
             
-            success, message, channel = asyncio.run(
+            success, message, channel = run_coroutine(
                 service.upsert_single_channel(user_id, channel_link, is_active=bool(is_active))
             )
             
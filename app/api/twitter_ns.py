@@ -9,6 +9,7 @@ import logging
 from app.database.connection import get_db_session
 from app.services.twitter_account_service import TwitterAccountService
 from app.api.routes import jwt_required
+from app.utils.event_loop import run_coroutine
 
 logger = logging.getLogger(__name__)
 
@@ -91,8 +92,7 @@ class TwitterOAuthCallback(Resource):
                 return {'success': False, 'error': 'oauth_token_secret обязателен'}, 400
             db = get_db_session()
             service = TwitterAccountService(db)
-            import asyncio
-            success, message, account = asyncio.run(
+            success, message, account = run_coroutine(
                 service.complete_oauth(
                     user_id=user_id,
                     oauth_token=oauth_token,
@@ -3,15 +3,28 @@ JWT Middleware для защиты маршрутов
 """
 
 from functools import wraps
-from typing import Optional, Callable, Any
-from flask import request, jsonify, g, current_app
+from typing import Optional, Callable, Any, Dict
+from flask import request, jsonify, g, current_app, after_this_request
 import logging
+import os
 
 from app.auth.services.auth_service import AuthService
 from app.auth.models.user import User, UserRole
+from app.utils.rate_limiter import RateLimit, rate_limiter
 
 logger = logging.getLogger(__name__)
 
+# Лимиты запросов пользователя по классам эндпоинтов. Один лимит на класс:
+# эндпоинты, которые запускают LLM (создание контента, генерация примеров,
+# анализ ссылок), расходуют общий бюджет пользователя
+USER_RATE_LIMITS: Dict[str, RateLimit] = {
+    "llm": RateLimit(
+        rate=int(os.getenv("USER_RATE_LIMIT_LLM", "10")),
+        period=float(os.getenv("USER_RATE_LIMIT_LLM_PERIOD", "60")),
+        burst=int(os.getenv("USER_RATE_LIMIT_LLM_BURST", "3"))
+    ),
+}
+
 
 class JWTMiddleware:
     """JWT Middleware для аутентификации"""
@@ -166,22 +179,10 @@ class JWTMiddleware:
         
         return decorated_function
 
-    def rate_limit_by_user(self, max_requests: int = 100, window_minutes: int = 60) -> Callable:
-        """Декоратор для ограничения запросов по пользователю"""
-        def decorator(f: Callable) -> Callable:
-            @wraps(f)
-            def decorated_function(*args, **kwargs):
-                if not hasattr(g, 'current_user_id'):
-                    return f(*args, **kwargs)
-                
-                # Здесь можно добавить логику rate limiting
-                # Например, используя Redis для хранения счетчиков
-                # Пока что просто пропускаем
-                
-                return f(*args, **kwargs)
-            
-            return decorated_function
-        return decorator
+    def rate_limit_by_user(self, max_requests: int = 100, window_minutes: int = 60,
+                           endpoint_class: Optional[str] = None) -> Callable:
+        """Декоратор для ограничения запросов по пользователю (см. rate_limit_by_user)"""
+        return rate_limit_by_user(max_requests, window_minutes, endpoint_class)
 
     def log_user_activity(self, action: str) -> Callable:
         """Декоратор для логирования активности пользователя"""
@@ -199,6 +200,53 @@ class JWTMiddleware:
         return decorator
 
 
+def rate_limit_by_user(max_requests: int = 100, window_minutes: int = 60,
+                       endpoint_class: Optional[str] = None) -> Callable:
+    """
+    Декоратор для ограничения запросов по пользователю (GCRA)
+    
+    Применяется после аутентификации (нужен g.current_user_id). Запрос сверх
+    лимита получает 429 с Retry-After; все ответы получают X-RateLimit-Limit,
+    X-RateLimit-Remaining и X-RateLimit-Reset (секунды до восстановления).
+    
+    Args:
+        max_requests: запросов за окно (если endpoint_class не задан в USER_RATE_LIMITS)
+        window_minutes: окно в минутах
+        endpoint_class: класс эндпоинта - общий лимит для группы эндпоинтов
+                        (по умолчанию у каждого эндпоинта свой лимит)
+    """
+    limit = USER_RATE_LIMITS.get(endpoint_class) or RateLimit(max_requests, window_minutes * 60.0)
+    
+    def decorator(f: Callable) -> Callable:
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            user_id = getattr(g, 'current_user_id', None)
+            if user_id is None:
+                return f(*args, **kwargs)
+            
+            scope = endpoint_class or request.endpoint
+            decision = rate_limiter.check(f"user:{user_id}:{scope}", limit, stats_key=f"user:{scope}")
+            headers = decision.headers()
+            
+            if not decision.allowed:
+                logger.info(f"Rate limit {scope} для пользователя {user_id}, повтор через {headers['Retry-After']} с")
+                return {
+                    'error': 'Слишком много запросов, повторите позже',
+                    'code': 'RATE_LIMITED',
+                    'retry_after': int(headers['Retry-After'])
+                }, 429, headers
+            
+            @after_this_request
+            def add_rate_limit_headers(response):
+                response.headers.update(headers)
+                return response
+            
+            return f(*args, **kwargs)
+        
+        return decorated_function
+    return decorator
+
+
 def get_current_user() -> Optional[User]:
     """Получить текущего пользователя из контекста"""
     return getattr(g, 'current_user', None)
@@ -414,8 +414,7 @@ def init_auth_routes(db_session: Session, secret_key: str):
             if not session:
                 return jsonify({'error': 'Сессия не найдена'}), 404
             
-            session.is_active = False
-            db_session.commit()
+            auth_service.revoke_session(session)
             
             return jsonify({'message': 'Сессия отозвана'}), 200
                 
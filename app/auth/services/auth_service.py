@@ -4,7 +4,8 @@
 
 import secrets
 import string
-from datetime import datetime, timedelta
+import time
+from datetime import datetime, timedelta, timezone
 from typing import Optional, Dict, Any, Tuple
 from sqlalchemy.orm import Session, joinedload
 from sqlalchemy.exc import IntegrityError
@@ -13,6 +14,7 @@ import jwt
 import logging
 
 from app.auth.models.user import User, UserSession, UserRole, UserStatus
+from app.auth.services.token_cache import CachedSession, last_used_buffer, token_cache
 from app.auth.utils.email import EmailService
 from app.billing.models.subscription import Subscription, SubscriptionStatus
 
@@ -22,10 +24,14 @@ logger = logging.getLogger(__name__)
 class AuthService:
     """Сервис аутентификации"""
     
-    def __init__(self, db_session: Session, secret_key: str, email_service: EmailService):
+    def __init__(self, db_session: Session, secret_key: str, email_service: EmailService,
+                 session_cache=None, last_used=None):
         self.db = db_session
         self.secret_key = secret_key
         self.email_service = email_service
+        # Кэш проверенных сессий по jti и буфер last_used (общие на процесс)
+        self.session_cache = session_cache or token_cache
+        self.last_used = last_used or last_used_buffer
         self.jwt_algorithm = 'HS256'
         self.access_token_expire_minutes = 30
         self.refresh_token_expire_days = 30
@@ -332,6 +338,9 @@ class AuthService:
                 session.is_active = False
                 self.db.commit()
             
+            self.session_cache.invalidate(token_jti)
+            self.last_used.discard(token_jti)
+            
             return True, "Успешный выход"
             
         except Exception as e:
@@ -339,6 +348,14 @@ class AuthService:
             logger.error(f"Error during logout: {e}")
             return False, "Внутренняя ошибка сервера"
 
+    def revoke_session(self, session: UserSession) -> None:
+        """Отзыв сессии: токен сразу перестает проходить проверку"""
+        session.is_active = False
+        self.db.commit()
+        
+        self.session_cache.invalidate(session.token_jti)
+        self.last_used.discard(session.token_jti)
+
     def logout_all_sessions(self, user_id: int) -> Tuple[bool, str]:
         """Выход из всех сессий"""
         try:
@@ -474,110 +491,94 @@ class AuthService:
             UserSession.user_id == user_id,
             UserSession.is_active == True
         ).update({'is_active': False})
+        self.session_cache.invalidate_user(user_id)
 
     def verify_token(self, token: str) -> Tuple[bool, Optional[Dict]]:
-        """Верификация JWT токена"""
-        print(f"DEBUG: AuthService.verify_token called with token: {token[:20]}...")
-        print(f"DEBUG: self.secret_key type: {type(self.secret_key)}")
-        print(f"DEBUG: self.secret_key value: {self.secret_key[:10] if self.secret_key else 'None'}...")
+        """
+        Верификация JWT токена
+        
+        Сессия проверяется по кэшу jti; при промахе - одним запросом по
+        индексу token_jti вместе с пользователем. last_used не пишется на
+        каждый запрос, а копится в буфере и сбрасывается пакетом.
+        """
         try:
-            logger.info(f"AuthService.verify_token called with token: {token[:20]}...")
-            try:
-                logger.info(f"AuthService SECRET_KEY: {self.secret_key[:10]}...")
-            except Exception as e:
-                print(f"DEBUG: ERROR accessing self.secret_key: {e}")
-                logger.error(f"ERROR accessing self.secret_key: {e}")
-                return False, None
-            
-            try:
-                logger.info(f"Attempting JWT decode with algorithm: {self.jwt_algorithm}")
-                payload = jwt.decode(token, self.secret_key, algorithms=[self.jwt_algorithm])
-                logger.info(f"JWT payload decoded successfully: {payload}")
-            except jwt.ExpiredSignatureError as e:
-                logger.error(f"JWT EXPIRED: {e}")
-                return False, None
-            except jwt.InvalidTokenError as e:
-                logger.error(f"JWT INVALID TOKEN: {e}")
-                return False, None
-            except Exception as e:
-                logger.error(f"JWT DECODE ERROR: {e}")
-                return False, None
-            
-            # Проверка типа токена
-            if payload.get('type') != 'access':
-                logger.warning(f"Invalid token type: {payload.get('type')}")
-                return False, None
-            
-            # Проверка существования сессии
-            jti = payload.get('jti')
-            
-            try:
-                logger.info(f"Looking for session with JTI: {jti}")
-                logger.info(f"DB session type: {type(self.db)}")
-                logger.info(f"DB session is active: {self.db.is_active if hasattr(self.db, 'is_active') else 'unknown'}")
-                
-                all_sessions = self.db.query(UserSession).all()
-                print(f"DEBUG: Total sessions in DB: {len(all_sessions)}")
-                
-            except Exception as db_error:
-                logger.error(f"DATABASE ERROR: {db_error}")
-                logger.error(f"DB ERROR TYPE: {type(db_error)}")
-                import traceback
-                logger.error(f"DB TRACEBACK: {traceback.format_exc()}")
-                return False, None
-            
-            for sess in all_sessions:
-                logger.info(f"Session: JTI={sess.token_jti}, is_active={sess.is_active}, user_id={sess.user_id}")
-            
-            session = self.db.query(UserSession).filter(
-                UserSession.token_jti == jti,
-                UserSession.is_active == True
-            ).first()
-            
-            if not session:
-                logger.warning(f"Session not found for JTI: {jti}")
-                return False, None
-            
-            if session.is_expired():
-                logger.warning(f"Session expired for JTI: {jti}")
+            payload = jwt.decode(token, self.secret_key, algorithms=[self.jwt_algorithm])
+        except jwt.ExpiredSignatureError as e:
+            logger.debug(f"JWT token expired: {e}")
+            return False, None
+        except jwt.InvalidTokenError as e:
+            logger.warning(f"Invalid JWT token: {e}")
+            return False, None
+        
+        # Проверка типа токена
+        if payload.get('type') != 'access':
+            logger.warning(f"Invalid token type: {payload.get('type')}")
+            return False, None
+        
+        jti = payload.get('jti')
+        if not jti:
+            return False, None
+        
+        try:
+            cached = self.session_cache.get(jti)
+            if cached is None:
+                cached = self._load_session(jti)
+                if cached is None:
+                    logger.warning(f"Session not found for JTI: {jti[:8]}...")
+                    return False, None
+                self.session_cache.set(jti, cached)
+            
+            if time.time() > cached.expires_at:
+                logger.warning(f"Session expired for JTI: {jti[:8]}...")
+                self.session_cache.invalidate(jti)
                 return False, None
             
-            # Проверка пользователя
-            user = session.user
-            logger.info(f"User found: id={user.id}, email={user.email}, is_active={user.is_active}, status={user.status}")
-            
-            print(f"DEBUG: User is_active check: {user.is_active} (type: {type(user.is_active)})")
-            if not user.is_active:
-                print(f"DEBUG: User not active: is_active={user.is_active}, status={user.status}")
-                logger.warning(f"User not active: is_active={user.is_active}, status={user.status}")
+            if not cached.is_active:
+                logger.warning(f"User not active: user_id={cached.user_id}, status={cached.status}")
                 return False, None
             
             # Разрешаем доступ пользователям в статусе PENDING_VERIFICATION для тестирования
-            if user.status not in [UserStatus.ACTIVE, UserStatus.PENDING_VERIFICATION]:
-                logger.warning(f"User status not allowed: is_active={user.is_active}, status={user.status}")
+            if cached.status not in (UserStatus.ACTIVE.value, UserStatus.PENDING_VERIFICATION.value):
+                logger.warning(f"User status not allowed: user_id={cached.user_id}, status={cached.status}")
                 return False, None
             
-            # Обновление времени последнего использования
-            session.update_last_used()
-            self.db.commit()
+            # Обновление времени последнего использования - пакетом
+            self.last_used.touch(jti)
+            self.last_used.flush_if_due(self.db)
             
-            result = {
-                'user_id': user.id,
-                'email': user.email,
-                'role': user.role.value,
-                'jti': payload.get('jti')
+            return True, {
+                'user_id': cached.user_id,
+                'email': cached.email,
+                'role': cached.role,
+                'jti': jti
             }
-            logger.info(f"Token verification successful: {result}")
-            return True, result
             
-        except jwt.ExpiredSignatureError as e:
-            logger.warning(f"JWT token expired: {e}")
-            return False, None
-        except jwt.InvalidTokenError as e:
-            logger.warning(f"Invalid JWT token: {e}")
-            return False, None
         except Exception as e:
-            logger.error(f"CRITICAL ERROR in verify_token: {e}")
-            import traceback
-            logger.error(f"CRITICAL TRACEBACK: {traceback.format_exc()}")
+            logger.error(f"CRITICAL ERROR in verify_token: {e}", exc_info=True)
             return False, None
+
+    def _load_session(self, jti: str) -> Optional[CachedSession]:
+        """Загружает активную сессию и ее пользователя одним запросом"""
+        row = self.db.query(
+            UserSession.user_id,
+            UserSession.expires_at,
+            User.email,
+            User.role,
+            User.status,
+            User.is_active
+        ).join(User, User.id == UserSession.user_id).filter(
+            UserSession.token_jti == jti,
+            UserSession.is_active == True
+        ).first()
+        
+        if row is None:
+            return None
+        
+        return CachedSession(
+            user_id=row.user_id,
+            email=row.email,
+            role=row.role.value if isinstance(row.role, UserRole) else row.role,
+            status=row.status.value if isinstance(row.status, UserStatus) else row.status,
+            is_active=bool(row.is_active),
+            expires_at=row.expires_at.replace(tzinfo=timezone.utc).timestamp()
+        )
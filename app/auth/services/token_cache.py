@@ -0,0 +1,330 @@
+"""
+Кэш проверенных access-токенов и буфер last_used
+verify_token вызывается на каждый аутентифицированный запрос: вместо запроса
+сессии с пользователем и commit'а last_used на каждый GET результат проверки
+сессии кэшируется по jti на короткий TTL, а last_used накапливается в памяти
+и записывается в БД одним пакетом.
+
+Кэш в памяти процесса или в Redis (AUTH_TOKEN_CACHE_BACKEND=redis) - тогда
+инвалидация при logout видна всем gunicorn workers сразу. С локальным кэшем
+другие процессы видят logout не позже чем через AUTH_TOKEN_CACHE_TTL секунд.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Any, Dict, Optional, Set
+
+from sqlalchemy import bindparam, update
+from sqlalchemy.orm import Session
+
+from app.auth.models.user import UserSession
+
+logger = logging.getLogger(__name__)
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    redis = None
+    REDIS_AVAILABLE = False
+
+
+@dataclass
+class CachedSession:
+    """Результат проверки сессии - все, что нужно verify_token без БД"""
+    user_id: int
+    email: str
+    role: str
+    status: str
+    is_active: bool
+    expires_at: float  # timestamp истечения сессии (refresh)
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self))
+
+    @classmethod
+    def from_json(cls, value) -> "CachedSession":
+        return cls(**json.loads(value))
+
+
+class LocalTokenCache:
+    """LRU-кэш сессий в памяти процесса с TTL"""
+
+    name = "local"
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # jti -> (CachedSession, deadline)
+        self._by_user: Dict[int, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, jti: str) -> Optional[CachedSession]:
+        with self._lock:
+            item = self._entries.get(jti)
+            if item is None:
+                return None
+            entry, deadline = item
+            if time.monotonic() >= deadline:
+                self._remove(jti)
+                return None
+            self._entries.move_to_end(jti)
+            return entry
+
+    def set(self, jti: str, entry: CachedSession):
+        with self._lock:
+            self._remove(jti)
+            self._entries[jti] = (entry, time.monotonic() + self.ttl)
+            self._by_user.setdefault(entry.user_id, set()).add(jti)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, jti: str):
+        with self._lock:
+            self._remove(jti)
+
+    def invalidate_user(self, user_id: int):
+        with self._lock:
+            for jti in list(self._by_user.get(user_id, ())):
+                self._remove(jti)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _remove(self, jti: str):
+        item = self._entries.pop(jti, None)
+        if item is not None:
+            jtis = self._by_user.get(item[0].user_id)
+            if jtis is not None:
+                jtis.discard(jti)
+                if not jtis:
+                    del self._by_user[item[0].user_id]
+
+
+class RedisTokenCache:
+    """Кэш сессий в Redis - общий для всех процессов"""
+
+    name = "redis"
+
+    def __init__(self, url: str, ttl: float, prefix: str = "auth:"):
+        if not REDIS_AVAILABLE:
+            raise ImportError("Для AUTH_TOKEN_CACHE_BACKEND=redis нужен пакет redis")
+        self.ttl = max(int(ttl), 1)
+        self.prefix = prefix
+        self.client = redis.Redis.from_url(url)
+
+    def _key(self, jti: str) -> str:
+        return f"{self.prefix}jti:{jti}"
+
+    def _user_key(self, user_id: int) -> str:
+        return f"{self.prefix}user:{user_id}"
+
+    def get(self, jti: str) -> Optional[CachedSession]:
+        value = self.client.get(self._key(jti))
+        return CachedSession.from_json(value) if value else None
+
+    def set(self, jti: str, entry: CachedSession):
+        pipe = self.client.pipeline()
+        pipe.set(self._key(jti), entry.to_json(), ex=self.ttl)
+        pipe.sadd(self._user_key(entry.user_id), jti)
+        pipe.expire(self._user_key(entry.user_id), self.ttl)
+        pipe.execute()
+
+    def invalidate(self, jti: str):
+        self.client.delete(self._key(jti))
+
+    def invalidate_user(self, user_id: int):
+        jtis = self.client.smembers(self._user_key(user_id))
+        keys = [self._key(jti.decode() if isinstance(jti, bytes) else jti) for jti in jtis]
+        self.client.delete(self._user_key(user_id), *keys)
+
+    def clear(self):
+        for key in self.client.scan_iter(f"{self.prefix}*"):
+            self.client.delete(key)
+
+    def __len__(self) -> int:
+        return 0
+
+
+class TokenCache:
+    """
+    Кэш проверенных сессий по jti со статистикой
+
+    Ошибки backend (недоступный Redis) не ломают аутентификацию: запрос
+    считается промахом и проверяется по БД.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend or LocalTokenCache(
+            ttl=float(os.getenv("AUTH_TOKEN_CACHE_TTL", "60")),
+            max_entries=int(os.getenv("AUTH_TOKEN_CACHE_MAX_ENTRIES", "100000"))
+        )
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.errors = 0
+
+    def get(self, jti: str) -> Optional[CachedSession]:
+        try:
+            entry = self.backend.get(jti)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Ошибка кэша токенов ({self.backend.name}): {e}")
+            entry = None
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def set(self, jti: str, entry: CachedSession):
+        try:
+            self.backend.set(jti, entry)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Ошибка записи в кэш токенов ({self.backend.name}): {e}")
+
+    def invalidate(self, jti: str):
+        self.invalidations += 1
+        try:
+            self.backend.invalidate(jti)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Не удалось инвалидировать токен в кэше ({self.backend.name}): {e}")
+
+    def invalidate_user(self, user_id: int):
+        self.invalidations += 1
+        try:
+            self.backend.invalidate_user(user_id)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Не удалось инвалидировать сессии пользователя {user_id} в кэше: {e}")
+
+    def clear(self):
+        self.backend.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "backend": self.backend.name,
+            "entries": len(self.backend),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups * 100, 1) if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "errors": self.errors
+        }
+
+
+class LastUsedBuffer:
+    """
+    Накопитель обновлений UserSession.last_used
+
+    touch() только запоминает время в памяти; flush_if_due() раз в
+    flush_interval секунд записывает все накопленные значения одним
+    executemany UPDATE.
+    """
+
+    def __init__(self, flush_interval: float = None, max_pending: int = None):
+        self.flush_interval = flush_interval if flush_interval is not None else float(
+            os.getenv("AUTH_LAST_USED_FLUSH_INTERVAL", "60")
+        )
+        self.max_pending = max_pending or int(os.getenv("AUTH_LAST_USED_MAX_PENDING", "10000"))
+        self._pending: Dict[str, datetime] = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+        # Метрики
+        self.touches = 0
+        self.flushes = 0
+        self.rows_written = 0
+
+    def touch(self, jti: str, when: Optional[datetime] = None):
+        with self._lock:
+            self._pending[jti] = when or datetime.utcnow()
+            self.touches += 1
+
+    def discard(self, jti: str):
+        with self._lock:
+            self._pending.pop(jti, None)
+
+    def is_due(self) -> bool:
+        return bool(self._pending) and (
+            time.monotonic() - self._last_flush >= self.flush_interval
+            or len(self._pending) >= self.max_pending
+        )
+
+    def flush_if_due(self, db: Session) -> int:
+        """Записывает накопленное, если пора"""
+        if not self.is_due():
+            return 0
+        return self.flush(db)
+
+    def flush(self, db: Session) -> int:
+        """
+        Записывает все накопленные last_used одним пакетом
+
+        Returns:
+            Количество записанных сессий
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+        if not pending:
+            return 0
+
+        statement = update(UserSession.__table__).where(
+            UserSession.__table__.c.token_jti == bindparam("jti")
+        ).values(last_used=bindparam("used_at"))
+        try:
+            db.execute(statement, [{"jti": jti, "used_at": ts} for jti, ts in pending.items()])
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            # Возвращаем значения, не перезаписывая более свежие
+            with self._lock:
+                for jti, ts in pending.items():
+                    self._pending.setdefault(jti, ts)
+            logger.warning(f"Не удалось записать last_used для {len(pending)} сессий: {e}")
+            return 0
+
+        self.flushes += 1
+        self.rows_written += len(pending)
+        return len(pending)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self._pending),
+            "touches": self.touches,
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+            "coalesced": self.touches - self.rows_written - len(self._pending)
+        }
+
+
+def create_token_cache() -> TokenCache:
+    """Создает кэш токенов по переменным окружения"""
+    backend_name = os.getenv("AUTH_TOKEN_CACHE_BACKEND", "local").lower()
+    if backend_name == "redis":
+        url = os.getenv("AUTH_TOKEN_CACHE_REDIS_URL") or os.getenv("REDIS_URL", "redis://localhost:6379/0")
+        try:
+            return TokenCache(RedisTokenCache(url, ttl=float(os.getenv("AUTH_TOKEN_CACHE_TTL", "60"))))
+        except ImportError as e:
+            logger.warning(f"{e}, используется локальный кэш токенов")
+    return TokenCache()
+
+
+# Глобальные экземпляры процесса
+token_cache = create_token_cache()
+last_used_buffer = LastUsedBuffer()
@@ -7,6 +7,8 @@ import logging
 from datetime import datetime
 from typing import List, Dict, Any, Optional
 
+from app.billing.services.quota_engine import get_quota_engine
+
 logger = logging.getLogger(__name__)
 
 
@@ -39,8 +41,11 @@ class AgentAccessMiddleware:
             logger.warning(f"User {user_id} has no active subscription for agent {agent_id}")
             return False
         
-        # Проверяем можно ли использовать (с учетом лимитов)
-        if not subscription.can_use():
+        # Проверяем можно ли использовать (с учетом лимитов). Счетчики в БД
+        # обновляются пакетно, поэтому лимиты проверяются и по счетчикам QuotaEngine
+        if not subscription.can_use() or not get_quota_engine().agent_within_limits(
+            user_id, agent_id, subscription.max_tokens_per_month, subscription.max_requests_per_month
+        ):
             logger.warning(f"User {user_id} reached limits for agent {agent_id}")
             return False
         
@@ -162,33 +167,23 @@ class AgentAccessMiddleware:
         """
         Увеличивает счетчики использования агента
         
+        Счетчики QuotaEngine увеличиваются сразу, а AgentSubscription
+        обновляется фоновым потоком одним пакетным UPDATE - без запроса и
+        commit на каждый вызов.
+        
         Args:
             user_id: ID пользователя
             agent_id: ID агента
             tokens_used: Количество использованных токенов
             cost_kopeks: Стоимость в копейках
-            db_session: Сессия БД
+            db_session: Не используется, оставлен для совместимости вызовов
         """
-        from app.billing.models.agent_subscription import AgentSubscription
-        
-        subscription = db_session.query(AgentSubscription).filter(
-            AgentSubscription.user_id == user_id,
-            AgentSubscription.agent_id == agent_id,
-            AgentSubscription.status == 'active'
-        ).first()
+        get_quota_engine().record_agent_usage(user_id, agent_id, tokens_used, cost_kopeks)
         
-        if subscription:
-            subscription.increment_usage(tokens_used, cost_kopeks)
-            db_session.commit()
-            
-            logger.info(
-                f"Updated usage for user {user_id}, agent {agent_id}: "
-                f"+{tokens_used} tokens, +{cost_kopeks/100:.2f}₽"
-            )
-        else:
-            logger.warning(
-                f"Cannot update usage - no subscription found for user {user_id}, agent {agent_id}"
-            )
+        logger.debug(
+            f"Updated usage for user {user_id}, agent {agent_id}: "
+            f"+{tokens_used} tokens, +{cost_kopeks/100:.2f}₽"
+        )
     
     @staticmethod
     def get_usage_stats(user_id: int, db_session) -> Dict[str, Any]:
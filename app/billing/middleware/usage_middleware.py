@@ -6,14 +6,25 @@ import logging
 from functools import wraps
 from typing import Callable, Optional, Dict, Any
 
-from flask import request, jsonify, g
+from flask import request, g
 
-from app.billing.services.subscription_service import SubscriptionService
-from app.billing.models.subscription import get_plan_by_id
+from app.billing.services.quota_engine import GB, UNLIMITED, get_quota_engine
 
 logger = logging.getLogger(__name__)
 
 
+def _current_user_id() -> Optional[str]:
+    """ID пользователя: из JWT (g.current_user_id) или заголовка X-User-ID"""
+    return getattr(g, 'current_user_id', None) or request.headers.get('X-User-ID')
+
+
+def _status_code(result) -> int:
+    """Код ответа view: кортеж (body, status) или Response"""
+    if isinstance(result, tuple) and len(result) >= 2 and isinstance(result[1], int):
+        return result[1]
+    return getattr(result, 'status_code', 200)
+
+
 def check_usage_limit(
     resource_type: str,
     quantity: int = 1,
@@ -22,94 +33,74 @@ def check_usage_limit(
     """
     Декоратор для проверки лимитов использования
     
+    Лимит проверяется и резервируется атомарно в QuotaEngine до вызова view
+    (без запросов к БД); если view завершилась ошибкой, резерв возвращается.
+    Отказы возвращаются как (dict, status) - так их отдают и Flask view,
+    и методы Flask-RESTX Resource.
+    
     Args:
         resource_type: Тип ресурса (posts, api_calls, agents, storage)
         quantity: Количество ресурса
-        required_plan: Требуемый план (если None, проверяется текущий план)
+        required_plan: Требуемый план (если None, проверяются лимиты текущего плана;
+                       без подписки действуют лимиты плана free)
     """
     def decorator(func: Callable) -> Callable:
         @wraps(func)
         def wrapper(*args, **kwargs):
+            user_id = _current_user_id()
+            if not user_id:
+                return {
+                    "success": False,
+                    "error": "Не указан ID пользователя"
+                }, 401
+            
+            engine = get_quota_engine()
             try:
-                # Получаем ID пользователя из заголовков
-                user_id = request.headers.get('X-User-ID')
-                if not user_id:
-                    return jsonify({
+                quota = engine.get_quota(user_id)
+                if required_plan and quota.plan_id != required_plan:
+                    return {
                         "success": False,
-                        "error": "Не указан ID пользователя"
-                    }), 401
-                
-                # TODO: Получить сессию БД из контекста приложения
-                # db_session = g.db_session
-                # subscription_service = SubscriptionService(db_session)
-                
-                # Получаем подписку пользователя
-                # subscription = subscription_service.get_user_subscription(user_id)
-                # if not subscription:
-                #     return jsonify({
-                #         "success": False,
-                #         "error": "У пользователя нет активной подписки"
-                #     }), 403
-                
-                # Получаем план
-                # plan = get_plan_by_id(subscription.plan_id)
-                # if not plan:
-                #     return jsonify({
-                #         "success": False,
-                #         "error": "План подписки не найден"
-                #     }), 500
-                
-                # Проверяем требуемый план
-                # if required_plan and subscription.plan_id != required_plan:
-                #     return jsonify({
-                #         "success": False,
-                #         "error": f"Требуется план {required_plan}",
-                #         "current_plan": subscription.plan_id,
-                #         "upgrade_required": True
-                #     }), 403
-                
-                # Проверяем лимиты использования
-                # if not subscription_service.check_usage_limit(user_id, resource_type, quantity):
-                #     usage_stats = subscription_service.get_usage_stats(user_id)
-                #     if usage_stats:
-                #         return jsonify({
-                #             "success": False,
-                #             "error": f"Превышен лимит использования {resource_type}",
-                #             "usage": {
-                #                 "used": getattr(usage_stats, f"{resource_type}_used", 0),
-                #                 "limit": getattr(usage_stats, f"{resource_type}_limit", 0)
-                #             },
-                #             "upgrade_required": True
-                #         }), 429
-                
-                # Временная заглушка - всегда разрешаем
-                logger.info(f"Проверка лимита {resource_type} для пользователя {user_id}: разрешено")
-                
-                # Выполняем оригинальную функцию
-                result = func(*args, **kwargs)
-                
-                # Записываем использование ресурса
-                # subscription_service.record_usage(
-                #     user_id=user_id,
-                #     resource_type=resource_type,
-                #     quantity=quantity,
-                #     resource_id=request.endpoint,
-                #     metadata={
-                #         "endpoint": request.endpoint,
-                #         "method": request.method,
-                #         "user_agent": request.headers.get('User-Agent', ''),
-                #         "ip": request.remote_addr
-                #     }
-                # )
-                
-                return result
+                        "error": f"Требуется план {required_plan}",
+                        "current_plan": quota.plan_id,
+                        "upgrade_required": True
+                    }, 403
                 
+                decision = engine.reserve(user_id, resource_type, quantity)
             except Exception as e:
                 logger.error(f"Ошибка проверки лимита использования: {e}")
-                return jsonify({
+                return {
                     "success": False,
                     "error": "Ошибка проверки лимитов"
-                }), 500
+                }, 500
+            
+            if decision.reason == "unknown_resource":
+                logger.error(f"Неизвестный тип ресурса {resource_type}, лимит не проверяется")
+                return func(*args, **kwargs)
+            
+            if not decision.allowed:
+                return {
+                    "success": False,
+                    "error": f"Превышен лимит использования {resource_type}",
+                    "usage": {
+                        "used": decision.used,
+                        "limit": decision.limit
+                    },
+                    "upgrade_required": True
+                }, 429
+            
+            try:
+                result = func(*args, **kwargs)
+            except Exception:
+                engine.release(user_id, resource_type, quantity)
+                raise
+            
+            # Записываем использование ресурса только при успешном выполнении
+            if _status_code(result) >= 400:
+                engine.release(user_id, resource_type, quantity)
+            else:
+                engine.commit(user_id, resource_type, quantity, resource_id=request.endpoint)
+            
+            return result
         
         return wrapper
     return decorator
@@ -125,34 +116,31 @@ def require_plan(plan_id: str):
     def decorator(func: Callable) -> Callable:
         @wraps(func)
         def wrapper(*args, **kwargs):
+            user_id = _current_user_id()
+            if not user_id:
+                return {
+                    "success": False,
+                    "error": "Не указан ID пользователя"
+                }, 401
+            
             try:
-                user_id = request.headers.get('X-User-ID')
-                if not user_id:
-                    return jsonify({
-                        "success": False,
-                        "error": "Не указан ID пользователя"
-                    }), 401
-                
-                # TODO: Проверить план пользователя
-                # subscription = subscription_service.get_user_subscription(user_id)
-                # if not subscription or subscription.plan_id != plan_id:
-                #     return jsonify({
-                #         "success": False,
-                #         "error": f"Требуется план {plan_id}",
-                #         "current_plan": subscription.plan_id if subscription else None,
-                #         "upgrade_required": True
-                #     }), 403
-                
-                logger.info(f"Проверка плана {plan_id} для пользователя {user_id}: разрешено")
-                
-                return func(*args, **kwargs)
-                
+                quota = get_quota_engine().get_quota(user_id)
             except Exception as e:
                 logger.error(f"Ошибка проверки плана: {e}")
-                return jsonify({
+                return {
                     "success": False,
                     "error": "Ошибка проверки плана"
-                }), 500
+                }, 500
+            
+            if quota.plan_id != plan_id:
+                return {
+                    "success": False,
+                    "error": f"Требуется план {plan_id}",
+                    "current_plan": quota.plan_id,
+                    "upgrade_required": True
+                }, 403
+            
+            return func(*args, **kwargs)
         
         return wrapper
     return decorator
@@ -160,7 +148,7 @@ def require_plan(plan_id: str):
 
 def track_usage(resource_type: str, quantity: int = 1):
     """
-    Декоратор для отслеживания использования ресурса
+    Декоратор для отслеживания использования ресурса (без проверки лимита)
     
     Args:
         resource_type: Тип ресурса
@@ -169,34 +157,17 @@ def track_usage(resource_type: str, quantity: int = 1):
     def decorator(func: Callable) -> Callable:
         @wraps(func)
         def wrapper(*args, **kwargs):
-            try:
-                result = func(*args, **kwargs)
-                
-                # Записываем использование только при успешном выполнении
-                if isinstance(result, tuple) and len(result) >= 2:
-                    status_code = result[1]
-                    if status_code < 400:  # Успешный ответ
-                        user_id = request.headers.get('X-User-ID')
-                        if user_id:
-                            # TODO: Записать использование
-                            # subscription_service.record_usage(
-                            #     user_id=user_id,
-                            #     resource_type=resource_type,
-                            #     quantity=quantity,
-                            #     resource_id=request.endpoint,
-                            #     metadata={
-                            #         "endpoint": request.endpoint,
-                            #         "method": request.method,
-                            #         "status_code": status_code
-                            #     }
-                            # )
-                            logger.info(f"Записано использование {resource_type} для пользователя {user_id}")
-                
-                return result
-                
-            except Exception as e:
-                logger.error(f"Ошибка отслеживания использования: {e}")
-                return func(*args, **kwargs)  # Возвращаем результат без отслеживания
+            result = func(*args, **kwargs)
+            
+            # Записываем использование только при успешном выполнении
+            user_id = _current_user_id()
+            if user_id and _status_code(result) < 400:
+                try:
+                    get_quota_engine().record(user_id, resource_type, quantity, resource_id=request.endpoint)
+                except Exception as e:
+                    logger.error(f"Ошибка отслеживания использования: {e}")
+            
+            return result
         
         return wrapper
     return decorator
@@ -222,11 +193,11 @@ class UsageMiddleware:
         if user_id:
             g.user_id = user_id
             
-            # TODO: Получить информацию о подписке
-            # subscription = subscription_service.get_user_subscription(user_id)
-            # if subscription:
-            #     g.subscription = subscription
-            #     g.plan = get_plan_by_id(subscription.plan_id)
+            # Лимиты плана (кэш процесса QuotaEngine, БД - только при промахе)
+            try:
+                g.quota = get_quota_engine().get_quota(user_id)
+            except Exception as e:
+                logger.warning(f"Не удалось получить лимиты пользователя {user_id}: {e}")
     
     def after_request(self, response):
         """Выполняется после каждого запроса"""
@@ -238,56 +209,27 @@ class UsageMiddleware:
 
 
 def get_user_limits(user_id: str) -> Optional[Dict[str, Any]]:
-    """Получить лимиты пользователя"""
+    """Получить лимиты и текущее использование пользователя"""
     try:
-        # TODO: Получить лимиты из подписки
-        # subscription = subscription_service.get_user_subscription(user_id)
-        # if not subscription:
-        #     return None
-        # 
-        # plan = get_plan_by_id(subscription.plan_id)
-        # if not plan:
-        #     return None
-        # 
-        # usage_stats = subscription_service.get_usage_stats(user_id)
-        # if not usage_stats:
-        #     return None
-        # 
-        # return {
-        #     "plan_id": subscription.plan_id,
-        #     "plan_name": plan.name,
-        #     "limits": {
-        #         "posts_per_month": plan.limits.posts_per_month,
-        #         "max_agents": plan.limits.max_agents,
-        #         "api_calls_per_day": plan.limits.api_calls_per_day,
-        #         "storage_gb": plan.limits.storage_gb
-        #     },
-        #     "usage": {
-        #         "posts_used": usage_stats.posts_used,
-        #         "agents_used": usage_stats.agents_used,
-        #         "api_calls_used": usage_stats.api_calls_used,
-        #         "storage_used_gb": usage_stats.storage_used_gb
-        #     },
-        #     "expires_at": subscription.expires_at.isoformat()
-        # }
-        
-        # Временная заглушка
+        engine = get_quota_engine()
+        quota = engine.get_quota(user_id)
+        usage = engine.get_usage(user_id)
         return {
-            "plan_id": "free",
-            "plan_name": "Free",
+            "plan_id": quota.plan_id,
+            "plan_name": quota.plan_name,
             "limits": {
-                "posts_per_month": 50,
-                "max_agents": 3,
-                "api_calls_per_day": 100,
-                "storage_gb": 1
+                "posts_per_month": quota.limits["posts"],
+                "max_agents": quota.limits["agents"],
+                "api_calls_per_day": quota.limits["api_calls"],
+                "storage_gb": quota.limits["storage"] // GB if quota.limits["storage"] >= 0 else UNLIMITED
             },
             "usage": {
-                "posts_used": 15,
-                "agents_used": 2,
-                "api_calls_used": 25,
-                "storage_used_gb": 0.5
+                "posts_used": usage["posts"],
+                "agents_used": usage["agents"],
+                "api_calls_used": usage["api_calls"],
+                "storage_used_gb": round(usage["storage"] / GB, 3)
             },
-            "expires_at": "2024-12-31T23:59:59Z"
+            "expires_at": quota.period_end.isoformat() if quota.period_end else None
         }
         
     except Exception as e:
@@ -0,0 +1,747 @@
+"""
+Квоты тарифного плана на пути запроса
+Счетчики использования (посты за месяц, API вызовы за день, хранилище,
+подключенные агенты, токены и запросы агентов за месяц) хранятся в быстром
+хранилище - Redis (QUOTA_STORE_BACKEND=redis, общий для всех процессов) или
+словаре процесса - и проверяются атомарным "проверить и увеличить" за O(1),
+без запросов к БД.
+
+БД остается источником истины:
+- UsageRecord и счетчики AgentSubscription пишутся пакетно фоновым потоком
+  (одинаковые события за интервал сводятся в одну строку/UPDATE);
+- счетчики периодически сверяются с БД (QUOTA_RECONCILE_INTERVAL) и при
+  загрузке лимитов пользователя - поэтому после перезапуска процесса или
+  потери Redis квоты не обнуляются.
+
+С локальным хранилищем каждый gunicorn worker видит использование других
+процессов с задержкой сверки - перерасход ограничен этим интервалом. Для
+точного учета между процессами используйте Redis.
+
+Пользователь без активной подписки получает лимиты плана free. UsageRecord
+для него не пишется (запись привязана к подписке): счет ведется только в
+хранилище счетчиков.
+"""
+
+import atexit
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, bindparam, func, insert, update
+
+from app.billing.models.agent_subscription import AgentSubscription
+from app.billing.models.subscription import UsageRecord, get_plan_by_id
+from app.billing.services.subscription_service import SubscriptionService
+
+logger = logging.getLogger(__name__)
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    redis = None
+    REDIS_AVAILABLE = False
+
+UNLIMITED = -1
+
+# План пользователя без активной подписки
+DEFAULT_PLAN_ID = "free"
+
+# Периоды счетчиков
+DAY = "day"
+MONTH = "month"
+TOTAL = "total"
+
+GB = 1024 ** 3
+
+
+@dataclass(frozen=True)
+class QuotaResource:
+    """Ресурс с лимитом тарифного плана"""
+    name: str
+    period: str
+    plan_limit: Callable[[Any], int]  # PlanLimits -> лимит (-1 - без лимита)
+    gauge: bool = False    # текущее количество (агенты), сверяется с БД точно, а не по максимуму
+    persist: bool = True   # писать использование в UsageRecord
+
+
+RESOURCES: Dict[str, QuotaResource] = {
+    "posts": QuotaResource("posts", MONTH, lambda limits: limits.posts_per_month),
+    "api_calls": QuotaResource("api_calls", DAY, lambda limits: limits.api_calls_per_day),
+    # Хранилище учитывается в байтах, как в UsageRecord
+    "storage": QuotaResource(
+        "storage", TOTAL,
+        lambda limits: limits.storage_gb * GB if limits.storage_gb >= 0 else UNLIMITED
+    ),
+    "agents": QuotaResource("agents", TOTAL, lambda limits: limits.max_agents, gauge=True, persist=False),
+}
+
+
+@dataclass
+class UserQuota:
+    """Лимиты пользователя по активной подписке (без подписки - план free)"""
+    user_id: int
+    plan_id: Optional[str]
+    plan_name: Optional[str] = None
+    subscription_id: Optional[int] = None
+    period_start: Optional[datetime] = None
+    period_end: Optional[datetime] = None
+    limits: Dict[str, int] = field(default_factory=dict)
+    # agent_id -> {"tokens": лимит, "requests": лимит}; None - без лимита
+    agent_limits: Dict[str, Dict[str, Optional[int]]] = field(default_factory=dict)
+
+    @property
+    def has_subscription(self) -> bool:
+        return self.subscription_id is not None
+
+
+@dataclass
+class QuotaDecision:
+    """Результат проверки квоты"""
+    allowed: bool
+    resource: str
+    used: int = 0
+    limit: int = UNLIMITED
+    plan_id: Optional[str] = None
+    reason: Optional[str] = None  # limit_exceeded, unknown_resource
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"resource": self.resource, "used": self.used, "limit": self.limit, "plan_id": self.plan_id}
+
+
+def period_bounds(period: str, now: Optional[datetime] = None) -> Tuple[str, Optional[datetime], Optional[datetime]]:
+    """
+    Идентификатор, начало и конец текущего периода счетчика (UTC)
+
+    Returns:
+        (метка периода для ключа, начало, конец); для TOTAL начало и конец - None
+    """
+    now = now or datetime.utcnow()
+    if period == DAY:
+        start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        return start.strftime("%Y-%m-%d"), start, start + timedelta(days=1)
+    if period == MONTH:
+        start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        end = (start + timedelta(days=32)).replace(day=1)
+        return start.strftime("%Y-%m"), start, end
+    return TOTAL, None, None
+
+
+def _ttl_until(end: Optional[datetime], now: Optional[datetime] = None) -> Optional[int]:
+    """TTL ключа счетчика: до конца периода плюс сутки запаса"""
+    if end is None:
+        return None
+    return int((end - (now or datetime.utcnow())).total_seconds()) + 86400
+
+
+# ==================== ХРАНИЛИЩА СЧЕТЧИКОВ ====================
+
+class LocalQuotaStore:
+    """Счетчики в памяти процесса"""
+
+    name = "local"
+
+    def __init__(self):
+        self._values: Dict[str, Tuple[int, Optional[float]]] = {}  # key -> (значение, monotonic дедлайн)
+        self._lock = threading.Lock()
+
+    def _get(self, key: str) -> int:
+        item = self._values.get(key)
+        if item is None:
+            return 0
+        if item[1] is not None and time.monotonic() >= item[1]:
+            del self._values[key]
+            return 0
+        return item[0]
+
+    def _put(self, key: str, value: int, ttl: Optional[int]):
+        item = self._values.get(key)
+        if item is not None and item[1] is not None and time.monotonic() < item[1]:
+            deadline = item[1]
+        else:
+            deadline = time.monotonic() + ttl if ttl else None
+        self._values[key] = (value, deadline)
+
+    def incr_within(self, key: str, amount: int, limit: int, ttl: Optional[int]) -> Tuple[bool, int]:
+        with self._lock:
+            value = self._get(key)
+            if limit >= 0 and value + amount > limit:
+                return False, value
+            self._put(key, value + amount, ttl)
+            return True, value + amount
+
+    def incr(self, key: str, amount: int, ttl: Optional[int]) -> int:
+        with self._lock:
+            value = max(self._get(key) + amount, 0)
+            self._put(key, value, ttl)
+            return value
+
+    def get_many(self, keys: List[str]) -> List[int]:
+        with self._lock:
+            return [self._get(key) for key in keys]
+
+    def sync(self, key: str, value: int, ttl: Optional[int], exact: bool = False) -> int:
+        with self._lock:
+            if not exact:
+                value = max(self._get(key), value)
+            self._put(key, value, ttl)
+            return value
+
+    def delete(self, *keys: str):
+        with self._lock:
+            for key in keys:
+                self._values.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+
+# KEYS[1] - счетчик; ARGV: amount, limit, ttl (0 - без срока)
+_INCR_WITHIN_LUA = """
+local value = tonumber(redis.call('GET', KEYS[1]) or '0')
+local amount = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+if limit >= 0 and value + amount > limit then
+    return {0, value}
+end
+value = redis.call('INCRBY', KEYS[1], amount)
+if tonumber(ARGV[3]) > 0 and redis.call('TTL', KEYS[1]) < 0 then
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+end
+return {1, value}
+"""
+
+_INCR_LUA = """
+local value = redis.call('INCRBY', KEYS[1], ARGV[1])
+if value < 0 then
+    redis.call('SET', KEYS[1], 0)
+    value = 0
+end
+if tonumber(ARGV[2]) > 0 and redis.call('TTL', KEYS[1]) < 0 then
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return value
+"""
+
+# ARGV: value, ttl, exact (1 - выставить, 0 - поднять до value)
+_SYNC_LUA = """
+local value = tonumber(ARGV[1])
+if ARGV[3] == '0' then
+    value = math.max(tonumber(redis.call('GET', KEYS[1]) or '0'), value)
+end
+if tonumber(ARGV[2]) > 0 then
+    redis.call('SET', KEYS[1], value, 'EX', ARGV[2])
+else
+    redis.call('SET', KEYS[1], value)
+end
+return value
+"""
+
+
+class RedisQuotaStore:
+    """Счетчики в Redis - общие для всех процессов; проверка и увеличение - один Lua-скрипт"""
+
+    name = "redis"
+
+    def __init__(self, url: str):
+        if not REDIS_AVAILABLE:
+            raise ImportError("Для QUOTA_STORE_BACKEND=redis нужен пакет redis")
+        self.client = redis.Redis.from_url(url, socket_timeout=0.2)
+        self._incr_within = self.client.register_script(_INCR_WITHIN_LUA)
+        self._incr = self.client.register_script(_INCR_LUA)
+        self._sync = self.client.register_script(_SYNC_LUA)
+
+    def incr_within(self, key: str, amount: int, limit: int, ttl: Optional[int]) -> Tuple[bool, int]:
+        allowed, value = self._incr_within(keys=[key], args=[amount, limit, ttl or 0])
+        return bool(allowed), int(value)
+
+    def incr(self, key: str, amount: int, ttl: Optional[int]) -> int:
+        return int(self._incr(keys=[key], args=[amount, ttl or 0]))
+
+    def get_many(self, keys: List[str]) -> List[int]:
+        return [int(value or 0) for value in self.client.mget(keys)] if keys else []
+
+    def sync(self, key: str, value: int, ttl: Optional[int], exact: bool = False) -> int:
+        return int(self._sync(keys=[key], args=[value, ttl or 0, 1 if exact else 0]))
+
+    def delete(self, *keys: str):
+        if keys:
+            self.client.delete(*keys)
+
+    def __len__(self) -> int:
+        return 0
+
+
+# ==================== ДВИЖОК КВОТ ====================
+
+class QuotaEngine:
+    """
+    Проверка и учет квот тарифного плана
+
+    reserve() атомарно проверяет лимит и увеличивает счетчик; release()
+    возвращает резерв, если операция не удалась; commit() ставит запись
+    использования в очередь на запись в UsageRecord.
+    """
+
+    def __init__(self, store=None, session_factory: Callable = None, limits_ttl: float = None,
+                 flush_interval: float = None, reconcile_interval: float = None, prefix: str = "quota:"):
+        """
+        Args:
+            store: хранилище счетчиков (LocalQuotaStore / RedisQuotaStore)
+            session_factory: фабрика сессий БД (по умолчанию get_db_session)
+            limits_ttl: сколько секунд лимиты пользователя кэшируются в процессе
+            flush_interval: период пакетной записи использования в БД
+            reconcile_interval: период сверки счетчиков с БД
+        """
+        self.store = store or LocalQuotaStore()
+        self._fallback = self.store if isinstance(self.store, LocalQuotaStore) else LocalQuotaStore()
+        self._session_factory = session_factory
+        self.limits_ttl = limits_ttl if limits_ttl is not None else float(os.getenv("QUOTA_LIMITS_TTL", "60"))
+        self.flush_interval = flush_interval if flush_interval is not None else float(
+            os.getenv("QUOTA_FLUSH_INTERVAL", "5")
+        )
+        self.reconcile_interval = reconcile_interval if reconcile_interval is not None else float(
+            os.getenv("QUOTA_RECONCILE_INTERVAL", "60")
+        )
+        self.prefix = prefix
+
+        self._quotas: Dict[int, Tuple[UserQuota, float]] = {}  # user_id -> (лимиты, monotonic дедлайн)
+        self._pending_usage: Dict[tuple, int] = {}
+        self._pending_agents: Dict[tuple, List] = {}  # (user_id, agent_id) -> [requests, tokens, cost, last_used]
+        self._active_users: set = set()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_reconcile = time.monotonic()
+
+        # Метрики
+        self.checks = 0
+        self.denied = 0
+        self.limits_loaded = 0
+        self.store_errors = 0
+        self.flushed_rows = 0
+        self.reconciled_users = 0
+
+    # ==================== ЛИМИТЫ ====================
+
+    def get_quota(self, user_id) -> UserQuota:
+        """Лимиты пользователя (кэш процесса; при промахе - загрузка из БД и сверка счетчиков)"""
+        user_id = int(user_id)
+        item = self._quotas.get(user_id)
+        if item is not None and time.monotonic() < item[1]:
+            return item[0]
+
+        db = self._new_session()
+        try:
+            quota = self._load_quota(db, user_id)
+            self._reconcile_users(db, [quota])
+        finally:
+            db.close()
+
+        with self._lock:
+            self._quotas[user_id] = (quota, time.monotonic() + self.limits_ttl)
+        self.limits_loaded += 1
+        self._ensure_started()
+        return quota
+
+    def invalidate_user(self, user_id):
+        """Сбрасывает кэш лимитов пользователя (смена или отмена подписки)"""
+        with self._lock:
+            self._quotas.pop(int(user_id), None)
+
+    def _load_quota(self, db, user_id: int) -> UserQuota:
+        subscription = SubscriptionService(db).get_user_subscription(user_id)
+        plan = get_plan_by_id(subscription.plan_id) if subscription else None
+        if not plan:
+            subscription = None
+            plan = get_plan_by_id(DEFAULT_PLAN_ID)
+
+        agent_limits = {
+            row.agent_id: {"tokens": row.max_tokens_per_month, "requests": row.max_requests_per_month}
+            for row in db.query(
+                AgentSubscription.agent_id,
+                AgentSubscription.max_tokens_per_month,
+                AgentSubscription.max_requests_per_month
+            ).filter(
+                AgentSubscription.user_id == user_id,
+                AgentSubscription.status == 'active'
+            ).all()
+        }
+        return UserQuota(
+            user_id=user_id,
+            plan_id=plan.id,
+            plan_name=plan.name,
+            subscription_id=subscription.id if subscription else None,
+            period_start=subscription.starts_at if subscription else None,
+            period_end=subscription.expires_at if subscription else None,
+            limits={name: resource.plan_limit(plan.limits) for name, resource in RESOURCES.items()},
+            agent_limits=agent_limits
+        )
+
+    # ==================== ПУТЬ ЗАПРОСА ====================
+
+    def _key(self, user_id: int, resource: str, period: str, now: Optional[datetime] = None) -> Tuple[str, Optional[int]]:
+        label, _, end = period_bounds(period, now)
+        return f"{self.prefix}{user_id}:{resource}:{label}", _ttl_until(end, now)
+
+    def _store_call(self, method: str, *args):
+        """Вызов хранилища; при недоступности Redis - локальные счетчики процесса"""
+        try:
+            return getattr(self.store, method)(*args)
+        except Exception as e:
+            self.store_errors += 1
+            logger.warning(f"Хранилище квот ({self.store.name}) недоступно, используются локальные счетчики: {e}")
+            return getattr(self._fallback, method)(*args)
+
+    def reserve(self, user_id, resource: str, quantity: int = 1) -> QuotaDecision:
+        """
+        Атомарно проверяет лимит и резервирует quantity
+
+        Returns:
+            QuotaDecision; при allowed=False счетчик не изменен
+        """
+        self.checks += 1
+        quota = self.get_quota(user_id)
+        decision = self._precheck(quota, resource)
+        if decision is not None:
+            return decision
+
+        limit = quota.limits[resource]
+        key, ttl = self._key(quota.user_id, resource, RESOURCES[resource].period)
+        allowed, used = self._store_call("incr_within", key, quantity, limit, ttl)
+        self._active_users.add(quota.user_id)
+        if not allowed:
+            self.denied += 1
+            return QuotaDecision(False, resource, used, limit, quota.plan_id, "limit_exceeded")
+        return QuotaDecision(True, resource, used, limit, quota.plan_id)
+
+    def check(self, user_id, resource: str, quantity: int = 1) -> QuotaDecision:
+        """Проверяет лимит без резервирования"""
+        self.checks += 1
+        quota = self.get_quota(user_id)
+        decision = self._precheck(quota, resource)
+        if decision is not None:
+            return decision
+
+        limit = quota.limits[resource]
+        key, _ = self._key(quota.user_id, resource, RESOURCES[resource].period)
+        used = self._store_call("get_many", [key])[0]
+        allowed = limit < 0 or used + quantity <= limit
+        if not allowed:
+            self.denied += 1
+        return QuotaDecision(allowed, resource, used, limit, quota.plan_id,
+                             None if allowed else "limit_exceeded")
+
+    def _precheck(self, quota: UserQuota, resource: str) -> Optional[QuotaDecision]:
+        if resource not in RESOURCES:
+            return QuotaDecision(False, resource, reason="unknown_resource")
+        return None
+
+    def release(self, user_id, resource: str, quantity: int = 1):
+        """Возвращает резерв (операция не выполнена)"""
+        if resource not in RESOURCES:
+            return
+        key, ttl = self._key(int(user_id), resource, RESOURCES[resource].period)
+        self._store_call("incr", key, -quantity, ttl)
+
+    def commit(self, user_id, resource: str, quantity: int = 1, resource_id: Optional[str] = None):
+        """Ставит использование в очередь на запись в UsageRecord (счетчик уже увеличен reserve)"""
+        resource_def = RESOURCES.get(resource)
+        if resource_def is None or not resource_def.persist:
+            return
+        quota = self.get_quota(user_id)
+        if not quota.has_subscription:
+            return
+        key = (quota.user_id, quota.subscription_id, resource, resource_id,
+               quota.period_start, quota.period_end)
+        with self._lock:
+            self._pending_usage[key] = self._pending_usage.get(key, 0) + quantity
+
+    def record(self, user_id, resource: str, quantity: int = 1, resource_id: Optional[str] = None):
+        """Учитывает использование без проверки лимита (операция уже выполнена)"""
+        if resource not in RESOURCES:
+            return
+        key, ttl = self._key(int(user_id), resource, RESOURCES[resource].period)
+        self._store_call("incr", key, quantity, ttl)
+        self._active_users.add(int(user_id))
+        self.commit(user_id, resource, quantity, resource_id)
+
+    # ==================== АГЕНТЫ ====================
+
+    def _agent_keys(self, user_id: int, agent_id: str) -> Tuple[str, str, Optional[int]]:
+        tokens_key, ttl = self._key(user_id, f"agent_tokens:{agent_id}", MONTH)
+        requests_key, _ = self._key(user_id, f"agent_requests:{agent_id}", MONTH)
+        return tokens_key, requests_key, ttl
+
+    def agent_within_limits(self, user_id, agent_id: str, max_tokens: Optional[int] = None,
+                            max_requests: Optional[int] = None) -> bool:
+        """Проверяет текущие счетчики агента за месяц против лимитов AgentSubscription"""
+        if not max_tokens and not max_requests:
+            return True
+        tokens_key, requests_key, _ = self._agent_keys(int(user_id), agent_id)
+        tokens, requests = self._store_call("get_many", [tokens_key, requests_key])
+        if max_tokens and tokens >= max_tokens:
+            return False
+        if max_requests and requests >= max_requests:
+            return False
+        return True
+
+    def record_agent_usage(self, user_id, agent_id: str, tokens_used: int, cost_kopeks: int):
+        """Учитывает запрос к агенту; счетчики AgentSubscription обновляются пакетно"""
+        user_id = int(user_id)
+        tokens_key, requests_key, ttl = self._agent_keys(user_id, agent_id)
+        self._store_call("incr", tokens_key, tokens_used, ttl)
+        self._store_call("incr", requests_key, 1, ttl)
+        with self._lock:
+            pending = self._pending_agents.setdefault((user_id, agent_id), [0, 0, 0, None])
+            pending[0] += 1
+            pending[1] += tokens_used
+            pending[2] += cost_kopeks
+            pending[3] = datetime.utcnow()
+            self._active_users.add(user_id)
+        self._ensure_started()
+
+    # ==================== ЧТЕНИЕ ====================
+
+    def get_usage(self, user_id) -> Dict[str, int]:
+        """Текущие значения счетчиков ресурсов плана"""
+        quota = self.get_quota(user_id)
+        keys = [self._key(quota.user_id, name, resource.period)[0] for name, resource in RESOURCES.items()]
+        return dict(zip(RESOURCES, self._store_call("get_many", keys)))
+
+    # ==================== ЗАПИСЬ И СВЕРКА С БД ====================
+
+    def flush(self) -> int:
+        """
+        Записывает накопленное использование в БД
+
+        Returns:
+            Количество записанных строк UsageRecord и обновленных подписок агентов
+        """
+        with self._flush_lock:
+            with self._lock:
+                usage, self._pending_usage = self._pending_usage, {}
+                agents, self._pending_agents = self._pending_agents, {}
+            if not usage and not agents:
+                return 0
+
+            db = None
+            try:
+                db = self._new_session()
+                if usage:
+                    db.execute(insert(UsageRecord.__table__), [
+                        {
+                            "user_id": user_id, "subscription_id": subscription_id,
+                            "resource_type": resource, "resource_id": resource_id, "quantity": quantity,
+                            "period_start": period_start, "period_end": period_end,
+                            "created_at": datetime.utcnow(), "meta_data": {"source": "quota_engine"}
+                        }
+                        for (user_id, subscription_id, resource, resource_id, period_start, period_end), quantity
+                        in usage.items()
+                    ])
+                if agents:
+                    table = AgentSubscription.__table__
+                    db.execute(
+                        update(table).where(and_(
+                            table.c.user_id == bindparam("uid"),
+                            table.c.agent_id == bindparam("aid"),
+                            table.c.status == 'active'
+                        )).values(
+                            requests_this_month=table.c.requests_this_month + bindparam("requests"),
+                            tokens_this_month=table.c.tokens_this_month + bindparam("tokens"),
+                            cost_this_month=table.c.cost_this_month + bindparam("cost"),
+                            last_used_at=bindparam("used_at")
+                        ),
+                        [
+                            {"uid": user_id, "aid": agent_id, "requests": requests, "tokens": tokens,
+                             "cost": cost, "used_at": used_at}
+                            for (user_id, agent_id), (requests, tokens, cost, used_at) in agents.items()
+                        ]
+                    )
+                db.commit()
+            except Exception as e:
+                if db is not None:
+                    db.rollback()
+                self._restore_pending(usage, agents)
+                logger.warning(f"Не удалось записать использование квот: {e}")
+                return 0
+            finally:
+                if db is not None:
+                    db.close()
+
+            written = len(usage) + len(agents)
+            self.flushed_rows += written
+            return written
+
+    def _restore_pending(self, usage: Dict[tuple, int], agents: Dict[tuple, List]):
+        with self._lock:
+            for key, quantity in usage.items():
+                self._pending_usage[key] = self._pending_usage.get(key, 0) + quantity
+            for key, (requests, tokens, cost, used_at) in agents.items():
+                pending = self._pending_agents.setdefault(key, [0, 0, 0, None])
+                pending[0] += requests
+                pending[1] += tokens
+                pending[2] += cost
+                pending[3] = max(filter(None, (pending[3], used_at)), default=None)
+
+    def reconcile(self, user_ids: Optional[Iterable[int]] = None) -> int:
+        """
+        Сверяет счетчики с БД
+
+        Счетчики периода поднимаются до значения в БД (в хранилище могут быть
+        еще не записанные резервы), количество агентов выставляется точно.
+
+        Args:
+            user_ids: пользователи для сверки (по умолчанию - активные с прошлой сверки)
+
+        Returns:
+            Количество сверенных пользователей
+        """
+        if user_ids is None:
+            with self._lock:
+                user_ids, self._active_users = self._active_users, set()
+        quotas = [self.get_quota(user_id) for user_id in user_ids]
+        quotas = [quota for quota in quotas if quota.has_subscription]
+        if not quotas:
+            return 0
+
+        db = self._new_session()
+        try:
+            self._reconcile_users(db, quotas)
+        finally:
+            db.close()
+        return len(quotas)
+
+    def _reconcile_users(self, db, quotas: List[UserQuota]):
+        user_ids = [quota.user_id for quota in quotas if quota.has_subscription]
+        if not user_ids:
+            return
+        now = datetime.utcnow()
+
+        for name, resource in RESOURCES.items():
+            if resource.gauge:
+                continue
+            _, start, _ = period_bounds(resource.period, now)
+            query = db.query(UsageRecord.user_id, func.sum(UsageRecord.quantity)).filter(
+                UsageRecord.user_id.in_(user_ids),
+                UsageRecord.resource_type == name
+            )
+            if start is not None:
+                query = query.filter(UsageRecord.created_at >= start)
+            used = dict(query.group_by(UsageRecord.user_id).all())
+            for user_id in user_ids:
+                key, ttl = self._key(user_id, name, resource.period, now)
+                self._store_call("sync", key, int(used.get(user_id) or 0), ttl, False)
+
+        # Агенты: количество активных подписок и месячные счетчики
+        agents_count = {user_id: 0 for user_id in user_ids}
+        for row in db.query(
+            AgentSubscription.user_id,
+            AgentSubscription.agent_id,
+            AgentSubscription.tokens_this_month,
+            AgentSubscription.requests_this_month
+        ).filter(
+            AgentSubscription.user_id.in_(user_ids),
+            AgentSubscription.status == 'active',
+            AgentSubscription.expires_at > now
+        ).all():
+            agents_count[row.user_id] += 1
+            tokens_key, requests_key, ttl = self._agent_keys(row.user_id, row.agent_id)
+            self._store_call("sync", tokens_key, int(row.tokens_this_month or 0), ttl, False)
+            self._store_call("sync", requests_key, int(row.requests_this_month or 0), ttl, False)
+
+        for user_id, count in agents_count.items():
+            key, ttl = self._key(user_id, "agents", TOTAL, now)
+            self._store_call("sync", key, count, ttl, True)
+
+        self.reconciled_users += len(user_ids)
+
+    def _new_session(self):
+        if self._session_factory is None:
+            from app.database.connection import get_db_session
+            self._session_factory = get_db_session
+        return self._session_factory()
+
+    # ==================== ФОНОВЫЙ ПОТОК ====================
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="QuotaEngine", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+                if time.monotonic() - self._last_reconcile >= self.reconcile_interval:
+                    self._last_reconcile = time.monotonic()
+                    self.reconcile()
+            except Exception as e:
+                logger.error(f"Ошибка фоновой синхронизации квот: {e}", exc_info=True)
+
+    def close(self):
+        """Останавливает фоновый поток и записывает накопленное использование"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.flush()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.store.name,
+            "counters": len(self.store),
+            "cached_users": len(self._quotas),
+            "checks": self.checks,
+            "denied": self.denied,
+            "limits_loaded": self.limits_loaded,
+            "pending_usage": len(self._pending_usage),
+            "pending_agent_updates": len(self._pending_agents),
+            "flushed_rows": self.flushed_rows,
+            "reconciled_users": self.reconciled_users,
+            "store_errors": self.store_errors
+        }
+
+
+def create_quota_store():
+    """Создает хранилище счетчиков по переменным окружения"""
+    backend_name = os.getenv("QUOTA_STORE_BACKEND", "local").lower()
+    if backend_name == "redis":
+        url = os.getenv("QUOTA_REDIS_URL") or os.getenv("REDIS_URL", "redis://localhost:6379/0")
+        try:
+            return RedisQuotaStore(url)
+        except ImportError as e:
+            logger.warning(f"{e}, используются локальные счетчики квот")
+    return LocalQuotaStore()
+
+
+_engine: Optional[QuotaEngine] = None
+_engine_pid: Optional[int] = None
+_engine_lock = threading.Lock()
+
+
+def get_quota_engine() -> QuotaEngine:
+    """
+    Возвращает движок квот процесса
+
+    Фоновый поток не переживает fork, поэтому в каждом gunicorn worker
+    создается свой движок (счетчики в Redis при этом общие).
+    """
+    global _engine, _engine_pid
+
+    pid = os.getpid()
+    if _engine is None or _engine_pid != pid:
+        with _engine_lock:
+            if _engine is None or _engine_pid != pid:
+                _engine = QuotaEngine(create_quota_store())
+                _engine_pid = pid
+                atexit.register(_engine.close)
+    return _engine
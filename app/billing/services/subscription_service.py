@@ -18,6 +18,12 @@ from app.billing.models.subscription import (
 logger = logging.getLogger(__name__)
 
 
+def _invalidate_quota(user_id):
+    """Сбрасывает кэш лимитов QuotaEngine после изменения подписки"""
+    from app.billing.services.quota_engine import get_quota_engine
+    get_quota_engine().invalidate_user(user_id)
+
+
 @dataclass
 class UsageStats:
     """Статистика использования"""
@@ -154,6 +160,7 @@ class SubscriptionService:
             
             self.db.add(subscription)
             self.db.commit()
+            _invalidate_quota(user_id)
             
             # Создаем событие
             self._create_billing_event(
@@ -214,6 +221,7 @@ class SubscriptionService:
                 subscription.expires_at = expires_at
             
             self.db.commit()
+            _invalidate_quota(subscription.user_id)
             
             # Создаем событие
             self._create_billing_event(
@@ -279,6 +287,7 @@ class SubscriptionService:
                     payment.paid_at = datetime.utcnow()
             
             self.db.commit()
+            _invalidate_quota(subscription.user_id)
             
             # Создаем событие
             self._create_billing_event(
@@ -319,6 +328,7 @@ class SubscriptionService:
             subscription.updated_at = datetime.utcnow()
             
             self.db.commit()
+            _invalidate_quota(subscription.user_id)
             
             # Создаем событие
             self._create_billing_event(
@@ -422,7 +432,7 @@ class SubscriptionService:
                 quantity=quantity,
                 period_start=subscription.starts_at,
                 period_end=subscription.expires_at,
-                metadata=metadata or {}
+                meta_data=metadata or {}
             )
             
             self.db.add(usage_record)
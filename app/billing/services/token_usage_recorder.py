@@ -0,0 +1,389 @@
+"""
+Буферизованная запись расхода AI токенов
+Вызов record() только кладет запись в очередь в памяти и сразу возвращает
+request_id - запись в token_usage не стоит на пути генерации. Фоновый поток
+пишет очередь пачками: multi-row INSERT на PostgreSQL (insertmanyvalues),
+executemany на SQLite, с ON CONFLICT DO NOTHING по request_id, поэтому
+повторная запись пачки безопасна.
+
+Если БД недоступна или очередь переполнена, записи дописываются в локальный
+JSONL-файл (spill) и повторно отправляются при следующих сбросах - расход
+не теряется. При остановке процесса очередь сбрасывается (atexit).
+Spill-файл общий для процессов (gunicorn workers): дозапись и повторная
+отправка защищены файловыми блокировками (fcntl.flock).
+"""
+
+import atexit
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import insert
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.models.content import TokenUsageDB
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировка только внутри процесса
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+# Поля, которые можно передать в record() помимо обязательных
+_OPTIONAL_COLUMNS = {
+    "content_id", "workflow_id", "endpoint", "platform", "content_type", "task_type",
+    "execution_time_ms", "request_metadata", "response_metadata"
+}
+
+
+def new_request_id() -> str:
+    """Уникальный request_id записи расхода"""
+    return uuid.uuid4().hex
+
+
+@contextmanager
+def _file_lock(path: str, blocking: bool = True):
+    """
+    Межпроцессная блокировка на файле path (flock)
+
+    Возвращает True, если блокировка взята; с blocking=False - False, когда
+    она занята другим процессом.
+    """
+    if fcntl is None:
+        yield True
+        return
+    with open(path, "a") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class TokenUsageRecorder:
+    """Очередь записей token_usage с фоновым пакетным сбросом"""
+
+    def __init__(self, session_factory: Callable = None, capacity: int = None, batch_size: int = None,
+                 flush_interval: float = None, block_timeout: float = None, spill_path: str = None):
+        """
+        Args:
+            session_factory: фабрика сессий БД (по умолчанию get_db_session)
+            capacity: максимум записей в очереди
+            batch_size: записей в одном INSERT
+            flush_interval: максимальная задержка записи в секундах
+            block_timeout: сколько record() ждет места в полной очереди, прежде чем
+                           сбросить запись в spill-файл
+            spill_path: файл для записей, которые не удалось записать в БД
+        """
+        self._session_factory = session_factory
+        self.capacity = capacity or int(os.getenv("TOKEN_USAGE_BUFFER_CAPACITY", "10000"))
+        self.batch_size = batch_size or int(os.getenv("TOKEN_USAGE_BATCH_SIZE", "500"))
+        self.flush_interval = flush_interval if flush_interval is not None else float(
+            os.getenv("TOKEN_USAGE_FLUSH_INTERVAL", "1.0")
+        )
+        self.block_timeout = block_timeout if block_timeout is not None else float(
+            os.getenv("TOKEN_USAGE_BLOCK_TIMEOUT", "0.5")
+        )
+        self.spill_path = spill_path or os.getenv(
+            "TOKEN_USAGE_SPILL_PATH", os.path.join(tempfile.gettempdir(), "token_usage_spill.jsonl")
+        )
+
+        self._queue: "deque[Dict[str, Any]]" = deque()
+        self._cond = threading.Condition()
+        self._spill_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+
+        # Метрики
+        self.recorded = 0
+        self.written = 0
+        self.batches = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.errors = 0
+        self.max_queue_depth = 0
+        self.last_flush_ms: Optional[float] = None
+
+    # ==================== ЗАПИСЬ ====================
+
+    def record(self, user_id: int, agent_id: str, ai_provider: str, ai_model: str,
+               prompt_tokens: int, completion_tokens: int, cost_usd: float, cost_rub: float,
+               request_id: Optional[str] = None, **fields) -> str:
+        """
+        Ставит запись в очередь (не блокирует, пока в очереди есть место)
+
+        Дополнительные поля - те же, что у TokenUsageService.record_token_usage
+        (content_id, workflow_id, endpoint, platform, execution_time_ms, ...).
+
+        Returns:
+            request_id записи
+        """
+        unknown = set(fields) - _OPTIONAL_COLUMNS
+        if unknown:
+            raise TypeError(f"Неизвестные поля token_usage: {sorted(unknown)}")
+
+        # Все строки пачки должны иметь одинаковый набор ключей (executemany)
+        row = {
+            **{column: fields.get(column) for column in _OPTIONAL_COLUMNS},
+            "user_id": user_id,
+            "agent_id": agent_id,
+            "ai_provider": ai_provider,
+            "ai_model": ai_model,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "cost_usd": cost_usd,
+            "cost_rub": cost_rub,
+            "request_id": request_id or new_request_id(),
+            "request_metadata": fields.get("request_metadata") or {},
+            "response_metadata": fields.get("response_metadata") or {},
+            "created_at": datetime.utcnow()
+        }
+        self._ensure_started()
+
+        with self._cond:
+            if len(self._queue) >= self.capacity:
+                # Backpressure: немного ждем сброса, затем - в spill-файл
+                self._cond.notify_all()
+                self._cond.wait_for(lambda: len(self._queue) < self.capacity, self.block_timeout)
+            if len(self._queue) < self.capacity:
+                self._queue.append(row)
+                self.recorded += 1
+                self.max_queue_depth = max(self.max_queue_depth, len(self._queue))
+                if len(self._queue) >= self._flush_threshold:
+                    self._cond.notify_all()
+                return row["request_id"]
+
+        logger.warning(f"Очередь token_usage переполнена ({self.capacity}), запись сохранена в spill-файл")
+        self.recorded += 1
+        self._spill([row])
+        return row["request_id"]
+
+    # ==================== СБРОС ====================
+
+    def flush(self) -> int:
+        """
+        Синхронно записывает всю очередь и spill-файл
+
+        Returns:
+            Количество записанных в БД записей
+        """
+        # Фоновый поток и close()/ручной flush не должны повторять один spill-файл
+        with self._flush_lock:
+            written = self._replay_spill()
+            while True:
+                batch = self._take_batch()
+                if not batch:
+                    return written
+                written += self._write_batch(batch)
+
+    @property
+    def _flush_threshold(self) -> int:
+        return min(self.batch_size, self.capacity)
+
+    def _take_batch(self) -> List[Dict[str, Any]]:
+        with self._cond:
+            batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+            if batch:
+                self._cond.notify_all()  # место освободилось - будим ждущие record()
+            return batch
+
+    def _write_batch(self, batch: List[Dict[str, Any]], spill_on_error: bool = True) -> int:
+        started = time.monotonic()
+        db = None
+        try:
+            db = self._new_session()
+            db.execute(self._insert_statement(db), batch)
+            db.commit()
+        except Exception as e:
+            if db is not None:
+                db.rollback()
+            self.errors += 1
+            logger.error(f"Не удалось записать {len(batch)} записей token_usage: {e}")
+            if spill_on_error:
+                self._spill(batch)
+            return 0
+        finally:
+            if db is not None:
+                db.close()
+
+        self.written += len(batch)
+        self.batches += 1
+        self.last_flush_ms = round((time.monotonic() - started) * 1000, 1)
+        return len(batch)
+
+    def _insert_statement(self, db):
+        """INSERT, пропускающий уже записанные request_id (повтор после spill)"""
+        dialect = db.get_bind().dialect.name
+        if dialect == "postgresql":
+            return postgresql.insert(TokenUsageDB.__table__).on_conflict_do_nothing(index_elements=["request_id"])
+        if dialect == "sqlite":
+            return sqlite.insert(TokenUsageDB.__table__).on_conflict_do_nothing(index_elements=["request_id"])
+        return insert(TokenUsageDB.__table__)
+
+    def _new_session(self):
+        if self._session_factory is None:
+            from app.database.connection import get_db_session
+            self._session_factory = get_db_session
+        return self._session_factory()
+
+    # ==================== SPILL ====================
+
+    def _spill(self, rows: List[Dict[str, Any]]):
+        """Дописывает записи в spill-файл (fsync - переживает падение процесса)"""
+        with self._spill_lock:
+            try:
+                # Другой процесс может в этот момент забирать файл на повторную отправку
+                with _file_lock(self.spill_path + ".lock"):
+                    with open(self.spill_path, "a", encoding="utf-8") as f:
+                        for row in rows:
+                            f.write(json.dumps(row, default=_json_default, ensure_ascii=False) + "\n")
+                        f.flush()
+                        os.fsync(f.fileno())
+                self.spilled += len(rows)
+            except OSError as e:
+                self.errors += 1
+                logger.critical(f"Потеряно {len(rows)} записей token_usage: не удалось записать spill-файл: {e}")
+
+    def _replay_spill(self) -> int:
+        """Отправляет в БД записи из spill-файла; файл удаляется после успешной записи"""
+        if not os.path.exists(self.spill_path) and not os.path.exists(self.spill_path + ".replay"):
+            return 0
+        # Повторную отправку ведет один процесс; остальные пропускают этот сброс
+        with _file_lock(self.spill_path + ".replay.lock", blocking=False) as locked:
+            if not locked:
+                return 0
+            return self._replay_spill_locked()
+
+    def _replay_spill_locked(self) -> int:
+        replay_path = self.spill_path + ".replay"
+        with self._spill_lock:
+            if not os.path.exists(replay_path):
+                # Под блокировкой дозаписи: строки не попадут в уже забранный файл
+                with _file_lock(self.spill_path + ".lock"):
+                    if not os.path.exists(self.spill_path):
+                        return 0
+                    os.replace(self.spill_path, replay_path)
+
+        rows = []
+        with open(replay_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    continue  # строка, оборванная падением процесса
+                row["created_at"] = datetime.fromisoformat(row["created_at"])
+                rows.append(row)
+
+        written = 0
+        for start in range(0, len(rows), self.batch_size):
+            batch = rows[start:start + self.batch_size]
+            if not self._write_batch(batch, spill_on_error=False) and batch:
+                # БД все еще недоступна - файл останется до следующего сброса
+                return written
+            written += len(batch)
+
+        os.remove(replay_path)
+        self.replayed += written
+        if written:
+            logger.info(f"Из spill-файла записано {written} записей token_usage")
+        return written
+
+    # ==================== ФОНОВЫЙ ПОТОК ====================
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._cond:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping = False
+                self._thread = threading.Thread(target=self._run, name="TokenUsageRecorder", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self._stopping or len(self._queue) >= self._flush_threshold,
+                    self.flush_interval
+                )
+                stopping = self._stopping
+            try:
+                self.flush()
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Ошибка сброса token_usage: {e}", exc_info=True)
+            if stopping:
+                return
+
+    def close(self, timeout: float = 10.0):
+        """Останавливает фоновый поток и записывает остаток очереди"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+        # Если поток не успел - то, что осталось в очереди, сохраняем в файл
+        remaining = self._take_batch()
+        while remaining:
+            self._spill(remaining)
+            remaining = self._take_batch()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": len(self._queue),
+            "max_queue_depth": self.max_queue_depth,
+            "capacity": self.capacity,
+            "recorded": self.recorded,
+            "written": self.written,
+            "batches": self.batches,
+            "spilled": self.spilled,
+            "replayed": self.replayed,
+            "errors": self.errors,
+            "last_flush_ms": self.last_flush_ms
+        }
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+_recorder: Optional[TokenUsageRecorder] = None
+_recorder_pid: Optional[int] = None
+_recorder_lock = threading.Lock()
+
+
+def get_token_usage_recorder() -> TokenUsageRecorder:
+    """
+    Возвращает recorder процесса
+
+    Поток сброса не переживает fork, поэтому в каждом gunicorn worker
+    создается свой recorder.
+    """
+    global _recorder, _recorder_pid
+
+    pid = os.getpid()
+    if _recorder is None or _recorder_pid != pid:
+        with _recorder_lock:
+            if _recorder is None or _recorder_pid != pid:
+                _recorder = TokenUsageRecorder()
+                _recorder_pid = pid
+                atexit.register(_recorder.close)
+    return _recorder
@@ -0,0 +1,141 @@
+"""
+Дневные агрегаты расхода AI токенов (token_usage_daily)
+Дашборды ЛК не сканируют token_usage целиком: закрытые дни читаются из
+token_usage_daily (пользователь x день x агент x модель), а сырые записи
+досчитываются только после последнего агрегированного дня ("хвост" -
+обычно текущие сутки).
+
+Агрегаты строит TokenUsageRollupService.compact(): каждый день
+пересчитывается целиком (DELETE + INSERT ... SELECT в одной транзакции),
+поэтому повторный запуск безопасен. Последние lookback_days дней
+пересчитываются при каждом запуске - так учитываются записи, дошедшие с
+опозданием (например, из spill-файла TokenUsageRecorder).
+"""
+
+import logging
+import os
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, Optional
+
+from sqlalchemy import Date, DateTime, func, insert, literal, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.models.content import TokenUsageDB, TokenUsageDailyDB
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOOKBACK_DAYS = int(os.getenv("TOKEN_USAGE_ROLLUP_LOOKBACK_DAYS", "2"))
+
+# Колонки агрегата и их вычисление по token_usage
+_ROLLUP_COLUMNS = (
+    "user_id", "usage_date", "agent_id", "ai_provider", "ai_model",
+    "requests_count", "prompt_tokens", "completion_tokens", "total_tokens", "cost_usd", "cost_rub",
+    "execution_time_ms_sum", "execution_time_count", "updated_at"
+)
+
+
+def day_start(day: date) -> datetime:
+    """Начало суток (UTC) как datetime - граница для created_at"""
+    return datetime.combine(day, time.min)
+
+
+class TokenUsageRollupService:
+    """Построение и чтение границы дневных агрегатов token_usage"""
+
+    def __init__(self, db_session: Session):
+        self.db = db_session
+
+    def rolled_up_through(self) -> Optional[date]:
+        """
+        Последний агрегированный день
+
+        Все дни до него включительно читаются из token_usage_daily, более
+        поздние - из token_usage. None - агрегатов еще нет.
+        """
+        return self.db.query(func.max(TokenUsageDailyDB.usage_date)).scalar()
+
+    def compact(self, lookback_days: Optional[int] = None, today: Optional[date] = None) -> Dict[str, Any]:
+        """
+        Агрегирует закрытые дни (до вчера включительно)
+
+        Args:
+            lookback_days: сколько последних закрытых дней пересчитывать повторно
+            today: текущая дата UTC (для тестов)
+
+        Returns:
+            Количество пересчитанных дней и записанных строк агрегатов
+        """
+        lookback_days = DEFAULT_LOOKBACK_DAYS if lookback_days is None else lookback_days
+        today = today or datetime.utcnow().date()
+        last_closed = today - timedelta(days=1)
+
+        watermark = self.rolled_up_through()
+        if watermark is None:
+            # Первый запуск - backfill всей истории
+            first_usage = self.db.query(func.min(TokenUsageDB.created_at)).scalar()
+            if first_usage is None:
+                return {"days": 0, "rows": 0}
+            start = first_usage.date()
+        else:
+            start = min(watermark + timedelta(days=1), last_closed - timedelta(days=max(lookback_days, 1) - 1))
+
+        days = rows = 0
+        day = start
+        while day <= last_closed:
+            rows += self.rebuild_day(day)
+            days += 1
+            day += timedelta(days=1)
+
+        if days:
+            logger.info(f"Агрегаты token_usage пересчитаны: {days} дн., {rows} строк")
+        return {"days": days, "rows": rows}
+
+    def rebuild_day(self, day: date) -> int:
+        """
+        Пересчитывает агрегаты одного дня
+
+        Returns:
+            Количество строк агрегатов за день
+        """
+        raw = TokenUsageDB
+        source = select(
+            raw.user_id,
+            literal(day, Date),
+            raw.agent_id,
+            raw.ai_provider,
+            raw.ai_model,
+            func.count(raw.id),
+            func.coalesce(func.sum(raw.prompt_tokens), 0),
+            func.coalesce(func.sum(raw.completion_tokens), 0),
+            func.coalesce(func.sum(raw.total_tokens), 0),
+            func.coalesce(func.sum(raw.cost_usd), 0.0),
+            func.coalesce(func.sum(raw.cost_rub), 0.0),
+            func.coalesce(func.sum(raw.execution_time_ms), 0),
+            func.count(raw.execution_time_ms),
+            literal(datetime.utcnow(), DateTime)
+        ).where(
+            raw.created_at >= day_start(day),
+            raw.created_at < day_start(day + timedelta(days=1))
+        ).group_by(
+            raw.user_id, raw.agent_id, raw.ai_provider, raw.ai_model
+        )
+
+        try:
+            self.db.query(TokenUsageDailyDB).filter(
+                TokenUsageDailyDB.usage_date == day
+            ).delete(synchronize_session=False)
+            result = self.db.execute(
+                insert(TokenUsageDailyDB.__table__).from_select(list(_ROLLUP_COLUMNS), source)
+            )
+            self.db.commit()
+        except IntegrityError:
+            # Тот же день одновременно пересчитал другой процесс
+            self.db.rollback()
+            logger.debug(f"Агрегаты token_usage за {day} уже пересчитаны другим процессом")
+            return 0
+        except Exception:
+            self.db.rollback()
+            raise
+
+        return max(result.rowcount or 0, 0)
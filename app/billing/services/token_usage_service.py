@@ -4,15 +4,37 @@
 """
 
 import logging
-from datetime import datetime, timedelta
-from typing import Dict, Any, List, Optional
-from sqlalchemy import func, and_
+from datetime import date, datetime, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 
-from app.models.content import TokenUsageDB
+from app.billing.services.token_usage_recorder import new_request_id
+from app.billing.services.token_usage_rollup import TokenUsageRollupService, day_start
+from app.models.content import TokenUsageDB, TokenUsageDailyDB
 
 logger = logging.getLogger(__name__)
 
+# Метрики, суммируемые из token_usage_daily и token_usage
+_METRICS = (
+    "requests_count", "prompt_tokens", "completion_tokens", "total_tokens", "cost_rub",
+    "execution_time_ms_sum", "execution_time_count"
+)
+
+_UNSET = object()
+
+
+def _period_start(days: int) -> datetime:
+    """Начало периода в днях - с полуночи, чтобы совпадать с дневными агрегатами"""
+    return day_start(datetime.utcnow().date() - timedelta(days=days))
+
+
+def _normalize_key(name: str, value: Any) -> Any:
+    # date() в SQLite возвращает строку, в PostgreSQL - date
+    if name == "usage_date" and isinstance(value, str):
+        return date.fromisoformat(value)
+    return value
+
 
 class TokenUsageService:
     """Сервис для агрегации и отображения статистики токенов"""
@@ -29,57 +51,17 @@ class TokenUsageService:
             now = datetime.utcnow()
             today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
             month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-            
-            # Сегодня
-            today_stats = self.db.query(
-                func.sum(TokenUsageDB.total_tokens).label('total_tokens'),
-                func.sum(TokenUsageDB.cost_rub).label('cost_rub'),
-                func.count(TokenUsageDB.id).label('requests_count')
-            ).filter(
-                and_(
-                    TokenUsageDB.user_id == user_id,
-                    TokenUsageDB.created_at >= today_start
-                )
-            ).first()
-            
-            # Этот месяц
-            month_stats = self.db.query(
-                func.sum(TokenUsageDB.total_tokens).label('total_tokens'),
-                func.sum(TokenUsageDB.cost_rub).label('cost_rub'),
-                func.count(TokenUsageDB.id).label('requests_count')
-            ).filter(
-                and_(
-                    TokenUsageDB.user_id == user_id,
-                    TokenUsageDB.created_at >= month_start
-                )
-            ).first()
-            
-            # Всего
-            total_stats = self.db.query(
-                func.sum(TokenUsageDB.total_tokens).label('total_tokens'),
-                func.sum(TokenUsageDB.cost_rub).label('cost_rub'),
-                func.count(TokenUsageDB.id).label('requests_count')
-            ).filter(
-                TokenUsageDB.user_id == user_id
-            ).first()
-            
-            return {
-                "today": {
-                    "total_tokens": int(today_stats.total_tokens or 0),
-                    "cost_rub": float(today_stats.cost_rub or 0),
-                    "requests_count": int(today_stats.requests_count or 0)
-                },
-                "this_month": {
-                    "total_tokens": int(month_stats.total_tokens or 0),
-                    "cost_rub": float(month_stats.cost_rub or 0),
-                    "requests_count": int(month_stats.requests_count or 0)
-                },
-                "all_time": {
-                    "total_tokens": int(total_stats.total_tokens or 0),
-                    "cost_rub": float(total_stats.cost_rub or 0),
-                    "requests_count": int(total_stats.requests_count or 0)
+            watermark = TokenUsageRollupService(self.db).rolled_up_through()
+            
+            summary = {}
+            for period, start in (("today", today_start), ("this_month", month_start), ("all_time", None)):
+                totals = self._aggregate(user_id, start, (), watermark=watermark).get((), {})
+                summary[period] = {
+                    "total_tokens": int(totals.get("total_tokens", 0)),
+                    "cost_rub": float(totals.get("cost_rub", 0)),
+                    "requests_count": int(totals.get("requests_count", 0))
                 }
-            }
+            return summary
             
         except Exception as e:
             logger.error(f"Error getting token summary for user {user_id}: {e}")
@@ -100,41 +82,18 @@ class TokenUsageService:
         Для графиков в frontend
         """
         try:
-            end_date = datetime.utcnow()
-            start_date = end_date - timedelta(days=days)
-            
-            query = self.db.query(
-                func.date(TokenUsageDB.created_at).label('date'),
-                func.sum(TokenUsageDB.total_tokens).label('total_tokens'),
-                func.sum(TokenUsageDB.prompt_tokens).label('prompt_tokens'),
-                func.sum(TokenUsageDB.completion_tokens).label('completion_tokens'),
-                func.sum(TokenUsageDB.cost_rub).label('cost_rub'),
-                func.count(TokenUsageDB.id).label('requests_count')
-            ).filter(
-                and_(
-                    TokenUsageDB.user_id == user_id,
-                    TokenUsageDB.created_at >= start_date,
-                    TokenUsageDB.created_at <= end_date
-                )
-            )
-            
-            if agent_id:
-                query = query.filter(TokenUsageDB.agent_id == agent_id)
-            
-            query = query.group_by(func.date(TokenUsageDB.created_at))
-            query = query.order_by(func.date(TokenUsageDB.created_at))
-            
-            results = query.all()
+            start_date = _period_start(days)
+            rows = self._aggregate(user_id, start_date, ("usage_date",), agent_id=agent_id)
             
             history = []
-            for row in results:
+            for (usage_date,), row in sorted(rows.items()):
                 history.append({
-                    "date": row.date.isoformat(),
-                    "total_tokens": int(row.total_tokens or 0),
-                    "prompt_tokens": int(row.prompt_tokens or 0),
-                    "completion_tokens": int(row.completion_tokens or 0),
-                    "cost_rub": float(row.cost_rub or 0),
-                    "requests_count": int(row.requests_count or 0)
+                    "date": usage_date.isoformat(),
+                    "total_tokens": int(row["total_tokens"]),
+                    "prompt_tokens": int(row["prompt_tokens"]),
+                    "completion_tokens": int(row["completion_tokens"]),
+                    "cost_rub": float(row["cost_rub"]),
+                    "requests_count": int(row["requests_count"])
                 })
             
             return history
@@ -153,35 +112,20 @@ class TokenUsageService:
         Показывает какой агент сколько токенов расходует
         """
         try:
-            start_date = datetime.utcnow() - timedelta(days=period_days)
-            
-            results = self.db.query(
-                TokenUsageDB.agent_id,
-                func.sum(TokenUsageDB.total_tokens).label('total_tokens'),
-                func.sum(TokenUsageDB.cost_rub).label('cost_rub'),
-                func.count(TokenUsageDB.id).label('requests_count'),
-                func.avg(TokenUsageDB.execution_time_ms).label('avg_execution_time_ms')
-            ).filter(
-                and_(
-                    TokenUsageDB.user_id == user_id,
-                    TokenUsageDB.created_at >= start_date
-                )
-            ).group_by(
-                TokenUsageDB.agent_id
-            ).order_by(
-                func.sum(TokenUsageDB.total_tokens).desc()
-            ).all()
+            rows = self._aggregate(user_id, _period_start(period_days), ("agent_id",))
             
             agents_stats = []
-            for row in results:
+            for (agent_id,), row in rows.items():
+                timed = row["execution_time_count"]
                 agents_stats.append({
-                    "agent_id": row.agent_id,
-                    "total_tokens": int(row.total_tokens or 0),
-                    "cost_rub": float(row.cost_rub or 0),
-                    "requests_count": int(row.requests_count or 0),
-                    "avg_execution_time_ms": int(row.avg_execution_time_ms or 0)
+                    "agent_id": agent_id,
+                    "total_tokens": int(row["total_tokens"]),
+                    "cost_rub": float(row["cost_rub"]),
+                    "requests_count": int(row["requests_count"]),
+                    "avg_execution_time_ms": int(row["execution_time_ms_sum"] / timed) if timed else 0
                 })
             
+            agents_stats.sort(key=lambda item: item["total_tokens"], reverse=True)
             return agents_stats
             
         except Exception as e:
@@ -198,42 +142,112 @@ class TokenUsageService:
         Показывает расход по OpenAI, Anthropic и конкретным моделям
         """
         try:
-            start_date = datetime.utcnow() - timedelta(days=period_days)
-            
-            results = self.db.query(
-                TokenUsageDB.ai_provider,
-                TokenUsageDB.ai_model,
-                func.sum(TokenUsageDB.total_tokens).label('total_tokens'),
-                func.sum(TokenUsageDB.cost_rub).label('cost_rub'),
-                func.count(TokenUsageDB.id).label('requests_count')
-            ).filter(
-                and_(
-                    TokenUsageDB.user_id == user_id,
-                    TokenUsageDB.created_at >= start_date
-                )
-            ).group_by(
-                TokenUsageDB.ai_provider,
-                TokenUsageDB.ai_model
-            ).order_by(
-                func.sum(TokenUsageDB.cost_rub).desc()
-            ).all()
+            rows = self._aggregate(user_id, _period_start(period_days), ("ai_provider", "ai_model"))
             
             models_stats = []
-            for row in results:
+            for (ai_provider, ai_model), row in rows.items():
                 models_stats.append({
-                    "ai_provider": row.ai_provider,
-                    "ai_model": row.ai_model,
-                    "total_tokens": int(row.total_tokens or 0),
-                    "cost_rub": float(row.cost_rub or 0),
-                    "requests_count": int(row.requests_count or 0)
+                    "ai_provider": ai_provider,
+                    "ai_model": ai_model,
+                    "total_tokens": int(row["total_tokens"]),
+                    "cost_rub": float(row["cost_rub"]),
+                    "requests_count": int(row["requests_count"])
                 })
             
+            models_stats.sort(key=lambda item: item["cost_rub"], reverse=True)
             return models_stats
             
         except Exception as e:
             logger.error(f"Error getting model usage for user {user_id}: {e}")
             return []
     
+    def _aggregate(
+        self,
+        user_id: int,
+        start: Optional[datetime],
+        group_by: Tuple[str, ...],
+        agent_id: Optional[str] = None,
+        watermark: Any = _UNSET
+    ) -> Dict[tuple, Dict[str, float]]:
+        """
+        Суммы расхода с start (None - за все время), сгруппированные по group_by
+        
+        Дни до последнего агрегированного включительно читаются из
+        token_usage_daily, остаток - из token_usage (обычно только текущие сутки).
+        
+        Args:
+            group_by: поля из usage_date, agent_id, ai_provider, ai_model
+            watermark: результат rolled_up_through(), если уже известен
+        
+        Returns:
+            {значения group_by: {метрика: сумма}}
+        """
+        if watermark is _UNSET:
+            watermark = TokenUsageRollupService(self.db).rolled_up_through()
+        
+        totals: Dict[tuple, Dict[str, float]] = {}
+        
+        def merge(rows):
+            for row in rows:
+                key = tuple(_normalize_key(name, getattr(row, name)) for name in group_by)
+                bucket = totals.setdefault(key, dict.fromkeys(_METRICS, 0))
+                for metric in _METRICS:
+                    bucket[metric] += getattr(row, metric) or 0
+        
+        tail_start = start
+        if watermark is not None:
+            rollup_end = day_start(watermark + timedelta(days=1))
+            tail_start = max(start, rollup_end) if start is not None else rollup_end
+        
+        if watermark is not None and (start is None or start.date() <= watermark):
+            daily = TokenUsageDailyDB
+            keys = [getattr(daily, name).label(name) for name in group_by]
+            query = self.db.query(
+                *keys,
+                func.sum(daily.requests_count).label("requests_count"),
+                func.sum(daily.prompt_tokens).label("prompt_tokens"),
+                func.sum(daily.completion_tokens).label("completion_tokens"),
+                func.sum(daily.total_tokens).label("total_tokens"),
+                func.sum(daily.cost_rub).label("cost_rub"),
+                func.sum(daily.execution_time_ms_sum).label("execution_time_ms_sum"),
+                func.sum(daily.execution_time_count).label("execution_time_count")
+            ).filter(
+                daily.user_id == user_id,
+                daily.usage_date <= watermark
+            )
+            if start is not None:
+                query = query.filter(daily.usage_date >= start.date())
+            if agent_id:
+                query = query.filter(daily.agent_id == agent_id)
+            merge(query.group_by(*keys).all() if keys else query.all())
+        
+        raw = TokenUsageDB
+        raw_columns = {
+            "usage_date": func.date(raw.created_at),
+            "agent_id": raw.agent_id,
+            "ai_provider": raw.ai_provider,
+            "ai_model": raw.ai_model
+        }
+        keys = [raw_columns[name].label(name) for name in group_by]
+        query = self.db.query(
+            *keys,
+            func.count(raw.id).label("requests_count"),
+            func.sum(raw.prompt_tokens).label("prompt_tokens"),
+            func.sum(raw.completion_tokens).label("completion_tokens"),
+            func.sum(raw.total_tokens).label("total_tokens"),
+            func.sum(raw.cost_rub).label("cost_rub"),
+            func.sum(raw.execution_time_ms).label("execution_time_ms_sum"),
+            func.count(raw.execution_time_ms).label("execution_time_count")
+        ).filter(raw.user_id == user_id)
+        if tail_start is not None:
+            query = query.filter(raw.created_at >= tail_start)
+        if agent_id:
+            query = query.filter(raw.agent_id == agent_id)
+        merge(query.group_by(*keys).all() if keys else query.all())
+        
+        # Пустые группы (агрегаты без строк за период) не возвращаем
+        return {key: row for key, row in totals.items() if row["requests_count"]}
+    
     def get_detailed_usage(
         self,
         user_id: int,
@@ -324,8 +338,10 @@ class TokenUsageService:
         response_metadata: Optional[Dict] = None
     ) -> Optional[TokenUsageDB]:
         """
-        Записать использование токенов
-        Вызывается после каждого запроса к AI
+        Записать использование токенов синхронно (INSERT + commit)
+        
+        На пути запроса к AI используйте get_token_usage_recorder().record(...) -
+        он пишет пачками в фоне.
         """
         try:
             usage_record = TokenUsageDB(
@@ -333,7 +349,7 @@ class TokenUsageService:
                 content_id=content_id,
                 workflow_id=workflow_id,
                 agent_id=agent_id,
-                request_id=request_id or f"{user_id}_{datetime.utcnow().timestamp()}",
+                request_id=request_id or new_request_id(),
                 endpoint=endpoint,
                 ai_provider=ai_provider,
                 ai_model=ai_model,
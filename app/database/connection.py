@@ -4,9 +4,15 @@ Database connection and initialization
 
 import os
 import logging
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker, declarative_base
-from sqlalchemy.pool import StaticPool
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+from sqlalchemy import create_engine, event, exc, text
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
+from sqlalchemy.pool import NullPool, QueuePool, StaticPool
 
 logger = logging.getLogger(__name__)
 
@@ -44,28 +50,210 @@ def get_database_url():
     # For development, use SQLite
     return 'sqlite:///./content_curator.db'
 
+def get_pool_settings() -> Dict[str, Any]:
+    """
+    Connection pool sizing for one process (gunicorn worker)
+
+    Every worker wants a connection per request thread (GUNICORN_THREADS) plus
+    DB_POOL_BACKGROUND_CONNECTIONS for workers, write-behind threads and the
+    shared event loop. The instance budget DB_MAX_CONNECTIONS_PER_INSTANCE
+    (default 20, 0 - no cap) is split evenly across GUNICORN_WORKERS and caps
+    pool + overflow of each worker, so that instances x budget stays under the
+    Cloud SQL max_connections. With the defaults (2 workers x 8 threads) each
+    worker gets pool_size=10 and no overflow: 20 connections per instance,
+    below the 2 x (5 + 10) = 30 of SQLAlchemy's default pool.
+    """
+    threads = int(os.getenv('GUNICORN_THREADS', '8'))
+    workers = int(os.getenv('GUNICORN_WORKERS', '2'))
+    background = int(os.getenv('DB_POOL_BACKGROUND_CONNECTIONS', '4'))
+
+    pool_size = int(os.getenv('DB_POOL_SIZE', str(threads + background)))
+    max_overflow = int(os.getenv('DB_MAX_OVERFLOW', str(max(2, pool_size // 2))))
+
+    budget = int(os.getenv('DB_MAX_CONNECTIONS_PER_INSTANCE', '20'))
+    if budget > 0:
+        per_worker = max(1, budget // max(1, workers))
+        pool_size = min(pool_size, per_worker)
+        max_overflow = max(0, min(max_overflow, per_worker - pool_size))
+
+    return {
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_timeout': float(os.getenv('DB_POOL_TIMEOUT', '10')),
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', '300')),
+    }
+
+
+def is_pgbouncer_mode() -> bool:
+    """DB_PGBOUNCER=true: connections are pooled by PgBouncer (transaction mode)"""
+    return os.getenv('DB_PGBOUNCER', 'false').lower() == 'true'
+
+
+class PoolMetrics:
+    """Checkout statistics of the connection pool (wait time, in-use, overflow, timeouts)"""
+
+    def __init__(self, slow_wait_ms: float = None):
+        self.slow_wait_ms = slow_wait_ms if slow_wait_ms is not None else float(
+            os.getenv('DB_POOL_SLOW_WAIT_MS', '100')
+        )
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.in_use = 0
+            self.max_in_use = 0
+            self.overflow_events = 0
+            self.timeouts = 0
+            self.slow_waits = 0
+            self.wait_ms_total = 0.0
+            self.wait_ms_max = 0.0
+            self.hold_ms_total = 0.0
+            self.hold_ms_max = 0.0
+            self.checkins = 0
+            self.connects = 0
+
+    def record_wait(self, wait_ms: float):
+        with self._lock:
+            self.wait_ms_total += wait_ms
+            self.wait_ms_max = max(self.wait_ms_max, wait_ms)
+            slow = wait_ms >= self.slow_wait_ms
+            if slow:
+                self.slow_waits += 1
+        if slow:
+            logger.warning(f"DB pool checkout waited {wait_ms:.0f} ms (in use: {self.in_use})")
+
+    def record_timeout(self, wait_ms: float):
+        with self._lock:
+            self.timeouts += 1
+            self.wait_ms_total += wait_ms
+            self.wait_ms_max = max(self.wait_ms_max, wait_ms)
+        logger.error(f"DB pool exhausted: checkout timed out after {wait_ms:.0f} ms (in use: {self.in_use})")
+
+    def record_overflow(self):
+        with self._lock:
+            self.overflow_events += 1
+
+    def on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connects += 1
+
+    def on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        connection_record.info['checked_out_at'] = time.monotonic()
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.max_in_use = max(self.max_in_use, self.in_use)
+
+    def on_checkin(self, dbapi_connection, connection_record):
+        checked_out_at = connection_record.info.pop('checked_out_at', None)
+        if checked_out_at is None:
+            return
+        hold_ms = (time.monotonic() - checked_out_at) * 1000
+        with self._lock:
+            self.checkins += 1
+            self.in_use -= 1
+            self.hold_ms_total += hold_ms
+            self.hold_ms_max = max(self.hold_ms_max, hold_ms)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'checkouts': self.checkouts,
+                'in_use': self.in_use,
+                'max_in_use': self.max_in_use,
+                'connects': self.connects,
+                'overflow_events': self.overflow_events,
+                'timeouts': self.timeouts,
+                'slow_waits': self.slow_waits,
+                'avg_wait_ms': round(self.wait_ms_total / self.checkouts, 2) if self.checkouts else 0.0,
+                'max_wait_ms': round(self.wait_ms_max, 2),
+                'avg_hold_ms': round(self.hold_ms_total / self.checkins, 2) if self.checkins else 0.0,
+                'max_hold_ms': round(self.hold_ms_max, 2),
+            }
+
+
+pool_metrics = PoolMetrics()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that measures how long a checkout waits for a connection
+
+    Only the public Pool.connect() is wrapped (the time includes opening a new
+    connection and the pre-ping); overflow is counted by the 'connect' pool
+    event in instrument_engine().
+    """
+
+    def connect(self):
+        started = time.monotonic()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            pool_metrics.record_timeout((time.monotonic() - started) * 1000)
+            raise
+        pool_metrics.record_wait((time.monotonic() - started) * 1000)
+        return connection
+
+
+def instrument_engine(db_engine):
+    """Attaches PoolMetrics listeners to the engine pool"""
+    pool = db_engine.pool
+    event.listen(db_engine, 'connect', pool_metrics.on_connect)
+    event.listen(db_engine, 'checkout', pool_metrics.on_checkout)
+    event.listen(db_engine, 'checkin', pool_metrics.on_checkin)
+
+    if isinstance(pool, QueuePool):
+        @event.listens_for(db_engine, 'connect')
+        def count_overflow(dbapi_connection, connection_record):
+            # overflow() starts at -pool_size: positive values are connections above pool_size
+            if pool.overflow() > 0:
+                pool_metrics.record_overflow()
+
+
+def create_db_engine(database_url: str):
+    """Creates the engine: StaticPool for SQLite, NullPool behind PgBouncer, tuned QueuePool otherwise"""
+    echo = os.getenv('DB_ECHO', 'false').lower() == 'true'
+
+    if database_url.startswith('sqlite'):
+        return create_engine(
+            database_url,
+            connect_args={"check_same_thread": False},
+            poolclass=StaticPool,
+            echo=echo
+        )
+
+    if is_pgbouncer_mode():
+        # PgBouncer already pools server connections: keeping a second pool in
+        # every worker would pin PgBouncer clients, and pre-ping is an extra
+        # round trip per transaction
+        db_engine = create_engine(database_url, echo=echo, poolclass=NullPool)
+        instrument_engine(db_engine)
+        logger.info("Database pool: NullPool (PgBouncer mode)")
+        return db_engine
+
+    settings = get_pool_settings()
+    db_engine = create_engine(
+        database_url,
+        echo=echo,
+        poolclass=InstrumentedQueuePool,
+        pool_pre_ping=True,
+        pool_use_lifo=True,
+        **settings
+    )
+    instrument_engine(db_engine)
+    logger.info(f"Database pool: size={settings['pool_size']}, overflow={settings['max_overflow']}, "
+                f"timeout={settings['pool_timeout']}s")
+    return db_engine
+
+
 def get_db_connection():
     """Get database connection"""
     global engine, SessionLocal
     
     if engine is None:
         database_url = get_database_url()
-        
-        # Configure engine based on database type
-        if database_url.startswith('sqlite'):
-            engine = create_engine(
-                database_url,
-                connect_args={"check_same_thread": False},
-                poolclass=StaticPool,
-                echo=os.getenv('DB_ECHO', 'false').lower() == 'true'
-            )
-        else:
-            engine = create_engine(
-                database_url,
-                echo=os.getenv('DB_ECHO', 'false').lower() == 'true',
-                pool_pre_ping=True,
-                pool_recycle=300
-            )
+        engine = create_db_engine(database_url)
         
         SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
         
@@ -73,29 +261,251 @@ def get_db_connection():
     
     return engine, SessionLocal
 
+def get_pool_stats() -> Dict[str, Any]:
+    """Pool configuration and checkout metrics for the health endpoint"""
+    if engine is None:
+        return {'status': 'not_connected'}
+    pool = engine.pool
+    stats = {'pool_class': type(pool).__name__, **pool_metrics.get_stats()}
+    if isinstance(pool, QueuePool):
+        stats.update({
+            'size': pool.size(),
+            'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(),
+            'overflow': pool.overflow(),
+            'max_overflow': pool._max_overflow,
+        })
+    return stats
+
+
+# ==================== SCOPED SESSIONS ====================
+
+class ScopedSession(Session):
+    """
+    Session shared by everything running inside one request or worker scope
+
+    Helpers keep calling get_db_session() / close() as before. Inside a scope
+    get_db_session() borrows this session and close() returns its connection
+    to the pool: a read-only transaction is committed without expiring the
+    loaded objects. Uncommitted changes are rolled back only by the outermost
+    borrower (as closing a private session would), nested borrowers leave them
+    to the outer one. The scope closes the session at its end.
+
+    The outer borrower owns the transaction: a helper borrowing the session
+    while the outer one has uncommitted writes runs in a SAVEPOINT. Its
+    commit() releases the savepoint, rollback() and close() with uncommitted
+    changes roll back to it - the outer work is neither committed nor lost.
+    Over a clean outer borrower commit()/rollback() end the transaction as
+    with a private session.
+    """
+
+    def borrow(self) -> 'ScopedSession':
+        borrowers = self.info.get('borrowers', 0)
+        self.info['borrowers'] = borrowers + 1
+        if borrowers and self.info.get('scope_owner') is not None:
+            frame = {'savepoint': None, 'writes': False}
+            if self._has_writes():
+                frame['savepoint'] = self.begin_nested()
+            self.info.setdefault('frames', []).append(frame)
+        return self
+
+    def _has_writes(self) -> bool:
+        return bool(self.new or self.dirty or self.deleted or self.info.get('has_writes'))
+
+    def _savepoint_frame(self) -> Optional[Dict[str, Any]]:
+        frames = self.info.get('frames')
+        if frames and frames[-1]['savepoint'] is not None:
+            return frames[-1]
+        return None
+
+    def _end_savepoint(self, frame: Dict[str, Any], commit: bool, reopen: bool = True):
+        savepoint = frame['savepoint']
+        if savepoint.is_active:
+            if commit:
+                savepoint.commit()
+            else:
+                savepoint.rollback()
+        frame['savepoint'] = self.begin_nested() if reopen else None
+        frame['writes'] = False
+
+    def commit(self):
+        frame = self._savepoint_frame()
+        if frame is None:
+            super().commit()
+        else:
+            self._end_savepoint(frame, commit=True)
+
+    def rollback(self):
+        frame = self._savepoint_frame()
+        if frame is None:
+            super().rollback()
+        else:
+            self._end_savepoint(frame, commit=False)
+
+    def close(self):
+        if self.info.get('scope_owner') is None:
+            super().close()
+            return
+        borrowers = self.info['borrowers'] = max(0, self.info.get('borrowers', 0) - 1)
+        frames = self.info.get('frames') or []
+        while len(frames) > max(0, borrowers - 1):
+            frame = frames.pop()
+            if frame['savepoint'] is not None:
+                discard = bool(self.new or self.dirty or self.deleted or frame['writes'])
+                self._end_savepoint(frame, commit=not discard, reopen=False)
+                # The outer borrower still owns its uncommitted transaction
+                return
+        if not self.in_transaction():
+            return
+        if self._has_writes():
+            if borrowers == 0:
+                super().rollback()
+            return
+        self.release()
+
+    def release(self):
+        """Commits a read-only transaction without expiring objects - the connection goes back to the pool"""
+        expire_on_commit = self.expire_on_commit
+        self.expire_on_commit = False
+        try:
+            super().commit()
+        except Exception:
+            super().rollback()
+        finally:
+            self.expire_on_commit = expire_on_commit
+
+    def end_scope(self):
+        self.info.pop('scope_owner', None)
+        self.info.pop('frames', None)
+        super().close()
+
+
+@event.listens_for(ScopedSession, 'after_flush')
+def _mark_writes(session, flush_context):
+    session.info['has_writes'] = True
+    frames = session.info.get('frames')
+    if frames and frames[-1]['savepoint'] is not None:
+        frames[-1]['writes'] = True
+
+
+@event.listens_for(ScopedSession, 'after_transaction_end')
+def _clear_writes(session, transaction):
+    # Savepoints end inside the outer transaction - its writes are still pending
+    if transaction.parent is None:
+        session.info.pop('has_writes', None)
+
+
+_worker_session: ContextVar[Optional[ScopedSession]] = ContextVar('worker_session', default=None)
+_request_scope_enabled = False
+
+
+def _new_scoped_session() -> ScopedSession:
+    db_engine, _ = get_db_connection()
+    session = ScopedSession(bind=db_engine, autocommit=False, autoflush=False)
+    # Context (and flask.g) is copied into coroutines submitted to the shared
+    # event loop - a session must never be used from a thread it wasn't made in
+    session.info['scope_owner'] = threading.get_ident()
+    return session
+
+
+def _owned(session: Optional[ScopedSession]) -> Optional[ScopedSession]:
+    if session is not None and session.info.get('scope_owner') == threading.get_ident():
+        return session
+    return None
+
+
+def get_scoped_session() -> Optional[ScopedSession]:
+    """Session of the current worker scope or HTTP request, None outside of a scope"""
+    session = _owned(_worker_session.get())
+    if session is not None:
+        return session
+
+    if _request_scope_enabled:
+        from flask import g, has_request_context
+        if has_request_context():
+            session = _owned(g.get('_db_session'))
+            if session is None and '_db_session' not in g:
+                session = g._db_session = _new_scoped_session()
+            return session
+    return None
+
+
+@contextmanager
+def worker_session():
+    """
+    Scope for one worker iteration (or one item): every get_db_session()
+    inside shares one session. Nested scopes reuse the outer session.
+    """
+    existing = _owned(_worker_session.get())
+    if existing is not None:
+        yield existing
+        return
+
+    session = _new_scoped_session()
+    # The scope itself is a borrower: helpers' close() never ends its transaction
+    session.borrow()
+    token = _worker_session.set(session)
+    try:
+        yield session
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        _worker_session.reset(token)
+        session.end_scope()
+
+
+def init_request_sessions(app):
+    """Enables the request-scoped session: one session per request, closed on teardown"""
+    global _request_scope_enabled
+    if os.getenv('DB_REQUEST_SCOPED_SESSION', 'true').lower() != 'true':
+        return
+    _request_scope_enabled = True
+
+    from flask import g
+
+    @app.teardown_request
+    def close_request_session(error=None):
+        session = g.pop('_db_session', None)
+        if session is None:
+            return
+        try:
+            if error is not None:
+                session.rollback()
+        finally:
+            session.end_scope()
+
+
 def get_db_session():
-    """Get database session"""
+    """Get database session (the scoped one inside a request or worker scope)"""
+    session = get_scoped_session()
+    if session is not None:
+        return session.borrow()
     _, SessionLocal = get_db_connection()
     return SessionLocal()
 
+def import_all_models():
+    """Import all models to ensure they are registered in Base.metadata"""
+    from app.auth.models.user import User, UserSession
+    from app.billing.models.subscription import Subscription, Payment, UsageRecord
+    from app.billing.models.agent_subscription import AgentSubscription
+    from app.models.project import Project
+    from app.models.telegram_channels import TelegramChannel
+    from app.models.instagram_accounts import InstagramAccount
+    from app.models.twitter_accounts import TwitterAccount
+    from app.models.scheduled_posts import ScheduledPostDB
+    from app.models.auto_posting_rules import AutoPostingRuleDB
+    from app.models.content_sources import ContentSource, MonitoredItem
+    from app.models.content import ContentPieceDB, TokenUsageDB, TokenUsageDailyDB
+    from app.models.workflow import WorkflowInstanceDB, WorkflowTaskDB
+    from app.models.uploads import FileUploadDB
+
 def init_database():
     """Initialize database and create tables"""
     try:
         engine, _ = get_db_connection()
         
-        # Import all models to ensure they are registered
-        from app.auth.models.user import User, UserSession
-        from app.billing.models.subscription import Subscription, Payment, UsageRecord
-        from app.billing.models.agent_subscription import AgentSubscription
-        from app.models.project import Project
-        from app.models.telegram_channels import TelegramChannel
-        from app.models.instagram_accounts import InstagramAccount
-        from app.models.twitter_accounts import TwitterAccount
-        from app.models.scheduled_posts import ScheduledPostDB
-        from app.models.auto_posting_rules import AutoPostingRuleDB
-        from app.models.content_sources import ContentSource, MonitoredItem
-        from app.models.content import ContentPieceDB, TokenUsageDB
-        from app.models.uploads import FileUploadDB
+        import_all_models()
         
         # Create all tables
         Base.metadata.create_all(bind=engine)
@@ -0,0 +1,117 @@
+"""
+Захват строк очереди с арендой (claim-and-lease)
+Несколько процессов (gunicorn workers, инстансы Cloud Run) выбирают наступившие
+строки из одной таблицы: каждая строка захватывается ровно одним процессом,
+который записывает себя в claimed_by и продлевает lease_expires_at. Если процесс
+упал, аренда истекает и строку забирает другой.
+
+На PostgreSQL выборка идет через SELECT ... FOR UPDATE SKIP LOCKED - процессы
+делят очередь без ожидания друг друга. SQLite не поддерживает SKIP LOCKED, там
+атомарность обеспечивает условный UPDATE (записи в SQLite сериализуются).
+"""
+
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from sqlalchemy.orm import Session
+
+DEFAULT_LEASE_SECONDS = int(os.getenv("SCHEDULER_LEASE_SECONDS", "300"))
+
+
+def make_worker_id(name: str) -> str:
+    """Уникальный идентификатор worker'а: имя, хост, PID и случайный суффикс"""
+    return f"{name}:{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def supports_skip_locked(db: Session) -> bool:
+    """True, если СУБД поддерживает FOR UPDATE SKIP LOCKED"""
+    return db.get_bind().dialect.name == "postgresql"
+
+
+def claim_rows(
+    db: Session,
+    model,
+    claimable,
+    order_by: Sequence[Any],
+    worker_id: str,
+    limit: int,
+    lease_seconds: int = DEFAULT_LEASE_SECONDS,
+    values: Optional[Dict[str, Any]] = None
+) -> List[Any]:
+    """
+    Атомарно захватывает до limit строк, удовлетворяющих условию claimable
+
+    Args:
+        db: сессия БД
+        model: модель с колонками id, claimed_by, lease_expires_at
+        claimable: условие "строку можно захватить" (включая истекшую аренду)
+        order_by: порядок выборки
+        worker_id: идентификатор захватывающего worker'а
+        limit: максимум строк
+        lease_seconds: длительность аренды
+        values: дополнительные поля, которые выставляются при захвате (например, статус)
+
+    Returns:
+        Захваченные этим worker'ом строки
+    """
+    query = db.query(model.id).filter(claimable).order_by(*order_by).limit(limit)
+    if supports_skip_locked(db):
+        query = query.with_for_update(skip_locked=True)
+
+    ids = [row.id for row in query.all()]
+    if not ids:
+        db.commit()
+        return []
+
+    # Условие повторяется в UPDATE: строки, которые успел захватить другой
+    # процесс между SELECT и UPDATE (возможно только без SKIP LOCKED), не трогаем
+    lease_expires_at = datetime.utcnow() + timedelta(seconds=lease_seconds)
+    db.query(model).filter(model.id.in_(ids), claimable).update(
+        {"claimed_by": worker_id, "lease_expires_at": lease_expires_at, **(values or {})},
+        synchronize_session=False
+    )
+    db.commit()
+
+    return db.query(model).filter(
+        model.id.in_(ids),
+        model.claimed_by == worker_id
+    ).order_by(*order_by).all()
+
+
+def renew_lease(db: Session, model, ids: Iterable[int], worker_id: str,
+                lease_seconds: int = DEFAULT_LEASE_SECONDS) -> int:
+    """
+    Продлевает аренду строк, которые все еще принадлежат worker'у (heartbeat)
+
+    Returns:
+        Количество продленных строк
+    """
+    ids = list(ids)
+    if not ids:
+        return 0
+
+    renewed = db.query(model).filter(
+        model.id.in_(ids),
+        model.claimed_by == worker_id
+    ).update(
+        {"lease_expires_at": datetime.utcnow() + timedelta(seconds=lease_seconds)},
+        synchronize_session=False
+    )
+    db.commit()
+    return renewed
+
+
+def owned_ids(db: Session, model, ids: Iterable[int], worker_id: str) -> set:
+    """Возвращает id строк из ids, аренда которых все еще у worker'а"""
+    ids = list(ids)
+    if not ids:
+        return set()
+    return {
+        row.id for row in db.query(model.id).filter(
+            model.id.in_(ids),
+            model.claimed_by == worker_id
+        ).all()
+    }
@@ -8,6 +8,8 @@ from typing import Dict, Any, Optional
 from dataclasses import dataclass, field
 from dotenv import load_dotenv
 
+from app.utils.rate_limiter import RateLimit
+
 # Загружаем переменные окружения
 load_dotenv()
 
@@ -22,9 +24,17 @@ class MCPConfig:
     max_retries: int = 3
     retry_delay: float = 1.0
     rate_limit: Optional[int] = None
+    rate_limit_period: float = 1.0  # окно rate_limit в секундах
+    rate_limit_burst: Optional[int] = None  # вызовов подряд без ожидания (по умолчанию rate_limit)
     fallback_enabled: bool = True
     test_mode: bool = True
     custom_params: Dict[str, Any] = field(default_factory=dict)
+    
+    def get_rate_limit(self) -> Optional[RateLimit]:
+        """Лимит частоты вызовов для RateLimiter (None - без ограничений)"""
+        if not self.rate_limit:
+            return None
+        return RateLimit(rate=self.rate_limit, period=self.rate_limit_period, burst=self.rate_limit_burst)
 
 
 class MCPConfigManager:
@@ -64,6 +74,7 @@ class MCPConfigManager:
             max_retries=2,
             retry_delay=2.0,
             rate_limit=60,  # 60 запросов в минуту
+            rate_limit_period=60,
             fallback_enabled=True,
             test_mode=os.getenv('TEST_MODE', 'True').lower() == 'true',
             custom_params={
@@ -82,6 +93,7 @@ class MCPConfigManager:
             max_retries=2,
             retry_delay=1.5,
             rate_limit=1000,  # 1000 запросов в час
+            rate_limit_period=3600,
             fallback_enabled=True,
             test_mode=os.getenv('TEST_MODE', 'True').lower() == 'true',
             custom_params={
@@ -116,6 +128,7 @@ class MCPConfigManager:
             max_retries=2,
             retry_delay=2.0,
             rate_limit=200,  # 200 запросов в час
+            rate_limit_period=3600,
             fallback_enabled=True,
             test_mode=os.getenv('TEST_MODE', 'True').lower() == 'true',
             custom_params={
@@ -132,6 +145,7 @@ class MCPConfigManager:
             max_retries=2,
             retry_delay=2.0,
             rate_limit=300,  # 300 твитов в 15 минут
+            rate_limit_period=900,
             fallback_enabled=True,
             test_mode=os.getenv('TEST_MODE', 'True').lower() == 'true',
             custom_params={
@@ -149,6 +163,7 @@ class MCPConfigManager:
             max_retries=2,
             retry_delay=1.0,
             rate_limit=1000,  # 1000 запросов в день
+            rate_limit_period=86400,
             fallback_enabled=True,
             test_mode=os.getenv('TEST_MODE', 'True').lower() == 'true',
             custom_params={
@@ -166,6 +181,7 @@ class MCPConfigManager:
             max_retries=2,
             retry_delay=2.0,
             rate_limit=100,  # 100 запросов в 100 секунд
+            rate_limit_period=100,
             fallback_enabled=True,
             test_mode=os.getenv('TEST_MODE', 'True').lower() == 'true',
             custom_params={
@@ -182,6 +198,7 @@ class MCPConfigManager:
             max_retries=2,
             retry_delay=1.0,
             rate_limit=500,  # 500 запросов в час
+            rate_limit_period=3600,
             fallback_enabled=True,
             test_mode=os.getenv('TEST_MODE', 'True').lower() == 'true',
             custom_params={
@@ -199,6 +216,7 @@ class MCPConfigManager:
             max_retries=2,
             retry_delay=2.0,
             rate_limit=100,  # 100 запросов в час
+            rate_limit_period=3600,
             fallback_enabled=True,
             test_mode=os.getenv('TEST_MODE', 'True').lower() == 'true',
             custom_params={
@@ -216,13 +234,15 @@ class MCPConfigManager:
             max_retries=2,
             retry_delay=2.0,
             rate_limit=60,  # 60 запросов в минуту
+            rate_limit_period=60,
             fallback_enabled=True,
             test_mode=os.getenv('TEST_MODE', 'True').lower() == 'true',
             custom_params={
                 'project_id': os.getenv('GOOGLE_CLOUD_PROJECT'),
                 'location': os.getenv('VERTEX_AI_LOCATION', 'us-central1'),
                 'gemini_model': os.getenv('VERTEX_AI_GEMINI_MODEL', 'gemini-1.5-pro'),
-                'imagen_model': os.getenv('VERTEX_AI_IMAGEN_MODEL', 'imagegeneration@007')  # Используем @007 как дефолт (новая версия)
+                'imagen_model': os.getenv('VERTEX_AI_IMAGEN_MODEL', 'imagegeneration@007'),  # Используем @007 как дефолт (новая версия)
+                'max_workers': int(os.getenv('VERTEX_AI_MAX_WORKERS', '8'))  # Потоки для блокирующих вызовов Imagen
             }
         )
     
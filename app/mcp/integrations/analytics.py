@@ -25,6 +25,7 @@ class AnalyticsMCP(BaseMCPIntegration):
             'timeout': config.timeout,
             'max_retries': config.max_retries,
             'retry_delay': config.retry_delay,
+            'rate_limit': config.get_rate_limit(),
             'fallback_enabled': config.fallback_enabled,
             'test_mode': config.test_mode
         })
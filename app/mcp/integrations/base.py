@@ -5,12 +5,17 @@
 
 import asyncio
 import logging
+import time
 from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
 from enum import Enum
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, AsyncContextManager, AsyncIterator, Dict, List, Optional, Union
 from dataclasses import dataclass, field
 
+from app.utils.http_clients import HTTPClientRegistry, PooledAsyncClient, get_http_clients
+from app.utils.rate_limiter import RateLimit, RateLimitExceeded, RateLimiter, rate_limiter as default_rate_limiter
+
 logger = logging.getLogger(__name__)
 
 
@@ -65,13 +70,39 @@ class MCPResponse:
         )
 
 
+@dataclass
+class CallStats:
+    """Статистика вызовов одной модели/эндпоинта интеграции"""
+    calls: int = 0
+    errors: int = 0
+    in_flight: int = 0
+    peak_in_flight: int = 0
+    total_latency: float = 0.0
+    max_latency: float = 0.0
+    last_latency: float = 0.0
+    
+    def to_dict(self) -> Dict[str, Any]:
+        avg_latency = self.total_latency / self.calls if self.calls else 0.0
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "avg_latency_ms": round(avg_latency * 1000, 1),
+            "max_latency_ms": round(self.max_latency * 1000, 1),
+            "last_latency_ms": round(self.last_latency * 1000, 1)
+        }
+
+
 class BaseMCPIntegration(ABC):
     """
     Базовый класс для всех MCP интеграций
     Обеспечивает единообразный интерфейс, обработку ошибок и fallback
     """
     
-    def __init__(self, service_name: str, config: Dict[str, Any]):
+    def __init__(self, service_name: str, config: Dict[str, Any],
+                 http_clients: Optional[HTTPClientRegistry] = None,
+                 rate_limiter: Optional[RateLimiter] = None):
         self.service_name = service_name
         self.config = config
         self.status = MCPStatus.DISCONNECTED
@@ -82,12 +113,20 @@ class BaseMCPIntegration(ABC):
         self.timeout = config.get('timeout', 30.0)
         self.use_fallback = config.get('use_fallback', True)
         self.fallback_enabled = config.get('fallback_enabled', True)
+        self.http_clients = http_clients or get_http_clients()
+        
+        # Лимит частоты из MCPConfig: вызовы ждут слот вместо 429 и ретраев
+        self.rate_limit: Optional[RateLimit] = config.get('rate_limit')
+        self.rate_limit_key = f"mcp:{service_name}"
+        self.rate_limit_max_wait = config.get('rate_limit_max_wait', self.timeout)
+        self.rate_limiter = rate_limiter or default_rate_limiter
         
         # Метрики
         self.request_count = 0
         self.success_count = 0
         self.error_count = 0
         self.last_request_time: Optional[datetime] = None
+        self.call_stats: Dict[str, CallStats] = {}
         
         logger.info(f"Инициализирована MCP интеграция: {service_name}")
     
@@ -114,6 +153,19 @@ class BaseMCPIntegration(ABC):
         self.last_request_time = datetime.now()
         
         for attempt in range(self.max_retries + 1):
+            try:
+                await self._acquire_rate_limit()
+            except RateLimitExceeded as e:
+                self.error_count += 1
+                self.status = MCPStatus.RATE_LIMITED
+                self.last_error = MCPError(
+                    service=self.service_name,
+                    error_type="rate_limited",
+                    message=str(e),
+                    details={"operation": operation, "retry_after": round(e.retry_after, 1)}
+                )
+                return MCPResponse.error_response(self.last_error)
+            
             try:
                 # Выполняем операцию
                 result = await self._execute_operation(operation, *args, **kwargs)
@@ -168,6 +220,12 @@ class BaseMCPIntegration(ABC):
             )
         )
     
+    async def _acquire_rate_limit(self) -> float:
+        """Ждет слот в лимите сервиса (RateLimitExceeded, если ждать дольше rate_limit_max_wait)"""
+        if not self.rate_limit:
+            return 0.0
+        return await self.rate_limiter.acquire(self.rate_limit_key, self.rate_limit, self.rate_limit_max_wait)
+    
     async def _execute_operation(self, operation: str, *args, **kwargs) -> MCPResponse:
         """Выполняет конкретную операцию"""
         try:
@@ -227,6 +285,42 @@ class BaseMCPIntegration(ABC):
             )
         )
     
+    def http_client(self, timeout: Optional[float] = None) -> AsyncContextManager[PooledAsyncClient]:
+        """
+        Общий HTTP клиент с пулом соединений (таймаут по умолчанию из MCPConfig)
+        
+        Использование:
+            async with self.http_client() as client:
+                response = await client.get(url)
+        """
+        return self.http_clients.async_client(timeout=timeout or self.timeout)
+    
+    @asynccontextmanager
+    async def track_call(self, key: str) -> AsyncIterator[CallStats]:
+        """
+        Учитывает латентность и параллелизм вызова (например, по имени модели)
+        
+        Использование:
+            async with self.track_call(model_name):
+                response = await model.generate_content_async(prompt)
+        """
+        stats = self.call_stats.setdefault(key, CallStats())
+        stats.in_flight += 1
+        stats.peak_in_flight = max(stats.peak_in_flight, stats.in_flight)
+        started = time.monotonic()
+        try:
+            yield stats
+        except BaseException:
+            stats.errors += 1
+            raise
+        finally:
+            latency = time.monotonic() - started
+            stats.in_flight -= 1
+            stats.calls += 1
+            stats.total_latency += latency
+            stats.last_latency = latency
+            stats.max_latency = max(stats.max_latency, latency)
+    
     def get_metrics(self) -> Dict[str, Any]:
         """Возвращает метрики интеграции"""
         success_rate = (self.success_count / self.request_count * 100) if self.request_count > 0 else 0
@@ -241,7 +335,9 @@ class BaseMCPIntegration(ABC):
             "last_request_time": self.last_request_time.isoformat() if self.last_request_time else None,
             "last_error": str(self.last_error) if self.last_error else None,
             "retry_count": self.retry_count,
-            "fallback_enabled": self.fallback_enabled
+            "fallback_enabled": self.fallback_enabled,
+            "calls": {key: stats.to_dict() for key, stats in self.call_stats.items()},
+            "rate_limit": self.rate_limiter.get_stats(self.rate_limit_key) if self.rate_limit else None
         }
     
     def reset_metrics(self):
@@ -252,6 +348,7 @@ class BaseMCPIntegration(ABC):
         self.retry_count = 0
         self.last_request_time = None
         self.last_error = None
+        self.call_stats = {}
         logger.info(f"Метрики сброшены для {self.service_name}")
     
     def __str__(self):
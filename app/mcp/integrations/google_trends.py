@@ -7,7 +7,6 @@ import asyncio
 import logging
 from datetime import datetime, timedelta
 from typing import Any, Dict, Optional, List
-import httpx
 
 from .base import BaseMCPIntegration, MCPResponse, MCPError, MCPStatus
 from ..config import get_mcp_config
@@ -43,6 +42,7 @@ class GoogleTrendsMCP(BaseMCPIntegration):
             'timeout': config.timeout,
             'max_retries': config.max_retries,
             'retry_delay': config.retry_delay,
+            'rate_limit': config.get_rate_limit(),
             'fallback_enabled': config.fallback_enabled,
             'test_mode': config.test_mode
         })
@@ -94,7 +94,7 @@ class GoogleTrendsMCP(BaseMCPIntegration):
                 "geo": self.region
             }
             
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
+            async with self.http_client() as client:
                 response = await client.get(url, params=params)
                 
                 if response.status_code == 200:
@@ -134,7 +134,7 @@ class GoogleTrendsMCP(BaseMCPIntegration):
                 }
             }
             
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
+            async with self.http_client() as client:
                 response = await client.get(url, params=params)
                 
                 if response.status_code == 200:
@@ -165,7 +165,7 @@ class GoogleTrendsMCP(BaseMCPIntegration):
                 }
             }
             
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
+            async with self.http_client() as client:
                 response = await client.get(url, params=params)
                 
                 if response.status_code == 200:
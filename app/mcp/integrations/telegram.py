@@ -7,7 +7,6 @@ import asyncio
 import logging
 from datetime import datetime
 from typing import Any, Dict, Optional
-import httpx
 
 from .base import BaseMCPIntegration, MCPResponse, MCPError, MCPStatus
 from ..config import get_mcp_config
@@ -29,6 +28,7 @@ class TelegramMCP(BaseMCPIntegration):
             'timeout': config.timeout,
             'max_retries': config.max_retries,
             'retry_delay': config.retry_delay,
+            'rate_limit': config.get_rate_limit(),
             'fallback_enabled': config.fallback_enabled,
             'test_mode': config.test_mode
         })
@@ -45,7 +45,7 @@ class TelegramMCP(BaseMCPIntegration):
         try:
             self.status = MCPStatus.CONNECTING
             
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
+            async with self.http_client() as client:
                 response = await client.get(f"{self.base_url}/getMe")
                 
                 if response.status_code == 200:
@@ -89,7 +89,7 @@ class TelegramMCP(BaseMCPIntegration):
     async def health_check(self) -> MCPResponse:
         """Проверка здоровья Telegram Bot API"""
         try:
-            async with httpx.AsyncClient(timeout=10) as client:
+            async with self.http_client(timeout=10) as client:
                 response = await client.get(f"{self.base_url}/getMe")
                 
                 if response.status_code == 200:
@@ -139,7 +139,7 @@ class TelegramMCP(BaseMCPIntegration):
                 'disable_web_page_preview': disable_web_page_preview
             }
             
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
+            async with self.http_client() as client:
                 response = await client.post(
                     f"{self.base_url}/sendMessage",
                     json=payload
@@ -194,7 +194,7 @@ class TelegramMCP(BaseMCPIntegration):
                 'parse_mode': self.parse_mode
             }
             
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
+            async with self.http_client() as client:
                 response = await client.post(
                     f"{self.base_url}/sendPhoto",
                     json=payload
@@ -242,7 +242,7 @@ class TelegramMCP(BaseMCPIntegration):
         try:
             target_chat = chat_id or self.chat_id
             
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
+            async with self.http_client() as client:
                 response = await client.get(
                     f"{self.base_url}/getChat",
                     params={'chat_id': target_chat}
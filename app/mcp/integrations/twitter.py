@@ -7,7 +7,6 @@ import asyncio
 import logging
 from datetime import datetime, timedelta
 from typing import Any, Dict, Optional, List
-import httpx
 
 from .base import BaseMCPIntegration, MCPResponse, MCPError, MCPStatus
 from ..config import get_mcp_config
@@ -29,6 +28,7 @@ class TwitterMCP(BaseMCPIntegration):
             'timeout': config.timeout,
             'max_retries': config.max_retries,
             'retry_delay': config.retry_delay,
+            'rate_limit': config.get_rate_limit(),
             'fallback_enabled': config.fallback_enabled,
             'test_mode': config.test_mode
         })
@@ -91,7 +91,7 @@ class TwitterMCP(BaseMCPIntegration):
             
             url = f"{self.base_url}/trends/by/woeid/1"  # Worldwide trends
             
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
+            async with self.http_client() as client:
                 response = await client.get(url, headers=headers)
                 
                 if response.status_code == 200:
@@ -123,7 +123,7 @@ class TwitterMCP(BaseMCPIntegration):
             
             url = f"{self.base_url}/tweets/search/recent"
             
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
+            async with self.http_client() as client:
                 response = await client.get(url, headers=headers, params=params)
                 
                 if response.status_code == 200:
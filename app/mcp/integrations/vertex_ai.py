@@ -4,9 +4,14 @@ Vertex AI MCP интеграция
 """
 
 import os
+import asyncio
 import logging
 import base64
-from typing import Any, Dict, Optional
+import tempfile
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
 from .base import BaseMCPIntegration, MCPResponse, MCPError, MCPStatus
 from ..config import get_mcp_config
 
@@ -22,6 +27,35 @@ except ImportError:
     logger.warning("Vertex AI SDK не установлен. Установите: pip install google-cloud-aiplatform")
 
 
+# Хэндлы моделей и пулы потоков общие для всех экземпляров VertexAIMCP:
+# агенты создают собственные интеграции. Imagen вызывается синхронно в пуле
+# потоков и кэшируется на процесс; async gRPC канал Gemini привязан к event
+# loop первого вызова, поэтому Gemini модели кэшируются по event loop.
+# Lock кэша Gemini берется в event loop и не держится во время сетевых
+# вызовов; загрузка Imagen (from_pretrained) идет в пуле потоков под
+# отдельным lock своей модели
+_model_cache: Dict[str, Any] = {}
+_gemini_models: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, Any]]" = weakref.WeakKeyDictionary()
+_gemini_lock = threading.Lock()
+_imagen_locks: Dict[str, threading.Lock] = {}
+_imagen_locks_lock = threading.Lock()
+_executors: Dict[int, ThreadPoolExecutor] = {}
+_executor_lock = threading.Lock()
+
+
+def _get_executor(max_workers: int) -> ThreadPoolExecutor:
+    """Возвращает ограниченный пул потоков для синхронных вызовов SDK (один на размер)"""
+    executor = _executors.get(max_workers)
+    if executor is None:
+        with _executor_lock:
+            executor = _executors.get(max_workers)
+            if executor is None:
+                executor = _executors[max_workers] = ThreadPoolExecutor(
+                    max_workers=max_workers, thread_name_prefix=f'vertex-ai-{max_workers}'
+                )
+    return executor
+
+
 class VertexAIMCP(BaseMCPIntegration):
     """MCP интеграция для Google Vertex AI"""
     
@@ -37,10 +71,14 @@ class VertexAIMCP(BaseMCPIntegration):
             'timeout': config.timeout,
             'max_retries': config.max_retries,
             'retry_delay': config.retry_delay,
+            'rate_limit': config.get_rate_limit(),
             'fallback_enabled': config.fallback_enabled,
             'test_mode': config.test_mode
         })
         
+        # Максимум одновременных блокирующих вызовов SDK (Imagen) в пуле потоков
+        self.max_workers = int(config.custom_params.get('max_workers', 8))
+        
         self.project_id = config.custom_params.get('project_id') or os.getenv('GOOGLE_CLOUD_PROJECT')
         self.location = config.custom_params.get('location', 'us-central1')
         
@@ -130,6 +168,68 @@ class VertexAIMCP(BaseMCPIntegration):
         
         return MCPResponse.success_response(data={"status": "healthy"})
     
+    def _get_gemini_model(self, model_name: str) -> 'GenerativeModel':
+        """Возвращает хэндл Gemini модели, закэшированный для текущего event loop"""
+        loop = asyncio.get_running_loop()
+        with _gemini_lock:
+            models = _gemini_models.get(loop)
+            if models is None:
+                models = _gemini_models[loop] = {}
+            model = models.get(model_name)
+            if model is None:
+                model = models[model_name] = GenerativeModel(model_name)
+        return model
+    
+    def _get_imagen_model(self, model_name: str) -> 'ImageGenerationModel':
+        """Возвращает закэшированный хэндл Imagen модели (from_pretrained - сетевой вызов)"""
+        key = f"imagen:{model_name}"
+        model = _model_cache.get(key)
+        if model is None:
+            with _imagen_locks_lock:
+                lock = _imagen_locks.setdefault(key, threading.Lock())
+            # Ждут только загрузки той же модели (в пуле потоков), event loop не блокируется
+            with lock:
+                model = _model_cache.get(key)
+                if model is None:
+                    model = ImageGenerationModel.from_pretrained(model_name)
+                    _model_cache[key] = model
+        return model
+    
+    async def _run_blocking(self, func, *args, **kwargs):
+        """Выполняет синхронный вызов SDK в пуле потоков, не блокируя event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            _get_executor(self.max_workers),
+            lambda: func(*args, **kwargs)
+        )
+    
+    async def _generate_with_model(self, model_name: str, prompt: str,
+                                   generation_config: Dict[str, Any]):
+        """Асинхронный вызов Gemini: нативный async API SDK, иначе пул потоков"""
+        model = self._get_gemini_model(model_name)
+        
+        if hasattr(model, 'generate_content_async'):
+            return await model.generate_content_async(prompt, generation_config=generation_config)
+        return await self._run_blocking(model.generate_content, prompt, generation_config=generation_config)
+    
+    @staticmethod
+    def _images_to_base64(images) -> List[Dict[str, str]]:
+        """Конвертирует изображения Imagen в base64 (блокирующий I/O)"""
+        image_data_list = []
+        for image in images:
+            # Сохраняем во временный файл и читаем как bytes
+            with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as tmp_file:
+                image.save(tmp_file.name)
+                with open(tmp_file.name, 'rb') as f:
+                    image_bytes = f.read()
+                os.unlink(tmp_file.name)
+            
+            image_data_list.append({
+                "image_data": base64.b64encode(image_bytes).decode('utf-8'),
+                "format": "png"
+            })
+        return image_data_list
+    
     async def generate_content(self, prompt: str, **kwargs) -> MCPResponse:
         """Генерация текста через Gemini"""
         if not VERTEX_AI_AVAILABLE:
@@ -150,7 +250,6 @@ class VertexAIMCP(BaseMCPIntegration):
         for model_name in gemini_models:
             try:
                 logger.info(f"Попытка генерации текста через Gemini модель: {model_name}")
-                model = GenerativeModel(model_name)
                 
                 # Параметры генерации
                 generation_config = {
@@ -160,10 +259,8 @@ class VertexAIMCP(BaseMCPIntegration):
                     "max_output_tokens": kwargs.get('max_tokens', 2000),
                 }
                 
-                response = model.generate_content(
-                    prompt,
-                    generation_config=generation_config
-                )
+                async with self.track_call(model_name):
+                    response = await self._generate_with_model(model_name, prompt, generation_config)
                 
                 # Улучшенная обработка ответа от Vertex AI
                 generated_text = ""
@@ -236,7 +333,6 @@ class VertexAIMCP(BaseMCPIntegration):
         for model_name in imagen_models:
             try:
                 logger.info(f"Попытка генерации изображения через Imagen модель: {model_name}")
-                model = ImageGenerationModel.from_pretrained(model_name)
                 
                 # Параметры генерации
                 number_of_images = kwargs.get('n', 1)
@@ -248,30 +344,21 @@ class VertexAIMCP(BaseMCPIntegration):
                 width = kwargs.get('width', 1024)
                 height = kwargs.get('height', 1024)
                 
-                images = model.generate_images(
-                    prompt=prompt,
-                    number_of_images=number_of_images,
-                    negative_prompt=negative_prompt if negative_prompt else None,
-                    seed=seed,
-                    guidance_scale=guidance_scale,
-                    aspect_ratio=f"{width}:{height}"
-                )
+                # У Imagen SDK нет async API - все блокирующие шаги идут в пул потоков
+                async with self.track_call(model_name):
+                    model = await self._run_blocking(self._get_imagen_model, model_name)
+                    images = await self._run_blocking(
+                        model.generate_images,
+                        prompt=prompt,
+                        number_of_images=number_of_images,
+                        negative_prompt=negative_prompt if negative_prompt else None,
+                        seed=seed,
+                        guidance_scale=guidance_scale,
+                        aspect_ratio=f"{width}:{height}"
+                    )
                 
                 # Конвертируем изображения в base64
-                image_data_list = []
-                for image in images:
-                    # Сохраняем во временный файл и читаем как bytes
-                    import tempfile
-                    with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as tmp_file:
-                        image.save(tmp_file.name)
-                        with open(tmp_file.name, 'rb') as f:
-                            image_bytes = f.read()
-                        os.unlink(tmp_file.name)
-                    
-                    image_data_list.append({
-                        "image_data": base64.b64encode(image_bytes).decode('utf-8'),
-                        "format": "png"
-                    })
+                image_data_list = await self._run_blocking(self._images_to_base64, images)
                 
                 logger.info(f"✅ Изображение успешно сгенерировано через модель {model_name}")
                 return MCPResponse.success_response(
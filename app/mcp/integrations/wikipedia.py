@@ -7,7 +7,6 @@ import asyncio
 import logging
 from datetime import datetime
 from typing import Any, Dict, Optional, List
-import httpx
 
 from .base import BaseMCPIntegration, MCPResponse, MCPError, MCPStatus
 from ..config import get_mcp_config
@@ -43,6 +42,7 @@ class WikipediaMCP(BaseMCPIntegration):
             'timeout': config.timeout,
             'max_retries': config.max_retries,
             'retry_delay': config.retry_delay,
+            'rate_limit': config.get_rate_limit(),
             'fallback_enabled': config.fallback_enabled,
             'test_mode': config.test_mode
         })
@@ -59,7 +59,7 @@ class WikipediaMCP(BaseMCPIntegration):
             self.status = MCPStatus.CONNECTING
             
             # Проверяем доступность API
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
+            async with self.http_client() as client:
                 response = await client.get(f"{self.base_url}/page/summary/Россия")
                 
                 if response.status_code == 200:
@@ -93,7 +93,7 @@ class WikipediaMCP(BaseMCPIntegration):
     async def health_check(self) -> MCPResponse:
         """Проверка здоровья Wikipedia API"""
         try:
-            async with httpx.AsyncClient(timeout=10) as client:
+            async with self.http_client(timeout=10) as client:
                 response = await client.get(f"{self.base_url}/page/summary/Тест")
                 
                 if response.status_code == 200:
@@ -132,7 +132,7 @@ class WikipediaMCP(BaseMCPIntegration):
                 'srprop': 'snippet|timestamp'
             }
             
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
+            async with self.http_client() as client:
                 response = await client.get(search_url, params=params)
                 
                 if response.status_code == 200:
@@ -260,7 +260,7 @@ class WikipediaMCP(BaseMCPIntegration):
             # Используем Wikipedia REST API для получения summary
             summary_url = f"{self.base_url}/page/summary/{title}"
             
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
+            async with self.http_client() as client:
                 response = await client.get(summary_url)
                 
                 if response.status_code == 200:
@@ -307,7 +307,7 @@ class WikipediaMCP(BaseMCPIntegration):
                 'ellimit': 20
             }
             
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
+            async with self.http_client() as client:
                 response = await client.get(sources_url, params=params)
                 
                 if response.status_code == 200:
@@ -48,6 +48,10 @@ class AutoPostingRuleDB(Base):
     last_execution_at = Column(DateTime, nullable=True)
     next_execution_at = Column(DateTime, nullable=True, index=True)
     
+    # Аренда: какой worker выполняет правило и до какого времени (см. app/database/leases.py)
+    claimed_by = Column(String(255), nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+    
     # Временные метки
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
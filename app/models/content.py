@@ -204,7 +204,10 @@ class ContentCampaign:
 
 # ==================== SQLAlchemy МОДЕЛИ ДЛЯ БД ====================
 
-from sqlalchemy import Column, Integer, String, Text, DateTime, Float, Boolean, JSON, ForeignKey, Enum as SQLEnum
+from sqlalchemy import (
+    Column, Integer, BigInteger, String, Text, Date, DateTime, Float, Boolean, JSON, ForeignKey,
+    Index, UniqueConstraint, Enum as SQLEnum
+)
 from sqlalchemy.orm import relationship
 from app.database.connection import Base
 
@@ -334,3 +337,38 @@ class TokenUsageDB(Base):
     # Связи
     user = relationship("User", back_populates="token_usage_records")
     content_piece = relationship("ContentPieceDB", back_populates="token_usage_records")
+
+
+class TokenUsageDailyDB(Base):
+    """
+    Дневные агрегаты token_usage (пользователь x день x агент x модель)
+
+    Заполняются TokenUsageRollupService за закрытые дни; текущий день
+    дашборды досчитывают по token_usage.
+    """
+    __tablename__ = 'token_usage_daily'
+    __table_args__ = (
+        UniqueConstraint('user_id', 'usage_date', 'agent_id', 'ai_provider', 'ai_model',
+                         name='uq_token_usage_daily_key'),
+        Index('ix_token_usage_daily_user_date', 'user_id', 'usage_date'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    usage_date = Column(Date, nullable=False, index=True)
+    agent_id = Column(String(100), nullable=False)
+    ai_provider = Column(String(50), nullable=False)
+    ai_model = Column(String(100), nullable=False)
+
+    requests_count = Column(Integer, nullable=False, default=0)
+    prompt_tokens = Column(BigInteger, nullable=False, default=0)
+    completion_tokens = Column(BigInteger, nullable=False, default=0)
+    total_tokens = Column(BigInteger, nullable=False, default=0)
+    cost_usd = Column(Float, nullable=False, default=0.0)
+    cost_rub = Column(Float, nullable=False, default=0.0)
+
+    # Для среднего времени выполнения (AVG не суммируется по дням)
+    execution_time_ms_sum = Column(BigInteger, nullable=False, default=0)
+    execution_time_count = Column(Integer, nullable=False, default=0)
+
+    updated_at = Column(DateTime, default=datetime.utcnow)
@@ -2,7 +2,10 @@
 Модели для источников контента и мониторинга веб-сайтов
 """
 
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Index, Text, ForeignKey, JSON, Float
+import hashlib
+from typing import Optional
+
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Index, Text, ForeignKey, JSON, Float, event, inspect, text
 from sqlalchemy.orm import relationship
 from app.database.connection import Base
 from datetime import datetime
@@ -44,6 +47,12 @@ class ContentSource(Base):
     
     # Расписание проверок
     check_interval_minutes = Column(Integer, default=60, nullable=False)  # Интервал проверки
+    # Границы адаптивного расписания (None - значения по умолчанию, CHECK_SCHEDULE_MIN/MAX_MINUTES)
+    min_check_interval_minutes = Column(Integer, nullable=True)
+    max_check_interval_minutes = Column(Integer, nullable=True)
+    # Оценка среднего интервала между изменениями (минуты) и время последнего изменения
+    change_interval_minutes = Column(Float, nullable=True)
+    last_change_at = Column(DateTime, nullable=True)
     next_check_at = Column(DateTime, nullable=True, index=True)
     last_check_at = Column(DateTime, nullable=True)
     last_check_status = Column(String(50), nullable=True)  # 'success', 'error'
@@ -62,6 +71,10 @@ class ContentSource(Base):
     last_snapshot_hash = Column(String(64), nullable=True)  # MD5 хеш контента
     last_snapshot_data = Column(JSON, nullable=True)  # Структурированные данные
     
+    # Валидаторы последнего ответа для условных запросов (If-None-Match / If-Modified-Since):
+    # {'url', 'etag', 'last_modified', 'content_length'}
+    http_validators = Column(JSON, nullable=True)
+    
     # Временные метки
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
@@ -115,6 +128,10 @@ class ContentSource(Base):
             'post_template': self.post_template,
             'auto_posting_rule_id': self.auto_posting_rule_id,
             'check_interval_minutes': self.check_interval_minutes,
+            'min_check_interval_minutes': self.min_check_interval_minutes,
+            'max_check_interval_minutes': self.max_check_interval_minutes,
+            'change_interval_minutes': round(self.change_interval_minutes, 1) if self.change_interval_minutes is not None else None,
+            'last_change_at': self.last_change_at.isoformat() if self.last_change_at else None,
             'next_check_at': self.next_check_at.isoformat() if self.next_check_at else None,
             'last_check_at': self.last_check_at.isoformat() if self.last_check_at else None,
             'last_check_status': self.last_check_status,
@@ -146,6 +163,7 @@ class MonitoredItem(Base):
     content = Column(Text, nullable=True)
     summary = Column(Text, nullable=True)
     url = Column(Text, nullable=True)
+    url_hash = Column(String(32), nullable=True)  # MD5 url - ключ дедупликации элементов без external_id
     image_url = Column(Text, nullable=True)
     author = Column(String(255), nullable=True)
     published_at = Column(DateTime, nullable=True, index=True)
@@ -186,8 +204,24 @@ class MonitoredItem(Base):
         Index('ix_monitored_items_user_status', 'user_id', 'status'),
         Index('ix_monitored_items_published', 'published_at', 'status'),
         Index('ix_monitored_items_relevance', 'relevance_score', 'status'),
+        # Дедупликация: поиск существующих ключей ленты одним IN запросом и
+        # ON CONFLICT DO NOTHING при пакетной вставке
+        Index('uq_monitored_items_source_external', 'source_id', 'external_id', unique=True,
+              postgresql_where=text('external_id IS NOT NULL'),
+              sqlite_where=text('external_id IS NOT NULL')),
+        Index('ix_monitored_items_source_url_hash', 'source_id', 'url_hash'),
+        Index('uq_monitored_items_source_url_hash', 'source_id', 'url_hash', unique=True,
+              postgresql_where=text('external_id IS NULL AND url_hash IS NOT NULL'),
+              sqlite_where=text('external_id IS NULL AND url_hash IS NOT NULL')),
     )
     
+    @staticmethod
+    def hash_url(url: Optional[str]) -> Optional[str]:
+        """Ключ URL для индекса дедупликации (совпадает с md5(url) в PostgreSQL)"""
+        if not url:
+            return None
+        return hashlib.md5(url.encode('utf-8')).hexdigest()
+    
     def to_dict(self) -> dict:
         """Преобразование в словарь для API"""
         return {
@@ -220,6 +254,21 @@ class MonitoredItem(Base):
         return f"<MonitoredItem(id={self.id}, title='{self.title[:30]}...', status='{self.status}')>"
 
 
+@event.listens_for(MonitoredItem, 'before_insert')
+def _set_url_hash(mapper, connection, target):
+    # Дубликаты (duplicate_of) не участвуют в ключах дедупликации
+    if target.duplicate_of is None:
+        target.url_hash = MonitoredItem.hash_url(target.url)
+
+
+@event.listens_for(MonitoredItem, 'before_update')
+def _update_url_hash(mapper, connection, target):
+    # Пересчитываем только при смене url: иначе обновление дубликата, у которого
+    # миграция очистила url_hash, нарушило бы uq_monitored_items_source_url_hash
+    if target.duplicate_of is None and inspect(target).attrs.url.history.has_changes():
+        target.url_hash = MonitoredItem.hash_url(target.url)
+
+
 class SourceCheckHistory(Base):
     """История проверок источников"""
     __tablename__ = 'source_check_history'
@@ -241,6 +290,12 @@ class SourceCheckHistory(Base):
     # Производительность
     execution_time_ms = Column(Integer, nullable=True)
     
+    # Условная загрузка: 304 Not Modified и сэкономленный трафик
+    http_status = Column(Integer, nullable=True)
+    not_modified = Column(Boolean, default=False, nullable=False)
+    bytes_downloaded = Column(Integer, default=0, nullable=False)
+    bytes_saved = Column(Integer, default=0, nullable=False)
+    
     # Связи
     source = relationship("ContentSource", back_populates="check_history")
     
@@ -261,7 +316,11 @@ class SourceCheckHistory(Base):
             'items_posted': self.items_posted,
             'status': self.status,
             'error_message': self.error_message,
-            'execution_time_ms': self.execution_time_ms
+            'execution_time_ms': self.execution_time_ms,
+            'http_status': self.http_status,
+            'not_modified': self.not_modified,
+            'bytes_downloaded': self.bytes_downloaded,
+            'bytes_saved': self.bytes_saved
         }
     
     def __repr__(self):
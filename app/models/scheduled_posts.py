@@ -29,7 +29,11 @@ class ScheduledPostDB(Base):
     published_at = Column(DateTime, nullable=True)
     
     # Статус
-    status = Column(String(50), default='scheduled', nullable=False, index=True)  # scheduled, published, failed, cancelled
+    status = Column(String(50), default='scheduled', nullable=False, index=True)  # scheduled, publishing, published, failed, cancelled
+    
+    # Аренда: какой worker публикует пост и до какого времени (см. app/database/leases.py)
+    claimed_by = Column(String(255), nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
     
     # Результат публикации
     platform_post_id = Column(String(255), nullable=True)
@@ -52,6 +56,7 @@ class ScheduledPostDB(Base):
         Index('ix_scheduled_user_status', 'user_id', 'status'),
         Index('ix_scheduled_time_status', 'scheduled_time', 'status'),
         Index('ix_scheduled_platform', 'platform', 'status'),
+        Index('ix_scheduled_status_lease', 'status', 'lease_expires_at'),
     )
     
     def to_dict(self) -> dict:
@@ -231,3 +231,67 @@ class WorkflowMetrics:
     avg_agent_utilization: float = 0.0
     
     created_at: datetime = field(default_factory=datetime.now)
+
+
+# ==================== SQLAlchemy МОДЕЛИ ДЛЯ БД ====================
+
+from sqlalchemy import Column, Integer, String, Text, DateTime, JSON, Index
+from app.database.connection import Base
+
+
+class WorkflowInstanceDB(Base):
+    """
+    Сохраненное состояние workflow (схема - WorkflowInstance)
+
+    Пишется WorkflowStore пакетами; завершенные workflow удаляются по TTL
+    (индекс по status + completed_at).
+    """
+    __tablename__ = 'workflow_instances'
+    __table_args__ = (
+        Index('ix_workflow_instances_status_completed', 'status', 'completed_at'),
+    )
+
+    id = Column(String(36), primary_key=True)
+    definition_id = Column(String(36), default="")
+    name = Column(String(500), nullable=False, default="")
+    status = Column(String(20), nullable=False)
+
+    context = Column(JSON, default=dict)
+    output_data = Column(JSON, default=dict)
+
+    created_at = Column(DateTime, nullable=False)
+    started_at = Column(DateTime)
+    completed_at = Column(DateTime)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+    created_by = Column(String(100), default="")
+    error_message = Column(Text)
+    retry_count = Column(Integer, default=0)
+
+
+class WorkflowTaskDB(Base):
+    """Сохраненное состояние задачи workflow (схема - TaskInstance)"""
+    __tablename__ = 'workflow_tasks'
+    __table_args__ = (
+        Index('ix_workflow_tasks_workflow_status', 'workflow_instance_id', 'status'),
+    )
+
+    id = Column(String(36), primary_key=True)
+    workflow_instance_id = Column(String(36), nullable=False)
+    name = Column(String(500), nullable=False, default="")
+
+    status = Column(String(20), nullable=False)
+    priority = Column(Integer, nullable=False)
+    task_type = Column(String(20), nullable=False)
+
+    assigned_agent_id = Column(String(100))
+    dependencies = Column(JSON, default=list)
+
+    input_data = Column(JSON, default=dict)
+    output_data = Column(JSON, default=dict)
+    error_message = Column(Text)
+
+    created_at = Column(DateTime, nullable=False)
+    deadline = Column(DateTime)
+    completed_at = Column(DateTime)
+    updated_at = Column(DateTime, default=datetime.utcnow)
@@ -7,7 +7,7 @@ import asyncio
 import logging
 from datetime import datetime
 from enum import Enum
-from typing import Dict, List, Optional, Any, Type
+from typing import Dict, Iterable, List, Optional, Any, Type
 from dataclasses import dataclass, field
 from abc import ABC, abstractmethod
 from uuid import uuid4
@@ -142,6 +142,10 @@ class AgentManager:
         logger.info(f"Агент {agent.name} ({agent.agent_id}) зарегистрирован")
         return True
     
+    def get_agent(self, agent_id: str) -> Optional[BaseAgent]:
+        """Возвращает зарегистрированного агента по ID"""
+        return self.agents.get(agent_id)
+    
     def unregister_agent(self, agent_id: str) -> bool:
         """Отменяет регистрацию агента"""
         if agent_id not in self.agents:
@@ -160,19 +164,28 @@ class AgentManager:
         logger.info(f"Агент {agent.name} ({agent_id}) отключен")
         return True
     
+    async def load_agents(self, task_types: Iterable[TaskType]):
+        """Готовит агентов для типов задач до назначения (зарегистрированные агенты уже созданы)"""
+        return None
+    
+    async def load_agent(self, agent_id: str) -> Optional[BaseAgent]:
+        """Готовит агента до назначения ему задачи"""
+        return self.get_agent(agent_id)
+    
     def get_available_agents(self, task_type: TaskType) -> List[BaseAgent]:
         """Возвращает доступных агентов для типа задачи"""
         available_agents = []
         
         for agent in self.agents.values():
-            if (agent.status == AgentStatus.IDLE and 
+            # Занятый агент доступен, пока не исчерпан max_concurrent_tasks
+            if (agent.status in (AgentStatus.IDLE, AgentStatus.BUSY) and
+                len(agent.current_tasks) < agent.capabilities.max_concurrent_tasks and
                 task_type in agent.capabilities.task_types):
                 available_agents.append(agent)
         
-        # Сортируем по производительности
+        # Сортируем по производительности, при равенстве - по загрузке
         available_agents.sort(
-            key=lambda a: a.capabilities.performance_score, 
-            reverse=True
+            key=lambda a: (-a.capabilities.performance_score, len(a.current_tasks))
         )
         
         return available_agents
@@ -205,6 +218,20 @@ class AgentManager:
         
         return None
     
+    def assign_task_to(self, task: Task, agent_id: str) -> bool:
+        """Назначает задачу конкретному агенту"""
+        agent = self.agents.get(agent_id)
+        if not agent:
+            logger.warning(f"Агент {agent_id} не найден в системе")
+            return False
+        
+        if not agent.assign_task(task.id):
+            return False
+        
+        self.task_assignments[task.id] = agent_id
+        self.workflow_engine.assign_task(task.id, agent_id)
+        return True
+    
     def _reassign_task(self, task_id: str, old_agent_id: str):
         """Переназначает задачу другому агенту"""
         task = self.workflow_engine._find_task(task_id)
@@ -221,9 +248,7 @@ class AgentManager:
             logger.info(f"Задача {task_id} переназначена с {old_agent_id} на {new_agent_id}")
         else:
             # Если не можем переназначить, возвращаем в очередь
-            task.status = TaskStatus.PENDING
-            task.assigned_agent = None
-            self.workflow_engine.task_queue.append(task)
+            self.workflow_engine.requeue_task(task)
             logger.warning(f"Задача {task_id} возвращена в очередь")
     
     async def execute_task(self, task_id: str) -> Dict[str, Any]:
@@ -322,14 +347,11 @@ class AgentManager:
     
     async def auto_assign_tasks(self):
         """Автоматически назначает задачи доступным агентам"""
-        # Получаем задачи из очереди
-        pending_tasks = [
-            task for task in self.workflow_engine.task_queue
-            if task.status == TaskStatus.PENDING
-        ]
+        # Получаем готовые задачи (все зависимости выполнены) в порядке приоритета
+        ready_tasks = self.workflow_engine.get_ready_tasks()
         
         assigned_count = 0
-        for task in pending_tasks:
+        for task in ready_tasks:
             if self.assign_task_to_agent(task):
                 assigned_count += 1
         
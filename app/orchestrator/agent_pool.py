@@ -0,0 +1,471 @@
+"""
+AgentPool - Общий пул экземпляров агентов процесса
+Агенты создаются лениво, разделяются между всеми пользователями и
+вытесняются по LRU. Доступ пользователя к агенту проверяется в момент
+назначения задачи (PooledAgentManager), а не при создании экземпляра.
+"""
+
+import asyncio
+import atexit
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Type, Union
+
+from .agent_manager import AgentCapability, AgentManager, AgentStatus, BaseAgent
+from .agent_registry import load_agent_class
+from .workflow_engine import Task, TaskType, WorkflowEngine
+
+logger = logging.getLogger(__name__)
+
+AGENT_POOL_MAX_SIZE = int(os.getenv("AGENT_POOL_MAX_SIZE", "10"))
+# tracemalloc глобальный и замедляет весь процесс, пока включен - только для диагностики
+AGENT_POOL_TRACK_MEMORY = os.getenv("AGENT_POOL_TRACK_MEMORY", "false").lower() == "true"
+
+
+@dataclass
+class PooledAgentInfo:
+    """Метрики экземпляра агента в пуле"""
+    agent_id: str
+    created_at: datetime
+    import_ms: float
+    instantiation_ms: float
+    memory_bytes: Optional[int]
+    last_used: float
+    hits: int = 0
+
+
+class AgentPool:
+    """
+    Ограниченный LRU пул агентов
+
+    Агенты задаются классами или путями импорта "модуль:Класс" (см.
+    agent_registry): во втором случае модуль агента импортируется при
+    первом обращении, и время импорта попадает в статистику.
+
+    Создание агента (импорт модуля, конструктор) блокирующее: в event loop
+    агенты берутся через get_async(), которая создает их в пуле потоков.
+
+    Экземпляры не хранят пользовательского состояния: учет назначенных
+    задач ведет PooledAgentManager конкретного пользователя. Вытеснение
+    только убирает ссылку из пула - задача, уже получившая агента,
+    дорабатывает на нем.
+    """
+
+    def __init__(self, agent_classes: Dict[str, Union[Type[BaseAgent], str]], max_size: int = AGENT_POOL_MAX_SIZE,
+                 track_memory: bool = AGENT_POOL_TRACK_MEMORY):
+        self.agent_classes = dict(agent_classes)
+        self.max_size = max(1, max_size)
+        self.track_memory = track_memory
+
+        self._agents: "OrderedDict[str, BaseAgent]" = OrderedDict()
+        self._info: Dict[str, PooledAgentInfo] = {}
+        # Возможности агента известны после первого создания и не теряются при вытеснении
+        self._capabilities: Dict[str, AgentCapability] = {}
+        self._lock = threading.Lock()
+        # Создание агентов сериализуется: оно редкое, а tracemalloc - глобальный
+        self._create_lock = threading.Lock()
+
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "instantiations": 0,
+            "instantiation_errors": 0,
+            "evictions": 0,
+        }
+
+    def get(self, agent_id: str) -> Optional[BaseAgent]:
+        """Возвращает экземпляр агента, создавая его при необходимости"""
+        agent = self._touch(agent_id)
+        if agent is not None:
+            return agent
+
+        agent_class = self.agent_classes.get(agent_id)
+        if agent_class is None:
+            logger.warning(f"Неизвестный агент: {agent_id}")
+            return None
+
+        with self._create_lock:
+            # Агента мог создать другой поток, пока мы ждали
+            agent = self._touch(agent_id)
+            if agent is not None:
+                return agent
+
+            try:
+                import_started = time.perf_counter()
+                if isinstance(agent_class, str):
+                    agent_class = load_agent_class(agent_class)
+                import_ms = (time.perf_counter() - import_started) * 1000
+                agent, elapsed_ms, memory_bytes = self._instantiate(agent_class)
+            except Exception as e:
+                with self._lock:
+                    self._stats["instantiation_errors"] += 1
+                logger.error(f"Ошибка создания агента {agent_id}: {e}")
+                return None
+
+            with self._lock:
+                self._stats["misses"] += 1
+                self._stats["instantiations"] += 1
+                self._agents[agent_id] = agent
+                self._capabilities[agent_id] = agent.capabilities
+                self._info[agent_id] = PooledAgentInfo(
+                    agent_id=agent_id,
+                    created_at=datetime.utcnow(),
+                    import_ms=import_ms,
+                    instantiation_ms=elapsed_ms,
+                    memory_bytes=memory_bytes,
+                    last_used=time.monotonic()
+                )
+                self._evict()
+
+        memory = f", ~{memory_bytes / 1024:.0f} KiB" if memory_bytes is not None else ""
+        logger.info(f"Агент {agent_id} создан в пуле за {elapsed_ms:.1f} мс "
+                    f"(импорт {import_ms:.1f} мс){memory}")
+        return agent
+
+    async def get_async(self, agent_id: str) -> Optional[BaseAgent]:
+        """get() для event loop: создание агента выполняется в пуле потоков"""
+        agent = self._touch(agent_id)
+        if agent is not None:
+            return agent
+        return await asyncio.get_running_loop().run_in_executor(None, self.get, agent_id)
+
+    def warm_up(self, agent_ids: Iterable[str]) -> int:
+        """Заранее создает агентов (после старта, чтобы первый запрос не ждал)"""
+        created = 0
+        for agent_id in agent_ids:
+            if self.get(agent_id) is not None:
+                created += 1
+        logger.info(f"Прогрев пула агентов: {created} готово")
+        return created
+
+    def is_loaded(self, agent_id: str) -> bool:
+        """Создан ли агент (без создания и без обновления LRU)"""
+        return agent_id in self._agents
+
+    def capabilities(self, agent_id: str) -> Optional[AgentCapability]:
+        """Возможности агента без создания экземпляра (если он уже создавался)"""
+        return self._capabilities.get(agent_id)
+
+    def evict(self, agent_id: str) -> bool:
+        """Принудительно убирает агента из пула"""
+        with self._lock:
+            if self._agents.pop(agent_id, None) is None:
+                return False
+            self._info.pop(agent_id, None)
+            self._stats["evictions"] += 1
+            return True
+
+    def evict_idle(self, max_idle_seconds: float) -> int:
+        """Убирает из пула агентов, не использовавшихся дольше max_idle_seconds"""
+        deadline = time.monotonic() - max_idle_seconds
+        with self._lock:
+            idle = [agent_id for agent_id, info in self._info.items() if info.last_used < deadline]
+            for agent_id in idle:
+                del self._agents[agent_id]
+                del self._info[agent_id]
+            self._stats["evictions"] += len(idle)
+        return len(idle)
+
+    def clear(self):
+        """Очищает пул"""
+        with self._lock:
+            self._agents.clear()
+            self._info.clear()
+
+    def _touch(self, agent_id: str) -> Optional[BaseAgent]:
+        with self._lock:
+            agent = self._agents.get(agent_id)
+            if agent is None:
+                return None
+            self._agents.move_to_end(agent_id)
+            info = self._info[agent_id]
+            info.last_used = time.monotonic()
+            info.hits += 1
+            self._stats["hits"] += 1
+            return agent
+
+    def _instantiate(self, agent_class: Type[BaseAgent]):
+        """Создает агента, замеряя время и прирост памяти Python-объектов"""
+        started_tracing = False
+        if self.track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            started_tracing = True
+        memory_before = tracemalloc.get_traced_memory()[0] if self.track_memory else 0
+
+        started = time.perf_counter()
+        try:
+            agent = agent_class()
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            memory_after = tracemalloc.get_traced_memory()[0] if self.track_memory else 0
+            if started_tracing:
+                tracemalloc.stop()
+
+        memory_bytes = max(0, memory_after - memory_before) if self.track_memory else None
+        return agent, elapsed_ms, memory_bytes
+
+    def _evict(self):
+        """Вытесняет давно не использованные агенты сверх max_size (под self._lock)"""
+        while len(self._agents) > self.max_size:
+            agent_id, _ = self._agents.popitem(last=False)
+            self._info.pop(agent_id, None)
+            self._stats["evictions"] += 1
+            logger.info(f"Агент {agent_id} вытеснен из пула (LRU, max_size={self.max_size})")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика пула: размер, попадания, время создания и память агентов"""
+        now = time.monotonic()
+        with self._lock:
+            agents = {
+                agent_id: {
+                    "created_at": info.created_at.isoformat(),
+                    "import_ms": round(info.import_ms, 2),
+                    "instantiation_ms": round(info.instantiation_ms, 2),
+                    "memory_bytes": info.memory_bytes,
+                    "hits": info.hits,
+                    "idle_seconds": round(now - info.last_used, 1),
+                }
+                for agent_id, info in self._info.items()
+            }
+            stats = dict(self._stats)
+
+        memory = [info["memory_bytes"] for info in agents.values() if info["memory_bytes"] is not None]
+        lookups = stats["hits"] + stats["misses"]
+        return {
+            "size": len(agents),
+            "max_size": self.max_size,
+            **stats,
+            "hit_rate": stats["hits"] / lookups if lookups else 0.0,
+            "total_import_ms": round(sum(info["import_ms"] for info in agents.values()), 2),
+            "total_instantiation_ms": round(sum(info["instantiation_ms"] for info in agents.values()), 2),
+            "memory_bytes": sum(memory) if self.track_memory else None,
+            "agents": agents,
+        }
+
+
+class PooledAgentManager(AgentManager):
+    """
+    AgentManager пользователя поверх общего пула
+
+    Набор агентов задается правами пользователя (entitlements) и
+    проверяется при каждом назначении задачи. Загрузка агентов
+    (current_tasks, max_concurrent_tasks) учитывается отдельно для
+    каждого пользователя, чтобы задачи одних пользователей не
+    блокировали общий экземпляр для других.
+    """
+
+    def __init__(self, workflow_engine: WorkflowEngine, pool: AgentPool,
+                 entitlements: Callable[[], Optional[FrozenSet[str]]]):
+        super().__init__(workflow_engine)
+        self.pool = pool
+        self.entitlements = entitlements
+        self._agent_tasks: Dict[str, List[str]] = {}  # agent_id -> task_id этого пользователя
+        self.completed_count = 0
+        self.failed_count = 0
+
+    def allowed_agent_ids(self) -> List[str]:
+        """ID агентов, доступных пользователю (None в entitlements - все агенты)"""
+        entitled = self.entitlements()
+        if entitled is None:
+            return list(self.pool.agent_classes)
+        return [agent_id for agent_id in self.pool.agent_classes if agent_id in entitled]
+
+    def is_entitled(self, agent_id: str) -> bool:
+        entitled = self.entitlements()
+        return agent_id in self.pool.agent_classes and (entitled is None or agent_id in entitled)
+
+    def get_agent(self, agent_id: str) -> Optional[BaseAgent]:
+        """Агент пула, если у пользователя есть на него права"""
+        if not self.is_entitled(agent_id):
+            return None
+        return self.pool.get(agent_id)
+
+    async def load_agents(self, task_types: Iterable[TaskType]):
+        """Создает вне event loop еще не загруженных агентов пользователя для типов задач"""
+        task_types = set(task_types)
+        for agent_id in self.allowed_agent_ids():
+            if self.pool.is_loaded(agent_id):
+                continue
+            capabilities = self.pool.capabilities(agent_id)
+            if capabilities is not None and not task_types.intersection(capabilities.task_types):
+                continue
+            await self.pool.get_async(agent_id)
+
+    async def load_agent(self, agent_id: str) -> Optional[BaseAgent]:
+        """Создает агента пула вне event loop, если у пользователя есть на него права"""
+        if not self.is_entitled(agent_id):
+            return None
+        return await self.pool.get_async(agent_id)
+
+    def register_agent(self, agent: BaseAgent) -> bool:
+        logger.warning(f"Агенты пользователя берутся из общего пула, регистрация {agent.agent_id} пропущена")
+        return False
+
+    def get_available_agents(self, task_type: TaskType) -> List[BaseAgent]:
+        """Доступные пользователю агенты пула для типа задачи"""
+        available = []
+        for agent_id in self.allowed_agent_ids():
+            capabilities = self.pool.capabilities(agent_id)
+            # Не создаем агента, если уже знаем, что он не умеет этот тип задач
+            if capabilities is not None and task_type not in capabilities.task_types:
+                continue
+            agent = self.pool.get(agent_id)
+            if agent is None or task_type not in agent.capabilities.task_types:
+                continue
+            if agent.status == AgentStatus.ERROR:
+                continue
+            if len(self._agent_tasks.get(agent_id, [])) >= agent.capabilities.max_concurrent_tasks:
+                continue
+            available.append(agent)
+
+        available.sort(
+            key=lambda a: (-a.capabilities.performance_score, len(self._agent_tasks.get(a.agent_id, [])))
+        )
+        return available
+
+    def assign_task_to_agent(self, task: Task) -> Optional[str]:
+        """Назначает задачу агенту пула, на которого у пользователя есть права"""
+        available_agents = self.get_available_agents(task.task_type)
+        if not available_agents:
+            logger.warning(f"Нет доступных агентов для задачи {task.id}")
+            return None
+
+        # Общие экземпляры не назначают себе задачи, поэтому can_handle_task
+        # проверяет только тип и содержимое задачи, а загрузку - менеджер
+        capable_agents = [agent for agent in available_agents if agent.can_handle_task(task)]
+        if not capable_agents:
+            logger.warning(f"Нет агентов способных обработать задачу {task.id} ({task.name})")
+            return None
+
+        best_agent = capable_agents[0]
+        self._book(task, best_agent.agent_id)
+        logger.info(f"Задача {task.id} ({task.name}) назначена агенту {best_agent.name} из пула")
+        return best_agent.agent_id
+
+    def assign_task_to(self, task: Task, agent_id: str) -> bool:
+        """Назначает задачу конкретному агенту пула"""
+        if not self.is_entitled(agent_id):
+            logger.warning(f"Нет доступа к агенту {agent_id}")
+            return False
+        agent = self.pool.get(agent_id)
+        if agent is None:
+            return False
+        if len(self._agent_tasks.get(agent_id, [])) >= agent.capabilities.max_concurrent_tasks:
+            return False
+
+        self._book(task, agent_id)
+        return True
+
+    def _book(self, task: Task, agent_id: str):
+        self._agent_tasks.setdefault(agent_id, []).append(task.id)
+        self.task_assignments[task.id] = agent_id
+        self.workflow_engine.assign_task(task.id, agent_id)
+
+    def _release(self, task_id: str):
+        agent_id = self.task_assignments.pop(task_id, None)
+        tasks = self._agent_tasks.get(agent_id)
+        if tasks and task_id in tasks:
+            tasks.remove(task_id)
+            if not tasks:
+                del self._agent_tasks[agent_id]
+
+    async def execute_task(self, task_id: str) -> Dict[str, Any]:
+        """Выполняет задачу через агента пула, повторно проверяя права"""
+        if task_id not in self.task_assignments:
+            raise ValueError(f"Задача {task_id} не назначена агенту")
+
+        agent_id = self.task_assignments[task_id]
+        task = self.workflow_engine._find_task(task_id)
+        if not task:
+            raise ValueError(f"Задача {task_id} не найдена")
+
+        try:
+            # Подписка могла закончиться между назначением и выполнением
+            if not self.is_entitled(agent_id):
+                raise PermissionError(f"Нет доступа к агенту {agent_id}")
+            agent = await self.pool.get_async(agent_id)
+            if not agent:
+                raise ValueError(f"Агент {agent_id} не найден")
+
+            result = await agent.execute_task(task)
+            self.workflow_engine.complete_task(task_id, result)
+            self.completed_count += 1
+            return result
+        except Exception as e:
+            logger.error(f"Ошибка выполнения задачи {task_id}: {str(e)}")
+            self.workflow_engine.fail_task(task_id, str(e))
+            self.failed_count += 1
+            raise
+        finally:
+            self._release(task_id)
+
+    def unregister_agent(self, agent_id: str) -> bool:
+        return False
+
+    def get_agent_status(self, agent_id: str) -> Optional[Dict[str, Any]]:
+        if not self.is_entitled(agent_id):
+            return None
+        agent = self.pool.get(agent_id)
+        if agent is None:
+            return None
+        self.agents[agent_id] = agent
+        try:
+            status = super().get_agent_status(agent_id)
+        finally:
+            del self.agents[agent_id]
+        status["current_tasks"] = len(self._agent_tasks.get(agent_id, []))
+        return status
+
+    def get_all_agents_status(self) -> Dict[str, Dict[str, Any]]:
+        """Статус агентов; еще не созданные агенты не загружаются ради статуса"""
+        return {
+            agent_id: (self.get_agent_status(agent_id) if self.pool.is_loaded(agent_id)
+                       else {"agent_id": agent_id, "status": "not_loaded"})
+            for agent_id in self.allowed_agent_ids()
+        }
+
+    def get_system_status(self) -> Dict[str, Any]:
+        total_agents = len(self.allowed_agent_ids())
+        busy_agents = len(self._agent_tasks)
+        return {
+            "total_agents": total_agents,
+            "idle_agents": total_agents - busy_agents,
+            "busy_agents": busy_agents,
+            "error_agents": 0,
+            "active_tasks": sum(len(tasks) for tasks in self._agent_tasks.values()),
+            "completed_tasks": self.completed_count,
+            "failed_tasks": self.failed_count,
+            "task_assignments": len(self.task_assignments),
+        }
+
+
+_pool: Optional[AgentPool] = None
+_pool_pid: Optional[int] = None
+_pool_lock = threading.Lock()
+
+
+def get_agent_pool(agent_classes: Optional[Dict[str, Union[Type[BaseAgent], str]]] = None) -> AgentPool:
+    """
+    Возвращает пул агентов процесса
+
+    Агенты держат HTTP и MCP клиентов, которые не переживают fork,
+    поэтому в каждом gunicorn worker создается свой пул.
+    """
+    global _pool, _pool_pid
+
+    pid = os.getpid()
+    if _pool is None or _pool_pid != pid:
+        with _pool_lock:
+            if _pool is None or _pool_pid != pid:
+                if agent_classes is None:
+                    raise RuntimeError("Пул агентов еще не создан: нужен реестр классов агентов")
+                _pool = AgentPool(agent_classes)
+                _pool_pid = pid
+                atexit.register(_pool.clear)
+    return _pool
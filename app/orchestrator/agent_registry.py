@@ -0,0 +1,48 @@
+"""
+Реестр агентов - ленивая загрузка
+Агенты задаются путями импорта "модуль:Класс": модуль агента и его тяжелые
+зависимости (Vertex AI, OpenAI, PIL, OpenCV, MCP клиенты) импортируются
+только при первом обращении к агенту через AgentPool, а не при старте
+процесса.
+"""
+
+import importlib
+import os
+from typing import Dict, List, Type
+
+from .agent_manager import BaseAgent
+
+AGENT_REGISTRY: Dict[str, str] = {
+    "chief_content_agent": "app.agents.chief_agent:ChiefContentAgent",
+    "drafting_agent": "app.agents.drafting_agent:DraftingAgent",
+    "publisher_agent": "app.agents.publisher_agent:PublisherAgent",
+    "research_factcheck_agent": "app.agents.research_factcheck_agent:ResearchFactCheckAgent",
+    "trends_scout_agent": "app.agents.trends_scout_agent:TrendsScoutAgent",
+    "multimedia_producer_agent": "app.agents.multimedia_producer_agent:MultimediaProducerAgent",
+    "legal_guard_agent": "app.agents.legal_guard_agent:LegalGuardAgent",
+    "repurpose_agent": "app.agents.repurpose_agent:RepurposeAgent",
+    "community_concierge_agent": "app.agents.community_concierge_agent:CommunityConciergeAgent",
+    "paid_creative_agent": "app.agents.paid_creative_agent:PaidCreativeAgent",
+}
+
+
+def load_agent_class(import_path: str) -> Type[BaseAgent]:
+    """Импортирует класс агента по пути "модуль:Класс" """
+    module_name, _, class_name = import_path.partition(":")
+    module = importlib.import_module(module_name)
+    return getattr(module, class_name)
+
+
+def get_warmup_agent_ids() -> List[str]:
+    """
+    Агенты для прогрева после старта (AGENT_WARMUP)
+
+    Список ID через запятую или "all"; по умолчанию пусто - все агенты
+    создаются при первом запросе.
+    """
+    value = os.getenv("AGENT_WARMUP", "").strip()
+    if not value:
+        return []
+    if value.lower() == "all":
+        return list(AGENT_REGISTRY)
+    return [agent_id.strip() for agent_id in value.split(",") if agent_id.strip()]
@@ -0,0 +1,473 @@
+"""
+ContentJobManager - фоновое выполнение workflow создания контента
+Запрос ставится в очередь и сразу получает workflow_id, а workflow выполняется
+в общем фоновом event loop процесса; прогресс доступен через статус workflow и поток событий (SSE)
+
+Задачи и их события живут в памяти процесса, принявшего запрос. Статус и
+результат сохраняются в WorkflowStore, поэтому /workflow/<id>/result отдает
+любой gunicorn worker (кроме WORKFLOW_STORE_BACKEND=memory). Живой поток
+событий есть только у процесса-владельца; другой worker восстанавливает
+события из сохраненных workflow и задач, опрашивая WorkflowStore.
+
+Каждый открытый SSE-поток занимает поток gthread worker до завершения
+workflow, поэтому число потоков на процесс ограничено (CONTENT_JOBS_MAX_STREAMS).
+"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from enum import Enum
+from typing import Any, Dict, Iterator, List, Optional
+
+from .workflow_engine import Task
+from .workflow_store import WorkflowStore, get_workflow_store
+from ..models.workflow import WorkflowStatus
+from app.utils.event_loop import get_background_loop
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+
+class JobStatus(Enum):
+    """Статусы фоновой задачи создания контента"""
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+# Статус сохраненного workflow -> статус задачи
+STORED_JOB_STATUS = {
+    WorkflowStatus.CREATED: JobStatus.QUEUED,
+    WorkflowStatus.RUNNING: JobStatus.RUNNING,
+    WorkflowStatus.PAUSED: JobStatus.RUNNING,
+    WorkflowStatus.COMPLETED: JobStatus.COMPLETED,
+    WorkflowStatus.FAILED: JobStatus.FAILED,
+    WorkflowStatus.CANCELLED: JobStatus.FAILED,
+}
+
+
+class JobQueueFullError(Exception):
+    """Очередь фоновых задач переполнена"""
+    pass
+
+
+class StreamLimitError(Exception):
+    """Открыто максимальное число SSE-потоков процесса"""
+    pass
+
+
+def _default_max_streams() -> int:
+    # Половина потоков gthread worker остается обычным запросам
+    return max(1, int(os.getenv("GUNICORN_THREADS", "8")) // 2)
+
+
+class _StreamSlot:
+    """Итератор SSE-потока, освобождающий слот при завершении или закрытии"""
+
+    def __init__(self, events: Iterator[str], release):
+        self._events = events
+        self._release = release
+        self._closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        try:
+            return next(self._events)
+        except StopIteration:
+            self.close()
+            raise
+
+    def close(self):
+        # WSGI-сервер вызывает close() и при обрыве соединения клиентом
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._events.close()
+        finally:
+            self._release()
+
+    def __del__(self):
+        # Ответ, который сервер так и не начал отдавать (stream_with_context
+        # закрывает поток, только если итерация началась)
+        self.close()
+
+
+@dataclass
+class ContentJob:
+    """Фоновая задача создания контента (ключ - workflow_id)"""
+    workflow_id: str
+    brief_id: str
+    user_id: Optional[int] = None
+    status: JobStatus = JobStatus.QUEUED
+    created_at: datetime = field(default_factory=datetime.now)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    events: List[Dict[str, Any]] = field(default_factory=list)
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in (JobStatus.COMPLETED, JobStatus.FAILED)
+
+    @classmethod
+    def from_workflow(cls, workflow) -> "ContentJob":
+        """Задача по сохраненному WorkflowInstance (без событий)"""
+        status = STORED_JOB_STATUS.get(workflow.status, JobStatus.RUNNING)
+        # Статус COMPLETED пишется движком до результата задачи
+        if status == JobStatus.COMPLETED and not workflow.output_data:
+            status = JobStatus.RUNNING
+        created_by = workflow.created_by or ""
+        return cls(
+            workflow_id=workflow.id,
+            brief_id=workflow.context.get("brief_id", ""),
+            user_id=int(created_by) if created_by.isdigit() else None,
+            status=status,
+            created_at=workflow.created_at,
+            started_at=workflow.started_at,
+            finished_at=workflow.completed_at if status in (JobStatus.COMPLETED, JobStatus.FAILED) else None,
+            result=workflow.output_data or None,
+            error=workflow.error_message
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "workflow_id": self.workflow_id,
+            "brief_id": self.brief_id,
+            "status": self.status.value,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "events_count": len(self.events),
+            "error": self.error
+        }
+
+
+class ContentJobManager:
+    """Менеджер фоновых задач создания контента"""
+
+    def __init__(self, max_concurrent_jobs: int = None, max_queued_jobs: int = None,
+                 retention_seconds: int = None, store: Optional[WorkflowStore] = None,
+                 max_streams: int = None, stored_poll_seconds: float = None):
+        self.max_concurrent_jobs = max_concurrent_jobs or int(os.getenv("CONTENT_JOBS_MAX_CONCURRENT", "200"))
+        self.max_queued_jobs = max_queued_jobs or int(os.getenv("CONTENT_JOBS_MAX_QUEUED", "1000"))
+        self.retention_seconds = retention_seconds or int(os.getenv("CONTENT_JOBS_RETENTION_SECONDS", "3600"))
+        self.max_streams = max_streams or int(os.getenv("CONTENT_JOBS_MAX_STREAMS", "0")) or _default_max_streams()
+        self.stored_poll_seconds = stored_poll_seconds or float(os.getenv("CONTENT_JOBS_STORED_POLL_SECONDS", "2"))
+
+        self.jobs: Dict[str, ContentJob] = {}
+        # None - хранилище текущего процесса (get_workflow_store() пересоздает его после fork)
+        self._store = store
+        self._changed = threading.Condition()
+        self._open_streams = 0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._semaphore_loop: Optional[asyncio.AbstractEventLoop] = None
+
+        logger.info("ContentJobManager инициализирован")
+
+    # ==================== JOBS ====================
+
+    def submit(self, orchestrator, request_data: Dict[str, Any], timeout: float = 30.0) -> ContentJob:
+        """
+        Создает workflow и ставит его выполнение в очередь
+
+        Подготовка (бриф и задачи) выполняется синхронно, поэтому workflow_id
+        сразу доступен для /workflow/<id>/status.
+
+        Raises:
+            JobQueueFullError: если незавершенных задач слишком много
+        """
+        self._prune_finished()
+
+        with self._changed:
+            unfinished = sum(1 for job in self.jobs.values() if not job.is_finished)
+        if unfinished >= self.max_queued_jobs:
+            raise JobQueueFullError(f"В очереди уже {unfinished} задач создания контента")
+
+        background_loop = get_background_loop()
+        prepared = background_loop.submit(
+            orchestrator.prepare_content_request(request_data), timeout=timeout
+        )
+
+        job = ContentJob(
+            workflow_id=prepared["workflow_id"],
+            brief_id=prepared["brief_id"],
+            user_id=request_data.get("user_id")
+        )
+        with self._changed:
+            self.jobs[job.workflow_id] = job
+        self._record_event(job, "queued", job.to_dict())
+
+        background_loop.submit_nowait(self._run_job(orchestrator, job))
+        logger.info(f"Workflow {job.workflow_id} поставлен в очередь фонового выполнения")
+
+        return job
+
+    async def _run_job(self, orchestrator, job: ContentJob):
+        """Выполняет workflow задачи в фоновом event loop"""
+        # Семафор привязан к loop: после fork/перезапуска loop создается заново
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent_jobs)
+            self._semaphore_loop = loop
+
+        async with self._semaphore:
+            job.status = JobStatus.RUNNING
+            job.started_at = datetime.now()
+            self._record_event(job, "started", job.to_dict())
+
+            def on_task_done(task: Task, result: Optional[Dict[str, Any]]):
+                self._record_event(job, "task", {
+                    "task_id": task.id,
+                    "name": task.name,
+                    "status": task.status.value,
+                    "platform": task.context.get("platform"),
+                    "error": task.error_message,
+                    "result": result
+                })
+
+            try:
+                job.result = await orchestrator.execute_workflow(job.workflow_id, on_task_done=on_task_done)
+                job.status = JobStatus.COMPLETED
+            except Exception as e:
+                logger.error(f"Ошибка фонового выполнения workflow {job.workflow_id}: {e}")
+                job.error = str(e)
+                job.status = JobStatus.FAILED
+            finally:
+                job.finished_at = datetime.now()
+                orchestrator.workflow_engine.set_workflow_output(job.workflow_id, job.result, job.error)
+
+            if job.status == JobStatus.COMPLETED:
+                self._record_event(job, "completed", {**job.to_dict(), "result": job.result})
+            else:
+                self._record_event(job, "failed", job.to_dict())
+
+    def get_job(self, workflow_id: str) -> Optional[ContentJob]:
+        """Возвращает задачу по workflow_id"""
+        with self._changed:
+            return self.jobs.get(workflow_id)
+
+    def find_job(self, workflow_id: str) -> Optional[ContentJob]:
+        """
+        Возвращает задачу из памяти или из WorkflowStore
+
+        Задача, принятая другим процессом, читается из хранилища: у нее есть
+        статус, результат и ошибка, но нет событий для SSE.
+        """
+        job = self.get_job(workflow_id)
+        if job:
+            return job
+
+        workflow = self._get_store().get_workflow(workflow_id)
+        return ContentJob.from_workflow(workflow) if workflow else None
+
+    def _get_store(self) -> WorkflowStore:
+        return self._store if self._store is not None else get_workflow_store()
+
+    def _record_event(self, job: ContentJob, event: str, data: Dict[str, Any]):
+        """Добавляет событие задачи и будит ожидающие SSE-потоки"""
+        with self._changed:
+            job.events.append({
+                "id": len(job.events) + 1,
+                "event": event,
+                "data": data,
+                "timestamp": datetime.now().isoformat()
+            })
+            self._changed.notify_all()
+
+    def _prune_finished(self):
+        """Удаляет завершенные задачи старше retention_seconds"""
+        now = datetime.now()
+        with self._changed:
+            expired = [
+                workflow_id for workflow_id, job in self.jobs.items()
+                if job.is_finished and (now - job.finished_at).total_seconds() > self.retention_seconds
+            ]
+            for workflow_id in expired:
+                del self.jobs[workflow_id]
+
+        if expired:
+            logger.info(f"Удалено {len(expired)} завершенных фоновых задач")
+
+    # ==================== STREAMING ====================
+
+    @staticmethod
+    def _has_final_event(job: ContentJob) -> bool:
+        return bool(job.events) and job.events[-1]["event"] in ("completed", "failed")
+
+    @staticmethod
+    def _format_event(event: Dict[str, Any]) -> str:
+        payload = json.dumps(
+            {**event["data"], "timestamp": event["timestamp"]},
+            ensure_ascii=False, default=str
+        )
+        return f"id: {event['id']}\nevent: {event['event']}\ndata: {payload}\n\n"
+
+    def open_stream(self, workflow_id: str, last_event_id: int = 0,
+                    heartbeat_seconds: float = 15.0) -> Iterator[str]:
+        """
+        Открывает SSE-поток задачи с учетом лимита потоков процесса
+
+        Задача процесса отдается из памяти (stream_events), задача другого
+        процесса - из WorkflowStore (stream_stored_events). Слот освобождается,
+        когда поток завершен или закрыт сервером.
+
+        Raises:
+            StreamLimitError: если открыто max_streams потоков
+        """
+        with self._changed:
+            if self._open_streams >= self.max_streams:
+                raise StreamLimitError(f"Открыто {self._open_streams} потоков событий из {self.max_streams}")
+            self._open_streams += 1
+
+        if self.get_job(workflow_id):
+            events = self.stream_events(workflow_id, last_event_id, heartbeat_seconds)
+        else:
+            events = self.stream_stored_events(workflow_id, last_event_id, heartbeat_seconds)
+        return _StreamSlot(events, self._release_stream)
+
+    def _release_stream(self):
+        with self._changed:
+            self._open_streams -= 1
+
+    def stream_events(self, workflow_id: str, last_event_id: int = 0,
+                      heartbeat_seconds: float = 15.0) -> Iterator[str]:
+        """
+        Генератор Server-Sent Events по задаче
+
+        Отдает события начиная с last_event_id (для переподключения по
+        Last-Event-ID), шлет keep-alive комментарии и завершается после
+        события completed/failed.
+        """
+        job = self.get_job(workflow_id)
+        if not job:
+            return
+
+        sent = last_event_id
+        while True:
+            with self._changed:
+                if len(job.events) <= sent and not self._has_final_event(job):
+                    self._changed.wait(timeout=heartbeat_seconds)
+                pending = job.events[sent:]
+                finished = self._has_final_event(job)
+
+            if not pending:
+                yield ": keep-alive\n\n"
+
+            for event in pending:
+                sent = event["id"]
+                yield self._format_event(event)
+
+            if finished:
+                return
+
+    @staticmethod
+    def _stored_events(workflow, tasks) -> List[Dict[str, Any]]:
+        """
+        События задачи, восстановленные по сохраненным workflow и задачам
+
+        Нумерация совпадает с событиями процесса-владельца (queued, started,
+        task по завершенным задачам, completed/failed), поэтому Last-Event-ID
+        переносится между процессами.
+        """
+        job = ContentJob.from_workflow(workflow)
+        timestamp = (workflow.completed_at or workflow.started_at or workflow.created_at).isoformat()
+        events = [("queued", {**job.to_dict(), "status": JobStatus.QUEUED.value}, workflow.created_at)]
+        if workflow.started_at:
+            events.append(("started", {**job.to_dict(), "status": JobStatus.RUNNING.value}, workflow.started_at))
+
+        finished_tasks = sorted(
+            (task for task in tasks if task.completed_at is not None),
+            key=lambda task: (task.completed_at, task.id)
+        )
+        for task in finished_tasks:
+            events.append(("task", {
+                "task_id": task.id,
+                "name": task.name,
+                "status": task.status.value,
+                "platform": task.input_data.get("platform"),
+                "error": task.error_message,
+                "result": task.output_data or None
+            }, task.completed_at))
+
+        if job.status == JobStatus.COMPLETED:
+            events.append(("completed", {**job.to_dict(), "result": job.result}, workflow.completed_at))
+        elif job.status == JobStatus.FAILED:
+            events.append(("failed", job.to_dict(), workflow.completed_at))
+
+        return [
+            {
+                "id": number,
+                "event": event,
+                "data": data,
+                "timestamp": at.isoformat() if at else timestamp
+            }
+            for number, (event, data, at) in enumerate(events, start=1)
+        ]
+
+    def stream_stored_events(self, workflow_id: str, last_event_id: int = 0,
+                             heartbeat_seconds: float = 15.0) -> Iterator[str]:
+        """
+        Генератор Server-Sent Events по задаче другого процесса
+
+        Опрашивает WorkflowStore раз в stored_poll_seconds и отдает новые
+        события, пока workflow не завершится.
+        """
+        store = self._get_store()
+        poll_seconds = min(self.stored_poll_seconds, heartbeat_seconds)
+
+        sent = last_event_id
+        idle = 0.0
+        while True:
+            workflow = store.get_workflow(workflow_id)
+            if workflow is None:
+                return
+            events = self._stored_events(workflow, store.get_tasks(workflow_id))
+            finished = bool(events) and events[-1]["event"] in ("completed", "failed")
+
+            pending = events[sent:]
+            for event in pending:
+                sent = event["id"]
+                yield self._format_event(event)
+
+            if finished:
+                return
+
+            if pending:
+                idle = 0.0
+            elif idle >= heartbeat_seconds:
+                yield ": keep-alive\n\n"
+                idle = 0.0
+
+            time.sleep(poll_seconds)
+            idle += poll_seconds
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Возвращает статистику фоновых задач"""
+        with self._changed:
+            by_status = {status.value: 0 for status in JobStatus}
+            for job in self.jobs.values():
+                by_status[job.status.value] += 1
+            open_streams = self._open_streams
+
+        return {
+            "jobs": by_status,
+            "open_streams": open_streams,
+            "max_streams": self.max_streams,
+            "max_concurrent_jobs": self.max_concurrent_jobs,
+            "max_queued_jobs": self.max_queued_jobs,
+            "retention_seconds": self.retention_seconds
+        }
+
+
+# Глобальный менеджер фоновых задач
+content_job_manager = ContentJobManager()
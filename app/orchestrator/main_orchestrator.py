@@ -5,12 +5,15 @@ MainOrchestrator - Главный оркестратор системы
 
 import asyncio
 import logging
+import os
+import time
 from datetime import datetime
-from typing import Dict, List, Optional, Any
+from typing import Callable, Dict, FrozenSet, List, Optional, Any, Tuple
 from dataclasses import dataclass
 
-from .workflow_engine import WorkflowEngine, Task, TaskType, TaskPriority, TaskStatus
+from .workflow_engine import WorkflowEngine, Workflow, Task, TaskType, TaskPriority, TaskStatus
 from .agent_manager import AgentManager, BaseAgent, AgentCapability, AgentStatus
+from .agent_pool import AgentPool, PooledAgentManager
 from ..models.content import ContentBrief, ContentPiece, Platform, ContentType
 from ..models.workflow import WorkflowInstance, WorkflowStatus
 
@@ -26,6 +29,8 @@ class ContentOrchestrator:
         self.agent_manager = AgentManager(self.workflow_engine)
         self.is_running = False
         self.auto_assign_enabled = True
+        # Максимум одновременно выполняемых задач одного workflow
+        self.max_parallel_tasks = max(1, int(os.getenv("WORKFLOW_MAX_PARALLEL_TASKS", "8")))
         
         logger.info("ContentOrchestrator инициализирован")
     
@@ -65,12 +70,24 @@ class ContentOrchestrator:
         """Отменяет регистрацию агента"""
         return self.agent_manager.unregister_agent(agent_id)
     
+    def attach_agent_pool(self, pool: AgentPool,
+                          entitlements: Optional[Callable[[], Optional[FrozenSet[str]]]] = None):
+        """Переключает оркестратор на агентов общего пула (создаются при первом использовании)
+        
+        Args:
+            pool: пул агентов процесса
+            entitlements: возвращает ID доступных агентов, None - все агенты пула
+        """
+        self.agent_manager = PooledAgentManager(self.workflow_engine, pool, entitlements or (lambda: None))
+    
     async def create_content_workflow(self, brief: ContentBrief, 
                                     platforms: List[Platform] = None,
                                     content_types: List[ContentType] = None,
                                     variants_count: int = 1,
-                                    image_source: str = None) -> str:
+                                    image_source: str = None,
+                                    request: Dict[str, Any] = None) -> str:
         """Создает workflow для создания контента"""
+        request = request or {}
         platforms = platforms or [Platform.TELEGRAM, Platform.VK]
         content_types = content_types or [ContentType.POST]
         
@@ -83,7 +100,8 @@ class ContentOrchestrator:
                 "platforms": [p.value for p in platforms],
                 "content_types": [ct.value for ct in content_types],
                 "image_source": image_source  # Сохраняем image_source в контексте workflow
-            }
+            },
+            created_by=str(request["user_id"]) if request.get("user_id") is not None else ""
         )
         
         # Добавляем задачи для каждого платформы и типа контента
@@ -142,72 +160,340 @@ class ContentOrchestrator:
         logger.info(f"Создан workflow {workflow.id} для бриф {brief.id}")
         return workflow.id
     
-    async def execute_workflow(self, workflow_id: str) -> Dict[str, Any]:
-        """Выполняет workflow"""
+    def _build_task_graph(self, workflow) -> Dict[str, List[str]]:
+        """Строит DAG задач workflow: task_id -> список task_id, от которых она зависит
+        
+        Зависимостью считается как явный dependencies, так и parent_task_id.
+        Ссылки на задачи вне workflow игнорируются (как и при прежнем
+        последовательном выполнении).
+        """
+        task_ids = {task.id for task in workflow.tasks}
+        graph: Dict[str, List[str]] = {}
+        
+        for task in workflow.tasks:
+            if task.id in graph:
+                continue  # задача могла быть добавлена в workflow дважды
+            
+            deps = list(task.dependencies)
+            parent_task_id = task.context.get("parent_task_id")
+            if parent_task_id and parent_task_id not in deps:
+                deps.append(parent_task_id)
+            graph[task.id] = [dep for dep in deps if dep in task_ids and dep != task.id]
+        
+        return graph
+    
+    def _apply_parent_result(self, task: Task, results: Dict[str, Any]):
+        """Переносит результат родительской задачи в контекст дочерней"""
+        parent_task_id = task.context.get("parent_task_id")
+        if not parent_task_id or parent_task_id not in results:
+            return
+        
+        # Получаем результат родительской задачи
+        parent_result = results[parent_task_id]
+        
+        # Если это задача публикации и у parent есть content, добавляем его в context
+        if "Publish" in task.name and isinstance(parent_result, dict) and "content" in parent_result:
+            task.context["content"] = parent_result["content"]
+            logger.info(f"Обновлен контекст задачи {task.id} контентом из parent task {parent_task_id}")
+            logger.info(f"Content keys: {list(parent_result['content'].keys())}")
+    
+    @staticmethod
+    async def _record_agent_usage(workflow: Workflow, task: Task, agent_id: Optional[str], result: Any,
+                                  execution_time_ms: int):
+        """
+        Учитывает выполненную задачу: счетчики подписки агента и запись token_usage
+
+        Провайдер, модель и стоимость берутся из результата агента, если он их
+        сообщает (ai_provider, ai_model, prompt_tokens, completion_tokens,
+        tokens_used, cost_usd, cost_kopeks); иначе остаются пустыми.
+        """
+        user_id = workflow.created_by
+        if not agent_id or not str(user_id).isdigit():
+            return
+        usage = result if isinstance(result, dict) else {}
+        tokens_used = int(usage.get("tokens_used") or 0)
+        prompt_tokens = int(usage.get("prompt_tokens") or 0)
+        completion_tokens = int(usage.get("completion_tokens") or max(0, tokens_used - prompt_tokens))
+        cost_kopeks = int(usage.get("cost_kopeks") or 0)
+
+        def record():
+            from ..billing.middleware.agent_access_middleware import AgentAccessMiddleware
+            from ..billing.services.token_usage_recorder import get_token_usage_recorder
+
+            AgentAccessMiddleware.increment_agent_usage(
+                int(user_id), agent_id, prompt_tokens + completion_tokens, cost_kopeks, None
+            )
+            get_token_usage_recorder().record(
+                user_id=int(user_id),
+                agent_id=agent_id,
+                ai_provider=usage.get("ai_provider") or "",
+                ai_model=usage.get("ai_model") or "",
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                cost_usd=float(usage.get("cost_usd") or 0.0),
+                cost_rub=cost_kopeks / 100,
+                workflow_id=workflow.id,
+                platform=task.context.get("platform"),
+                task_type=task.task_type.value,
+                execution_time_ms=execution_time_ms
+            )
+
+        try:
+            # С Redis хранилищем квот учет - сетевой вызов, а полная очередь
+            # token_usage ждет сброса: не выполняем их в event loop
+            await asyncio.to_thread(record)
+        except Exception as e:
+            logger.warning(f"Не удалось учесть использование агента {agent_id} пользователем {user_id}: {e}")
+
+    @staticmethod
+    def _notify_task_done(callback: Optional[Callable], task: Task, result: Optional[Dict[str, Any]]):
+        """Вызывает on_task_done, не давая ошибке подписчика сорвать workflow"""
+        if not callback:
+            return
+        try:
+            callback(task, result)
+        except Exception as e:
+            logger.warning(f"Ошибка в on_task_done для задачи {task.id}: {e}")
+    
+    @staticmethod
+    def _topological_order(graph: Dict[str, List[str]]) -> List[str]:
+        """Порядок задач, в котором зависимости идут раньше зависимых (алгоритм Кана)
+        
+        Задачи на цикле зависимостей и задачи, зависящие от них, в порядок
+        не попадают: они никогда не станут готовыми к выполнению.
+        """
+        waiting_on = {task_id: len(deps) for task_id, deps in graph.items()}
+        dependents: Dict[str, List[str]] = {}
+        for task_id, deps in graph.items():
+            for dep_id in deps:
+                dependents.setdefault(dep_id, []).append(task_id)
+        
+        order = [task_id for task_id, count in waiting_on.items() if count == 0]
+        for task_id in order:
+            for dependent_id in dependents.get(task_id, []):
+                waiting_on[dependent_id] -= 1
+                if waiting_on[dependent_id] == 0:
+                    order.append(dependent_id)
+        return order
+    
+    @classmethod
+    def _critical_path(cls, graph: Dict[str, List[str]],
+                       timings: Dict[str, Dict[str, float]]) -> Tuple[float, List[str]]:
+        """Находит критический путь DAG по фактическим длительностям задач
+        
+        Задачи, заблокированные циклом зависимостей, не учитываются.
+        
+        Returns:
+            (длительность критического пути в секундах, task_id вдоль пути)
+        """
+        longest: Dict[str, float] = {}
+        previous: Dict[str, Optional[str]] = {}
+        
+        for task_id in cls._topological_order(graph):
+            duration = timings.get(task_id, {}).get("duration", 0.0)
+            best_dep, best_length = None, 0.0
+            for dep_id in graph[task_id]:
+                if best_dep is None or longest[dep_id] > best_length:
+                    best_dep, best_length = dep_id, longest[dep_id]
+            
+            longest[task_id] = best_length + duration
+            previous[task_id] = best_dep
+        
+        if not longest:
+            return 0.0, []
+        
+        tail = max(longest, key=longest.get)
+        path = []
+        while tail:
+            path.append(tail)
+            tail = previous.get(tail)
+        path.reverse()
+        
+        return longest[path[-1]], path
+    
+    async def execute_workflow(self, workflow_id: str,
+                               on_task_done: Optional[Callable[[Task, Optional[Dict[str, Any]]], None]] = None
+                               ) -> Dict[str, Any]:
+        """Выполняет workflow
+        
+        Задачи выполняются как DAG: каждая задача запускается, как только
+        завершены все ее зависимости, независимые задачи (например, черновики
+        для разных платформ) выполняются параллельно. Параллелизм ограничен
+        max_parallel_tasks на workflow и max_concurrent_tasks каждого агента.
+        Задачи на цикле зависимостей (и зависящие от них) помечаются FAILED,
+        workflow при этом завершается со статусом FAILED.
+        
+        Args:
+            workflow_id: ID workflow
+            on_task_done: вызывается с (task, result) после завершения каждой
+                задачи, в том числе неудачного (result=None)
+        """
         if workflow_id not in self.workflow_engine.workflows:
             raise ValueError(f"Workflow {workflow_id} не найден")
 
         workflow = self.workflow_engine.workflows[workflow_id]
-        workflow.status = TaskStatus.IN_PROGRESS
+        self.workflow_engine.set_workflow_status(workflow_id, TaskStatus.IN_PROGRESS)
+
+        # Агенты пула создаются в потоках до назначения задач, а не в event loop
+        await self.agent_manager.load_agents({task.task_type for task in workflow.tasks})
+
+        tasks_by_id = {task.id: task for task in workflow.tasks}
+        graph = self._build_task_graph(workflow)
+        waiting_on = {task_id: set(deps) for task_id, deps in graph.items()}
+        dependents: Dict[str, List[str]] = {}
+        for task_id, deps in graph.items():
+            for dep_id in deps:
+                dependents.setdefault(dep_id, []).append(task_id)
 
         results = {}
+        timings: Dict[str, Dict[str, float]] = {}
+        in_flight: Dict[asyncio.Task, str] = {}
+        errors: List[Exception] = []
+        # Задачи в порядке workflow.tasks, чьи зависимости выполнены
+        ready = [task_id for task_id in graph if not waiting_on[task_id]]
+        resolved = set()
+        started_at = time.monotonic()
+
+        def fail_unreachable(task_ids: List[str], reason: str):
+            """Проваливает задачи, которые никогда не станут готовыми"""
+            for task_id in task_ids:
+                task = tasks_by_id[task_id]
+                task.status = TaskStatus.FAILED
+                task.error_message = reason
+                resolved.add(task_id)
+                self._notify_task_done(on_task_done, task, None)
+            logger.error(f"Workflow {workflow_id}: {reason}, задачи {task_ids}")
+
+        # Цикл зависимостей: задачи цикла и зависящие от них не запустятся
+        reachable = set(self._topological_order(graph))
+        blocked = [task_id for task_id in graph if task_id not in reachable]
+        if blocked:
+            fail_unreachable(blocked, "Циклическая зависимость задач")
+
+        async def run_task(task_id: str):
+            task_started = time.monotonic()
+            agent_id = tasks_by_id[task_id].assigned_agent
+            try:
+                result = await self.agent_manager.execute_task(task_id)
+                await self._record_agent_usage(
+                    workflow, tasks_by_id[task_id], agent_id, result,
+                    int((time.monotonic() - task_started) * 1000)
+                )
+                return result
+            finally:
+                task_finished = time.monotonic()
+                timings[task_id] = {
+                    "started": task_started - started_at,
+                    "finished": task_finished - started_at,
+                    "duration": task_finished - task_started,
+                }
+
+        def resolve(task_id: str):
+            """Отмечает задачу обработанной и разблокирует зависимые"""
+            resolved.add(task_id)
+            self._notify_task_done(on_task_done, tasks_by_id[task_id], results.get(task_id))
+            for dependent_id in dependents.get(task_id, []):
+                waiting_on[dependent_id].discard(task_id)
+                if not waiting_on[dependent_id]:
+                    ready.append(dependent_id)
 
         try:
-            # Выполняем задачи по порядку
-            for task in workflow.tasks:
-                # Проверяем, нужно ли обновить контекст задачи из parent task
-                parent_task_id = task.context.get("parent_task_id")
-                if parent_task_id and parent_task_id in results:
-                    # Получаем результат родительской задачи
-                    parent_result = results[parent_task_id]
-
-                    # Если это задача публикации и у parent есть content, добавляем его в context
-                    if "Publish" in task.name and "content" in parent_result:
-                        task.context["content"] = parent_result["content"]
-                        logger.info(f"Обновлен контекст задачи {task.id} контентом из parent task {parent_task_id}")
-                        logger.info(f"Content keys: {list(parent_result['content'].keys())}")
-
-                if task.status == TaskStatus.PENDING:
-                    # Назначаем задачу агенту
-                    agent_id = self.agent_manager.assign_task_to_agent(task)
-                    if agent_id:
-                        # Выполняем задачу
-                        result = await self.agent_manager.execute_task(task.id)
-                        results[task.id] = result
-                    else:
-                        logger.warning(f"Не удалось назначить задачу {task.id}")
-                        task.status = TaskStatus.FAILED
-                        task.error_message = "No available agent"
-                elif task.status == TaskStatus.IN_PROGRESS:
-                    # Задача уже назначена, выполняем её
-                    result = await self.agent_manager.execute_task(task.id)
-                    results[task.id] = result
+            while ready or in_flight:
+                deferred = []
+                
+                # Запускаем готовые задачи, пока есть свободные слоты и агенты
+                while ready and not errors and len(in_flight) < self.max_parallel_tasks:
+                    task_id = ready.pop(0)
+                    task = tasks_by_id[task_id]
+                    self._apply_parent_result(task, results)
+
+                    if task.status == TaskStatus.PENDING:
+                        # Назначаем задачу агенту
+                        agent_id = self.agent_manager.assign_task_to_agent(task)
+                        if not agent_id:
+                            if in_flight:
+                                # Агенты заняты задачами этого workflow - ждем освобождения
+                                deferred.append(task_id)
+                                continue
+                            logger.warning(f"Не удалось назначить задачу {task.id}")
+                            task.status = TaskStatus.FAILED
+                            task.error_message = "No available agent"
+                            resolve(task_id)
+                            continue
+                    elif task.status != TaskStatus.IN_PROGRESS:
+                        # Задача уже выполнена или отменена ранее
+                        resolve(task_id)
+                        continue
+
+                    in_flight[asyncio.create_task(run_task(task_id))] = task_id
+
+                ready[:0] = deferred
+
+                if not in_flight:
+                    break
+
+                done, _ = await asyncio.wait(in_flight.keys(), return_when=asyncio.FIRST_COMPLETED)
+                for finished in done:
+                    task_id = in_flight.pop(finished)
+                    try:
+                        results[task_id] = finished.result()
+                    except Exception as e:
+                        # Дожидаемся уже запущенных задач, новые не запускаем
+                        errors.append(e)
+                    resolve(task_id)
+
+            if errors:
+                raise errors[0]
+
+            # Задачи, так и не ставшие готовыми, не должны пропадать молча
+            unreachable = [task_id for task_id in graph if task_id not in resolved]
+            if unreachable:
+                fail_unreachable(unreachable, "Зависимости задачи не выполнены")
 
             # Проверяем статус workflow
-            completed_tasks = sum(1 for t in workflow.tasks if t.status == TaskStatus.COMPLETED)
-            failed_tasks = sum(1 for t in workflow.tasks if t.status == TaskStatus.FAILED)
+            completed_tasks = sum(1 for t in tasks_by_id.values() if t.status == TaskStatus.COMPLETED)
+            failed_tasks = sum(1 for t in tasks_by_id.values() if t.status == TaskStatus.FAILED)
 
             if failed_tasks == 0:
-                workflow.status = TaskStatus.COMPLETED
+                self.workflow_engine.set_workflow_status(workflow_id, TaskStatus.COMPLETED)
             elif completed_tasks > 0:
-                workflow.status = TaskStatus.FAILED
+                self.workflow_engine.set_workflow_status(workflow_id, TaskStatus.FAILED)
             else:
-                workflow.status = TaskStatus.FAILED
+                self.workflow_engine.set_workflow_status(workflow_id, TaskStatus.FAILED)
 
             logger.info(f"Workflow {workflow_id} завершен со статусом {workflow.status.value}")
 
         except Exception as e:
-            workflow.status = TaskStatus.FAILED
+            self.workflow_engine.set_workflow_status(workflow_id, TaskStatus.FAILED)
             logger.error(f"Ошибка выполнения workflow {workflow_id}: {e}")
             raise
 
+        wall_clock = time.monotonic() - started_at
+        critical_path_seconds, critical_path = self._critical_path(graph, timings)
+        busy_seconds = sum(t["duration"] for t in timings.values())
+        logger.info(
+            f"Workflow {workflow_id}: wall-clock {wall_clock * 1000:.0f} мс, "
+            f"критический путь {critical_path_seconds * 1000:.0f} мс ({len(critical_path)} задач)"
+        )
+
         return {
             "workflow_id": workflow_id,
             "status": workflow.status.value,
             "results": results,
             "completed_tasks": completed_tasks,
             "failed_tasks": failed_tasks,
-            "total_tasks": len(workflow.tasks)
+            "total_tasks": len(tasks_by_id),
+            "timing": {
+                "wall_clock_ms": round(wall_clock * 1000, 1),
+                "critical_path_ms": round(critical_path_seconds * 1000, 1),
+                "critical_path": critical_path,
+                "total_task_time_ms": round(busy_seconds * 1000, 1),
+                "parallelism": round(busy_seconds / wall_clock, 2) if wall_clock > 0 else 0.0,
+                "tasks": {
+                    task_id: {key: round(value * 1000, 1) for key, value in timing.items()}
+                    for task_id, timing in timings.items()
+                }
+            }
         }
     
     def get_workflow_status(self, workflow_id: str) -> Optional[Dict[str, Any]]:
@@ -237,137 +523,147 @@ class ContentOrchestrator:
         """Возвращает статус всех агентов"""
         return self.agent_manager.get_all_agents_status()
     
-    async def process_content_request(self, request: Dict[str, Any]) -> Dict[str, Any]:
-        """Обрабатывает запрос на создание контента"""
-        try:
-            # ВАЖНО: Логируем входящие данные для отладки
-            logger.info(f"📝 Создание контента: title='{request.get('title', '')}', description='{request.get('description', '')[:100]}...'")
-            logger.info(f"📝 Параметры изображения: generate_image={request.get('generate_image', False)}, image_source={request.get('image_source', 'не указан')}")
-            
-            # Создаем бриф из запроса (НЕ перезаписываем title и description!)
-            brief = ContentBrief(
-                title=request.get("title", ""),  # Используем title из запроса
-                description=request.get("description", ""),  # Используем description из запроса
-                target_audience=request.get("target_audience", ""),
-                business_goals=request.get("business_goals", []),
-                call_to_action=request.get("call_to_action", ""),
-                tone=request.get("tone", "professional"),
-                keywords=request.get("keywords", []),
-                constraints=request.get("constraints", {})
+    async def prepare_content_request(self, request: Dict[str, Any]) -> Dict[str, str]:
+        """
+        Создает бриф и workflow по запросу, не выполняя его
+        
+        Returns:
+            {"workflow_id": ..., "brief_id": ...}
+        """
+        # ВАЖНО: Логируем входящие данные для отладки
+        logger.info(f"📝 Создание контента: title='{request.get('title', '')}', description='{request.get('description', '')[:100]}...'")
+        logger.info(f"📝 Параметры изображения: generate_image={request.get('generate_image', False)}, image_source={request.get('image_source', 'не указан')}")
+        
+        # Создаем бриф из запроса (НЕ перезаписываем title и description!)
+        brief = ContentBrief(
+            title=request.get("title", ""),  # Используем title из запроса
+            description=request.get("description", ""),  # Используем description из запроса
+            target_audience=request.get("target_audience", ""),
+            business_goals=request.get("business_goals", []),
+            call_to_action=request.get("call_to_action", ""),
+            tone=request.get("tone", "professional"),
+            keywords=request.get("keywords", []),
+            constraints=request.get("constraints", {})
+        )
+        
+        logger.info(f"✅ Бриф создан: title='{brief.title}', description='{brief.description[:100]}...'")
+
+        # Определяем платформы и типы контента
+        platforms = [Platform(p) for p in request.get("platforms", ["telegram", "vk"])]
+        content_types = [ContentType(ct) for ct in request.get("content_types", ["post"])]
+        variants_count = request.get("variants_count", 1)  # Количество вариантов (по умолчанию 1)
+        
+        # ВАЖНО: Проверяем оба поля для генерации изображений
+        generate_image = request.get("generate_image", False)  # Флаг генерации изображения
+        image_source = request.get("image_source")  # Источник изображения (ai, stock, или None)
+        
+        # Если generate_image=True и image_source='ai', то генерируем изображение через AI
+        # Если generate_image=True и image_source='stock', то используем стоковые изображения
+        # Если generate_image=False или image_source не указан, то изображение не генерируется
+        final_image_source = None
+        if generate_image and image_source:
+            final_image_source = image_source
+            logger.info(f"🖼️ Генерация изображения включена: generate_image={generate_image}, image_source={image_source}")
+        elif generate_image and not image_source:
+            logger.warning(f"⚠️ generate_image=True, но image_source не указан. Изображение не будет сгенерировано.")
+        else:
+            logger.info(f"📝 Генерация изображения отключена: generate_image={generate_image}")
+
+        # Создаем workflow с передачей image_source
+        workflow_id = await self.create_content_workflow(
+            brief, 
+            platforms, 
+            content_types, 
+            variants_count=variants_count,
+            image_source=final_image_source,  # Передаем только если generate_image=True и image_source указан
+            request=request
+        )
+
+        # Получаем workflow для добавления дополнительных задач
+        workflow = self.workflow_engine.workflows[workflow_id]
+
+        # Проверяем нужен ли фактчекинг
+        constraints = request.get("constraints", {})
+        if constraints.get("fact_checking", False):
+            # Добавляем задачу фактчекинга
+            factcheck_task = self.workflow_engine.add_task(
+                workflow_id=workflow_id,
+                task_name="Fact Check Content",
+                task_type=TaskType.PLANNED,
+                priority=TaskPriority.MEDIUM,
+                context={
+                    "content": {
+                        "id": brief.id,
+                        "text": f"{brief.title} {brief.description}",
+                        "type": "content_brief"
+                    },
+                    "check_type": "comprehensive"
+                }
             )
-            
-            logger.info(f"✅ Бриф создан: title='{brief.title}', description='{brief.description[:100]}...'")
+            logger.info(f"Добавлена задача фактчекинга в workflow {workflow_id}")
 
-            # Определяем платформы и типы контента
-            platforms = [Platform(p) for p in request.get("platforms", ["telegram", "vk"])]
-            content_types = [ContentType(ct) for ct in request.get("content_types", ["post"])]
-            variants_count = request.get("variants_count", 1)  # Количество вариантов (по умолчанию 1)
-            
-            # ВАЖНО: Проверяем оба поля для генерации изображений
-            generate_image = request.get("generate_image", False)  # Флаг генерации изображения
-            image_source = request.get("image_source")  # Источник изображения (ai, stock, или None)
-            
-            # Если generate_image=True и image_source='ai', то генерируем изображение через AI
-            # Если generate_image=True и image_source='stock', то используем стоковые изображения
-            # Если generate_image=False или image_source не указан, то изображение не генерируется
-            final_image_source = None
-            if generate_image and image_source:
-                final_image_source = image_source
-                logger.info(f"🖼️ Генерация изображения включена: generate_image={generate_image}, image_source={image_source}")
-            elif generate_image and not image_source:
-                logger.warning(f"⚠️ generate_image=True, но image_source не указан. Изображение не будет сгенерировано.")
+            # Принудительно назначаем задачу ResearchFactCheckAgent
+            await self.agent_manager.load_agent("research_factcheck_agent")
+            if self.agent_manager.assign_task_to(factcheck_task, "research_factcheck_agent"):
+                # Устанавливаем статус IN_PROGRESS для выполнения
+                factcheck_task.status = TaskStatus.IN_PROGRESS
+                # Добавляем задачу в workflow для выполнения
+                workflow.tasks.append(factcheck_task)
+                logger.info(f"Задача фактчекинга {factcheck_task.id} назначена ResearchFactCheckAgent и добавлена в workflow")
             else:
-                logger.info(f"📝 Генерация изображения отключена: generate_image={generate_image}")
-
-            # Создаем workflow с передачей image_source
-            workflow_id = await self.create_content_workflow(
-                brief, 
-                platforms, 
-                content_types, 
-                variants_count=variants_count,
-                image_source=final_image_source  # Передаем только если generate_image=True и image_source указан
-            )
+                logger.warning("ResearchFactCheckAgent недоступен для фактчекинга")
+
+        # Проверяем нужно ли публиковать сразу
+        publish_immediately = request.get("publish_immediately", True)
+        if publish_immediately:
+            # Добавляем задачи публикации для каждой платформы
+            channel_id = request.get("channel_id")
+            test_mode = request.get("test_mode", False)
+            user_id = request.get("user_id")  # ID пользователя (из JWT токена)
 
-            # Получаем workflow для добавления дополнительных задач
-            workflow = self.workflow_engine.workflows[workflow_id]
+            logger.info(f"Добавление задач публикации: publish_immediately={publish_immediately}, channel_id={channel_id}, test_mode={test_mode}, user_id={user_id}")
 
-            # Проверяем нужен ли фактчекинг
-            constraints = request.get("constraints", {})
-            if constraints.get("fact_checking", False):
-                # Добавляем задачу фактчекинга
-                factcheck_task = self.workflow_engine.add_task(
+            # Находим задачи создания контента, чтобы привязать к ним публикацию
+            content_tasks = [t for t in workflow.tasks if "Create" in t.name and "image" not in t.name.lower()]
+
+            for content_task in content_tasks:
+                platform = content_task.context.get("platform", "telegram")
+
+                # Создаем задачу публикации с зависимостью от контента
+                publish_task = self.workflow_engine.add_task(
                     workflow_id=workflow_id,
-                    task_name="Fact Check Content",
+                    task_name=f"Publish {platform} content",
                     task_type=TaskType.PLANNED,
-                    priority=TaskPriority.MEDIUM,
+                    priority=TaskPriority.HIGH,  # Высокий приоритет для публикации
                     context={
-                        "content": {
-                            "id": brief.id,
-                            "text": f"{brief.title} {brief.description}",
-                            "type": "content_brief"
-                        },
-                        "check_type": "comprehensive"
-                    }
+                        "platform": platform,
+                        "account_id": channel_id,  # ID канала/аккаунта для публикации
+                        "user_id": user_id,
+                        "test_mode": test_mode,
+                        "parent_task_id": content_task.id,  # Связь с задачей создания контента
+                        # content будет добавлен из результата parent task при выполнении
+                    },
+                    dependencies=[content_task.id]  # Публикация после создания контента
                 )
-                logger.info(f"Добавлена задача фактчекинга в workflow {workflow_id}")
-
-                # Принудительно назначаем задачу ResearchFactCheckAgent
-                if "research_factcheck_agent" in self.agent_manager.agents:
-                    factcheck_agent = self.agent_manager.agents["research_factcheck_agent"]
-                    if factcheck_agent.assign_task(factcheck_task.id):
-                        self.agent_manager.task_assignments[factcheck_task.id] = "research_factcheck_agent"
-                        self.workflow_engine.assign_task(factcheck_task.id, "research_factcheck_agent")
-                        # Устанавливаем статус IN_PROGRESS для выполнения
-                        factcheck_task.status = TaskStatus.IN_PROGRESS
-                        # Добавляем задачу в workflow для выполнения
-                        workflow.tasks.append(factcheck_task)
-                        logger.info(f"Задача фактчекинга {factcheck_task.id} назначена ResearchFactCheckAgent и добавлена в workflow")
-                    else:
-                        logger.warning("ResearchFactCheckAgent недоступен для фактчекинга")
-                else:
-                    logger.warning("ResearchFactCheckAgent не найден в системе")
-
-            # Проверяем нужно ли публиковать сразу
-            publish_immediately = request.get("publish_immediately", True)
-            if publish_immediately:
-                # Добавляем задачи публикации для каждой платформы
-                channel_id = request.get("channel_id")
-                test_mode = request.get("test_mode", False)
-                user_id = request.get("user_id")  # ID пользователя (из JWT токена)
-
-                logger.info(f"Добавление задач публикации: publish_immediately={publish_immediately}, channel_id={channel_id}, test_mode={test_mode}, user_id={user_id}")
-
-                # Находим задачи создания контента, чтобы привязать к ним публикацию
-                content_tasks = [t for t in workflow.tasks if "Create" in t.name and "image" not in t.name.lower()]
-
-                for content_task in content_tasks:
-                    platform = content_task.context.get("platform", "telegram")
-
-                    # Создаем задачу публикации с зависимостью от контента
-                    publish_task = self.workflow_engine.add_task(
-                        workflow_id=workflow_id,
-                        task_name=f"Publish {platform} content",
-                        task_type=TaskType.PLANNED,
-                        priority=TaskPriority.HIGH,  # Высокий приоритет для публикации
-                        context={
-                            "platform": platform,
-                            "account_id": channel_id,  # ID канала/аккаунта для публикации
-                            "user_id": user_id,
-                            "test_mode": test_mode,
-                            "parent_task_id": content_task.id,  # Связь с задачей создания контента
-                            # content будет добавлен из результата parent task при выполнении
-                        },
-                        dependencies=[content_task.id]  # Публикация после создания контента
-                    )
-                    logger.info(f"Добавлена задача публикации {publish_task.id} для {platform} (зависит от {content_task.id})")
+                logger.info(f"Добавлена задача публикации {publish_task.id} для {platform} (зависит от {content_task.id})")
+
+        return {
+            "workflow_id": workflow_id,
+            "brief_id": brief.id
+        }
+    
+    async def process_content_request(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Обрабатывает запрос на создание контента"""
+        try:
+            prepared = await self.prepare_content_request(request)
 
             # Выполняем workflow
-            result = await self.execute_workflow(workflow_id)
+            result = await self.execute_workflow(prepared["workflow_id"])
 
             return {
                 "success": True,
-                "workflow_id": workflow_id,
-                "brief_id": brief.id,
+                "workflow_id": prepared["workflow_id"],
+                "brief_id": prepared["brief_id"],
                 "result": result
             }
 
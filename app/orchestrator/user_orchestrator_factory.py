@@ -1,16 +1,21 @@
 """
-Фабрика для создания изолированных оркестраторов для каждого пользователя
-Реализует Per-User Agent Clusters архитектуру
+Фабрика оркестраторов пользователей
+Реализует Per-User Agent Clusters поверх общего пула агентов: у каждого
+пользователя свой легкий оркестратор (workflow и учет задач), а экземпляры
+агентов общие для процесса (AgentPool). Права пользователя на агентов
+проверяются при назначении задачи.
 """
 
 import asyncio
 import logging
+import os
 from datetime import datetime, timedelta
-from typing import Dict, Type, Optional
+from typing import Dict, FrozenSet, Optional
 from dataclasses import dataclass
 
 from .main_orchestrator import ContentOrchestrator
-from .agent_manager import BaseAgent
+from .agent_pool import AgentPool, get_agent_pool
+from .agent_registry import AGENT_REGISTRY
 
 logger = logging.getLogger(__name__)
 
@@ -22,15 +27,18 @@ class UserOrchestratorInstance:
     user_id: int
     created_at: datetime
     last_used: datetime
-    agent_ids: list  # Список ID агентов, зарегистрированных для пользователя
+    # ID агентов по активным подпискам; None - подписок нет, доступны все агенты
+    entitlements: Optional[FrozenSet[str]]
+    entitlements_loaded_at: datetime
 
 
 class UserOrchestratorFactory:
     """
     Фабрика для создания и управления оркестраторами по пользователям
     
-    Каждый пользователь получает свой изолированный оркестратор
-    с только теми агентами, на которые у него есть подписка
+    Каждый пользователь получает свой изолированный оркестратор, который
+    назначает задачи только тем агентам общего пула, на которых у него
+    есть подписка
     """
     
     # Хранилище оркестраторов по пользователям
@@ -39,6 +47,13 @@ class UserOrchestratorFactory:
     # Настройки управления lifecycle
     _cleanup_interval = 3600  # Очистка каждый час (секунды)
     _max_idle_time = 7200  # Максимальное время неактивности - 2 часа
+    # Как долго права на агентов используются без перечитывания подписок
+    _entitlements_ttl = int(os.getenv("AGENT_ENTITLEMENTS_TTL", "300"))
+    
+    @classmethod
+    def get_pool(cls) -> AgentPool:
+        """Общий пул агентов процесса"""
+        return get_agent_pool(cls._get_agent_classes())
     
     @classmethod
     def get_orchestrator(cls, user_id: int, db_session) -> ContentOrchestrator:
@@ -50,134 +65,102 @@ class UserOrchestratorFactory:
             db_session: Сессия БД для загрузки подписок
         
         Returns:
-            ContentOrchestrator с зарегистрированными агентами пользователя
+            ContentOrchestrator, назначающий задачи агентам пула по подпискам пользователя
         """
-        # Проверяем есть ли уже оркестратор для этого пользователя
-        if user_id not in cls._user_orchestrators:
+        now = datetime.utcnow()
+        instance = cls._user_orchestrators.get(user_id)
+        
+        if instance is None:
             logger.info(f"Creating new orchestrator for user {user_id}")
-            # Создаем новый оркестратор для пользователя
-            orchestrator = cls._create_user_orchestrator(user_id, db_session)
-            
-            # Получаем список зарегистрированных агентов
-            agent_ids = [agent_id for agent_id in orchestrator.agent_manager.agents.keys()]
-            
-            cls._user_orchestrators[user_id] = UserOrchestratorInstance(
-                orchestrator=orchestrator,
+            entitlements = cls._load_entitlements(user_id, db_session)
+            instance = UserOrchestratorInstance(
+                orchestrator=cls._create_user_orchestrator(user_id),
                 user_id=user_id,
-                created_at=datetime.utcnow(),
-                last_used=datetime.utcnow(),
-                agent_ids=agent_ids
+                created_at=now,
+                last_used=now,
+                entitlements=entitlements,
+                entitlements_loaded_at=now
             )
-            
-            logger.info(f"Orchestrator created for user {user_id} with {len(agent_ids)} agents: {agent_ids}")
+            cls._user_orchestrators[user_id] = instance
+            logger.info(f"Orchestrator created for user {user_id} with agents: "
+                        f"{sorted(entitlements) if entitlements is not None else 'all'}")
+        elif (now - instance.entitlements_loaded_at).total_seconds() > cls._entitlements_ttl:
+            instance.entitlements = cls._load_entitlements(user_id, db_session)
+            instance.entitlements_loaded_at = now
         
         # Обновляем время последнего использования
-        cls._user_orchestrators[user_id].last_used = datetime.utcnow()
+        instance.last_used = now
         
-        return cls._user_orchestrators[user_id].orchestrator
+        return instance.orchestrator
     
     @classmethod
-    def _create_user_orchestrator(cls, user_id: int, db_session) -> ContentOrchestrator:
+    def _create_user_orchestrator(cls, user_id: int) -> ContentOrchestrator:
         """
-        Создает оркестратор и регистрирует агентов
+        Создает оркестратор пользователя без собственных экземпляров агентов
         
         Args:
             user_id: ID пользователя
-            db_session: Сессия БД
         
         Returns:
-            ContentOrchestrator с зарегистрированными агентами
+            ContentOrchestrator с PooledAgentManager
         """
-        # Создаем новый оркестратор
         orchestrator = ContentOrchestrator()
+        # Агенты берутся из общего пула, права читаются из кеша фабрики при каждом назначении
+        orchestrator.attach_agent_pool(cls.get_pool(), lambda: cls._entitlements(user_id))
+        return orchestrator
+    
+    @classmethod
+    def _entitlements(cls, user_id: int) -> Optional[FrozenSet[str]]:
+        """Права пользователя из кеша (пустое множество, если оркестратор уже удален)"""
+        instance = cls._user_orchestrators.get(user_id)
+        if instance is None:
+            return frozenset()
+        return instance.entitlements
+    
+    @classmethod
+    def _load_entitlements(cls, user_id: int, db_session) -> Optional[FrozenSet[str]]:
+        """
+        Загружает агентов по активным подпискам пользователя
         
-        # Получаем маппинг агентов
-        agent_classes = cls._get_agent_classes()
+        Если подписок нет (или таблица недоступна) - доступны все агенты
+        (для разработки/тестирования)
         
-        # Пытаемся загрузить подписки если таблица существует
-        subscriptions = []
+        Returns:
+            frozenset ID агентов или None - все агенты
+        """
         try:
             from ..billing.models.agent_subscription import AgentSubscription
-            subscriptions = db_session.query(AgentSubscription).filter(
+            rows = db_session.query(AgentSubscription.agent_id).filter(
                 AgentSubscription.user_id == user_id,
                 AgentSubscription.status == 'active',
                 AgentSubscription.expires_at > datetime.utcnow()
             ).all()
-            logger.info(f"Found {len(subscriptions)} active agent subscriptions for user {user_id}")
         except Exception as e:
-            logger.warning(f"Agent subscriptions not available: {e}. Registering all agents.")
+            logger.warning(f"Agent subscriptions not available: {e}. Allowing all agents.")
+            return None
         
-        # Если есть подписки - регистрируем только купленных агентов
-        # Если нет подписок - регистрируем всех агентов (для разработки/тестирования)
-        if subscriptions:
-            # Регистрируем только купленных агентов
-            registered_count = 0
-            for subscription in subscriptions:
-                agent_class = agent_classes.get(subscription.agent_id)
-                
-                if agent_class:
-                    try:
-                        agent = agent_class()
-                        if orchestrator.register_agent(agent):
-                            registered_count += 1
-                            logger.info(f"Registered {subscription.agent_id} for user {user_id}")
-                        else:
-                            logger.warning(f"Failed to register {subscription.agent_id} for user {user_id}")
-                    except Exception as e:
-                        logger.error(f"Error creating agent {subscription.agent_id}: {e}")
-                else:
-                    logger.warning(f"Unknown agent_id: {subscription.agent_id}")
-            
-            logger.info(f"Successfully registered {registered_count} agents for user {user_id}")
-        else:
-            # Регистрируем всех агентов
-            registered_count = 0
-            for agent_id, agent_class in agent_classes.items():
-                try:
-                    agent = agent_class()
-                    if orchestrator.register_agent(agent):
-                        registered_count += 1
-                        logger.info(f"Registered {agent_id} (no subscription check)")
-                    else:
-                        logger.warning(f"Failed to register {agent_id}")
-                except Exception as e:
-                    logger.error(f"Error creating agent {agent_id}: {e}")
-            
-            logger.info(f"Successfully registered {registered_count} agents (all available)")
+        logger.info(f"Found {len(rows)} active agent subscriptions for user {user_id}")
+        if not rows:
+            return None
         
-        return orchestrator
+        agent_classes = cls._get_agent_classes()
+        entitlements = set()
+        for (agent_id,) in rows:
+            if agent_id in agent_classes:
+                entitlements.add(agent_id)
+            else:
+                logger.warning(f"Unknown agent_id: {agent_id}")
+        return frozenset(entitlements)
     
     @classmethod
-    def _get_agent_classes(cls) -> Dict[str, Type[BaseAgent]]:
+    def _get_agent_classes(cls) -> Dict[str, str]:
         """
-        Маппинг ID агентов на их классы
+        Маппинг ID агентов на пути импорта их классов
         
         Returns:
-            Dict с agent_id -> Agent Class
+            Dict с agent_id -> "модуль:Класс"
         """
-        from ..agents.chief_agent import ChiefContentAgent
-        from ..agents.drafting_agent import DraftingAgent
-        from ..agents.publisher_agent import PublisherAgent
-        from ..agents.research_factcheck_agent import ResearchFactCheckAgent
-        from ..agents.trends_scout_agent import TrendsScoutAgent
-        from ..agents.multimedia_producer_agent import MultimediaProducerAgent
-        from ..agents.legal_guard_agent import LegalGuardAgent
-        from ..agents.repurpose_agent import RepurposeAgent
-        from ..agents.community_concierge_agent import CommunityConciergeAgent
-        from ..agents.paid_creative_agent import PaidCreativeAgent
-        
-        return {
-            "chief_content_agent": ChiefContentAgent,
-            "drafting_agent": DraftingAgent,
-            "publisher_agent": PublisherAgent,
-            "research_factcheck_agent": ResearchFactCheckAgent,
-            "trends_scout_agent": TrendsScoutAgent,
-            "multimedia_producer_agent": MultimediaProducerAgent,
-            "legal_guard_agent": LegalGuardAgent,
-            "repurpose_agent": RepurposeAgent,
-            "community_concierge_agent": CommunityConciergeAgent,
-            "paid_creative_agent": PaidCreativeAgent
-        }
+        return AGENT_REGISTRY
     
     @classmethod
     def refresh_user_agents(cls, user_id: int, db_session):
@@ -191,14 +174,14 @@ class UserOrchestratorFactory:
         """
         logger.info(f"Refreshing agents for user {user_id}")
         
-        if user_id in cls._user_orchestrators:
-            # Удаляем старый оркестратор
-            old_instance = cls._user_orchestrators[user_id]
-            logger.info(f"Removing old orchestrator for user {user_id} (had {len(old_instance.agent_ids)} agents)")
-            del cls._user_orchestrators[user_id]
+        instance = cls._user_orchestrators.get(user_id)
+        if instance is None:
+            # При следующем запросе права загрузятся вместе с оркестратором
+            return
         
-        # При следующем запросе создастся новый с актуальными подписками
-        logger.info(f"User {user_id} orchestrator will be recreated on next request")
+        # Оркестратор и его workflow сохраняются, меняются только права
+        instance.entitlements = cls._load_entitlements(user_id, db_session)
+        instance.entitlements_loaded_at = datetime.utcnow()
     
     @classmethod
     async def cleanup_idle_orchestrators(cls):
@@ -222,6 +205,11 @@ class UserOrchestratorFactory:
             logger.info(f"Removing idle orchestrator for user {user_id} (last used: {instance.last_used})")
             del cls._user_orchestrators[user_id]
         
+        # Агенты, которыми давно никто не пользовался, тоже освобождают память
+        evicted = cls.get_pool().evict_idle(cls._max_idle_time)
+        if evicted:
+            logger.info(f"Evicted {evicted} idle agents from pool")
+        
         if to_remove:
             logger.info(f"Cleaned up {len(to_remove)} idle orchestrators")
         else:
@@ -243,30 +231,31 @@ class UserOrchestratorFactory:
         Returns:
             Список ID агентов или пустой список
         """
-        if user_id in cls._user_orchestrators:
-            return cls._user_orchestrators[user_id].agent_ids.copy()
-        return []
+        instance = cls._user_orchestrators.get(user_id)
+        if instance is None:
+            return []
+        return instance.orchestrator.agent_manager.allowed_agent_ids()
     
     @classmethod
     def get_stats(cls) -> Dict:
         """
-        Получить статистику по оркестраторам
+        Получить статистику по оркестраторам и пулу агентов
         
         Returns:
             Dict со статистикой
         """
-        now = datetime.utcnow()
-        total_agents = 0
-        
-        for instance in cls._user_orchestrators.values():
-            total_agents += len(instance.agent_ids)
+        instances = list(cls._user_orchestrators.values())
+        restricted = [instance for instance in instances if instance.entitlements is not None]
+        total_entitled = sum(len(instance.entitlements) for instance in restricted)
         
         return {
-            "active_users": len(cls._user_orchestrators),
-            "total_agents_registered": total_agents,
-            "avg_agents_per_user": total_agents / len(cls._user_orchestrators) if cls._user_orchestrators else 0,
+            "active_users": len(instances),
+            "users_with_subscriptions": len(restricted),
+            "avg_agents_per_subscribed_user": total_entitled / len(restricted) if restricted else 0,
             "cleanup_interval": cls._cleanup_interval,
-            "max_idle_time": cls._max_idle_time
+            "max_idle_time": cls._max_idle_time,
+            "entitlements_ttl": cls._entitlements_ttl,
+            "agent_pool": cls.get_pool().get_stats()
         }
 
 
@@ -4,13 +4,19 @@ WorkflowEngine - Система управления задачами и workflo
 """
 
 import asyncio
+import heapq
 import logging
+import os
+import time
 from datetime import datetime, timedelta
 from enum import Enum
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 from dataclasses import dataclass, field
 from uuid import uuid4
 
+from ..models import workflow as workflow_models
+from .workflow_store import WorkflowStore, get_workflow_store
+
 # Настройка логирования
 logger = logging.getLogger(__name__)
 
@@ -75,17 +81,62 @@ class Workflow:
     created_at: datetime = field(default_factory=datetime.now)
     status: TaskStatus = TaskStatus.PENDING
     context: Dict[str, Any] = field(default_factory=dict)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    created_by: str = ""
+    output_data: Dict[str, Any] = field(default_factory=dict)
+    error_message: Optional[str] = None
+
+
+FINISHED_TASK_STATUSES = (TaskStatus.COMPLETED, TaskStatus.FAILED, TaskStatus.CANCELLED)
+
+# Статус workflow движка -> статус WorkflowInstance в хранилище
+WORKFLOW_STATUS_TO_STORE = {
+    TaskStatus.PENDING: workflow_models.WorkflowStatus.CREATED,
+    TaskStatus.IN_PROGRESS: workflow_models.WorkflowStatus.RUNNING,
+    TaskStatus.COMPLETED: workflow_models.WorkflowStatus.COMPLETED,
+    TaskStatus.FAILED: workflow_models.WorkflowStatus.FAILED,
+    TaskStatus.CANCELLED: workflow_models.WorkflowStatus.CANCELLED,
+}
+WORKFLOW_STATUS_FROM_STORE = {value: key for key, value in WORKFLOW_STATUS_TO_STORE.items()}
 
 
 class WorkflowEngine:
-    """Движок управления workflow и задачами"""
+    """Движок управления workflow и задачами
+    
+    Планировщик индексированный: все задачи лежат в словаре task_id -> Task,
+    готовые к выполнению задачи - в приоритетной куче, а для ожидающих
+    задач ведутся счетчики невыполненных зависимостей и обратный индекс
+    зависимостей. Задача попадает в кучу только когда завершилась ее
+    последняя зависимость, поэтому add/dispatch стоят O(log n).
     
-    def __init__(self):
+    Каждое изменение workflow и задачи сохраняется в WorkflowStore, а
+    завершенные workflow старше retention_seconds выгружаются из памяти:
+    их статус дальше читается из хранилища (в том числе другими процессами).
+    """
+    
+    def __init__(self, store: Optional[WorkflowStore] = None, retention_seconds: int = None):
+        self.store = store if store is not None else get_workflow_store()
+        self.retention_seconds = retention_seconds if retention_seconds is not None else int(
+            os.getenv("WORKFLOW_RETENTION_SECONDS", "3600")
+        )
+        self._compact_interval = 60.0
+        self._last_compaction = time.monotonic()
+        
         self.workflows: Dict[str, Workflow] = {}
-        self.task_queue: List[Task] = []
+        self.tasks: Dict[str, Task] = {}
+        self._task_workflow: Dict[str, str] = {}  # task_id -> workflow_id
+        self.pending_tasks: Dict[str, Task] = {}
         self.running_tasks: Dict[str, Task] = {}
         self.completed_tasks: Dict[str, Task] = {}
         
+        # Индексы планировщика
+        self._ready_heap: List[Tuple[int, datetime, int, str]] = []
+        self._heap_entries: Dict[str, int] = {}  # task_id -> seq актуальной записи в куче
+        self._heap_seq = 0
+        self._unresolved_deps: Dict[str, int] = {}  # task_id -> число невыполненных зависимостей
+        self._dependents: Dict[str, List[str]] = {}  # dep_id -> задачи, ожидающие dep_id
+        
         # Конфигурация приоритизации
         self.task_priorities = {
             TaskType.REAL_TIME: {"sla": 15, "weight": 10},
@@ -96,14 +147,18 @@ class WorkflowEngine:
         logger.info("WorkflowEngine инициализирован")
     
     def create_workflow(self, name: str, task_type: TaskType, 
-                       context: Dict[str, Any] = None) -> Workflow:
+                       context: Dict[str, Any] = None, created_by: str = "") -> Workflow:
         """Создает новый workflow"""
+        self._maybe_compact()
+        
         workflow = Workflow(
             name=name,
-            context=context or {}
+            context=context or {},
+            created_by=created_by
         )
         
         self.workflows[workflow.id] = workflow
+        self._save_workflow(workflow)
         logger.info(f"Создан workflow: {workflow.id} - {name}")
         
         return workflow
@@ -126,50 +181,96 @@ class WorkflowEngine:
         workflow = self.workflows[workflow_id]
         workflow.tasks.append(task)
         
-        # Добавляем в очередь задач
-        self.task_queue.append(task)
-        self._sort_task_queue()
+        # Индексируем задачу и ставим в очередь
+        self.tasks[task.id] = task
+        self._task_workflow[task.id] = workflow_id
+        self._enqueue(task)
+        self._save_task(task)
         
         logger.info(f"Добавлена задача: {task.id} - {task_name} в workflow {workflow_id}")
         
         return task
     
-    def _sort_task_queue(self):
-        """Сортирует очередь задач по приоритету"""
-        def task_priority_score(task: Task) -> float:
-            # Базовый приоритет
-            priority_score = task.priority.value
-            
-            # Множитель типа задачи
-            type_multiplier = self.task_priorities[task.task_type]["weight"]
-            
-            # Штраф за приближающийся дедлайн
-            time_penalty = 0
-            if task.deadline:
-                time_left = (task.deadline - datetime.now()).total_seconds() / 60
-                if time_left < 60:  # Меньше часа
-                    time_penalty = 10
-                elif time_left < 240:  # Меньше 4 часов
-                    time_penalty = 5
-            
-            return priority_score * type_multiplier - time_penalty
+    def _priority_key(self, task: Task) -> Tuple[int, datetime]:
+        """Ключ кучи: больший priority x weight раньше, затем более ранний дедлайн"""
+        weight = self.task_priorities[task.task_type]["weight"]
+        return (-(task.priority.value * weight), task.deadline or datetime.max)
+    
+    def _enqueue(self, task: Task):
+        """Ставит PENDING задачу в очередь с учетом зависимостей"""
+        self.pending_tasks[task.id] = task
+        
+        unresolved = 0
+        for dep_id in task.dependencies:
+            if dep_id not in self.completed_tasks:
+                self._dependents.setdefault(dep_id, []).append(task.id)
+                unresolved += 1
         
-        self.task_queue.sort(key=task_priority_score, reverse=True)
+        if unresolved:
+            self._unresolved_deps[task.id] = unresolved
+        else:
+            self._push_ready(task)
+    
+    def _push_ready(self, task: Task):
+        """Помещает готовую к выполнению задачу в кучу"""
+        self._heap_seq += 1
+        self._heap_entries[task.id] = self._heap_seq
+        heapq.heappush(self._ready_heap, (*self._priority_key(task), self._heap_seq, task.id))
+    
+    def _is_stale(self, entry: Tuple[int, datetime, int, str]) -> bool:
+        """Запись кучи устарела: задача уже назначена, завершена или переставлена"""
+        seq, task_id = entry[2], entry[3]
+        if self._heap_entries.get(task_id) != seq:
+            return True
+        task = self.pending_tasks.get(task_id)
+        return task is None or task.status != TaskStatus.PENDING
+    
+    def _drop_heap_entry(self, task_id: str):
+        """Ленивое удаление: запись останется в куче, но будет пропущена"""
+        self._heap_entries.pop(task_id, None)
+    
+    @property
+    def task_queue(self) -> List[Task]:
+        """Ожидающие задачи в порядке приоритета (снимок, только для чтения)"""
+        return sorted(self.pending_tasks.values(), key=self._priority_key)
+    
+    def get_ready_tasks(self) -> List[Task]:
+        """Возвращает готовые к выполнению задачи в порядке приоритета"""
+        return [
+            self.pending_tasks[entry[3]]
+            for entry in sorted(self._ready_heap)
+            if not self._is_stale(entry)
+        ]
     
     def get_next_task(self, agent_id: str) -> Optional[Task]:
         """Возвращает следующую задачу для агента"""
-        for task in self.task_queue:
-            if (task.status == TaskStatus.PENDING and 
-                self._can_execute_task(task, agent_id)):
-                return task
-        return None
+        skipped = []
+        next_task = None
+        
+        while self._ready_heap:
+            entry = self._ready_heap[0]
+            if self._is_stale(entry):
+                heapq.heappop(self._ready_heap)
+                continue
+            
+            task = self.pending_tasks[entry[3]]
+            if self._can_execute_task(task, agent_id):
+                next_task = task
+                break
+            
+            # Задача закреплена за другим агентом - временно откладываем
+            skipped.append(heapq.heappop(self._ready_heap))
+        
+        for entry in skipped:
+            heapq.heappush(self._ready_heap, entry)
+        
+        return next_task
     
     def _can_execute_task(self, task: Task, agent_id: str) -> bool:
         """Проверяет, может ли агент выполнить задачу"""
         # Проверяем зависимости
-        for dep_id in task.dependencies:
-            if dep_id not in self.completed_tasks:
-                return False
+        if self._unresolved_deps.get(task.id, 0) > 0:
+            return False
         
         # Проверяем, не назначена ли уже другому агенту
         if task.assigned_agent and task.assigned_agent != agent_id:
@@ -177,6 +278,19 @@ class WorkflowEngine:
         
         return True
     
+    def requeue_task(self, task: Task):
+        """Возвращает задачу в очередь (например, после отключения агента)"""
+        self.running_tasks.pop(task.id, None)
+        task.status = TaskStatus.PENDING
+        task.assigned_agent = None
+        self.tasks[task.id] = task
+        
+        if task.id in self._unresolved_deps:
+            self.pending_tasks[task.id] = task
+        else:
+            self._enqueue(task)
+        self._save_task(task)
+    
     def assign_task(self, task_id: str, agent_id: str) -> bool:
         """Назначает задачу агенту"""
         task = self._find_task(task_id)
@@ -190,9 +304,10 @@ class WorkflowEngine:
         task.status = TaskStatus.IN_PROGRESS
         
         # Перемещаем в выполняемые
-        if task in self.task_queue:
-            self.task_queue.remove(task)
+        self.pending_tasks.pop(task_id, None)
+        self._drop_heap_entry(task_id)
         self.running_tasks[task_id] = task
+        self._save_task(task)
         
         logger.info(f"Задача {task_id} назначена агенту {agent_id}")
         return True
@@ -207,10 +322,25 @@ class WorkflowEngine:
         task.result = result or {}
         
         # Перемещаем в выполненные
+        self.pending_tasks.pop(task_id, None)
+        self._drop_heap_entry(task_id)
         if task_id in self.running_tasks:
             del self.running_tasks[task_id]
         self.completed_tasks[task_id] = task
         
+        # Разблокируем зависимые задачи
+        for dependent_id in self._dependents.pop(task_id, []):
+            remaining = self._unresolved_deps.get(dependent_id, 0) - 1
+            if remaining > 0:
+                self._unresolved_deps[dependent_id] = remaining
+                continue
+            
+            self._unresolved_deps.pop(dependent_id, None)
+            dependent = self.pending_tasks.get(dependent_id)
+            if dependent and dependent.status == TaskStatus.PENDING:
+                self._push_ready(dependent)
+        
+        self._save_task(task)
         logger.info(f"Задача {task_id} выполнена")
         return True
     
@@ -223,48 +353,78 @@ class WorkflowEngine:
         task.status = TaskStatus.FAILED
         task.error_message = error_message
         
-        # Возвращаем в очередь или помечаем как неудачную
+        # Задача покидает очередь; зависимые задачи остаются заблокированными
+        self.pending_tasks.pop(task_id, None)
+        self._drop_heap_entry(task_id)
         if task_id in self.running_tasks:
             del self.running_tasks[task_id]
+        self._save_task(task)
         
         logger.error(f"Задача {task_id} провалена: {error_message}")
         return True
     
     def _find_task(self, task_id: str) -> Optional[Task]:
         """Находит задачу по ID"""
-        # Ищем в очереди
-        for task in self.task_queue:
-            if task.id == task_id:
-                return task
-        
-        # Ищем в выполняемых
-        if task_id in self.running_tasks:
-            return self.running_tasks[task_id]
-        
-        # Ищем в выполненных
-        if task_id in self.completed_tasks:
-            return self.completed_tasks[task_id]
-        
-        return None
+        return self.tasks.get(task_id)
     
+    def set_workflow_status(self, workflow_id: str, status: TaskStatus):
+        """Меняет статус workflow и сохраняет его"""
+        workflow = self.workflows.get(workflow_id)
+        if not workflow:
+            return
+        
+        workflow.status = status
+        if status == TaskStatus.IN_PROGRESS and not workflow.started_at:
+            workflow.started_at = datetime.now()
+        if status in FINISHED_TASK_STATUSES:
+            workflow.finished_at = datetime.now()
+        self._save_workflow(workflow)
+
+    def set_workflow_output(self, workflow_id: str, output_data: Optional[Dict[str, Any]] = None,
+                            error_message: Optional[str] = None):
+        """Сохраняет результат или ошибку workflow (доступны другим процессам через хранилище)"""
+        workflow = self.workflows.get(workflow_id)
+        if not workflow:
+            return
+
+        workflow.output_data = output_data or {}
+        workflow.error_message = error_message
+        self._save_workflow(workflow)
+
     def get_workflow_status(self, workflow_id: str) -> Optional[Dict[str, Any]]:
-        """Возвращает статус workflow"""
-        if workflow_id not in self.workflows:
-            return None
+        """Возвращает статус workflow (из памяти или из хранилища)"""
+        workflow = self.workflows.get(workflow_id)
+        if workflow:
+            return self._status_summary(
+                workflow_id, workflow.name, workflow.status, workflow.created_at,
+                [task.status.value for task in workflow.tasks]
+            )
         
-        workflow = self.workflows[workflow_id]
+        # Workflow выполнялся в другом процессе или уже выгружен из памяти
+        stored = self.store.get_workflow(workflow_id)
+        if not stored:
+            return None
         
-        # Подсчитываем статистику
-        total_tasks = len(workflow.tasks)
-        completed_tasks = sum(1 for task in workflow.tasks if task.status == TaskStatus.COMPLETED)
-        failed_tasks = sum(1 for task in workflow.tasks if task.status == TaskStatus.FAILED)
-        in_progress_tasks = sum(1 for task in workflow.tasks if task.status == TaskStatus.IN_PROGRESS)
+        return self._status_summary(
+            workflow_id, stored.name, WORKFLOW_STATUS_FROM_STORE.get(stored.status, TaskStatus.IN_PROGRESS),
+            stored.created_at,
+            [task.status.value for task in self.store.get_tasks(workflow_id)]
+        )
+    
+    @staticmethod
+    def _status_summary(workflow_id: str, name: str, status: TaskStatus, created_at: datetime,
+                        task_statuses: List[str]) -> Dict[str, Any]:
+        """Сводка статуса workflow по статусам его задач"""
+        total_tasks = len(task_statuses)
+        completed_tasks = task_statuses.count(TaskStatus.COMPLETED.value)
+        failed_tasks = task_statuses.count(TaskStatus.FAILED.value)
+        in_progress_tasks = task_statuses.count(TaskStatus.IN_PROGRESS.value)
         
         return {
             "workflow_id": workflow_id,
-            "name": workflow.name,
-            "status": workflow.status.value,
-            "created_at": workflow.created_at.isoformat(),
+            "name": name,
+            "status": status.value,
+            "created_at": created_at.isoformat(),
             "total_tasks": total_tasks,
             "completed_tasks": completed_tasks,
             "failed_tasks": failed_tasks,
@@ -272,11 +432,85 @@ class WorkflowEngine:
             "progress_percentage": (completed_tasks / total_tasks * 100) if total_tasks > 0 else 0
         }
     
+    # ==================== ХРАНИЛИЩЕ ====================
+    
+    def _save_workflow(self, workflow: Workflow):
+        self.store.save_workflow(workflow_models.WorkflowInstance(
+            id=workflow.id,
+            name=workflow.name,
+            status=WORKFLOW_STATUS_TO_STORE[workflow.status],
+            context=dict(workflow.context),
+            created_at=workflow.created_at,
+            started_at=workflow.started_at,
+            completed_at=workflow.finished_at,
+            created_by=workflow.created_by,
+            output_data=dict(workflow.output_data),
+            error_message=workflow.error_message
+        ))
+    
+    def _save_task(self, task: Task):
+        # Снимок: контекст и результат меняются агентами, пока хранилище пишет в фоне
+        self.store.save_task(workflow_models.TaskInstance(
+            id=task.id,
+            workflow_instance_id=self._task_workflow.get(task.id, ""),
+            name=task.name,
+            status=workflow_models.TaskStatus(task.status.value),
+            priority=workflow_models.TaskPriority(task.priority.value),
+            task_type=workflow_models.TaskType(task.task_type.value),
+            assigned_agent_id=task.assigned_agent,
+            dependencies=list(task.dependencies),
+            input_data=dict(task.context),
+            output_data=dict(task.result) if task.result else {},
+            error_message=task.error_message,
+            created_at=task.created_at,
+            deadline=task.deadline,
+            completed_at=datetime.now() if task.status in FINISHED_TASK_STATUSES else None
+        ))
+    
+    def _maybe_compact(self):
+        if time.monotonic() - self._last_compaction >= self._compact_interval:
+            self.compact()
+    
+    def compact(self, now: Optional[datetime] = None) -> int:
+        """
+        Выгружает из памяти завершенные workflow старше retention_seconds
+        
+        Их состояние остается в хранилище до истечения TTL хранилища.
+        
+        Returns:
+            Количество выгруженных workflow
+        """
+        self._last_compaction = time.monotonic()
+        cutoff = (now or datetime.now()) - timedelta(seconds=self.retention_seconds)
+        expired = [
+            workflow for workflow in self.workflows.values()
+            if workflow.status in FINISHED_TASK_STATUSES and workflow.finished_at
+            and workflow.finished_at < cutoff
+        ]
+        
+        for workflow in expired:
+            for task in workflow.tasks:
+                self.tasks.pop(task.id, None)
+                self._task_workflow.pop(task.id, None)
+                self.pending_tasks.pop(task.id, None)
+                self.running_tasks.pop(task.id, None)
+                self.completed_tasks.pop(task.id, None)
+                self._unresolved_deps.pop(task.id, None)
+                self._dependents.pop(task.id, None)
+                self._drop_heap_entry(task.id)
+            del self.workflows[workflow.id]
+        
+        if expired:
+            logger.info(f"Выгружено из памяти {len(expired)} завершенных workflow")
+        return len(expired)
+    
     def get_queue_status(self) -> Dict[str, Any]:
         """Возвращает статус очереди задач"""
         return {
-            "pending_tasks": len(self.task_queue),
+            "pending_tasks": len(self.pending_tasks),
+            "ready_tasks": len(self._heap_entries),
             "running_tasks": len(self.running_tasks),
             "completed_tasks": len(self.completed_tasks),
-            "total_workflows": len(self.workflows)
+            "total_workflows": len(self.workflows),
+            "store": self.store.get_stats()
         }
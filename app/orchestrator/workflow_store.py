@@ -0,0 +1,541 @@
+"""
+WorkflowStore - хранилище состояния workflow и задач
+Позволяет любому процессу (gunicorn worker) отдать статус workflow, который
+выполнялся в другом процессе или до перезапуска, и освобождает память
+WorkflowEngine от завершенных workflow.
+
+Реализации:
+- SQLAlchemyWorkflowStore (по умолчанию) - таблицы workflow_instances /
+  workflow_tasks с отложенной пакетной записью (write-behind) и удалением
+  завершенных workflow по TTL
+- InMemoryWorkflowStore - словари в процессе (тесты, один процесс): другие
+  workers его не видят, завершенные workflow держатся в памяти до TTL
+"""
+
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from sqlalchemy import select
+
+from ..models.workflow import (
+    WorkflowInstance, TaskInstance, WorkflowStatus, TaskStatus, TaskPriority, TaskType,
+    WorkflowInstanceDB, WorkflowTaskDB
+)
+
+logger = logging.getLogger(__name__)
+
+FINISHED_STATUSES = (WorkflowStatus.COMPLETED, WorkflowStatus.FAILED, WorkflowStatus.CANCELLED)
+
+
+class WorkflowStore(ABC):
+    """Интерфейс хранилища workflow"""
+
+    def __init__(self, ttl_seconds: int = None):
+        # Сколько хранить завершенные workflow
+        self.ttl_seconds = ttl_seconds or int(os.getenv("WORKFLOW_STORE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+    @abstractmethod
+    def save_workflow(self, workflow: WorkflowInstance):
+        """Сохраняет состояние workflow (последняя запись по id побеждает)"""
+
+    @abstractmethod
+    def save_task(self, task: TaskInstance):
+        """Сохраняет состояние задачи"""
+
+    @abstractmethod
+    def get_workflow(self, workflow_id: str) -> Optional[WorkflowInstance]:
+        """Возвращает workflow по id"""
+
+    @abstractmethod
+    def get_tasks(self, workflow_id: str) -> List[TaskInstance]:
+        """Возвращает задачи workflow"""
+
+    @abstractmethod
+    def list_by_status(self, status: WorkflowStatus, limit: int = 100) -> List[WorkflowInstance]:
+        """Workflow в указанном статусе"""
+
+    @abstractmethod
+    def compact(self, older_than: Optional[datetime] = None) -> int:
+        """
+        Удаляет завершенные workflow (и их задачи), закончившиеся раньше older_than
+
+        Returns:
+            Количество удаленных workflow
+        """
+
+    def flush(self) -> int:
+        """Записывает отложенные изменения; возвращает число записанных объектов"""
+        return 0
+
+    def close(self):
+        """Записывает остаток и останавливает фоновую работу"""
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {}
+
+    def _cutoff(self, older_than: Optional[datetime]) -> datetime:
+        return older_than or datetime.now() - timedelta(seconds=self.ttl_seconds)
+
+
+class InMemoryWorkflowStore(WorkflowStore):
+    """Хранилище в памяти процесса с индексами по workflow и статусу"""
+
+    name = "memory"
+
+    def __init__(self, ttl_seconds: int = None, compact_interval: float = None):
+        super().__init__(ttl_seconds)
+        self.compact_interval = compact_interval if compact_interval is not None else float(
+            os.getenv("WORKFLOW_STORE_COMPACT_INTERVAL", "3600")
+        )
+        self._workflows: Dict[str, WorkflowInstance] = {}
+        self._tasks: Dict[str, TaskInstance] = {}
+        self._tasks_by_workflow: Dict[str, Set[str]] = {}
+        self._by_status: Dict[WorkflowStatus, Set[str]] = {status: set() for status in WorkflowStatus}
+        self._lock = threading.Lock()
+        self._last_compaction = time.monotonic()
+        self.compacted = 0
+
+    def save_workflow(self, workflow: WorkflowInstance):
+        with self._lock:
+            previous = self._workflows.get(workflow.id)
+            if previous is not None:
+                self._by_status[previous.status].discard(workflow.id)
+            self._workflows[workflow.id] = workflow
+            self._by_status[workflow.status].add(workflow.id)
+        self._maybe_compact()
+
+    def save_task(self, task: TaskInstance):
+        with self._lock:
+            self._tasks[task.id] = task
+            self._tasks_by_workflow.setdefault(task.workflow_instance_id, set()).add(task.id)
+
+    def get_workflow(self, workflow_id: str) -> Optional[WorkflowInstance]:
+        with self._lock:
+            return self._workflows.get(workflow_id)
+
+    def get_tasks(self, workflow_id: str) -> List[TaskInstance]:
+        with self._lock:
+            tasks = [self._tasks[task_id] for task_id in self._tasks_by_workflow.get(workflow_id, ())]
+        return sorted(tasks, key=lambda task: task.created_at)
+
+    def list_by_status(self, status: WorkflowStatus, limit: int = 100) -> List[WorkflowInstance]:
+        with self._lock:
+            workflows = [self._workflows[workflow_id] for workflow_id in self._by_status[status]]
+        return sorted(workflows, key=lambda workflow: workflow.created_at, reverse=True)[:limit]
+
+    def compact(self, older_than: Optional[datetime] = None) -> int:
+        cutoff = self._cutoff(older_than)
+        with self._lock:
+            expired = [
+                workflow_id
+                for status in FINISHED_STATUSES
+                for workflow_id in self._by_status[status]
+                if (self._workflows[workflow_id].completed_at or datetime.min) < cutoff
+            ]
+            for workflow_id in expired:
+                workflow = self._workflows.pop(workflow_id)
+                self._by_status[workflow.status].discard(workflow_id)
+                for task_id in self._tasks_by_workflow.pop(workflow_id, ()):
+                    self._tasks.pop(task_id, None)
+            self._last_compaction = time.monotonic()
+        self.compacted += len(expired)
+        return len(expired)
+
+    def _maybe_compact(self):
+        if time.monotonic() - self._last_compaction >= self.compact_interval:
+            self.compact()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            by_status = {status.value: len(ids) for status, ids in self._by_status.items()}
+            tasks = len(self._tasks)
+        return {
+            "backend": self.name,
+            "workflows": by_status,
+            "tasks": tasks,
+            "compacted": self.compacted,
+            "ttl_seconds": self.ttl_seconds
+        }
+
+
+class SQLAlchemyWorkflowStore(WorkflowStore):
+    """
+    Хранилище в БД с отложенной пакетной записью
+
+    save_* только кладут последнее состояние объекта в буфер (повторные
+    изменения одного workflow/задачи схлопываются), фоновый поток раз в
+    flush_interval пишет буфер пакетами. Чтение сначала смотрит в буфер,
+    поэтому процесс видит свои изменения сразу, а остальные - после сброса.
+    """
+
+    name = "sqlalchemy"
+
+    def __init__(self, session_factory: Callable = None, batch_size: int = None,
+                 flush_interval: float = None, compact_interval: float = None, ttl_seconds: int = None):
+        super().__init__(ttl_seconds)
+        self._session_factory = session_factory
+        self.batch_size = batch_size or int(os.getenv("WORKFLOW_STORE_BATCH_SIZE", "500"))
+        self.flush_interval = flush_interval if flush_interval is not None else float(
+            os.getenv("WORKFLOW_STORE_FLUSH_INTERVAL", "0.5")
+        )
+        self.compact_interval = compact_interval if compact_interval is not None else float(
+            os.getenv("WORKFLOW_STORE_COMPACT_INTERVAL", "3600")
+        )
+
+        self._pending_workflows: Dict[str, WorkflowInstance] = {}
+        self._pending_tasks: Dict[str, TaskInstance] = {}
+        # Пакет, который пишется сейчас: читатели видят его до коммита
+        self._inflight_workflows: Dict[str, WorkflowInstance] = {}
+        self._inflight_tasks: Dict[str, TaskInstance] = {}
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self._last_compaction = time.monotonic()
+
+        # Метрики
+        self.saved = 0
+        self.written = 0
+        self.batches = 0
+        self.errors = 0
+        self.compacted = 0
+        self.last_flush_ms: Optional[float] = None
+
+    # ==================== ЗАПИСЬ ====================
+
+    def save_workflow(self, workflow: WorkflowInstance):
+        with self._cond:
+            self._pending_workflows[workflow.id] = workflow
+            self.saved += 1
+            self._wake_if_full()
+        self._ensure_started()
+
+    def save_task(self, task: TaskInstance):
+        with self._cond:
+            self._pending_tasks[task.id] = task
+            self.saved += 1
+            self._wake_if_full()
+        self._ensure_started()
+
+    def _wake_if_full(self):
+        if len(self._pending_workflows) + len(self._pending_tasks) >= self.batch_size:
+            self._cond.notify_all()
+
+    def flush(self) -> int:
+        with self._flush_lock:
+            with self._cond:
+                workflows, self._pending_workflows = self._pending_workflows, {}
+                tasks, self._pending_tasks = self._pending_tasks, {}
+                self._inflight_workflows, self._inflight_tasks = workflows, tasks
+            if not workflows and not tasks:
+                return 0
+
+            started = time.monotonic()
+            db = None
+            try:
+                db = self._new_session()
+                # Сначала workflow, затем задачи - задачи ссылаются на workflow
+                self._upsert(db, WorkflowInstanceDB, [self._workflow_row(item) for item in workflows.values()])
+                self._upsert(db, WorkflowTaskDB, [self._task_row(item) for item in tasks.values()])
+                db.commit()
+            except Exception as e:
+                if db is not None:
+                    db.rollback()
+                self.errors += 1
+                logger.error(f"Не удалось записать состояние workflow ({len(workflows)} workflow, "
+                             f"{len(tasks)} задач): {e}")
+                # Возвращаем в буфер, если за это время не пришло более новое состояние
+                with self._cond:
+                    for workflow_id, workflow in workflows.items():
+                        self._pending_workflows.setdefault(workflow_id, workflow)
+                    for task_id, task in tasks.items():
+                        self._pending_tasks.setdefault(task_id, task)
+                return 0
+            finally:
+                if db is not None:
+                    db.close()
+                with self._cond:
+                    self._inflight_workflows, self._inflight_tasks = {}, {}
+
+            written = len(workflows) + len(tasks)
+            self.written += written
+            self.last_flush_ms = round((time.monotonic() - started) * 1000, 1)
+            return written
+
+    def _upsert(self, db, model, rows: List[Dict[str, Any]]):
+        """Пакетный upsert: одна выборка существующих id, затем bulk insert/update"""
+        for start in range(0, len(rows), self.batch_size):
+            batch = rows[start:start + self.batch_size]
+            ids = [row["id"] for row in batch]
+            existing = {row_id for (row_id,) in db.query(model.id).filter(model.id.in_(ids))}
+            inserts = [row for row in batch if row["id"] not in existing]
+            updates = [row for row in batch if row["id"] in existing]
+            if inserts:
+                db.bulk_insert_mappings(model, inserts)
+            if updates:
+                db.bulk_update_mappings(model, updates)
+            self.batches += 1
+
+    @staticmethod
+    def _workflow_row(workflow: WorkflowInstance) -> Dict[str, Any]:
+        return {
+            "id": workflow.id,
+            "definition_id": workflow.definition_id,
+            "name": workflow.name,
+            "status": workflow.status.value,
+            "context": _jsonable(workflow.context),
+            "output_data": _jsonable(workflow.output_data),
+            "created_at": workflow.created_at,
+            "started_at": workflow.started_at,
+            "completed_at": workflow.completed_at,
+            "updated_at": datetime.utcnow(),
+            "created_by": workflow.created_by,
+            "error_message": workflow.error_message,
+            "retry_count": workflow.retry_count
+        }
+
+    @staticmethod
+    def _task_row(task: TaskInstance) -> Dict[str, Any]:
+        return {
+            "id": task.id,
+            "workflow_instance_id": task.workflow_instance_id,
+            "name": task.name,
+            "status": task.status.value,
+            "priority": task.priority.value,
+            "task_type": task.task_type.value,
+            "assigned_agent_id": task.assigned_agent_id,
+            "dependencies": list(task.dependencies),
+            "input_data": _jsonable(task.input_data),
+            "output_data": _jsonable(task.output_data),
+            "error_message": task.error_message,
+            "created_at": task.created_at,
+            "deadline": task.deadline,
+            "completed_at": task.completed_at,
+            "updated_at": datetime.utcnow()
+        }
+
+    def _new_session(self):
+        if self._session_factory is None:
+            from app.database.connection import get_db_session
+            self._session_factory = get_db_session
+        return self._session_factory()
+
+    # ==================== ЧТЕНИЕ ====================
+
+    def get_workflow(self, workflow_id: str) -> Optional[WorkflowInstance]:
+        with self._cond:
+            pending = self._pending_workflows.get(workflow_id) or self._inflight_workflows.get(workflow_id)
+        if pending is not None:
+            return pending
+
+        db = self._new_session()
+        try:
+            row = db.query(WorkflowInstanceDB).filter(WorkflowInstanceDB.id == workflow_id).first()
+            return _workflow_from_row(row) if row else None
+        finally:
+            db.close()
+
+    def get_tasks(self, workflow_id: str) -> List[TaskInstance]:
+        db = self._new_session()
+        try:
+            rows = db.query(WorkflowTaskDB).filter(WorkflowTaskDB.workflow_instance_id == workflow_id).all()
+            tasks = {row.id: _task_from_row(row) for row in rows}
+        finally:
+            db.close()
+
+        with self._cond:
+            for buffered in (self._inflight_tasks, self._pending_tasks):
+                tasks.update({
+                    task_id: task for task_id, task in buffered.items()
+                    if task.workflow_instance_id == workflow_id
+                })
+        return sorted(tasks.values(), key=lambda task: task.created_at)
+
+    def list_by_status(self, status: WorkflowStatus, limit: int = 100) -> List[WorkflowInstance]:
+        with self._cond:
+            pending = {**self._inflight_workflows, **self._pending_workflows}
+
+        db = self._new_session()
+        try:
+            rows = db.query(WorkflowInstanceDB).filter(
+                WorkflowInstanceDB.status == status.value
+            ).order_by(WorkflowInstanceDB.created_at.desc()).limit(limit + len(pending)).all()
+            workflows = {row.id: _workflow_from_row(row) for row in rows}
+        finally:
+            db.close()
+
+        # Несохраненные изменения статуса важнее строк БД
+        workflows.update(pending)
+        matching = [workflow for workflow in workflows.values() if workflow.status == status]
+        return sorted(matching, key=lambda workflow: workflow.created_at, reverse=True)[:limit]
+
+    # ==================== TTL ====================
+
+    def compact(self, older_than: Optional[datetime] = None) -> int:
+        # Иначе отложенный upsert вернет только что удаленный workflow
+        self.flush()
+        cutoff = self._cutoff(older_than)
+        expired = (
+            WorkflowInstanceDB.status.in_([status.value for status in FINISHED_STATUSES]),
+            WorkflowInstanceDB.completed_at < cutoff
+        )
+        db = self._new_session()
+        try:
+            db.query(WorkflowTaskDB).filter(
+                WorkflowTaskDB.workflow_instance_id.in_(select(WorkflowInstanceDB.id).where(*expired))
+            ).delete(synchronize_session=False)
+            deleted = db.query(WorkflowInstanceDB).filter(*expired).delete(synchronize_session=False)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            self.errors += 1
+            logger.error(f"Ошибка удаления завершенных workflow: {e}")
+            return 0
+        finally:
+            db.close()
+
+        self._last_compaction = time.monotonic()
+        self.compacted += deleted
+        if deleted:
+            logger.info(f"Удалено {deleted} завершенных workflow старше {cutoff.isoformat()}")
+        return deleted
+
+    # ==================== ФОНОВЫЙ ПОТОК ====================
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._cond:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping = False
+                self._thread = threading.Thread(target=self._run, name="WorkflowStore", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self._stopping or
+                    len(self._pending_workflows) + len(self._pending_tasks) >= self.batch_size,
+                    self.flush_interval
+                )
+                stopping = self._stopping
+            try:
+                self.flush()
+                if time.monotonic() - self._last_compaction >= self.compact_interval:
+                    self.compact()
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Ошибка сброса состояния workflow: {e}", exc_info=True)
+            if stopping:
+                return
+
+    def close(self, timeout: float = 10.0):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+        self.flush()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.name,
+            "pending_workflows": len(self._pending_workflows),
+            "pending_tasks": len(self._pending_tasks),
+            "saved": self.saved,
+            "written": self.written,
+            "batches": self.batches,
+            "errors": self.errors,
+            "compacted": self.compacted,
+            "ttl_seconds": self.ttl_seconds,
+            "last_flush_ms": self.last_flush_ms
+        }
+
+
+def _jsonable(value: Any) -> Any:
+    """Приводит контекст/результат к JSON (datetime, Enum и т.п. - строками)"""
+    return json.loads(json.dumps(value, default=str, ensure_ascii=False))
+
+
+def _workflow_from_row(row: WorkflowInstanceDB) -> WorkflowInstance:
+    return WorkflowInstance(
+        id=row.id,
+        definition_id=row.definition_id or "",
+        name=row.name,
+        status=WorkflowStatus(row.status),
+        context=row.context or {},
+        output_data=row.output_data or {},
+        created_at=row.created_at,
+        started_at=row.started_at,
+        completed_at=row.completed_at,
+        created_by=row.created_by or "",
+        error_message=row.error_message,
+        retry_count=row.retry_count or 0
+    )
+
+
+def _task_from_row(row: WorkflowTaskDB) -> TaskInstance:
+    return TaskInstance(
+        id=row.id,
+        workflow_instance_id=row.workflow_instance_id,
+        name=row.name,
+        status=TaskStatus(row.status),
+        priority=TaskPriority(row.priority),
+        task_type=TaskType(row.task_type),
+        assigned_agent_id=row.assigned_agent_id,
+        dependencies=row.dependencies or [],
+        input_data=row.input_data or {},
+        output_data=row.output_data or {},
+        error_message=row.error_message,
+        created_at=row.created_at,
+        deadline=row.deadline,
+        completed_at=row.completed_at
+    )
+
+
+def create_workflow_store() -> WorkflowStore:
+    """Хранилище по WORKFLOW_STORE_BACKEND (sqlalchemy | memory)"""
+    backend = os.getenv("WORKFLOW_STORE_BACKEND", "sqlalchemy").lower()
+    if backend == "memory":
+        workers = int(os.getenv("GUNICORN_WORKERS", "1"))
+        if workers > 1:
+            logger.warning(
+                f"WORKFLOW_STORE_BACKEND=memory при GUNICORN_WORKERS={workers}: статус и результат "
+                f"workflow доступны только принявшему запрос worker"
+            )
+        return InMemoryWorkflowStore()
+    if backend != "sqlalchemy":
+        logger.warning(f"Неизвестный WORKFLOW_STORE_BACKEND={backend}, используется sqlalchemy")
+    return SQLAlchemyWorkflowStore()
+
+
+_store: Optional[WorkflowStore] = None
+_store_pid: Optional[int] = None
+_store_lock = threading.Lock()
+
+
+def get_workflow_store() -> WorkflowStore:
+    """
+    Возвращает хранилище workflow процесса
+
+    Поток записи не переживает fork, поэтому в каждом gunicorn worker
+    создается свое хранилище (данные в БД при этом общие).
+    """
+    global _store, _store_pid
+
+    pid = os.getpid()
+    if _store is None or _store_pid != pid:
+        with _store_lock:
+            if _store is None or _store_pid != pid:
+                _store = create_workflow_store()
+                _store_pid = pid
+                atexit.register(_store.close)
+    return _store
@@ -6,7 +6,7 @@ from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.services.instagram_account_service import InstagramAccountService
 from app.database.connection import get_db_session
-import asyncio
+from app.utils.event_loop import run_coroutine
 import logging
 
 logger = logging.getLogger(__name__)
@@ -102,7 +102,7 @@ def add_account():
         service = InstagramAccountService(db)
         
         # Добавляем аккаунт (async операция)
-        success, message, account = asyncio.run(
+        success, message, account = run_coroutine(
             service.add_account(user_id, username, password, account_name)
         )
         
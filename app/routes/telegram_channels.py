@@ -6,7 +6,7 @@ from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.services.telegram_channel_service import TelegramChannelService
 from app.database.connection import get_db_session
-import asyncio
+from app.utils.event_loop import run_coroutine
 import logging
 
 logger = logging.getLogger(__name__)
@@ -28,7 +28,7 @@ def get_bot_info():
         service = TelegramChannelService(db)
         
         # Вызываем async функцию
-        bot_info = asyncio.run(service.get_bot_info())
+        bot_info = run_coroutine(service.get_bot_info())
         
         return jsonify({
             'success': True,
@@ -116,7 +116,7 @@ def add_channel():
         service = TelegramChannelService(db)
         
         # Используем упрощенный метод (автоматическое получение названия из Telegram API)
-        success, message, channel = asyncio.run(
+        success, message, channel = run_coroutine(
             service.upsert_single_channel(user_id, channel_link, is_active=bool(is_active))
         )
         
@@ -218,7 +218,7 @@ def update_channel(channel_id):
         service = TelegramChannelService(db)
         
         # Обновляем канал (async операция)
-        success, message, channel = asyncio.run(
+        success, message, channel = run_coroutine(
             service.update_channel(
                 user_id=user_id,
                 channel_id=channel_id,
@@ -370,7 +370,7 @@ def toggle_activation(channel_id):
         # Если указаны изменения канала - обновляем канал с активацией
         if channel_link or channel_name:
             logger.info(f"Обновление канала {channel_id} с последующей активацией для user_id={user_id}")
-            success, message, channel = asyncio.run(
+            success, message, channel = run_coroutine(
                 service.update_channel(
                     user_id=user_id,
                     channel_id=channel_id,
@@ -449,7 +449,7 @@ def verify_channel(channel_id):
             }), 404
         
         # Проверяем статус
-        is_verified, chat_info = asyncio.run(
+        is_verified, chat_info = run_coroutine(
             service.verify_bot_in_channel(channel.chat_id)
         )
         
@@ -529,7 +529,7 @@ def activate_single_channel():
         service = TelegramChannelService(db)
         
         # Вызываем упрощенный метод (async операция)
-        success, message, channel = asyncio.run(
+        success, message, channel = run_coroutine(
             service.upsert_single_channel(user_id, channel_link, is_active=bool(is_active))
         )
         
@@ -7,7 +7,7 @@ from flask import Blueprint, request, jsonify, redirect, session
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.services.twitter_account_service import TwitterAccountService
 from app.database.connection import get_db_session
-import asyncio
+from app.utils.event_loop import run_coroutine
 import logging
 import os
 
@@ -109,7 +109,7 @@ def oauth_callback():
         service = TwitterAccountService(db)
         
         # Завершаем OAuth
-        success, message, account = asyncio.run(
+        success, message, account = run_coroutine(
             service.complete_oauth(
                 user_id=user_id,
                 oauth_token=oauth_token,
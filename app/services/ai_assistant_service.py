@@ -3,6 +3,7 @@ AI Assistant Service для помощи в заполнении опросни
 Анализирует ресурсы (сайты, телеграм-каналы) и извлекает информацию
 """
 
+import asyncio
 import logging
 import json
 import requests
@@ -12,6 +13,8 @@ from typing import Dict, Optional, Any, List
 from openai import AsyncOpenAI
 import os
 
+from app.utils.http_clients import get_http_clients
+
 logger = logging.getLogger(__name__)
 
 
@@ -66,7 +69,7 @@ class AIAssistantService:
             logger.info(f"Парсинг постов из Telegram канала: {channel_url}")
             
             # Загружаем HTML страницы канала
-            response = requests.get(channel_url, timeout=10, headers={
+            response = get_http_clients().session.get(channel_url, timeout=10, headers={
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
                 'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
                 'Accept-Language': 'ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7'
@@ -190,9 +193,12 @@ class AIAssistantService:
         try:
             if resource_type == 'website':
                 # Для сайтов получаем HTML с таймаутом 5 секунд
-                response = requests.get(url, timeout=5, headers={
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-                })
+                # Блокирующий запрос выполняется в потоке, чтобы не занимать общий event loop
+                response = await asyncio.to_thread(
+                    get_http_clients().session.get, url, timeout=5, headers={
+                        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+                    }
+                )
                 response.raise_for_status()
                 return {
                     'type': 'html',
@@ -201,7 +207,7 @@ class AIAssistantService:
                 }
             elif resource_type == 'telegram':
                 # Парсим посты из Telegram канала
-                posts = self._parse_telegram_channel_posts(url, max_posts=20)
+                posts = await asyncio.to_thread(self._parse_telegram_channel_posts, url, max_posts=20)
                 
                 if posts:
                     # Объединяем посты в один текст для анализа
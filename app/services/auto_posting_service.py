@@ -6,9 +6,11 @@ import logging
 from datetime import datetime, timedelta
 from typing import List, Optional, Dict, Any
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from sqlalchemy import and_, func, or_
 
+from app.database.leases import DEFAULT_LEASE_SECONDS, claim_rows, renew_lease
 from app.models.auto_posting_rules import AutoPostingRuleDB
+from app.utils.wakeup import AUTO_POSTING, notify_workers
 
 logger = logging.getLogger(__name__)
 
@@ -57,6 +59,7 @@ class AutoPostingService:
         self.db.add(rule)
         self.db.commit()
         self.db.refresh(rule)
+        notify_workers(AUTO_POSTING, rule.next_execution_at)
         
         logger.info(f"Создано правило автопостинга {rule.id} для user_id={user_id}")
         return rule
@@ -113,6 +116,8 @@ class AutoPostingService:
         rule.updated_at = datetime.utcnow()
         self.db.commit()
         self.db.refresh(rule)
+        if rule.is_active and not rule.is_paused:
+            notify_workers(AUTO_POSTING, rule.next_execution_at)
         
         logger.info(f"Обновлено правило автопостинга {rule_id}")
         return rule
@@ -138,6 +143,8 @@ class AutoPostingService:
         rule.is_active = is_active
         rule.updated_at = datetime.utcnow()
         self.db.commit()
+        if is_active:
+            notify_workers(AUTO_POSTING, rule.next_execution_at)
         
         return True
     
@@ -152,6 +159,65 @@ class AutoPostingService:
             )
         ).order_by(AutoPostingRuleDB.next_execution_at.asc()).limit(limit).all()
     
+    def get_next_deadline(self) -> Optional[datetime]:
+        """
+        Ближайшее время, когда для worker'а появится работа: наступление
+        свободного правила или истечение аренды захваченного
+        """
+        now = datetime.utcnow()
+        active = and_(
+            AutoPostingRuleDB.is_active == True,
+            AutoPostingRuleDB.is_paused == False
+        )
+        next_free = self.db.query(func.min(AutoPostingRuleDB.next_execution_at)).filter(
+            active,
+            or_(
+                AutoPostingRuleDB.lease_expires_at.is_(None),
+                AutoPostingRuleDB.lease_expires_at < now
+            )
+        ).scalar()
+        next_lease_expiry = self.db.query(func.min(AutoPostingRuleDB.lease_expires_at)).filter(
+            active,
+            AutoPostingRuleDB.lease_expires_at >= now
+        ).scalar()
+        deadlines = [value for value in (next_free, next_lease_expiry) if value is not None]
+        return min(deadlines) if deadlines else None
+    
+    def claim_rules_to_execute(
+        self,
+        worker_id: str,
+        limit: int = 100,
+        lease_seconds: int = DEFAULT_LEASE_SECONDS
+    ) -> List[AutoPostingRuleDB]:
+        """
+        Захватить наступившие правила для выполнения этим worker'ом
+        
+        Каждое правило достается ровно одному worker'у; аренда снимается в
+        mark_execution, а если worker упал - истекает через lease_seconds.
+        """
+        now = datetime.utcnow()
+        claimable = and_(
+            AutoPostingRuleDB.is_active == True,
+            AutoPostingRuleDB.is_paused == False,
+            AutoPostingRuleDB.next_execution_at <= now,
+            or_(
+                AutoPostingRuleDB.lease_expires_at.is_(None),
+                AutoPostingRuleDB.lease_expires_at < now
+            )
+        )
+        return claim_rows(
+            self.db, AutoPostingRuleDB, claimable,
+            order_by=[AutoPostingRuleDB.next_execution_at.asc(), AutoPostingRuleDB.id.asc()],
+            worker_id=worker_id,
+            limit=limit,
+            lease_seconds=lease_seconds
+        )
+    
+    def renew_leases(self, rule_ids: List[int], worker_id: str,
+                     lease_seconds: int = DEFAULT_LEASE_SECONDS) -> int:
+        """Продлить аренду правил, которые еще ждут выполнения (heartbeat)"""
+        return renew_lease(self.db, AutoPostingRuleDB, rule_ids, worker_id, lease_seconds)
+    
     def mark_execution(
         self,
         rule_id: int,
@@ -183,6 +249,10 @@ class AutoPostingService:
                 rule.schedule_config
             )
         
+        # Снимаем аренду - правило снова доступно по next_execution_at
+        rule.claimed_by = None
+        rule.lease_expires_at = None
+        
         rule.updated_at = datetime.utcnow()
         self.db.commit()
         
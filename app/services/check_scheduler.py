@@ -0,0 +1,112 @@
+"""
+Адаптивное расписание проверок источников
+Для каждого источника оценивается среднее время между изменениями
+(экспоненциальное скользящее среднее интервалов между проверками с новыми
+элементами), следующая проверка планируется через долю этой оценки в
+границах источника. Редко меняющиеся источники проверяются реже, активные -
+чаще; источники с автопостингом - еще чаще.
+"""
+
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveCheckScheduler:
+    """Оценка частоты изменений источника и интервал следующей проверки"""
+
+    def __init__(self, enabled: bool = None, alpha: float = None, fraction: float = None,
+                 auto_post_factor: float = None, min_minutes: float = None, max_minutes: float = None):
+        if enabled is None:
+            enabled = os.getenv("CHECK_SCHEDULE_ADAPTIVE", "true").lower() == "true"
+        self.enabled = enabled
+        # Вес нового интервала в скользящем среднем
+        self.alpha = alpha or float(os.getenv("CHECK_SCHEDULE_ALPHA", "0.3"))
+        # Проверяем через эту долю ожидаемого интервала между изменениями
+        self.fraction = fraction or float(os.getenv("CHECK_SCHEDULE_FRACTION", "0.5"))
+        self.auto_post_factor = auto_post_factor or float(os.getenv("CHECK_SCHEDULE_AUTO_POST_FACTOR", "0.5"))
+        # Границы по умолчанию, если у источника свои не заданы
+        self.min_minutes = min_minutes or float(os.getenv("CHECK_SCHEDULE_MIN_MINUTES", "10"))
+        self.max_minutes = max_minutes or float(os.getenv("CHECK_SCHEDULE_MAX_MINUTES", "1440"))
+
+    def bounds(self, source) -> Tuple[float, float]:
+        """Минимальный и максимальный интервал проверки источника (минуты)"""
+        low = source.min_check_interval_minutes or self.min_minutes
+        high = source.max_check_interval_minutes or self.max_minutes
+        return low, max(low, high)
+
+    def _blend(self, estimate: Optional[float], interval: float) -> float:
+        if estimate is None:
+            return interval
+        return self.alpha * interval + (1 - self.alpha) * estimate
+
+    def bootstrap(self, source, change_times: List[datetime]):
+        """Начальная оценка по истории проверок (время проверок с новыми элементами, по возрастанию)"""
+        estimate = None
+        for previous, current in zip(change_times, change_times[1:]):
+            estimate = self._blend(estimate, (current - previous).total_seconds() / 60)
+        source.change_interval_minutes = estimate
+        source.last_change_at = change_times[-1] if change_times else None
+
+    def observe(self, source, changed: bool, now: datetime):
+        """Учитывает результат проверки в оценке источника"""
+        estimate = source.change_interval_minutes
+        reference = source.last_change_at or source.created_at
+        quiet = (now - reference).total_seconds() / 60 if reference else None
+
+        if changed:
+            if source.last_change_at is not None:
+                estimate = self._blend(estimate, quiet)
+            source.last_change_at = now
+        elif quiet is not None and quiet > (estimate if estimate is not None else source.check_interval_minutes or 0):
+            # Изменений нет дольше ожидаемого - оценка занижена, растим ее
+            estimate = self._blend(estimate, quiet)
+
+        if estimate is not None:
+            # Оценка больше этой уже не меняет интервал, а только замедляет возврат к частым проверкам
+            estimate = min(estimate, self.bounds(source)[1] / self.fraction)
+        source.change_interval_minutes = estimate
+
+    def next_interval_minutes(self, source) -> float:
+        """Интервал до следующей проверки"""
+        low, high = self.bounds(source)
+        estimate = source.change_interval_minutes
+        if estimate is None:
+            # Частота изменений еще неизвестна - интервал, заданный пользователем
+            interval = source.check_interval_minutes or 60
+        else:
+            interval = estimate * self.fraction
+            if source.auto_post_enabled:
+                interval *= self.auto_post_factor
+        return min(max(interval, low), high)
+
+    def schedule(self, source, changed: bool, now: datetime) -> datetime:
+        """Обновляет оценку источника и возвращает время следующей проверки"""
+        if not self.enabled:
+            return now + timedelta(minutes=source.check_interval_minutes)
+        self.observe(source, changed, now)
+        return now + timedelta(minutes=self.next_interval_minutes(source))
+
+    def get_stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "alpha": self.alpha,
+            "fraction": self.fraction,
+            "auto_post_factor": self.auto_post_factor,
+            "min_minutes": self.min_minutes,
+            "max_minutes": self.max_minutes
+        }
+
+
+_check_scheduler: Optional[AdaptiveCheckScheduler] = None
+
+
+def get_check_scheduler() -> AdaptiveCheckScheduler:
+    """Планировщик проверок процесса (настройки из окружения)"""
+    global _check_scheduler
+    if _check_scheduler is None:
+        _check_scheduler = AdaptiveCheckScheduler()
+    return _check_scheduler
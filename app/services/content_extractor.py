@@ -5,9 +5,15 @@ AI-based Content Extractor для извлечения структуриров
 import logging
 import json
 import hashlib
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Awaitable, Callable
 from datetime import datetime
+import os
 import re
+import tempfile
+
+from app.services.feed_parser import iter_feed_items
+from app.services.page_blocks import FingerprintIndex, segment_blocks
+from app.utils.disk_cache import DiskCache, MISS
 
 logger = logging.getLogger(__name__)
 
@@ -220,8 +226,15 @@ HTML:
 class ChangeDetector:
     """Определение изменений на странице"""
     
-    def __init__(self):
+    def __init__(self, min_block_chars: int = None, max_distance: int = None, max_snapshot_blocks: int = None):
         self.extractor = ContentExtractor()
+        # Блоки короче (после нормализации) не сравниваются: кнопки, даты, счетчики
+        self.min_block_chars = min_block_chars or int(os.getenv("WEB_CRAWLER_BLOCK_MIN_CHARS", "20"))
+        # Блоки с отпечатками не дальше этого расстояния Хэмминга считаются одним блоком
+        self.max_distance = max_distance if max_distance is not None else int(
+            os.getenv("WEB_CRAWLER_BLOCK_MAX_DISTANCE", "3"))
+        # Сколько отпечатков хранится в снимке (включая исчезнувшие блоки: ротация, карусели)
+        self.max_snapshot_blocks = max_snapshot_blocks or int(os.getenv("WEB_CRAWLER_SNAPSHOT_MAX_BLOCKS", "500"))
     
     def detect_changes(
         self,
@@ -231,12 +244,20 @@ class ChangeDetector:
         """
         Определение изменений между текущей версией и снимком
         
+        Страница сравнивается со снимком поблочно (page_blocks): изменение
+        дат, счетчиков и рекламы не считается изменением, новые блоки
+        возвращаются в new_blocks и new_html (фрагмент для AI извлечения).
+        
         Returns:
             {
                 'has_changes': bool,
                 'change_type': 'new_content' | 'updated_content' | 'no_changes',
-                'new_items': [],
-                'updated_items': [],
+                'new_hash': MD5 текста страницы,
+                'new_blocks': [PageBlock],
+                'new_html': HTML новых блоков (None - извлекать всю страницу),
+                'blocks_total': int,
+                'snapshot': данные для ContentSourceService.save_snapshot,
+                'snapshot_updated': bool - снимок нужно сохранить,
                 'confidence': 0.0-1.0
             }
         """
@@ -244,34 +265,70 @@ class ChangeDetector:
         # Вычисляем хеш нового контента
         new_text = self.extractor.extract_text_from_html(new_html)
         new_hash = self.extractor.calculate_content_hash(new_text)
+        blocks = segment_blocks(new_html, self.min_block_chars)
+        old_hash = old_snapshot.get('hash') if old_snapshot else None
+        old_blocks = old_snapshot.get('blocks') if old_snapshot else None
         
-        # Если нет старого снимка - это новый контент
-        if not old_snapshot:
-            return {
-                'has_changes': True,
-                'change_type': 'new_content',
-                'new_hash': new_hash,
-                'confidence': 1.0
-            }
+        result = {
+            'new_hash': new_hash,
+            'blocks_total': len(blocks),
+            'new_blocks': [],
+            'new_html': None,
+            'confidence': 1.0
+        }
         
-        # Сравниваем хеши
-        old_hash = old_snapshot.get('hash')
-        if new_hash == old_hash:
-            return {
-                'has_changes': False,
-                'change_type': 'no_changes',
-                'new_hash': new_hash,
-                'confidence': 1.0
-            }
+        if not blocks:
+            # Блоков не нашлось (страница без текстовой разметки) - сравнение хеша всей страницы
+            changed = new_hash != old_hash
+            snapshot = {'hash': new_hash, 'blocks': [], 'timestamp': datetime.utcnow().isoformat()}
+            result.update(
+                has_changes=changed,
+                change_type='no_changes' if not changed else ('updated_content' if old_snapshot else 'new_content'),
+                snapshot=snapshot,
+                snapshot_updated=changed or old_blocks is None
+            )
+            if changed and old_snapshot:
+                result.update(old_hash=old_hash, confidence=0.8)
+            return result
         
-        # Контент изменился
-        return {
-            'has_changes': True,
-            'change_type': 'updated_content',
-            'new_hash': new_hash,
-            'old_hash': old_hash,
-            'confidence': 0.8
+        if old_blocks is None and old_hash == new_hash:
+            # Снимок старого формата и страница не менялась - только переводим снимок на блоки
+            new_blocks = []
+        elif old_blocks is None:
+            # Нет снимка или снимок старого формата (только хеш) - новыми считаются все блоки
+            new_blocks = blocks
+        else:
+            index = FingerprintIndex((int(value, 16) for value in old_blocks), self.max_distance)
+            new_blocks = [block for block in blocks if index.find(block.fingerprint) is None]
+        
+        # Текущие отпечатки первыми, затем запомненные исчезнувшие блоки
+        current = [block.fingerprint_hex for block in blocks]
+        current_set = set(current)
+        remembered = current + [value for value in (old_blocks or []) if value not in current_set]
+        snapshot = {
+            'hash': new_hash,
+            'blocks': remembered[:self.max_snapshot_blocks],
+            'timestamp': datetime.utcnow().isoformat()
         }
+        
+        if not new_blocks:
+            change_type = 'no_changes'
+        elif old_snapshot:
+            change_type = 'updated_content'
+        else:
+            change_type = 'new_content'
+        
+        result.update(
+            has_changes=bool(new_blocks),
+            change_type=change_type,
+            new_blocks=new_blocks,
+            new_html="\n".join(block.html for block in new_blocks) or None,
+            snapshot=snapshot,
+            snapshot_updated=old_blocks is None or old_hash != new_hash or snapshot['blocks'] != old_blocks
+        )
+        if old_snapshot and new_blocks:
+            result['old_hash'] = old_hash
+        return result
     
     def extract_new_items(
         self,
@@ -323,64 +380,10 @@ class RSSParser:
     """Парсер RSS лент"""
     
     @staticmethod
-    def parse_feed(feed_xml: str) -> List[Dict[str, Any]]:
-        """Парсинг RSS/Atom ленты"""
-        items = []
-        
+    def parse_feed(feed_xml: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Парсинг RSS/Atom ленты (для потока ответа - feed_parser.aiter_feed_items)"""
         try:
-            # Ищем все <item> или <entry>
-            item_pattern = r'<(?:item|entry)[^>]*>(.*?)</(?:item|entry)>'
-            item_matches = re.findall(item_pattern, feed_xml, re.IGNORECASE | re.DOTALL)
-            
-            for item_xml in item_matches:
-                item_data = {}
-                
-                # Заголовок
-                title_match = re.search(r'<title[^>]*>(.*?)</title>', item_xml, re.IGNORECASE | re.DOTALL)
-                if title_match:
-                    item_data['title'] = re.sub(r'<!\[CDATA\[(.*?)\]\]>', r'\1', title_match.group(1)).strip()
-                
-                # Ссылка
-                link_match = re.search(r'<link[^>]*>([^<]+)</link>', item_xml, re.IGNORECASE)
-                if not link_match:
-                    link_match = re.search(r'<link[^>]+href=["\']([^"\']+)["\']', item_xml, re.IGNORECASE)
-                if link_match:
-                    item_data['url'] = link_match.group(1).strip()
-                
-                # Описание
-                desc_match = re.search(r'<(?:description|summary)[^>]*>(.*?)</(?:description|summary)>', item_xml, re.IGNORECASE | re.DOTALL)
-                if desc_match:
-                    item_data['summary'] = re.sub(r'<!\[CDATA\[(.*?)\]\]>', r'\1', desc_match.group(1)).strip()
-                    item_data['summary'] = re.sub(r'<[^>]+>', '', item_data['summary'])[:500]
-                
-                # Контент
-                content_match = re.search(r'<(?:content:encoded|content)[^>]*>(.*?)</(?:content:encoded|content)>', item_xml, re.IGNORECASE | re.DOTALL)
-                if content_match:
-                    item_data['content'] = re.sub(r'<!\[CDATA\[(.*?)\]\]>', r'\1', content_match.group(1)).strip()
-                    item_data['content'] = re.sub(r'<[^>]+>', '', item_data['content'])
-                
-                # Дата публикации
-                date_match = re.search(r'<(?:pubDate|published|updated)[^>]*>(.*?)</(?:pubDate|published|updated)>', item_xml, re.IGNORECASE)
-                if date_match:
-                    item_data['published_date'] = date_match.group(1).strip()
-                
-                # Автор
-                author_match = re.search(r'<(?:author|dc:creator)[^>]*>(.*?)</(?:author|dc:creator)>', item_xml, re.IGNORECASE | re.DOTALL)
-                if author_match:
-                    author_text = author_match.group(1)
-                    name_match = re.search(r'<name>(.*?)</name>', author_text, re.IGNORECASE)
-                    item_data['author'] = name_match.group(1).strip() if name_match else re.sub(r'<[^>]+>', '', author_text).strip()
-                
-                # GUID как external_id
-                guid_match = re.search(r'<guid[^>]*>(.*?)</guid>', item_xml, re.IGNORECASE)
-                if guid_match:
-                    item_data['external_id'] = guid_match.group(1).strip()
-                elif item_data.get('url'):
-                    item_data['external_id'] = item_data['url']
-                
-                if item_data.get('title'):
-                    items.append(item_data)
-            
+            items = list(iter_feed_items([feed_xml], limit=limit))
             logger.info(f"Parsed {len(items)} items from RSS feed")
             return items
             
@@ -388,11 +391,146 @@ class RSSParser:
             logger.error(f"Error parsing RSS feed: {e}")
             return []
 
+    DISCOVERY_USER_AGENTS = [
+        'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+        'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+        'Mozilla/5.0 (compatible; ContentCurator/1.0)'
+    ]
+    PROBE_HEADERS = {'User-Agent': 'Mozilla/5.0 (compatible; ContentCurator/1.0)'}
+    
+    @staticmethod
+    def _page_headers(user_agent: str) -> Dict[str, str]:
+        return {
+            'User-Agent': user_agent,
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+            'Accept-Language': 'ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7'
+        }
+    
+    @staticmethod
+    def _feed_link_from_html(url: str, html: str) -> Optional[str]:
+        """RSS/Atom ссылка из <link rel="alternate"> страницы"""
+        from urllib.parse import urljoin
+        
+        rss_link_pattern = r'<link[^>]+rel=["\'](?:alternate|feed)["\'][^>]+type=["\']application/(?:rss|atom)\+xml["\'][^>]+href=["\']([^"\']+)["\']'
+        matches = re.findall(rss_link_pattern, html, re.IGNORECASE)
+        if not matches:
+            return None
+        
+        rss_url = matches[0]
+        # Преобразуем относительный URL в абсолютный
+        if not rss_url.startswith('http'):
+            rss_url = urljoin(url, rss_url)
+        return rss_url
+    
+    @staticmethod
+    def _standard_feed_urls(url: str) -> List[str]:
+        """Стандартные пути RSS на сайте"""
+        from urllib.parse import urljoin, urlparse
+        
+        parsed_url = urlparse(url)
+        base_url = f"{parsed_url.scheme}://{parsed_url.netloc}"
+        standard_paths = [
+            '/rss',
+            '/feed',
+            '/rss.xml',
+            '/feed.xml',
+            '/rss/',
+            '/feed/',
+            '/atom.xml',
+            '/index.xml',
+            f'{parsed_url.path}/rss',
+            f'{parsed_url.path}/feed',
+        ]
+        return [urljoin(base_url, path) for path in standard_paths]
+    
+    @staticmethod
+    def _mentioned_feed_urls(html: str) -> List[str]:
+        """Упоминания RSS в тексте страницы (первые 5)"""
+        rss_mention_pattern = r'(https?://[^\s<>"\']+\.(?:rss|xml|atom))'
+        return re.findall(rss_mention_pattern, html, re.IGNORECASE)[:5]
+    
+    @staticmethod
+    def _is_feed_content_type(content_type: str, allow_atom: bool = True) -> bool:
+        content_type = content_type.lower()
+        return 'xml' in content_type or 'rss' in content_type or (allow_atom and 'atom' in content_type)
+    
+    @staticmethod
+    def _cached_feed(url: str) -> Any:
+        """Результат прошлого поиска RSS для страницы (MISS - не искали или устарел)"""
+        return get_discovery_cache().get(f"feed:{url}")
+    
+    @staticmethod
+    def _remember_feed(url: str, feed_url: Optional[str]):
+        cache = get_discovery_cache()
+        # Отсутствие RSS помним меньше: сайт может его добавить
+        ttl = None if feed_url else float(os.getenv('WEB_CRAWLER_DISCOVERY_NEGATIVE_TTL', '3600'))
+        cache.set(f"feed:{url}", feed_url, ttl)
+    
+    @staticmethod
+    def forget_discovered_feed(url: str):
+        """Сбрасывает закешированный RSS страницы (например, если лента перестала работать)"""
+        get_discovery_cache().delete(f"feed:{url}")
+    
+    @staticmethod
+    def _probe_feed(probe_url: str, head: Callable[[str], Any], allow_atom: bool = True) -> bool:
+        """HEAD проба пути с кешем Content-Type на диске"""
+        cache = get_discovery_cache()
+        content_type = cache.get(f"probe:{probe_url}")
+        if content_type is MISS:
+            try:
+                content_type = head(probe_url).headers.get('Content-Type', '')
+            except Exception:
+                content_type = ''
+            cache.set(f"probe:{probe_url}", content_type)
+        return RSSParser._is_feed_content_type(content_type, allow_atom)
+    
+    @staticmethod
+    async def _probe_feed_async(probe_url: str, fetch: Callable[..., Awaitable[Any]],
+                                allow_atom: bool = True) -> bool:
+        cache = get_discovery_cache()
+        content_type = cache.get(f"probe:{probe_url}")
+        if content_type is MISS:
+            try:
+                response = await fetch('HEAD', probe_url, headers=RSSParser.PROBE_HEADERS, timeout=5)
+                content_type = response.headers.get('Content-Type', '')
+            except Exception:
+                content_type = ''
+            cache.set(f"probe:{probe_url}", content_type)
+        return RSSParser._is_feed_content_type(content_type, allow_atom)
+    
+    @staticmethod
+    def _find_feed(url: str, html: str, probe: Callable[[str, bool], bool]) -> Optional[str]:
+        """Поиск RSS по HTML страницы: <link> теги, стандартные пути, упоминания в тексте"""
+        # 1. Ищем RSS ссылки в <link> тегах
+        rss_url = RSSParser._feed_link_from_html(url, html)
+        if rss_url:
+            logger.info(f"Found RSS feed via <link> tag: {rss_url}")
+            return rss_url
+        
+        # 2. Проверяем стандартные пути RSS
+        for test_url in RSSParser._standard_feed_urls(url):
+            if probe(test_url, True):
+                logger.info(f"Found RSS feed at standard path: {test_url}")
+                return test_url
+        
+        # 3. Ищем упоминания RSS в тексте страницы
+        for mention in RSSParser._mentioned_feed_urls(html):
+            if probe(mention, False):
+                logger.info(f"Found RSS feed via text mention: {mention}")
+                return mention
+        
+        logger.info(f"No RSS feed found for {url}")
+        return None
+    
     @staticmethod
     def discover_rss_feed(url: str, html: Optional[str] = None) -> Optional[str]:
         """
         Автоматический поиск RSS ленты на странице
         
+        Результат поиска и ответы на HEAD пробы кешируются на диске
+        (WEB_CRAWLER_DISCOVERY_CACHE_DIR), поэтому повторные проверки
+        источника не загружают страницу и не перебирают пути заново.
+        
         Args:
             url: URL страницы
             html: HTML содержимое страницы (если уже загружено)
@@ -401,28 +539,25 @@ class RSSParser:
             URL RSS ленты или None если не найдено
         """
         import requests
-        from urllib.parse import urljoin, urlparse
+        from app.utils.http_clients import get_http_clients
         
+        session = get_http_clients().session
         try:
-            # Если HTML не передан, загружаем страницу
-            if not html:
-                # Пробуем загрузить с разными User-Agent
-                user_agents = [
-                    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                    'Mozilla/5.0 (compatible; ContentCurator/1.0)'
-                ]
+            # Если HTML не передан, загружаем страницу (или берем результат из кеша)
+            page_fetched = not html
+            if page_fetched:
+                cached = RSSParser._cached_feed(url)
+                if cached is not MISS:
+                    return cached
                 
+                # Пробуем загрузить с разными User-Agent
+                user_agents = RSSParser.DISCOVERY_USER_AGENTS
                 for user_agent in user_agents:
                     try:
-                        response = requests.get(
+                        response = session.get(
                             url, 
                             timeout=10, 
-                            headers={
-                                'User-Agent': user_agent,
-                                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-                                'Accept-Language': 'ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7'
-                            },
+                            headers=RSSParser._page_headers(user_agent),
                             allow_redirects=True
                         )
                         response.raise_for_status()
@@ -433,66 +568,86 @@ class RSSParser:
                             continue  # Пробуем следующий User-Agent
                         raise
             
-            # 1. Ищем RSS ссылки в <link> тегах
-            rss_link_pattern = r'<link[^>]+rel=["\'](?:alternate|feed)["\'][^>]+type=["\']application/(?:rss|atom)\+xml["\'][^>]+href=["\']([^"\']+)["\']'
-            matches = re.findall(rss_link_pattern, html, re.IGNORECASE)
-            
-            if matches:
-                rss_url = matches[0]
-                # Преобразуем относительный URL в абсолютный
-                if not rss_url.startswith('http'):
-                    rss_url = urljoin(url, rss_url)
-                logger.info(f"Found RSS feed via <link> tag: {rss_url}")
-                return rss_url
+            head = lambda probe_url: session.head(
+                probe_url, timeout=5, allow_redirects=True, headers=RSSParser.PROBE_HEADERS
+            )
+            feed_url = RSSParser._find_feed(
+                url, html, lambda probe_url, allow_atom: RSSParser._probe_feed(probe_url, head, allow_atom)
+            )
+            if page_fetched:
+                RSSParser._remember_feed(url, feed_url)
+            return feed_url
             
-            # 2. Проверяем стандартные пути RSS
-            parsed_url = urlparse(url)
-            base_url = f"{parsed_url.scheme}://{parsed_url.netloc}"
-            standard_paths = [
-                '/rss',
-                '/feed',
-                '/rss.xml',
-                '/feed.xml',
-                '/rss/',
-                '/feed/',
-                '/atom.xml',
-                '/index.xml',
-                f'{parsed_url.path}/rss',
-                f'{parsed_url.path}/feed',
-            ]
+        except Exception as e:
+            logger.warning(f"Error discovering RSS feed for {url}: {e}")
+            return None
+    
+    @staticmethod
+    async def discover_rss_feed_async(url: str, fetch: Callable[..., Awaitable[Any]],
+                                      html: Optional[str] = None) -> Optional[str]:
+        """
+        Асинхронный discover_rss_feed (с тем же кешем на диске)
+        
+        Args:
+            url: URL страницы
+            fetch: корутина fetch(method, url, headers=..., timeout=...) -> httpx.Response
+                   (краулер передает запрос через общий клиент и лимиты хостов)
+            html: HTML содержимое страницы (если уже загружено)
+        """
+        try:
+            page_fetched = not html
+            if page_fetched:
+                cached = RSSParser._cached_feed(url)
+                if cached is not MISS:
+                    return cached
+                
+                user_agents = RSSParser.DISCOVERY_USER_AGENTS
+                for user_agent in user_agents:
+                    response = await fetch('GET', url, headers=RSSParser._page_headers(user_agent), timeout=10)
+                    if response.status_code == 403 and user_agent != user_agents[-1]:
+                        continue  # Пробуем следующий User-Agent
+                    response.raise_for_status()
+                    html = response.text
+                    break
             
-            for path in standard_paths:
-                test_url = urljoin(base_url, path)
-                try:
-                    response = requests.head(test_url, timeout=5, allow_redirects=True, headers={
-                        'User-Agent': 'Mozilla/5.0 (compatible; ContentCurator/1.0)'
-                    })
-                    content_type = response.headers.get('Content-Type', '').lower()
-                    if 'xml' in content_type or 'rss' in content_type or 'atom' in content_type:
+            # Порядок как в _find_feed, но пробы асинхронные
+            rss_url = RSSParser._feed_link_from_html(url, html)
+            if rss_url:
+                logger.info(f"Found RSS feed via <link> tag: {rss_url}")
+            else:
+                for test_url in RSSParser._standard_feed_urls(url):
+                    if await RSSParser._probe_feed_async(test_url, fetch):
                         logger.info(f"Found RSS feed at standard path: {test_url}")
-                        return test_url
-                except:
-                    continue
-            
-            # 3. Ищем упоминания RSS в тексте страницы
-            rss_mention_pattern = r'(https?://[^\s<>"\']+\.(?:rss|xml|atom))'
-            mentions = re.findall(rss_mention_pattern, html, re.IGNORECASE)
-            for mention in mentions[:5]:  # Проверяем первые 5 упоминаний
-                try:
-                    response = requests.head(mention, timeout=5, allow_redirects=True, headers={
-                        'User-Agent': 'Mozilla/5.0 (compatible; ContentCurator/1.0)'
-                    })
-                    content_type = response.headers.get('Content-Type', '').lower()
-                    if 'xml' in content_type or 'rss' in content_type:
+                        rss_url = test_url
+                        break
+            if not rss_url:
+                for mention in RSSParser._mentioned_feed_urls(html):
+                    if await RSSParser._probe_feed_async(mention, fetch, allow_atom=False):
                         logger.info(f"Found RSS feed via text mention: {mention}")
-                        return mention
-                except:
-                    continue
+                        rss_url = mention
+                        break
+            if not rss_url:
+                logger.info(f"No RSS feed found for {url}")
             
-            logger.info(f"No RSS feed found for {url}")
-            return None
+            if page_fetched:
+                RSSParser._remember_feed(url, rss_url)
+            return rss_url
             
         except Exception as e:
             logger.warning(f"Error discovering RSS feed for {url}: {e}")
             return None
 
+
+_discovery_cache: Optional[DiskCache] = None
+
+
+def get_discovery_cache() -> DiskCache:
+    """Кеш поиска RSS на диске (общий для процессов)"""
+    global _discovery_cache
+    if _discovery_cache is None:
+        _discovery_cache = DiskCache(
+            os.getenv('WEB_CRAWLER_DISCOVERY_CACHE_DIR')
+            or os.path.join(tempfile.gettempdir(), 'content_curator_discovery'),
+            ttl_seconds=float(os.getenv('WEB_CRAWLER_DISCOVERY_CACHE_TTL', '86400'))
+        )
+    return _discovery_cache
@@ -4,12 +4,15 @@
 
 import logging
 from datetime import datetime, timedelta
-from typing import List, Optional, Dict, Any
-from sqlalchemy import and_, or_
+from typing import List, Optional, Dict, Any, Set, Tuple
+from sqlalchemy import and_, case, func, or_
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import Session
 
 from app.models.content_sources import ContentSource, MonitoredItem, SourceCheckHistory
 from app.database.connection import get_db_session
+from app.services.check_scheduler import get_check_scheduler
+from app.utils.wakeup import WEB_CRAWLER, notify_workers
 
 logger = logging.getLogger(__name__)
 
@@ -53,6 +56,7 @@ class ContentSourceService:
             
             logger.info("Refreshing source object...")
             db.refresh(source)
+            notify_workers(WEB_CRAWLER, source.next_check_at)
             
             logger.info(f"✅ Created content source: {source.id} for user {user_id}")
             return source
@@ -127,12 +131,18 @@ class ContentSourceService:
             
             source.updated_at = datetime.utcnow()
             
-            # Если изменился интервал проверки, пересчитываем next_check_at
+            # Если изменился интервал или границы расписания, пересчитываем next_check_at
             if 'check_interval_minutes' in updates:
                 source.next_check_at = datetime.utcnow() + timedelta(minutes=updates['check_interval_minutes'])
+            elif {'min_check_interval_minutes', 'max_check_interval_minutes'} & updates.keys():
+                source.next_check_at = datetime.utcnow() + timedelta(
+                    minutes=get_check_scheduler().next_interval_minutes(source)
+                )
             
             db.commit()
             db.refresh(source)
+            if source.is_active:
+                notify_workers(WEB_CRAWLER, source.next_check_at)
             
             logger.info(f"Updated content source: {source_id}")
             return source
@@ -173,17 +183,34 @@ class ContentSourceService:
             db.close()
     
     @staticmethod
-    def get_sources_to_check(limit: int = 50) -> List[ContentSource]:
-        """Получение источников, которые нужно проверить"""
+    def get_sources_to_check(limit: int = 50, exclude_ids: Optional[Set[int]] = None) -> List[ContentSource]:
+        """Получение источников, которые нужно проверить (кроме exclude_ids - уже взятых в работу)"""
         db = get_db_session()
         try:
             now = datetime.utcnow()
-            return db.query(ContentSource).filter(
+            query = db.query(ContentSource).filter(
                 and_(
                     ContentSource.is_active == True,
                     ContentSource.next_check_at <= now
                 )
-            ).order_by(ContentSource.next_check_at).limit(limit).all()
+            )
+            if exclude_ids:
+                query = query.filter(ContentSource.id.notin_(exclude_ids))
+            # Источники с автопостингом - первыми: от задержки их проверки зависит публикация
+            return query.order_by(
+                ContentSource.auto_post_enabled.desc(), ContentSource.next_check_at
+            ).limit(limit).all()
+        finally:
+            db.close()
+    
+    @staticmethod
+    def get_next_check_at() -> Optional[datetime]:
+        """Время ближайшей проверки активного источника"""
+        db = get_db_session()
+        try:
+            return db.query(func.min(ContentSource.next_check_at)).filter(
+                ContentSource.is_active == True
+            ).scalar()
         finally:
             db.close()
     
@@ -193,9 +220,18 @@ class ContentSourceService:
         status: str,
         items_found: int = 0,
         items_new: int = 0,
-        error_message: Optional[str] = None
+        error_message: Optional[str] = None,
+        http_validators: Optional[Dict[str, Any]] = None,
+        changed: Optional[bool] = None
     ) -> bool:
-        """Обновление статуса проверки источника"""
+        """
+        Обновление статуса проверки источника
+        
+        http_validators - ETag/Last-Modified успешно обработанного ответа;
+        None оставляет сохраненные (ответ 304 или проверка без загрузки).
+        changed - изменился ли источник (по умолчанию - есть новые элементы);
+        по нему адаптивное расписание выбирает время следующей проверки.
+        """
         db = get_db_session()
         try:
             source = db.query(ContentSource).filter(ContentSource.id == source_id).first()
@@ -209,9 +245,16 @@ class ContentSourceService:
             source.total_checks += 1
             source.total_items_found += items_found
             source.total_items_new += items_new
-            
-            # Планируем следующую проверку
-            source.next_check_at = datetime.utcnow() + timedelta(minutes=source.check_interval_minutes)
+            if http_validators is not None:
+                source.http_validators = http_validators
+            
+            # Планируем следующую проверку по наблюдаемой частоте изменений
+            scheduler = get_check_scheduler()
+            if scheduler.enabled and source.change_interval_minutes is None and source.last_change_at is None:
+                scheduler.bootstrap(source, SourceCheckHistoryService.get_change_times(source_id, db=db))
+            source.next_check_at = scheduler.schedule(
+                source, items_new > 0 if changed is None else changed, source.last_check_at
+            )
             
             db.commit()
             
@@ -470,6 +513,159 @@ class MonitoredItemService:
             return db.query(MonitoredItem).filter(and_(*conditions)).first()
         finally:
             db.close()
+    
+    @staticmethod
+    def get_recent_external_ids(source_id: int, limit: int = 100) -> Set[str]:
+        """external_id последних сохраненных элементов источника (граница разбора ленты)"""
+        db = get_db_session()
+        try:
+            rows = db.query(MonitoredItem.external_id).filter(
+                MonitoredItem.source_id == source_id,
+                MonitoredItem.external_id.isnot(None)
+            ).order_by(MonitoredItem.id.desc()).limit(limit)
+            return {external_id for (external_id,) in rows}
+        finally:
+            db.close()
+    
+    # Размер IN списка и пачки вставки (лимит параметров запроса SQLite/PostgreSQL)
+    BULK_CHUNK_SIZE = 500
+    
+    @staticmethod
+    def item_key(external_id: Optional[str], url: Optional[str]) -> Optional[Tuple[str, str]]:
+        """Ключ дедупликации: external_id, а без него - хеш URL (как в check_duplicate)"""
+        if external_id:
+            return ('external_id', external_id[:255])
+        if url:
+            return ('url_hash', MonitoredItem.hash_url(url))
+        return None
+    
+    @staticmethod
+    def find_existing_keys(source_id: int, keys: Set[Tuple[str, str]]) -> Set[Tuple[str, str]]:
+        """Какие из ключей уже сохранены для источника - IN запросами по индексам дедупликации"""
+        existing = set()
+        if not keys:
+            return existing
+        
+        chunk_size = MonitoredItemService.BULK_CHUNK_SIZE
+        db = get_db_session()
+        try:
+            for kind, column in (('external_id', MonitoredItem.external_id), ('url_hash', MonitoredItem.url_hash)):
+                values = [value for key_kind, value in keys if key_kind == kind]
+                for start in range(0, len(values), chunk_size):
+                    rows = db.query(column).filter(
+                        MonitoredItem.source_id == source_id,
+                        column.in_(values[start:start + chunk_size])
+                    )
+                    existing.update((kind, value) for (value,) in rows)
+            return existing
+        finally:
+            db.close()
+    
+    @staticmethod
+    def split_duplicates(source_id: int, feed_items: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Отделяет новые элементы ленты от уже сохраненных и повторов внутри ленты
+        
+        Returns:
+            (новые элементы в порядке ленты, число дубликатов)
+        """
+        keyed = [
+            (MonitoredItemService.item_key(item.get('external_id'), item.get('url')), item)
+            for item in feed_items
+        ]
+        existing = MonitoredItemService.find_existing_keys(source_id, {key for key, _ in keyed if key})
+        
+        new_items = []
+        duplicates = 0
+        for key, item in keyed:
+            if key in existing:
+                duplicates += 1
+                continue
+            if key:
+                existing.add(key)
+            new_items.append(item)
+        return new_items, duplicates
+    
+    @staticmethod
+    def _column_default(column) -> Any:
+        default = column.default
+        if default is None:
+            return None
+        return default.arg(None) if default.is_callable else default.arg
+    
+    @staticmethod
+    def bulk_create_items(source_id: int, user_id: int,
+                          items: List[Dict[str, Any]]) -> Tuple[List[MonitoredItem], int]:
+        """
+        Пакетная вставка элементов с ON CONFLICT DO NOTHING
+        
+        Элементы, которые успел сохранить другой worker, пропускаются по
+        уникальным индексам дедупликации.
+        
+        Args:
+            items: значения колонок MonitoredItem (title, url, external_id, ...)
+        
+        Returns:
+            (созданные элементы, число пропущенных как дубликаты)
+        
+        Raises:
+            Ошибка БД пробрасывается: проверка источника не должна считаться
+            успешной (и сохранять ETag/Last-Modified), если элементы не сохранены
+        """
+        if not items:
+            return [], 0
+        
+        now = datetime.utcnow()
+        rows = []
+        for item in items:
+            row = {key: value for key, value in item.items() if key in MonitoredItem.__table__.c}
+            if row.get('external_id'):
+                row['external_id'] = row['external_id'][:255]
+            row.update(
+                source_id=source_id,
+                user_id=user_id,
+                url_hash=MonitoredItem.hash_url(row.get('url')),
+                created_at=now
+            )
+            row.setdefault('status', 'new')
+            row.setdefault('ai_keywords', [])
+            rows.append(row)
+        
+        # Все строки пачки должны иметь одинаковый набор колонок: недостающие - значения по умолчанию
+        table = MonitoredItem.__table__
+        defaults = {
+            name: MonitoredItemService._column_default(table.c[name]) for name in set().union(*rows)
+        }
+        rows = [{**defaults, **row} for row in rows]
+        
+        db = get_db_session()
+        try:
+            dialect = postgresql if db.get_bind().dialect.name == 'postgresql' else sqlite
+            ids = []
+            chunk_size = MonitoredItemService.BULK_CHUNK_SIZE
+            for start in range(0, len(rows), chunk_size):
+                statement = dialect.insert(MonitoredItem).values(
+                    rows[start:start + chunk_size]
+                ).on_conflict_do_nothing().returning(MonitoredItem.id)
+                ids.extend(row_id for (row_id,) in db.execute(statement))
+            db.commit()
+            
+            created = []
+            for start in range(0, len(ids), chunk_size):
+                created.extend(db.query(MonitoredItem).filter(
+                    MonitoredItem.id.in_(ids[start:start + chunk_size])
+                ).order_by(MonitoredItem.id).all())
+            
+            logger.info(f"Created {len(created)} monitored items for source {source_id} "
+                        f"({len(rows) - len(ids)} skipped as duplicates)")
+            return created, len(rows) - len(ids)
+            
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error bulk creating monitored items for source {source_id}: {e}", exc_info=True)
+            raise
+        finally:
+            db.close()
 
 
 class SourceCheckHistoryService:
@@ -484,7 +680,11 @@ class SourceCheckHistoryService:
         items_posted: int,
         status: str,
         error_message: Optional[str] = None,
-        execution_time_ms: Optional[int] = None
+        execution_time_ms: Optional[int] = None,
+        http_status: Optional[int] = None,
+        not_modified: bool = False,
+        bytes_downloaded: int = 0,
+        bytes_saved: int = 0
     ) -> Optional[SourceCheckHistory]:
         """Создание записи истории проверки"""
         db = get_db_session()
@@ -497,7 +697,11 @@ class SourceCheckHistoryService:
                 items_posted=items_posted,
                 status=status,
                 error_message=error_message,
-                execution_time_ms=execution_time_ms
+                execution_time_ms=execution_time_ms,
+                http_status=http_status,
+                not_modified=not_modified,
+                bytes_downloaded=bytes_downloaded,
+                bytes_saved=bytes_saved
             )
             
             db.add(history)
@@ -514,6 +718,22 @@ class SourceCheckHistoryService:
         finally:
             db.close()
     
+    @staticmethod
+    def get_change_times(source_id: int, limit: int = 20, db: Optional[Session] = None) -> List[datetime]:
+        """Время последних проверок с новыми элементами (по возрастанию)"""
+        own_session = db is None
+        if own_session:
+            db = get_db_session()
+        try:
+            rows = db.query(SourceCheckHistory.checked_at).filter(
+                SourceCheckHistory.source_id == source_id,
+                SourceCheckHistory.items_new > 0
+            ).order_by(SourceCheckHistory.checked_at.desc()).limit(limit)
+            return sorted(checked_at for (checked_at,) in rows)
+        finally:
+            if own_session:
+                db.close()
+    
     @staticmethod
     def get_source_history(source_id: int, limit: int = 50) -> List[SourceCheckHistory]:
         """Получение истории проверок источника"""
@@ -524,4 +744,33 @@ class SourceCheckHistoryService:
             ).order_by(SourceCheckHistory.checked_at.desc()).limit(limit).all()
         finally:
             db.close()
-
+    
+    @staticmethod
+    def get_fetch_stats(source_id: Optional[int] = None, hours: int = 24) -> Dict[str, Any]:
+        """
+        Эффективность условной загрузки за последние hours часов
+        
+        Returns:
+            {'checks', 'not_modified', 'not_modified_rate', 'bytes_downloaded', 'bytes_saved'}
+        """
+        db = get_db_session()
+        try:
+            query = db.query(
+                func.count(SourceCheckHistory.id),
+                func.sum(case((SourceCheckHistory.not_modified == True, 1), else_=0)),
+                func.sum(SourceCheckHistory.bytes_downloaded),
+                func.sum(SourceCheckHistory.bytes_saved)
+            ).filter(SourceCheckHistory.checked_at >= datetime.utcnow() - timedelta(hours=hours))
+            if source_id is not None:
+                query = query.filter(SourceCheckHistory.source_id == source_id)
+            checks, not_modified, downloaded, saved = query.one()
+            
+            return {
+                'checks': checks or 0,
+                'not_modified': not_modified or 0,
+                'not_modified_rate': round((not_modified or 0) / checks, 3) if checks else None,
+                'bytes_downloaded': downloaded or 0,
+                'bytes_saved': saved or 0
+            }
+        finally:
+            db.close()
@@ -0,0 +1,316 @@
+"""
+Потоковый парсер RSS/Atom лент
+XMLPullParser разбирает ленту по мере загрузки (куски байтов ответа) и
+отдает элементы лениво: разбор останавливается после limit элементов или
+на уже известных external_id, разобранные элементы удаляются из дерева.
+CDATA, сущности и пространства имен (content:encoded, dc:creator, Atom)
+разбирает XML парсер. Невалидный XML (HTML сущности, битая кодировка)
+разбирается прежним regex парсером - целиком, даже если ошибка встретилась
+в середине ленты (уже отданные элементы пропускаются).
+"""
+
+import logging
+import re
+import xml.etree.ElementTree as ET
+from typing import Any, AsyncIterable, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Set, Union
+
+logger = logging.getLogger(__name__)
+
+ATOM_NS = "http://www.w3.org/2005/Atom"
+RSS10_NS = "http://purl.org/rss/1.0/"
+CONTENT_NS = "http://purl.org/rss/1.0/modules/content/"
+DC_NS = "http://purl.org/dc/elements/1.1/"
+
+# Пространства имен основных полей: RSS 2.0 (без ns), Atom, RSS 1.0 (RDF)
+CORE_NS = ("", ATOM_NS, RSS10_NS)
+
+TAG_RE = re.compile(r"<[^>]+>")
+CDATA_RE = re.compile(r"<!\[CDATA\[(.*?)\]\]>", re.DOTALL)
+
+Chunk = Union[bytes, str]
+
+
+def _split_tag(tag: str):
+    """'{ns}local' -> (ns, local)"""
+    if tag[:1] == "{":
+        ns, _, local = tag[1:].partition("}")
+        return ns, local
+    return "", tag
+
+
+def _text(element: ET.Element) -> str:
+    return "".join(element.itertext()).strip()
+
+
+class FeedStreamParser:
+    """
+    Инкрементальный разбор ленты
+
+    feed(chunk) возвращает элементы, закрытые в этом куске; ошибка XML
+    пробрасывается как ET.ParseError.
+    """
+
+    def __init__(self):
+        self._parser = ET.XMLPullParser(events=("start", "end"))
+        self._stack: List[ET.Element] = []
+        self._started = False
+
+    def feed(self, chunk: Chunk) -> List[Dict[str, Any]]:
+        if not self._started:
+            # Пробелы перед <?xml ...?> expat считает ошибкой
+            chunk = chunk.lstrip()
+            if not chunk:
+                return []
+            self._started = True
+        self._parser.feed(chunk)
+        return self._read_events()
+
+    def close(self) -> List[Dict[str, Any]]:
+        if not self._started:
+            return []
+        self._parser.close()
+        return self._read_events()
+
+    def _read_events(self) -> List[Dict[str, Any]]:
+        items = []
+        for event, element in self._parser.read_events():
+            if event == "start":
+                self._stack.append(element)
+                continue
+
+            self._stack.pop()
+            ns, local = _split_tag(element.tag)
+            if local not in ("item", "entry") or ns not in CORE_NS:
+                continue
+
+            item = self.parse_item(element)
+            if item.get("title"):
+                items.append(item)
+            # Разобранный элемент больше не нужен - дерево не растет с размером ленты
+            if self._stack:
+                self._stack[-1].remove(element)
+            element.clear()
+        return items
+
+    @staticmethod
+    def parse_item(element: ET.Element) -> Dict[str, Any]:
+        """Поля элемента <item>/<entry> в формате parse_feed"""
+        item_data: Dict[str, Any] = {}
+        link_text = link_alternate = link_any = None
+
+        for child in element:
+            ns, local = _split_tag(child.tag)
+
+            if ns in CORE_NS:
+                if local == "title" and "title" not in item_data:
+                    item_data["title"] = _text(child)
+                elif local == "link":
+                    href = child.get("href")
+                    if child.text and child.text.strip():
+                        link_text = link_text or child.text.strip()
+                    elif href:
+                        link_any = link_any or href.strip()
+                        if child.get("rel", "alternate") == "alternate":
+                            link_alternate = link_alternate or href.strip()
+                elif local in ("description", "summary") and "summary" not in item_data:
+                    item_data["summary"] = TAG_RE.sub("", _text(child))[:500]
+                elif local == "content" and "content" not in item_data:
+                    item_data["content"] = TAG_RE.sub("", _text(child))
+                elif local in ("pubDate", "published", "updated") and "published_date" not in item_data:
+                    item_data["published_date"] = _text(child)
+                elif local == "author" and "author" not in item_data:
+                    name = next((c for c in child if _split_tag(c.tag)[1] == "name"), None)
+                    item_data["author"] = _text(name) if name is not None else _text(child)
+                elif local == "guid" and "external_id" not in item_data:
+                    item_data["external_id"] = _text(child)
+                # Atom <id> не используется как external_id: ключи дедупликации
+                # уже сохраненных элементов построены по guid / url
+            elif ns == CONTENT_NS and local == "encoded":
+                item_data["content"] = TAG_RE.sub("", _text(child))
+            elif ns == DC_NS and local == "creator" and "author" not in item_data:
+                item_data["author"] = _text(child)
+            elif ns == DC_NS and local == "date" and "published_date" not in item_data:
+                item_data["published_date"] = _text(child)
+
+        url = link_text or link_alternate or link_any
+        if url:
+            item_data["url"] = url
+        if not item_data.get("external_id") and item_data.get("url"):
+            item_data["external_id"] = item_data["url"]
+        return item_data
+
+
+class _FeedLimits:
+    """Условия остановки: limit элементов или known_run известных external_id подряд"""
+
+    def __init__(self, limit: Optional[int], known_ids: Optional[Set[str]], known_run: int):
+        self.limit = limit
+        self.known_ids = known_ids or set()
+        self.known_run = known_run
+        self.count = 0
+        self._run = 0
+
+    def accept(self, item: Dict[str, Any]) -> bool:
+        """Учитывает элемент; False - дальше разбирать не нужно"""
+        self.count += 1
+        if item.get("external_id") in self.known_ids:
+            self._run += 1
+        else:
+            self._run = 0
+        if self.limit is not None and self.count >= self.limit:
+            return False
+        return not (self.known_ids and self._run >= self.known_run)
+
+
+def parse_feed_regex(feed_xml: str) -> List[Dict[str, Any]]:
+    """Прежний regex разбор ленты - для невалидного XML"""
+    items = []
+
+    # Ищем все <item> или <entry>
+    item_pattern = r'<(?:item|entry)[^>]*>(.*?)</(?:item|entry)>'
+    item_matches = re.findall(item_pattern, feed_xml, re.IGNORECASE | re.DOTALL)
+
+    for item_xml in item_matches:
+        item_data = {}
+
+        # Заголовок
+        title_match = re.search(r'<title[^>]*>(.*?)</title>', item_xml, re.IGNORECASE | re.DOTALL)
+        if title_match:
+            item_data['title'] = CDATA_RE.sub(r'\1', title_match.group(1)).strip()
+
+        # Ссылка
+        link_match = re.search(r'<link[^>]*>([^<]+)</link>', item_xml, re.IGNORECASE)
+        if not link_match:
+            link_match = re.search(r'<link[^>]+href=["\']([^"\']+)["\']', item_xml, re.IGNORECASE)
+        if link_match:
+            item_data['url'] = link_match.group(1).strip()
+
+        # Описание
+        desc_match = re.search(r'<(?:description|summary)[^>]*>(.*?)</(?:description|summary)>', item_xml, re.IGNORECASE | re.DOTALL)
+        if desc_match:
+            item_data['summary'] = CDATA_RE.sub(r'\1', desc_match.group(1)).strip()
+            item_data['summary'] = TAG_RE.sub('', item_data['summary'])[:500]
+
+        # Контент
+        content_match = re.search(r'<(?:content:encoded|content)[^>]*>(.*?)</(?:content:encoded|content)>', item_xml, re.IGNORECASE | re.DOTALL)
+        if content_match:
+            item_data['content'] = CDATA_RE.sub(r'\1', content_match.group(1)).strip()
+            item_data['content'] = TAG_RE.sub('', item_data['content'])
+
+        # Дата публикации
+        date_match = re.search(r'<(?:pubDate|published|updated)[^>]*>(.*?)</(?:pubDate|published|updated)>', item_xml, re.IGNORECASE)
+        if date_match:
+            item_data['published_date'] = date_match.group(1).strip()
+
+        # Автор
+        author_match = re.search(r'<(?:author|dc:creator)[^>]*>(.*?)</(?:author|dc:creator)>', item_xml, re.IGNORECASE | re.DOTALL)
+        if author_match:
+            author_text = author_match.group(1)
+            name_match = re.search(r'<name>(.*?)</name>', author_text, re.IGNORECASE)
+            item_data['author'] = name_match.group(1).strip() if name_match else TAG_RE.sub('', author_text).strip()
+
+        # GUID как external_id
+        guid_match = re.search(r'<guid[^>]*>(.*?)</guid>', item_xml, re.IGNORECASE)
+        if guid_match:
+            item_data['external_id'] = guid_match.group(1).strip()
+        elif item_data.get('url'):
+            item_data['external_id'] = item_data['url']
+
+        if item_data.get('title'):
+            items.append(item_data)
+
+    return items
+
+
+def _decode(chunks: List[Chunk], encoding: Optional[str]) -> str:
+    if chunks and isinstance(chunks[0], str):
+        return "".join(chunks)
+    return b"".join(chunks).decode(encoding or "utf-8", errors="replace")
+
+
+def _item_key(item: Dict[str, Any]) -> Optional[str]:
+    return item.get("external_id") or item.get("title")
+
+
+def _regex_fallback(body: List[Chunk], encoding: Optional[str], yielded: Set[Optional[str]],
+                    error: ET.ParseError, count: int) -> List[Dict[str, Any]]:
+    """Элементы ленты по regex разбору всего тела, кроме уже отданных XML парсером"""
+    if count:
+        logger.warning(f"Invalid XML after {count} feed items ({error}), reparsing feed with regex parser")
+    else:
+        logger.info(f"Feed is not valid XML ({error}), falling back to regex parser")
+    return [item for item in parse_feed_regex(_decode(body, encoding)) if _item_key(item) not in yielded]
+
+
+def iter_feed_items(chunks: Iterable[Chunk], limit: Optional[int] = None,
+                    known_ids: Optional[Set[str]] = None, known_run: int = 3,
+                    encoding: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Элементы ленты по мере разбора кусков
+
+    Args:
+        chunks: куски ленты (bytes или str)
+        limit: максимум элементов
+        known_ids: уже сохраненные external_id - разбор останавливается
+                   после known_run таких элементов подряд (ленты отсортированы
+                   от новых к старым, одиночный известный элемент может быть закрепленным)
+        encoding: кодировка для regex разбора, если XML невалиден
+    """
+    limits = _FeedLimits(limit, known_ids, known_run)
+    parser = FeedStreamParser()
+    # Прочитанные куски храним до конца разбора: при ошибке XML в любом месте
+    # ленту целиком разбираем regex парсером. Чтение останавливается на limit
+    # элементов, так что тело ограничено размером нужной части ленты
+    body: List[Chunk] = []
+    yielded: Set[Optional[str]] = set()
+    chunks = iter(chunks)
+    try:
+        for chunk in chunks:
+            body.append(chunk)
+            for item in parser.feed(chunk):
+                yielded.add(_item_key(item))
+                yield item
+                if not limits.accept(item):
+                    return
+        for item in parser.close():
+            yielded.add(_item_key(item))
+            yield item
+            if not limits.accept(item):
+                return
+    except ET.ParseError as e:
+        body.extend(chunks)
+        for item in _regex_fallback(body, encoding, yielded, e, limits.count):
+            yield item
+            if not limits.accept(item):
+                return
+
+
+async def aiter_feed_items(chunks: AsyncIterable[Chunk], limit: Optional[int] = None,
+                           known_ids: Optional[Set[str]] = None, known_run: int = 3,
+                           encoding: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+    """iter_feed_items по асинхронному потоку (например, response.aiter_bytes())"""
+    limits = _FeedLimits(limit, known_ids, known_run)
+    parser = FeedStreamParser()
+    body: List[Chunk] = []
+    yielded: Set[Optional[str]] = set()
+    chunks = chunks.__aiter__()
+    try:
+        async for chunk in chunks:
+            body.append(chunk)
+            for item in parser.feed(chunk):
+                yielded.add(_item_key(item))
+                yield item
+                if not limits.accept(item):
+                    return
+        for item in parser.close():
+            yielded.add(_item_key(item))
+            yield item
+            if not limits.accept(item):
+                return
+    except ET.ParseError as e:
+        async for chunk in chunks:
+            body.append(chunk)
+        for item in _regex_fallback(body, encoding, yielded, e, limits.count):
+            yield item
+            if not limits.accept(item):
+                return
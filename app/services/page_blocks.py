@@ -0,0 +1,300 @@
+"""
+Разбиение страницы на блоки и отпечатки блоков
+Страница делится на блоки (article, заголовки, абзацы, элементы списков,
+текст вне блоков), для каждого блока считается 64-битный SimHash по
+нормализованному тексту. Навигация, подвал, скрипты и рекламные элементы
+пропускаются, даты, время и счетчики из текста удаляются - их смена не
+считается изменением блока. ChangeDetector сравнивает отпечатки со снимком
+и отправляет на AI извлечение только новые блоки.
+"""
+
+import hashlib
+import html as html_lib
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from html.parser import HTMLParser
+from typing import Dict, Iterable, List, Optional, Set
+
+# Блоки: самый внешний из вложенных элементов становится одним блоком
+BLOCK_TAGS = {"article", "h1", "h2", "h3", "h4", "h5", "h6", "p", "li", "blockquote",
+              "pre", "figcaption", "dt", "dd", "td", "th"}
+# Не содержат контента
+SKIP_TAGS = {"script", "style", "noscript", "template", "svg", "nav", "aside", "form",
+             "iframe", "button", "select", "textarea", "head"}
+# Пропускаются вне блоков (шапка и подвал сайта), внутри article - часть статьи
+BOILERPLATE_TAGS = {"header", "footer"}
+# Граница текста вне блоков
+CONTAINER_TAGS = {"div", "section", "main", "body", "table", "tr", "ul", "ol", "dl", "figure", "center"}
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta",
+             "param", "source", "track", "wbr"}
+# Открытие этих тегов закрывает незакрытый <p>
+CLOSES_P = BLOCK_TAGS | CONTAINER_TAGS | BOILERPLATE_TAGS | {"nav", "aside", "form"}
+# Атрибуты, которые остаются в HTML блока (остальные только тратят токены)
+KEEP_ATTRS = {"href", "src", "alt", "datetime", "title"}
+
+AD_CLASS_RE = re.compile(
+    r"^(ad|ads|adv|advert\w*|adsbygoogle|ya-?direct|banner\w*|sponsor\w*|cookie\w*|gdpr\w*)$"
+    r"|^ad[-_]|[-_]ad$|[-_](ads|banner)([-_]|$)"
+)
+
+MONTHS = (r"январ\w*|феврал\w*|март\w*|апрел\w*|ма[йя]|июн\w*|июл\w*|август\w*|сентябр\w*|октябр\w*|"
+          r"ноябр\w*|декабр\w*|jan\w*|feb\w*|mar\w*|apr\w*|may|jun\w*|jul\w*|aug\w*|sep\w*|oct\w*|nov\w*|dec\w*")
+VOLATILE_RE = [
+    # "5 минут назад", "2 hours ago"
+    re.compile(r"\d+\s*(секунд\w*|минут\w*|час\w*|дн\w*|дней|недел\w*|sec\w*|min\w*|hours?|days?|weeks?)"
+               r"\s*(назад|ago)"),
+    re.compile(r"\b(сегодня|вчера|только что|today|yesterday|just now)\b"),
+    # "16 октября 2026", "Oct 16, 2026"
+    re.compile(rf"\b\d{{1,2}}\s+({MONTHS})\b(\s+\d{{4}})?"),
+    re.compile(rf"\b({MONTHS})\s+\d{{1,2}}\b(,?\s+\d{{4}})?"),
+]
+# Оставшиеся числа (время, даты, счетчики просмотров и комментариев) - один токен
+NUMBER_RE = re.compile(r"\d+([.,:/-]\d+)*")
+WORD_RE = re.compile(r"\w+")
+
+
+def normalize_text(text: str) -> str:
+    """Текст блока без дат, времени и счетчиков - основа отпечатка"""
+    text = text.lower()
+    for pattern in VOLATILE_RE:
+        text = pattern.sub(" ", text)
+    text = NUMBER_RE.sub("0", text)
+    return " ".join(WORD_RE.findall(text))
+
+
+def _feature_hash(feature: str) -> int:
+    return int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+# Счетчики единичных битов признаков считаются сложением длинных целых: бит i
+# признака раскладывается в отдельную 32-битную "дорожку" (таблица по байтам)
+LANE = 32
+_SPREAD = [sum(((byte >> bit) & 1) << (LANE * bit) for bit in range(8)) for byte in range(256)]
+
+
+def _spread(value: int) -> int:
+    result = 0
+    for shift in range(8):
+        result |= _SPREAD[value >> (8 * shift) & 0xFF] << (LANE * 8 * shift)
+    return result
+
+
+@lru_cache(maxsize=4096)
+def simhash(text: str) -> int:
+    """64-битный SimHash по словам и парам слов нормализованного текста (кеш: блоки повторяются между проверками)"""
+    words = text.split()
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    if not features:
+        return 0
+    ones = sum(_spread(_feature_hash(feature)) for feature in features)
+    half, mask = len(features), (1 << LANE) - 1
+    result = 0
+    for bit in range(64):
+        # Бит отпечатка 1, если единиц в позиции больше, чем нулей
+        if 2 * (ones >> (LANE * bit) & mask) > half:
+            result |= 1 << bit
+    return result
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+@dataclass
+class PageBlock:
+    """Блок страницы"""
+    tag: str
+    text: str
+    html: str
+    fingerprint: int = 0
+    normalized: str = field(default="", repr=False)
+
+    @property
+    def fingerprint_hex(self) -> str:
+        return f"{self.fingerprint:016x}"
+
+
+def _is_ad(attrs) -> bool:
+    for name, value in attrs:
+        if name in ("class", "id") and value:
+            if any(AD_CLASS_RE.search(token) for token in value.lower().split()):
+                return True
+    return False
+
+
+class _BlockParser(HTMLParser):
+    """Разбор HTML в блоки; незакрытые теги закрываются по правилам HTML"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.blocks: List[PageBlock] = []
+        # (тег, роль): роль 'skip', 'block' или None
+        self._stack: List[tuple] = []
+        self._skip = 0
+        self._block: Optional[dict] = None
+        self._loose_text: List[str] = []
+        self._loose_html: List[str] = []
+
+    # Текст вне блоков ("div soup") - отдельный блок до ближайшей границы
+    def _flush_loose(self):
+        text = " ".join("".join(self._loose_text).split())
+        if text:
+            self.blocks.append(PageBlock("text", text, "".join(self._loose_html).strip()))
+        self._loose_text, self._loose_html = [], []
+
+    def _open_block(self, tag: str):
+        self._flush_loose()
+        self._block = {"tag": tag, "text": [], "html": []}
+
+    def _close_block(self):
+        block = self._block
+        self._block = None
+        text = " ".join("".join(block["text"]).split())
+        if text:
+            self.blocks.append(PageBlock(block["tag"], text, "".join(block["html"]).strip()))
+
+    def _pop(self):
+        tag, role = self._stack.pop()
+        if role == "skip":
+            self._skip -= 1
+            return
+        if self._skip:
+            return
+        self._emit_html(f"</{tag}>")
+        if tag in BLOCK_TAGS or tag in CONTAINER_TAGS:
+            self._emit_text(" ")
+        if role == "block":
+            self._close_block()
+        elif tag in CONTAINER_TAGS and self._block is None:
+            self._flush_loose()
+
+    def _emit_html(self, piece: str):
+        if self._block is not None:
+            self._block["html"].append(piece)
+        else:
+            self._loose_html.append(piece)
+
+    def _emit_text(self, text: str):
+        if self._block is not None:
+            self._block["text"].append(text)
+        else:
+            self._loose_text.append(text)
+
+    def handle_starttag(self, tag, attrs):
+        # Неявное закрытие <p>, <li>, <dt>/<dd>, ячеек таблицы
+        while self._stack:
+            top = self._stack[-1][0]
+            if (top == "p" and tag in CLOSES_P) or (top == tag and tag in ("li", "dt", "dd", "td", "th")) \
+                    or (top in ("dt", "dd") and tag in ("dt", "dd")):
+                self._pop()
+            else:
+                break
+
+        if tag in VOID_TAGS:
+            if not self._skip and tag == "img":
+                self._emit_html(self._tag_html(tag, attrs))
+            elif not self._skip and tag == "br":
+                self._emit_text(" ")
+            return
+
+        if self._skip or tag in SKIP_TAGS or _is_ad(attrs) \
+                or (tag in BOILERPLATE_TAGS and self._block is None):
+            self._stack.append((tag, "skip"))
+            self._skip += 1
+            return
+
+        role = None
+        if tag in BLOCK_TAGS and self._block is None:
+            role = "block"
+            self._open_block(tag)
+        elif tag in CONTAINER_TAGS and self._block is None:
+            self._flush_loose()
+        elif tag in BLOCK_TAGS or tag in CONTAINER_TAGS:
+            self._emit_text(" ")
+        self._stack.append((tag, role))
+        self._emit_html(self._tag_html(tag, attrs))
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS and self._stack and self._stack[-1][0] == tag:
+            self._pop()
+
+    def handle_endtag(self, tag):
+        if not any(open_tag == tag for open_tag, _ in self._stack):
+            return
+        while self._stack:
+            top = self._stack[-1][0]
+            self._pop()
+            if top == tag:
+                break
+
+    def handle_data(self, data):
+        if self._skip:
+            return
+        self._emit_text(data)
+        self._emit_html(html_lib.escape(data, quote=False))
+
+    def close(self):
+        super().close()
+        while self._stack:
+            self._pop()
+        self._flush_loose()
+
+    @staticmethod
+    def _tag_html(tag: str, attrs) -> str:
+        kept = "".join(f' {name}="{html_lib.escape(value)}"' for name, value in attrs
+                       if name in KEEP_ATTRS and value)
+        return f"<{tag}{kept}>"
+
+
+def segment_blocks(html: str, min_chars: int = 20) -> List[PageBlock]:
+    """
+    Блоки страницы с отпечатками, в порядке документа
+
+    Блоки короче min_chars нормализованного текста (кнопки, даты, счетчики)
+    и повторы одного блока на странице отбрасываются.
+    """
+    parser = _BlockParser()
+    parser.feed(html)
+    parser.close()
+
+    blocks, seen = [], set()
+    for block in parser.blocks:
+        block.normalized = normalize_text(block.text)
+        if len(block.normalized) < min_chars or block.normalized in seen:
+            continue
+        seen.add(block.normalized)
+        block.fingerprint = simhash(block.normalized)
+        blocks.append(block)
+    return blocks
+
+
+class FingerprintIndex:
+    """Поиск отпечатков в пределах расстояния Хэмминга"""
+
+    def __init__(self, fingerprints: Iterable[int], max_distance: int = 3):
+        self.max_distance = max_distance
+        self._exact: Set[int] = set(fingerprints)
+        # Разбиение 64 бит на max_distance + 1 частей: у близких отпечатков
+        # хотя бы одна часть совпадает (принцип Дирихле)
+        parts = max_distance + 1
+        width = 64 // parts
+        self._masks = [((1 << width) - 1 if i < parts - 1 else (1 << (64 - width * i)) - 1, width * i)
+                       for i in range(parts)]
+        self._buckets: List[Dict[int, List[int]]] = [{} for _ in self._masks]
+        for fingerprint in self._exact:
+            for bucket, (mask, shift) in zip(self._buckets, self._masks):
+                bucket.setdefault(fingerprint >> shift & mask, []).append(fingerprint)
+
+    def find(self, fingerprint: int) -> Optional[int]:
+        """Ближайший известный отпечаток или None"""
+        if fingerprint in self._exact:
+            return fingerprint
+        best, best_distance = None, self.max_distance + 1
+        for bucket, (mask, shift) in zip(self._buckets, self._masks):
+            for candidate in bucket.get(fingerprint >> shift & mask, ()):
+                distance = hamming_distance(candidate, fingerprint)
+                if distance < best_distance:
+                    best, best_distance = candidate, distance
+        return best
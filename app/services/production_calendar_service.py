@@ -4,10 +4,11 @@
 """
 
 import logging
-import requests
 from typing import Dict, List, Optional
 from datetime import datetime, date
 
+from app.utils.http_clients import get_http_clients
+
 logger = logging.getLogger(__name__)
 
 # API токен для production-calendar.ru
@@ -35,7 +36,7 @@ class ProductionCalendarService:
             
             url = f"{PRODUCTION_CALENDAR_BASE_URL}/get-period/{PRODUCTION_CALENDAR_TOKEN}/{country}/{date_str}/json"
             
-            response = requests.get(url, timeout=10)
+            response = get_http_clients().session.get(url, timeout=10)
             response.raise_for_status()
             
             data = response.json()
@@ -84,7 +85,7 @@ class ProductionCalendarService:
             
             url = f"{PRODUCTION_CALENDAR_BASE_URL}/get-period/{PRODUCTION_CALENDAR_TOKEN}/{country}/{period_str}/json"
             
-            response = requests.get(url, timeout=10)
+            response = get_http_clients().session.get(url, timeout=10)
             response.raise_for_status()
             
             data = response.json()
@@ -6,10 +6,12 @@ import logging
 from datetime import datetime
 from typing import List, Optional, Dict, Any
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
+from sqlalchemy import and_, func, or_
 
+from app.database.leases import DEFAULT_LEASE_SECONDS, claim_rows, owned_ids, renew_lease
 from app.models.scheduled_posts import ScheduledPostDB
 from app.models.content import ContentPieceDB
+from app.utils.wakeup import SCHEDULED_POSTS, notify_workers
 
 logger = logging.getLogger(__name__)
 
@@ -65,6 +67,7 @@ class ScheduledPostService:
         self.db.add(scheduled_post)
         self.db.commit()
         self.db.refresh(scheduled_post)
+        notify_workers(SCHEDULED_POSTS, scheduled_time)
         
         logger.info(f"Создан запланированный пост {scheduled_post.id} для user_id={user_id}")
         return scheduled_post
@@ -121,6 +124,8 @@ class ScheduledPostService:
         post.updated_at = datetime.utcnow()
         self.db.commit()
         self.db.refresh(post)
+        if post.status == 'scheduled':
+            notify_workers(SCHEDULED_POSTS, post.scheduled_time)
         
         logger.info(f"Обновлен запланированный пост {post_id}")
         return post
@@ -166,6 +171,58 @@ class ScheduledPostService:
             )
         ).order_by(ScheduledPostDB.scheduled_time.asc()).limit(limit).all()
     
+    def get_next_deadline(self) -> Optional[datetime]:
+        """
+        Ближайшее время, когда для worker'а появится работа: наступление
+        запланированного поста или истечение аренды публикуемого
+        """
+        next_scheduled = self.db.query(func.min(ScheduledPostDB.scheduled_time)).filter(
+            ScheduledPostDB.status == 'scheduled'
+        ).scalar()
+        next_lease_expiry = self.db.query(func.min(ScheduledPostDB.lease_expires_at)).filter(
+            ScheduledPostDB.status == 'publishing'
+        ).scalar()
+        deadlines = [value for value in (next_scheduled, next_lease_expiry) if value is not None]
+        return min(deadlines) if deadlines else None
+    
+    def claim_posts_to_publish(
+        self,
+        worker_id: str,
+        limit: int = 100,
+        lease_seconds: int = DEFAULT_LEASE_SECONDS
+    ) -> List[ScheduledPostDB]:
+        """
+        Захватить наступившие посты для публикации этим worker'ом
+        
+        Пост переводится в статус 'publishing' с арендой; несколько worker'ов
+        делят очередь без повторных публикаций. Посты с истекшей арендой
+        (worker упал посреди пачки) захватываются заново.
+        """
+        now = datetime.utcnow()
+        claimable = or_(
+            and_(
+                ScheduledPostDB.status == 'scheduled',
+                ScheduledPostDB.scheduled_time <= now
+            ),
+            and_(
+                ScheduledPostDB.status == 'publishing',
+                ScheduledPostDB.lease_expires_at < now
+            )
+        )
+        return claim_rows(
+            self.db, ScheduledPostDB, claimable,
+            order_by=[ScheduledPostDB.scheduled_time.asc(), ScheduledPostDB.id.asc()],
+            worker_id=worker_id,
+            limit=limit,
+            lease_seconds=lease_seconds,
+            values={'status': 'publishing'}
+        )
+    
+    def renew_leases(self, post_ids: List[int], worker_id: str,
+                     lease_seconds: int = DEFAULT_LEASE_SECONDS) -> int:
+        """Продлить аренду постов, которые еще публикуются (heartbeat)"""
+        return renew_lease(self.db, ScheduledPostDB, post_ids, worker_id, lease_seconds)
+    
     def mark_as_published(
         self,
         post_id: int,
@@ -188,8 +245,62 @@ class ScheduledPostService:
             post.platform_post_id = platform_post_id
             post.published_at = datetime.utcnow()
         
+        post.claimed_by = None
+        post.lease_expires_at = None
         post.updated_at = datetime.utcnow()
         self.db.commit()
         
         return True
-
+    
+    def mark_many_as_published(self, results: Dict[int, Dict[str, Any]],
+                               worker_id: Optional[str] = None) -> int:
+        """
+        Пакетно записывает результаты публикации одним UPDATE-пакетом и одним commit
+        
+        Args:
+            results: {post_id: {'success': bool, 'platform_post_id': str, 'error': str,
+                                'published_at': datetime}}
+            worker_id: если указан, записываются только посты, аренда которых
+                       еще принадлежит этому worker'у
+        
+        Returns:
+            Количество обновленных постов
+        """
+        if worker_id is not None:
+            owned = owned_ids(self.db, ScheduledPostDB, results.keys(), worker_id)
+            lost = set(results) - owned
+            if lost:
+                logger.warning(f"Аренда постов {sorted(lost)} перехвачена другим worker'ом, результаты не записаны")
+            results = {post_id: result for post_id, result in results.items() if post_id in owned}
+        
+        if not results:
+            return 0
+        
+        now = datetime.utcnow()
+        mappings = []
+        for post_id, result in results.items():
+            if result.get('success'):
+                mappings.append({
+                    'id': post_id,
+                    'status': 'published',
+                    'platform_post_id': result.get('platform_post_id'),
+                    'published_at': result.get('published_at') or now,
+                    'error_message': None,
+                    'claimed_by': None,
+                    'lease_expires_at': None,
+                    'updated_at': now
+                })
+            else:
+                mappings.append({
+                    'id': post_id,
+                    'status': 'failed',
+                    'error_message': result.get('error') or 'Неизвестная ошибка',
+                    'claimed_by': None,
+                    'lease_expires_at': None,
+                    'updated_at': now
+                })
+        
+        self.db.bulk_update_mappings(ScheduledPostDB, mappings)
+        self.db.commit()
+        
+        return len(mappings)
@@ -6,9 +6,10 @@
 import os
 import re
 import httpx
-from typing import List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 from sqlalchemy.orm import Session
 from app.models.telegram_channels import TelegramChannel
+from app.utils.http_clients import HTTPClientRegistry, get_http_clients
 from datetime import datetime
 import logging
 
@@ -18,8 +19,9 @@ logger = logging.getLogger(__name__)
 class TelegramChannelService:
     """Сервис управления Telegram каналами пользователей"""
     
-    def __init__(self, db: Session):
+    def __init__(self, db: Session, http_clients: Optional[HTTPClientRegistry] = None):
         self.db = db
+        self.http_clients = http_clients or get_http_clients()
         self.bot_token = os.getenv('TELEGRAM_BOT_TOKEN')
         
         if not self.bot_token:
@@ -79,7 +81,7 @@ class TelegramChannelService:
             Словарь с информацией о боте
         """
         try:
-            async with httpx.AsyncClient(timeout=10) as client:
+            async with self.http_clients.async_client(timeout=10) as client:
                 response = await client.get(f"{self.base_url}/getMe")
                 result = response.json()
                 
@@ -108,7 +110,7 @@ class TelegramChannelService:
             - chat_info: Информация о канале или None
         """
         try:
-            async with httpx.AsyncClient(timeout=15) as client:
+            async with self.http_clients.async_client(timeout=15) as client:
                 # Получаем информацию о канале
                 response = await client.get(
                     f"{self.base_url}/getChat",
@@ -616,7 +618,7 @@ class TelegramChannelService:
                 'disable_web_page_preview': disable_web_page_preview
             }
             
-            async with httpx.AsyncClient(timeout=30) as client:
+            async with self.http_clients.async_client(timeout=30) as client:
                 response = await client.post(
                     f"{self.base_url}/sendMessage",
                     json=payload
@@ -696,7 +698,7 @@ class TelegramChannelService:
             if caption:
                 payload['caption'] = caption
             
-            async with httpx.AsyncClient(timeout=30) as client:
+            async with self.http_clients.async_client(timeout=30) as client:
                 response = await client.post(
                     f"{self.base_url}/sendPhoto",
                     json=payload
@@ -746,6 +748,34 @@ class TelegramChannelService:
                 "error": error_msg
             }
     
+    def update_channels_stats(self, outcomes: Dict[int, Dict[str, Any]]) -> None:
+        """
+        Пакетно обновляет статистику каналов после пачки публикаций
+        
+        Args:
+            outcomes: {channel_id: {'published': int, 'last_error': Optional[str]}}
+        """
+        if not outcomes:
+            return
+        
+        now = datetime.utcnow()
+        channels = self.db.query(TelegramChannel).filter(
+            TelegramChannel.id.in_(list(outcomes.keys()))
+        ).all()
+        
+        for channel in channels:
+            outcome = outcomes[channel.id]
+            if outcome.get('published'):
+                channel.posts_count += outcome['published']
+                channel.last_post_at = now
+                channel.last_error = None
+            if outcome.get('last_error'):
+                channel.last_error = outcome['last_error']
+            channel.updated_at = now
+        
+        self.db.commit()
+        logger.info(f"Статистика обновлена для {len(channels)} каналов")
+    
     def update_channel_stats(self, channel_id: int, post_success: bool = True, 
                            error_message: Optional[str] = None) -> None:
         """
@@ -0,0 +1,132 @@
+"""
+Небольшой кеш на диске с TTL
+Один JSON файл на ключ (имя - md5 ключа), запись через временный файл и
+os.replace, поэтому кеш можно делить между процессами gunicorn и воркерами.
+Переживает рестарт, при переполнении удаляются самые старые записи.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Отличает промах от закешированного None
+MISS = object()
+
+
+class DiskCache:
+    """Кеш JSON значений в каталоге"""
+
+    def __init__(self, directory: str, ttl_seconds: float = 86400, max_entries: int = 10000):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._writes_since_prune = 0
+
+        # Метрики
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.errors = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.md5(key.encode("utf-8")).hexdigest() + ".json")
+
+    def get(self, key: str) -> Any:
+        """Значение по ключу или MISS, если записи нет или она устарела"""
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            self.misses += 1
+            return MISS
+        except (OSError, ValueError):
+            self.errors += 1
+            self.misses += 1
+            return MISS
+
+        if entry.get("key") != key or entry.get("expires_at", 0) < time.time():
+            self.misses += 1
+            return MISS
+        self.hits += 1
+        return entry.get("value")
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None):
+        """Сохраняет значение; ошибки записи не пробрасываются - кеш необязателен"""
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        entry = {"key": key, "value": value, "expires_at": time.time() + ttl}
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, self._path(key))
+            self.writes += 1
+        except (OSError, TypeError, ValueError) as e:
+            self.errors += 1
+            logger.warning(f"Не удалось записать кеш {self.directory}: {e}")
+            return
+
+        with self._lock:
+            self._writes_since_prune += 1
+            should_prune = self._writes_since_prune >= max(1, self.max_entries // 10)
+            if should_prune:
+                self._writes_since_prune = 0
+        if should_prune:
+            self.prune()
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def prune(self) -> int:
+        """Удаляет устаревшие записи и самые старые сверх max_entries"""
+        try:
+            entries = [entry for entry in os.scandir(self.directory) if entry.name.endswith(".json")]
+        except OSError:
+            return 0
+
+        now = time.time()
+        removed = 0
+        alive = []
+        for entry in entries:
+            try:
+                # mtime - время записи; ttl отдельной записи не больше ttl кеша
+                mtime = entry.stat().st_mtime
+                if mtime + self.ttl_seconds < now:
+                    os.remove(entry.path)
+                    removed += 1
+                else:
+                    alive.append((mtime, entry.path))
+            except OSError:
+                continue
+
+        alive.sort()
+        for _, path in alive[:max(0, len(alive) - self.max_entries)]:
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                continue
+        return removed
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "directory": self.directory,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            "writes": self.writes,
+            "errors": self.errors
+        }
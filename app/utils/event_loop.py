@@ -0,0 +1,173 @@
+"""
+Общий фоновый event loop процесса
+Один долгоживущий loop в отдельном потоке на процесс: Flask views и workers
+передают в него корутины через submit(), поэтому async клиенты (httpx,
+SDK) и их keep-alive пулы соединений переживают отдельные запросы
+"""
+
+import asyncio
+import concurrent.futures
+import logging
+import os
+import threading
+import time
+from typing import Any, Awaitable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundEventLoop:
+    """Event loop, работающий в отдельном daemon-потоке"""
+
+    def __init__(self, name: str = "background-loop"):
+        self.name = name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+        # Метрики
+        self.submitted_count = 0
+        self.completed_count = 0
+        self.error_count = 0
+        self.timeout_count = 0
+        self.in_flight = 0
+        self.total_wait_time = 0.0
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """Возвращает работающий loop, запуская поток при необходимости"""
+        return self.start()
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> asyncio.AbstractEventLoop:
+        """Запускает поток с event loop (идемпотентно)"""
+        loop = self._loop
+        if loop is not None and self.is_running:
+            return loop
+
+        with self._lock:
+            if self._loop is None or not self.is_running:
+                loop = asyncio.new_event_loop()
+                started = threading.Event()
+
+                def run():
+                    asyncio.set_event_loop(loop)
+                    loop.call_soon(started.set)
+                    loop.run_forever()
+
+                thread = threading.Thread(target=run, name=self.name, daemon=True)
+                thread.start()
+                started.wait()
+                # Публикуем loop только после старта, чтобы быстрый путь не вернул None
+                self._thread = thread
+                self._loop = loop
+                logger.info(f"Фоновый event loop {self.name} запущен")
+
+        return self._loop
+
+    def stop(self, timeout: float = 5.0):
+        """Останавливает loop и ждет завершения потока"""
+        with self._lock:
+            if not self.is_running:
+                return
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=timeout)
+            self._thread = None
+            self._loop = None
+            logger.info(f"Фоновый event loop {self.name} остановлен")
+
+    def in_loop_thread(self) -> bool:
+        """True, если вызов идет из потока самого loop"""
+        return self._thread is not None and threading.current_thread() is self._thread
+
+    def submit_nowait(self, coro: Awaitable) -> concurrent.futures.Future:
+        """Планирует корутину в loop и сразу возвращает concurrent Future"""
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        with self._stats_lock:
+            self.submitted_count += 1
+        return future
+
+    def submit(self, coro: Awaitable, timeout: Optional[float] = None) -> Any:
+        """
+        Выполняет корутину в фоновом loop и блокирующе ждет результат
+
+        Args:
+            coro: корутина
+            timeout: максимальное ожидание в секундах (None - без ограничения)
+
+        Raises:
+            TimeoutError: если результат не получен за timeout (корутина отменяется)
+            RuntimeError: если вызвано из потока самого loop (это дедлок)
+        """
+        if self.in_loop_thread():
+            coro.close()
+            raise RuntimeError("submit() нельзя вызывать из потока фонового loop - используйте await")
+
+        started = time.monotonic()
+        future = self.submit_nowait(coro)
+        self._count("in_flight", 1)
+        try:
+            result = future.result(timeout=timeout)
+            self._count("completed_count", 1)
+            return result
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            self._count("timeout_count", 1)
+            raise TimeoutError(f"Корутина не завершилась за {timeout} с")
+        except Exception:
+            self._count("error_count", 1)
+            raise
+        finally:
+            self._count("in_flight", -1)
+            self._count("total_wait_time", time.monotonic() - started)
+
+    def _count(self, metric: str, delta: float):
+        with self._stats_lock:
+            setattr(self, metric, getattr(self, metric) + delta)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Возвращает метрики loop"""
+        finished = self.completed_count + self.error_count + self.timeout_count
+        return {
+            "name": self.name,
+            "running": self.is_running,
+            "submitted": self.submitted_count,
+            "completed": self.completed_count,
+            "errors": self.error_count,
+            "timeouts": self.timeout_count,
+            "in_flight": self.in_flight,
+            "pending_tasks": len(asyncio.all_tasks(self._loop)) if self.is_running else 0,
+            "avg_wait_ms": round(self.total_wait_time / finished * 1000, 1) if finished else 0.0
+        }
+
+
+_background_loop: Optional[BackgroundEventLoop] = None
+_background_loop_pid: Optional[int] = None
+_background_loop_lock = threading.Lock()
+
+
+def get_background_loop() -> BackgroundEventLoop:
+    """
+    Возвращает общий фоновый loop процесса
+
+    После fork (gunicorn worker) поток родителя не существует, поэтому
+    loop создается заново для каждого PID.
+    """
+    global _background_loop, _background_loop_pid
+
+    pid = os.getpid()
+    if _background_loop is None or _background_loop_pid != pid:
+        with _background_loop_lock:
+            if _background_loop is None or _background_loop_pid != pid:
+                _background_loop = BackgroundEventLoop(name=f"app-event-loop-{pid}")
+                _background_loop_pid = pid
+    return _background_loop
+
+
+def run_coroutine(coro: Awaitable, timeout: Optional[float] = None) -> Any:
+    """Удобная функция: выполняет корутину в общем фоновом loop и возвращает результат"""
+    return get_background_loop().submit(coro, timeout=timeout)
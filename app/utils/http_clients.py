@@ -0,0 +1,239 @@
+"""
+Реестр общих HTTP клиентов
+Один пул соединений на процесс вместо клиента на каждый вызов: keep-alive,
+переиспользование TLS-сессий (api.telegram.org и т.п.), HTTP/2 при наличии h2.
+Async клиент httpx создается на каждый event loop, sync клиент - requests.Session
+с пулами urllib3 по хостам.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import weakref
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class HostStats:
+    """Счетчики запросов и соединений по одному хосту"""
+
+    def __init__(self):
+        self.requests = 0
+        self.new_connections = 0
+        self.tls_handshakes = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        reused = max(self.requests - self.new_connections, 0)
+        return {
+            "requests": self.requests,
+            "new_connections": self.new_connections,
+            "tls_handshakes": self.tls_handshakes,
+            "reused_connections": reused,
+            "reuse_rate": round(reused / self.requests * 100, 1) if self.requests else 0.0
+        }
+
+
+class PooledAsyncClient:
+    """
+    Представление общего httpx.AsyncClient с таймаутом вызывающей стороны
+
+    Проксирует все атрибуты клиента; методы запросов получают timeout по
+    умолчанию, если он не передан явно.
+    """
+
+    _REQUEST_METHODS = {"request", "stream", "get", "post", "put", "patch", "delete", "head", "options"}
+
+    def __init__(self, client: httpx.AsyncClient, timeout: Optional[float] = None):
+        self._client = client
+        self._timeout = timeout
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._client, name)
+        if name in self._REQUEST_METHODS and self._timeout is not None:
+            def with_timeout(*args, **kwargs):
+                kwargs.setdefault("timeout", self._timeout)
+                return attr(*args, **kwargs)
+            return with_timeout
+        return attr
+
+
+class HTTPClientRegistry:
+    """Реестр общих HTTP клиентов процесса"""
+
+    def __init__(self, max_connections: int = None, max_keepalive_connections: int = None,
+                 keepalive_expiry: float = None, timeout: float = None, http2: bool = None):
+        self.max_connections = max_connections or int(os.getenv("HTTP_POOL_MAX_CONNECTIONS", "100"))
+        self.max_keepalive_connections = max_keepalive_connections or int(
+            os.getenv("HTTP_POOL_MAX_KEEPALIVE", "20")
+        )
+        self.keepalive_expiry = keepalive_expiry or float(os.getenv("HTTP_POOL_KEEPALIVE_EXPIRY", "30"))
+        self.timeout = timeout or float(os.getenv("HTTP_CLIENT_TIMEOUT", "30"))
+        if http2 is None:
+            http2 = os.getenv("HTTP_CLIENT_HTTP2", "true").lower() == "true"
+        self.http2 = http2 and HTTP2_AVAILABLE
+
+        # Async клиенты привязаны к event loop, в котором созданы
+        self._async_clients: "weakref.WeakKeyDictionary[Any, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+        self._session: Optional[requests.Session] = None
+        self._lock = threading.Lock()
+
+        # Метрики
+        self.clients_created = 0
+        self.host_stats: Dict[str, HostStats] = {}
+
+    # ==================== ASYNC ====================
+
+    def get_async_client(self) -> httpx.AsyncClient:
+        """Возвращает общий httpx.AsyncClient текущего event loop"""
+        loop = asyncio.get_running_loop()
+
+        with self._lock:
+            client = self._async_clients.get(loop)
+            if client is not None and not client.is_closed:
+                return client
+
+            client = httpx.AsyncClient(
+                http2=self.http2,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive_connections,
+                    keepalive_expiry=self.keepalive_expiry
+                ),
+                event_hooks={"request": [self._attach_trace]}
+            )
+            self._async_clients[loop] = client
+            self.clients_created += 1
+
+        logger.info(f"Создан общий HTTP клиент (http2={self.http2}, max_connections={self.max_connections})")
+        return client
+
+    @asynccontextmanager
+    async def async_client(self, timeout: Optional[float] = None) -> AsyncIterator[PooledAsyncClient]:
+        """
+        Замена `async with httpx.AsyncClient(timeout=...) as client`
+
+        Клиент не закрывается при выходе из блока - соединения остаются в пуле.
+        """
+        yield PooledAsyncClient(self.get_async_client(), timeout)
+
+    async def _attach_trace(self, request: httpx.Request):
+        """Подключает трассировку httpcore для учета новых соединений"""
+        stats = self._host(request.url.host)
+        stats.requests += 1
+
+        async def trace(event_name: str, info: Dict[str, Any]):
+            if event_name == "connection.connect_tcp.complete":
+                stats.new_connections += 1
+            elif event_name == "connection.start_tls.complete":
+                stats.tls_handshakes += 1
+
+        request.extensions["trace"] = trace
+
+    async def aclose(self):
+        """Закрывает async клиент текущего event loop"""
+        with self._lock:
+            client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+    # ==================== SYNC ====================
+
+    @property
+    def session(self) -> requests.Session:
+        """Общая requests.Session с пулами соединений по хостам"""
+        if self._session is not None:
+            return self._session
+
+        with self._lock:
+            if self._session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=self.max_connections,
+                    pool_maxsize=self.max_keepalive_connections
+                )
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._session = session
+                self.clients_created += 1
+        return self._session
+
+    def _sync_host_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Собирает счетчики из пулов urllib3 общей сессии"""
+        result: Dict[str, Dict[str, Any]] = {}
+        if self._session is None:
+            return result
+
+        for adapter in set(self._session.adapters.values()):
+            pool_manager = getattr(adapter, "poolmanager", None)
+            if pool_manager is None:
+                continue
+            for key in pool_manager.pools.keys():
+                pool = pool_manager.pools.get(key)
+                if pool is None:
+                    continue
+                stats = HostStats()
+                stats.requests = pool.num_requests
+                stats.new_connections = pool.num_connections
+                stats.tls_handshakes = pool.num_connections if key.key_scheme == "https" else 0
+                result[pool.host] = stats.to_dict()
+        return result
+
+    # ==================== METRICS ====================
+
+    def _host(self, host: str) -> HostStats:
+        stats = self.host_stats.get(host)
+        if stats is None:
+            stats = self.host_stats.setdefault(host, HostStats())
+        return stats
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Возвращает статистику пулов (pool_hits - запросы на уже открытых соединениях)"""
+        async_hosts = {host: stats.to_dict() for host, stats in list(self.host_stats.items())}
+        sync_hosts = self._sync_host_stats()
+        return {
+            "http2": self.http2,
+            "max_connections": self.max_connections,
+            "max_keepalive_connections": self.max_keepalive_connections,
+            "clients_created": self.clients_created,
+            "pool_hits": sum(stats["reused_connections"]
+                             for hosts in (async_hosts, sync_hosts) for stats in hosts.values()),
+            "async_hosts": async_hosts,
+            "sync_hosts": sync_hosts
+        }
+
+
+_http_clients: Optional[HTTPClientRegistry] = None
+_http_clients_pid: Optional[int] = None
+_http_clients_lock = threading.Lock()
+
+
+def get_http_clients() -> HTTPClientRegistry:
+    """
+    Возвращает реестр HTTP клиентов процесса
+
+    Сокеты пула нельзя делить между процессами, поэтому после fork
+    (gunicorn worker) реестр создается заново.
+    """
+    global _http_clients, _http_clients_pid
+
+    pid = os.getpid()
+    if _http_clients is None or _http_clients_pid != pid:
+        with _http_clients_lock:
+            if _http_clients is None or _http_clients_pid != pid:
+                _http_clients = HTTPClientRegistry()
+                _http_clients_pid = pid
+    return _http_clients
@@ -0,0 +1,69 @@
+"""
+Простые метрики процесса
+Histogram с фиксированными границами корзин (как в Prometheus): O(1) память,
+перцентили оцениваются по верхней границе корзины.
+"""
+
+import bisect
+import threading
+from typing import Any, Dict, Optional, Sequence
+
+# Границы по умолчанию в секундах - от миллисекунд до часа
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+
+class Histogram:
+    """Гистограмма значений с фиксированными корзинами"""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)  # последняя корзина - больше всех границ
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.max: Optional[float] = None
+
+    def observe(self, value: float):
+        """Добавляет наблюдение"""
+        with self._lock:
+            self._counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.total += value
+            self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Оценка перцентиля p (0-100): верхняя граница корзины, в которую он попал"""
+        with self._lock:
+            if not self.count:
+                return None
+            rank = p / 100 * self.count
+            seen = 0
+            for index, bucket_count in enumerate(self._counts):
+                seen += bucket_count
+                if seen >= rank and bucket_count:
+                    return self.buckets[index] if index < len(self.buckets) else self.max
+            return self.max
+
+    def reset(self):
+        """Сбрасывает наблюдения"""
+        with self._lock:
+            self._counts = [0] * (len(self.buckets) + 1)
+            self.count = 0
+            self.total = 0.0
+            self.max = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = list(self._counts)
+        return {
+            "count": self.count,
+            "avg": round(self.total / self.count, 3) if self.count else None,
+            "max": round(self.max, 3) if self.max is not None else None,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "buckets": {
+                **{f"le_{bound:g}": count for bound, count in zip(self.buckets, counts)},
+                "inf": counts[-1]
+            }
+        }
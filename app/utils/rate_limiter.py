@@ -0,0 +1,370 @@
+"""
+Ограничитель частоты вызовов (GCRA - token bucket без фонового пополнения)
+Исходящие вызовы (acquire) не отклоняются сразу, а ставятся в очередь: каждый
+резервирует слот и ждет своей очереди. Входящие HTTP запросы (check) не ждут:
+запрос сверх лимита сразу получает отказ со временем повтора. Состояние
+хранится в процессе или в Redis (общий лимит для всех gunicorn workers).
+"""
+
+import asyncio
+import logging
+import math
+import os
+import threading
+import time
+import weakref
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    import redis
+    import redis.asyncio as redis_asyncio
+    REDIS_AVAILABLE = True
+except ImportError:
+    redis = None
+    redis_asyncio = None
+    REDIS_AVAILABLE = False
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    """Лимит: rate вызовов за period секунд, burst вызовов подряд без ожидания"""
+    rate: int
+    period: float = 1.0
+    burst: Optional[int] = None
+
+    @property
+    def interval(self) -> float:
+        """Интервал между вызовами при равномерной нагрузке"""
+        return self.period / self.rate
+
+    @property
+    def tolerance(self) -> float:
+        """Допуск GCRA: сколько интервалов можно \"занять\" наперед"""
+        return self.interval * ((self.burst or self.rate) - 1)
+
+
+class RateLimitExceeded(Exception):
+    """Ожидание слота превысило допустимое"""
+
+    def __init__(self, key: str, retry_after: float):
+        self.key = key
+        self.retry_after = retry_after
+        super().__init__(f"Лимит {key} исчерпан, повторите через {retry_after:.1f} с")
+
+
+@dataclass
+class RateLimitDecision:
+    """Результат проверки лимита без ожидания"""
+    allowed: bool
+    limit: int           # запросов подряд (burst)
+    remaining: int       # сколько запросов еще можно сделать сразу
+    reset_after: float   # через сколько секунд лимит полностью восстановится
+    retry_after: float   # через сколько секунд повторить (для отказа)
+
+    def headers(self) -> Dict[str, str]:
+        """Заголовки X-RateLimit-* (Reset - в секундах от текущего момента) и Retry-After"""
+        headers = {
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(self.remaining),
+            "X-RateLimit-Reset": str(math.ceil(self.reset_after))
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(max(math.ceil(self.retry_after), 1))
+        return headers
+
+
+@dataclass
+class RateLimitStats:
+    """Статистика ограничителя по одному ключу"""
+    calls: int = 0
+    throttled: int = 0
+    rejected: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "throttled": self.throttled,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self.total_wait / self.calls * 1000, 1) if self.calls else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 1)
+        }
+
+
+class LocalRateLimitBackend:
+    """Состояние лимитов в памяти процесса"""
+
+    name = "local"
+
+    # Выше этого числа ключей (лимиты по пользователям) восстановленные ключи удаляются
+    MAX_KEYS = 100000
+
+    def __init__(self):
+        self._tat: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    async def reserve(self, key: str, limit: RateLimit, max_wait: Optional[float]) -> Tuple[bool, float]:
+        """
+        Резервирует слот
+
+        Returns:
+            (зарезервирован ли слот, сколько ждать до него в секундах)
+        """
+        allowed, wait, _ = self.reserve_now(key, limit, max_wait)
+        return allowed, wait
+
+    def reserve_now(self, key: str, limit: RateLimit, max_wait: Optional[float]) -> Tuple[bool, float, float]:
+        """
+        Синхронная версия reserve
+
+        Returns:
+            (зарезервирован ли слот, ожидание в секундах, через сколько секунд лимит восстановится)
+        """
+        with self._lock:
+            now = time.monotonic()
+            tat = max(self._tat.get(key, now), now)
+            wait = max(tat - limit.tolerance - now, 0.0)
+            if max_wait is not None and wait > max_wait:
+                return False, wait, tat - now
+            self._tat[key] = tat + limit.interval
+            if len(self._tat) > self.MAX_KEYS:
+                self._tat = {name: value for name, value in self._tat.items() if value > now}
+            return True, wait, tat + limit.interval - now
+
+    async def release(self, key: str, limit: RateLimit):
+        """Возвращает зарезервированный, но не использованный слот"""
+        with self._lock:
+            tat = self._tat.get(key)
+            if tat is not None:
+                self._tat[key] = tat - limit.interval
+
+
+class RedisRateLimitBackend:
+    """Состояние лимитов в Redis - один лимит на все процессы"""
+
+    name = "redis"
+
+    # Время берется у Redis, чтобы часы процессов не влияли на результат
+    SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local interval = tonumber(ARGV[1])
+local tolerance = tonumber(ARGV[2])
+local max_wait = tonumber(ARGV[3])
+local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+if tat < now then tat = now end
+local wait = tat - tolerance - now
+if wait < 0 then wait = 0 end
+if max_wait >= 0 and wait > max_wait then
+    return {0, tostring(wait), tostring(tat - now)}
+end
+local new_tat = tat + interval
+redis.call('SET', KEYS[1], tostring(new_tat), 'PX', math.ceil((new_tat - now) * 1000) + 1000)
+return {1, tostring(wait), tostring(new_tat - now)}
+"""
+
+    RELEASE_SCRIPT = """
+local tat = tonumber(redis.call('GET', KEYS[1]))
+if not tat then return 0 end
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local new_tat = tat - tonumber(ARGV[1])
+if new_tat <= now then
+    redis.call('DEL', KEYS[1])
+else
+    redis.call('SET', KEYS[1], tostring(new_tat), 'PX', math.ceil((new_tat - now) * 1000) + 1000)
+end
+return 1
+"""
+
+    def __init__(self, url: str, prefix: str = "ratelimit:"):
+        if not REDIS_AVAILABLE:
+            raise ImportError("Для RATE_LIMIT_BACKEND=redis нужен пакет redis")
+        self.url = url
+        self.prefix = prefix
+        # Клиент redis.asyncio привязан к event loop, в котором создан
+        self._clients: "weakref.WeakKeyDictionary[Any, Any]" = weakref.WeakKeyDictionary()
+        self._sync_client = None
+
+    def _client(self):
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = redis_asyncio.from_url(self.url)
+            self._clients[loop] = client
+        return client
+
+    async def reserve(self, key: str, limit: RateLimit, max_wait: Optional[float]) -> Tuple[bool, float]:
+        allowed, wait, _ = await self._client().eval(
+            self.SCRIPT, 1, self.prefix + key,
+            limit.interval, limit.tolerance, -1 if max_wait is None else max_wait
+        )
+        return bool(allowed), float(wait)
+
+    async def release(self, key: str, limit: RateLimit):
+        await self._client().eval(self.RELEASE_SCRIPT, 1, self.prefix + key, limit.interval)
+
+    def reserve_now(self, key: str, limit: RateLimit, max_wait: Optional[float]) -> Tuple[bool, float, float]:
+        """Синхронная версия reserve (Flask views)"""
+        if self._sync_client is None:
+            self._sync_client = redis.Redis.from_url(self.url, socket_timeout=0.2)
+        allowed, wait, reset_after = self._sync_client.eval(
+            self.SCRIPT, 1, self.prefix + key,
+            limit.interval, limit.tolerance, -1 if max_wait is None else max_wait
+        )
+        return bool(allowed), float(wait), float(reset_after)
+
+
+class RateLimiter:
+    """
+    Асинхронный ограничитель частоты
+
+    Использование:
+        await rate_limiter.acquire("mcp:telegram", RateLimit(30, 1.0))
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend or LocalRateLimitBackend()
+        self._fallback = LocalRateLimitBackend()
+        self.stats: Dict[str, RateLimitStats] = {}
+        self.backend_errors = 0
+
+    async def acquire(self, key: str, limit: RateLimit, max_wait: Optional[float] = None,
+                      stats_key: Optional[str] = None) -> float:
+        """
+        Ждет слот в лимите key
+
+        Args:
+            key: ключ лимита (сервис, платформа, аккаунт)
+            limit: параметры лимита
+            max_wait: максимальное ожидание; None - ждать сколько нужно
+            stats_key: ключ статистики (по умолчанию key)
+
+        Returns:
+            Время ожидания в секундах
+
+        Raises:
+            RateLimitExceeded: если слот будет доступен позже max_wait
+        """
+        return await self.acquire_all({key: limit}, max_wait, {key: stats_key or key})
+
+    async def acquire_all(self, limits: Dict[str, RateLimit], max_wait: Optional[float] = None,
+                          stats_keys: Optional[Dict[str, str]] = None) -> float:
+        """
+        Ждет слоты сразу в нескольких лимитах (например, запросы в секунду и посты в час)
+
+        Слоты резервируются все или ни одного: если один лимит отказал, уже
+        зарезервированные слоты остальных возвращаются. Ожидание - до самого
+        позднего из слотов.
+
+        Raises:
+            RateLimitExceeded: если слот какого-либо лимита будет доступен позже max_wait
+        """
+        stats_keys = stats_keys or {}
+        reserved = []
+        wait = 0.0
+        for key, limit in limits.items():
+            stats = self.stats.setdefault(stats_keys.get(key, key), RateLimitStats())
+            allowed, key_wait = await self._reserve(key, limit, max_wait)
+            if not allowed:
+                stats.rejected += 1
+                for reserved_key, reserved_limit in reserved:
+                    await self._release(reserved_key, reserved_limit)
+                raise RateLimitExceeded(key, key_wait)
+            reserved.append((key, limit))
+            wait = max(wait, key_wait)
+
+            stats.calls += 1
+            if key_wait > 0:
+                stats.throttled += 1
+                stats.total_wait += key_wait
+                stats.max_wait = max(stats.max_wait, key_wait)
+                logger.debug(f"Лимит {key}: ожидание {key_wait:.3f} с")
+
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    async def _reserve(self, key: str, limit: RateLimit, max_wait: Optional[float]) -> Tuple[bool, float]:
+        try:
+            return await self.backend.reserve(key, limit, max_wait)
+        except Exception as e:
+            # Недоступный Redis не должен останавливать публикации
+            self.backend_errors += 1
+            logger.warning(f"Ошибка backend ограничителя {self.backend.name}, используем локальный: {e}")
+            return await self._fallback.reserve(key, limit, max_wait)
+
+    async def _release(self, key: str, limit: RateLimit):
+        try:
+            await self.backend.release(key, limit)
+        except Exception as e:
+            self.backend_errors += 1
+            logger.warning(f"Не удалось вернуть слот {key} в {self.backend.name}: {e}")
+            await self._fallback.release(key, limit)
+
+    def check(self, key: str, limit: RateLimit, stats_key: Optional[str] = None) -> RateLimitDecision:
+        """
+        Проверяет лимит без ожидания: слот резервируется, только если доступен сейчас
+
+        Args:
+            key: ключ лимита (например, пользователь и класс эндпоинта)
+            limit: параметры лимита
+            stats_key: ключ статистики (по умолчанию key) - чтобы не заводить
+                       статистику на каждого пользователя
+
+        Returns:
+            RateLimitDecision с данными для заголовков ответа
+        """
+        stats = self.stats.setdefault(stats_key or key, RateLimitStats())
+
+        try:
+            allowed, wait, reset_after = self.backend.reserve_now(key, limit, 0.0)
+        except Exception as e:
+            self.backend_errors += 1
+            logger.warning(f"Ошибка backend ограничителя {self.backend.name}, используем локальный: {e}")
+            allowed, wait, reset_after = self._fallback.reserve_now(key, limit, 0.0)
+
+        if allowed:
+            stats.calls += 1
+        else:
+            stats.rejected += 1
+
+        burst = limit.burst or limit.rate
+        remaining = int((limit.tolerance + limit.interval - reset_after) / limit.interval + 1e-9)
+        return RateLimitDecision(
+            allowed=allowed,
+            limit=burst,
+            remaining=min(max(remaining, 0), burst),
+            reset_after=max(reset_after, 0.0),
+            retry_after=wait
+        )
+
+    def get_stats(self, key: Optional[str] = None) -> Dict[str, Any]:
+        """Возвращает статистику по ключу или по всем ключам"""
+        if key is not None:
+            return self.stats.get(key, RateLimitStats()).to_dict()
+        return {
+            "backend": self.backend.name,
+            "backend_errors": self.backend_errors,
+            "keys": {name: stats.to_dict() for name, stats in list(self.stats.items())}
+        }
+
+
+def create_rate_limiter() -> RateLimiter:
+    """Создает ограничитель по переменным окружения"""
+    backend_name = os.getenv("RATE_LIMIT_BACKEND", "local").lower()
+    if backend_name == "redis":
+        url = os.getenv("RATE_LIMIT_REDIS_URL") or os.getenv("REDIS_URL", "redis://localhost:6379/0")
+        try:
+            return RateLimiter(RedisRateLimitBackend(url))
+        except ImportError as e:
+            logger.warning(f"{e}, используется локальный ограничитель")
+    return RateLimiter()
+
+
+# Глобальный ограничитель процесса
+rate_limiter = create_rate_limiter()
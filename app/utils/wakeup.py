@@ -0,0 +1,164 @@
+"""
+Пробуждение фоновых workers по ближайшему дедлайну
+Вместо sleep(check_interval) между полными проходами по таблице worker спит
+до ближайшего scheduled_time / next_execution_at / next_check_at. Сервисы,
+которые вставляют или переносят строки, будят worker'а раньше, если новый
+дедлайн наступает до запланированного пробуждения. Пока очередь пуста,
+интервал опроса растет (backoff) до max_interval.
+"""
+
+import logging
+import os
+import threading
+import weakref
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Имена очередей, по которым сервисы будят workers
+SCHEDULED_POSTS = "scheduled_posts"
+AUTO_POSTING = "auto_posting"
+WEB_CRAWLER = "web_crawler"
+
+# Верхняя граница сна: страхует от вставок из других процессов, о которых
+# этот процесс не узнает
+DEFAULT_MAX_SLEEP = float(os.getenv("SCHEDULER_MAX_SLEEP_SECONDS", "300"))
+
+
+class DeadlineWaiter:
+    """Ожидание до дедлайна с ранним пробуждением и backoff в простое"""
+
+    def __init__(self, name: str, base_interval: float = 60.0, min_interval: float = 1.0,
+                 max_interval: float = None, backoff_factor: float = 2.0):
+        """
+        Args:
+            name: имя очереди (SCHEDULED_POSTS, AUTO_POSTING, WEB_CRAWLER)
+            base_interval: первый интервал опроса, когда дедлайнов нет
+            min_interval: минимальный сон (защита от горячего цикла)
+            max_interval: максимальный сон
+            backoff_factor: множитель интервала на каждый пустой проход
+        """
+        self.name = name
+        self.base_interval = base_interval
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval or DEFAULT_MAX_SLEEP, base_interval)
+        self.backoff_factor = backoff_factor
+
+        self._cond = threading.Condition()
+        self._wake_at: Optional[datetime] = None
+        self._pending = False
+        self._stopped = False
+        self._idle_interval = base_interval
+
+        # Метрики
+        self.waits = 0
+        self.notifications = 0
+        self.early_wakeups = 0
+        self.last_timeout: Optional[float] = None
+
+        register_waiter(self)
+
+    def timeout_for(self, next_deadline: Optional[datetime], now: Optional[datetime] = None) -> float:
+        """Сколько спать до следующего прохода"""
+        if next_deadline is None:
+            # Очередь пуста - увеличиваем интервал опроса
+            timeout = self._idle_interval
+            self._idle_interval = min(self._idle_interval * self.backoff_factor, self.max_interval)
+            return timeout
+
+        self._idle_interval = self.base_interval
+        delay = (next_deadline - (now or datetime.utcnow())).total_seconds()
+        return min(max(delay, self.min_interval), self.max_interval)
+
+    def wait(self, next_deadline: Optional[datetime] = None) -> bool:
+        """
+        Спит до next_deadline (или backoff-интервала, если дедлайна нет)
+
+        Returns:
+            True, если разбужен notify() или stop() раньше срока
+        """
+        now = datetime.utcnow()
+        timeout = self.timeout_for(next_deadline, now)
+
+        with self._cond:
+            self.waits += 1
+            self.last_timeout = timeout
+            if self._pending or self._stopped:
+                # Строку добавили, пока worker обрабатывал пачку
+                self._pending = False
+                self.early_wakeups += 1
+                return True
+
+            self._wake_at = now + timedelta(seconds=timeout)
+            woken = self._cond.wait_for(lambda: self._pending or self._stopped, timeout)
+            self._wake_at = None
+            self._pending = False
+
+        if woken:
+            self.early_wakeups += 1
+            self._idle_interval = self.base_interval
+        return woken
+
+    def notify(self, deadline: Optional[datetime] = None):
+        """
+        Сообщает о новом дедлайне; будит worker'а, если дедлайн раньше его пробуждения
+
+        Args:
+            deadline: время новой строки (None - будить безусловно)
+        """
+        with self._cond:
+            if self._wake_at is not None and deadline is not None and deadline >= self._wake_at:
+                return
+            self.notifications += 1
+            self._pending = True
+            self._cond.notify_all()
+
+    def stop(self):
+        """Будит worker'а для остановки"""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    def reset(self):
+        """Сбрасывает состояние остановки (повторный start worker'а)"""
+        with self._cond:
+            self._stopped = False
+            self._pending = False
+            self._idle_interval = self.base_interval
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "waits": self.waits,
+            "notifications": self.notifications,
+            "early_wakeups": self.early_wakeups,
+            "last_timeout_s": round(self.last_timeout, 3) if self.last_timeout is not None else None,
+            "idle_interval_s": self._idle_interval
+        }
+
+
+_waiters: Dict[str, "weakref.WeakSet[DeadlineWaiter]"] = {}
+_waiters_lock = threading.Lock()
+
+
+def register_waiter(waiter: DeadlineWaiter):
+    """Регистрирует waiter, чтобы notify_workers мог его разбудить"""
+    with _waiters_lock:
+        _waiters.setdefault(waiter.name, weakref.WeakSet()).add(waiter)
+
+
+def notify_workers(name: str, deadline: Optional[datetime] = None):
+    """
+    Будит workers очереди name, если deadline раньше их пробуждения
+
+    Вызывается сервисами после commit вставки/переноса строки. Ошибки не
+    пробрасываются - пробуждение лишь ускоряет обработку.
+    """
+    try:
+        with _waiters_lock:
+            waiters = list(_waiters.get(name, ()))
+        for waiter in waiters:
+            waiter.notify(deadline)
+    except Exception as e:
+        logger.warning(f"Не удалось разбудить workers {name}: {e}")
@@ -1,6 +1,9 @@
 """
 Worker для выполнения правил автопостинга
-Проверяет таблицу auto_posting_rules и создает/публикует контент
+Проверяет таблицу auto_posting_rules и создает/публикует контент.
+Правила захватываются с арендой, поэтому worker можно запускать в
+нескольких процессах. Между проходами worker спит до ближайшего
+next_execution_at; AutoPostingService будит его при изменении правил.
 """
 
 import logging
@@ -10,10 +13,12 @@ import requests
 from datetime import datetime
 from typing import Optional
 
-from app.database.connection import get_db_session
+from app.database.connection import get_db_session, worker_session
+from app.database.leases import DEFAULT_LEASE_SECONDS, make_worker_id
 from app.services.auto_posting_service import AutoPostingService
 from app.services.scheduled_post_service import ScheduledPostService
 from app.models.auto_posting_rules import AutoPostingRuleDB
+from app.utils.wakeup import AUTO_POSTING, DeadlineWaiter
 
 logger = logging.getLogger(__name__)
 
@@ -21,16 +26,23 @@ logger = logging.getLogger(__name__)
 class AutoPostingWorker:
     """Worker для автоматического создания и публикации контента по правилам"""
     
-    def __init__(self, check_interval: int = 300, api_base_url: str = None):
+    def __init__(self, check_interval: int = 300, api_base_url: str = None,
+                 worker_id: str = None, lease_seconds: int = None):
         """
         Args:
-            check_interval: Интервал проверки в секундах (по умолчанию 300 = 5 минут)
+            check_interval: Интервал опроса без правил в секундах (по умолчанию 300 = 5 минут),
+                            растет в простое до SCHEDULER_MAX_SLEEP_SECONDS
             api_base_url: Базовый URL API для создания контента
+            worker_id: Идентификатор для аренды правил (по умолчанию - хост и PID)
+            lease_seconds: Длительность аренды, продлевается перед каждым правилом
         """
         self.check_interval = check_interval
         self.api_base_url = api_base_url or "http://localhost:8080"
+        self.worker_id = worker_id or make_worker_id('auto-posting')
+        self.lease_seconds = lease_seconds or DEFAULT_LEASE_SECONDS
         self.is_running = False
         self._thread: Optional[threading.Thread] = None
+        self.wakeup = DeadlineWaiter(AUTO_POSTING, base_interval=check_interval)
         logger.info(f"AutoPostingWorker инициализирован с интервалом {check_interval}s")
     
     def start(self):
@@ -40,6 +52,7 @@ class AutoPostingWorker:
             return
         
         self.is_running = True
+        self.wakeup.reset()
         self._thread = threading.Thread(target=self._run_loop, daemon=True, name="AutoPostingWorker")
         self._thread.start()
         logger.info("AutoPostingWorker запущен")
@@ -47,6 +60,7 @@ class AutoPostingWorker:
     def stop(self):
         """Остановить worker"""
         self.is_running = False
+        self.wakeup.stop()
         if self._thread:
             self._thread.join(timeout=5)
         logger.info("AutoPostingWorker остановлен")
@@ -56,16 +70,26 @@ class AutoPostingWorker:
         logger.info("AutoPostingWorker начал работу")
         
         while self.is_running:
+            next_deadline = None
             try:
-                self._process_auto_posting_rules()
+                with worker_session():
+                    self._process_auto_posting_rules()
+                    next_deadline = self._get_next_deadline()
             except Exception as e:
                 logger.error(f"Ошибка в AutoPostingWorker: {e}", exc_info=True)
             
-            # Ждем до следующей проверки
-            time.sleep(self.check_interval)
+            # Спим до ближайшего правила (или до изменения правил)
+            self.wakeup.wait(next_deadline)
         
         logger.info("AutoPostingWorker завершил работу")
     
+    def _get_next_deadline(self) -> Optional[datetime]:
+        db = get_db_session()
+        try:
+            return AutoPostingService(db).get_next_deadline()
+        finally:
+            db.close()
+    
     def _process_auto_posting_rules(self):
         """Обработать правила автопостинга"""
         db = None
@@ -73,8 +97,8 @@ class AutoPostingWorker:
             db = get_db_session()
             service = AutoPostingService(db)
             
-            # Получаем правила готовые к выполнению
-            rules = service.get_rules_to_execute(limit=50)
+            # Захватываем наступившие правила - другие worker'ы их уже не получат
+            rules = service.claim_rules_to_execute(self.worker_id, limit=50, lease_seconds=self.lease_seconds)
             
             if not rules:
                 logger.debug("Нет правил для выполнения")
@@ -82,8 +106,10 @@ class AutoPostingWorker:
             
             logger.info(f"Найдено {len(rules)} правил для выполнения")
             
-            for rule in rules:
+            for index, rule in enumerate(rules):
                 try:
+                    # Правила выполняются последовательно - продлеваем аренду оставшихся
+                    service.renew_leases([r.id for r in rules[index:]], self.worker_id, self.lease_seconds)
                     self._execute_rule(rule, db, service)
                 except Exception as e:
                     logger.error(f"Ошибка выполнения правила {rule.id}: {e}", exc_info=True)
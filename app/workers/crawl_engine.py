@@ -0,0 +1,308 @@
+"""
+Конкурентный обход источников для WebCrawlerWorker
+Источники, которым пора на проверку, попадают в ограниченную очередь и
+проверяются N корутинами в event loop краулера - отдельном от общего loop
+процесса, который ждут Flask views. Запросы к одному хосту ограничены по
+числу одновременных и разнесены паузой вежливости, поэтому медленный сайт
+занимает только свой слот, а не весь обход.
+
+Загрузка условная: с сохраненными ETag/Last-Modified источника сервер
+отвечает 304 без тела, и проверка завершается до разбора и извлечения.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set
+from urllib.parse import urlsplit
+
+from app.utils.metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+
+class HostState:
+    """Лимит, пауза вежливости и задержки запросов одного хоста"""
+
+    def __init__(self, concurrency: int):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.next_start = 0.0  # loop.time(), раньше которого не начинаем следующий запрос
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.latency = Histogram()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "errors": self.errors,
+            "latency_seconds": self.latency.to_dict()
+        }
+
+
+class HostLimiter:
+    """
+    Ограничение запросов по хостам
+
+    Не больше per_host одновременных запросов к хосту, начала запросов к
+    одному хосту разнесены не меньше чем на delay секунд. Состояние хранится
+    для max_hosts последних хостов (LRU).
+    """
+
+    def __init__(self, per_host: int = None, delay: float = None, max_hosts: int = 10000):
+        self.per_host = per_host or int(os.getenv("WEB_CRAWLER_PER_HOST_CONCURRENCY", "2"))
+        self.delay = delay if delay is not None else float(os.getenv("WEB_CRAWLER_HOST_DELAY", "1.0"))
+        self.max_hosts = max_hosts
+        self._hosts: "OrderedDict[str, HostState]" = OrderedDict()
+        self.politeness_wait_seconds = 0.0
+
+    @staticmethod
+    def host_of(url: str) -> str:
+        return (urlsplit(url).hostname or "").lower()
+
+    def _state(self, host: str) -> HostState:
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = HostState(self.per_host)
+            # Вытесняем давно не использованные хосты без активных запросов
+            while len(self._hosts) > self.max_hosts:
+                oldest, oldest_state = next(iter(self._hosts.items()))
+                if oldest_state.in_flight:
+                    break
+                del self._hosts[oldest]
+        else:
+            self._hosts.move_to_end(host)
+        return state
+
+    @asynccontextmanager
+    async def slot(self, url: str) -> AsyncIterator[None]:
+        """Слот для одного запроса к хосту url"""
+        state = self._state(self.host_of(url))
+        async with state.semaphore:
+            loop = asyncio.get_running_loop()
+            # Время старта фиксируем без await между проверкой и записью:
+            # ожидающий запрос перепроверяет паузу после каждого пробуждения
+            wait_started = loop.time()
+            while True:
+                now = loop.time()
+                if now >= state.next_start:
+                    state.next_start = now + self.delay
+                    break
+                await asyncio.sleep(state.next_start - now)
+            self.politeness_wait_seconds += now - wait_started
+
+            state.in_flight += 1
+            state.requests += 1
+            started = time.monotonic()
+            try:
+                yield
+            except Exception:
+                state.errors += 1
+                raise
+            finally:
+                state.in_flight -= 1
+                state.latency.observe(time.monotonic() - started)
+
+    def get_stats(self, top: int = 20) -> Dict[str, Any]:
+        busiest = sorted(self._hosts.items(), key=lambda item: -item[1].requests)[:top]
+        return {
+            "per_host": self.per_host,
+            "delay_seconds": self.delay,
+            "hosts": len(self._hosts),
+            "politeness_wait_seconds": round(self.politeness_wait_seconds, 1),
+            "top_hosts": {host: state.to_dict() for host, state in busiest}
+        }
+
+
+def conditional_headers(validators: Optional[Dict[str, Any]], url: str) -> Dict[str, str]:
+    """If-None-Match / If-Modified-Since по валидаторам, сохраненным для этого url"""
+    if not validators or validators.get("url") != url:
+        return {}
+    headers = {}
+    if validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+    return headers
+
+
+def fetch_result(url: str, response, validators: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Итог загрузки для истории проверки
+
+    http_validators - что сохранить для следующей проверки (None - оставить
+    прежние: ответ 304 или ошибка).
+    """
+    not_modified = response.status_code == 304
+    downloaded = response.num_bytes_downloaded
+    # 304 сэкономил тело прошлого полного ответа
+    saved = ((validators or {}).get("content_length") or 0) if not_modified else 0
+    new_validators = None
+    if response.is_success:
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        # Без валидаторов сохранять нечего - следующий запрос будет обычным
+        new_validators = {
+            "url": url, "etag": etag, "last_modified": last_modified, "content_length": downloaded
+        } if etag or last_modified else {}
+    return {
+        "http_status": response.status_code,
+        "not_modified": not_modified,
+        "bytes_downloaded": downloaded,
+        "bytes_saved": saved,
+        "http_validators": new_validators
+    }
+
+
+class FetchStats:
+    """Счетчики условной загрузки процесса"""
+
+    def __init__(self):
+        self.requests = 0
+        self.conditional = 0
+        self.not_modified = 0
+        self.bytes_downloaded = 0
+        self.bytes_saved = 0
+
+    def record(self, conditional: bool, result: Dict[str, Any]):
+        self.requests += 1
+        self.conditional += int(conditional)
+        self.not_modified += int(result["not_modified"])
+        self.bytes_downloaded += result["bytes_downloaded"]
+        self.bytes_saved += result["bytes_saved"]
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "conditional": self.conditional,
+            "not_modified": self.not_modified,
+            "not_modified_rate": round(self.not_modified / self.requests, 3) if self.requests else None,
+            "bytes_downloaded": self.bytes_downloaded,
+            "bytes_saved": self.bytes_saved
+        }
+
+
+class CrawlEngine:
+    """
+    Обход наступивших источников: ограниченная очередь + пул корутин
+
+    fetch_due(limit, exclude_ids) отдает источники, которым пора на проверку
+    (синхронно, вызывается в потоке), check(source) проверяет один источник.
+    """
+
+    def __init__(self, check: Callable[[Any], Awaitable[Any]],
+                 fetch_due: Callable[[int, Set[int]], List[Any]],
+                 concurrency: int = None, queue_size: int = None, hosts: HostLimiter = None):
+        self.check = check
+        self.fetch_due = fetch_due
+        self.concurrency = concurrency or int(os.getenv("WEB_CRAWLER_CONCURRENCY", "20"))
+        self.queue_size = queue_size or int(os.getenv("WEB_CRAWLER_QUEUE_SIZE", "100"))
+        self.hosts = hosts or HostLimiter()
+        self._stopping = False
+        self._queue: Optional[asyncio.Queue] = None
+        self._in_flight: Set[int] = set()
+
+        # Метрики
+        self.runs = 0
+        self.checked = 0
+        self.errors = 0
+        self.source_seconds = Histogram()
+        self._completed_at: deque = deque()  # monotonic времена завершения за последнюю минуту
+        self.last_run_seconds: Optional[float] = None
+
+    def stop(self):
+        """Прекращает выдачу новых источников; начатые проверки завершаются"""
+        self._stopping = True
+
+    def resume(self):
+        self._stopping = False
+
+    async def run_once(self) -> int:
+        """
+        Проверяет все источники, которым пора на проверку
+
+        Returns:
+            Количество проверенных источников
+        """
+        started = time.monotonic()
+        queue = self._queue = asyncio.Queue(maxsize=self.queue_size)
+        seen: Set[int] = set()
+        checked_before = self.checked
+
+        consumers = [asyncio.create_task(self._consume(queue)) for _ in range(self.concurrency)]
+        try:
+            while not self._stopping:
+                # Источники в работе еще "наступили" - исключаем их из выборки
+                batch = await asyncio.to_thread(self.fetch_due, self.queue_size, set(seen))
+                fresh = [source for source in batch if source.id not in seen]
+                if not fresh:
+                    break
+                for source in fresh:
+                    seen.add(source.id)
+                    self._in_flight.add(source.id)
+                    # Очередь ограничена: при заполнении ждем, пока корутины освободятся
+                    await queue.put(source)
+            await queue.join()
+        finally:
+            for consumer in consumers:
+                consumer.cancel()
+            await asyncio.gather(*consumers, return_exceptions=True)
+            self._queue = None
+            self._in_flight.clear()
+
+        self.runs += 1
+        self.last_run_seconds = round(time.monotonic() - started, 3)
+        checked = self.checked - checked_before
+        if checked:
+            logger.info(f"Crawl run: {checked} sources in {self.last_run_seconds}s "
+                        f"({self.sources_per_minute()} sources/min)")
+        return checked
+
+    async def _consume(self, queue: asyncio.Queue):
+        while True:
+            source = await queue.get()
+            try:
+                if not self._stopping:
+                    await self._check(source)
+            finally:
+                self._in_flight.discard(source.id)
+                queue.task_done()
+
+    async def _check(self, source):
+        started = time.monotonic()
+        try:
+            await self.check(source)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Error checking source {source.id}: {e}", exc_info=True)
+        finally:
+            finished = time.monotonic()
+            self.checked += 1
+            self.source_seconds.observe(finished - started)
+            self._completed_at.append(finished)
+
+    def sources_per_minute(self) -> int:
+        """Источников, проверенных за последние 60 секунд"""
+        cutoff = time.monotonic() - 60
+        while self._completed_at and self._completed_at[0] < cutoff:
+            self._completed_at.popleft()
+        return len(self._completed_at)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "concurrency": self.concurrency,
+            "queue_size": self.queue_size,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "in_flight": len(self._in_flight),
+            "runs": self.runs,
+            "checked": self.checked,
+            "errors": self.errors,
+            "sources_per_minute": self.sources_per_minute(),
+            "last_run_seconds": self.last_run_seconds,
+            "source_seconds": self.source_seconds.to_dict(),
+            "hosts": self.hosts.get_stats()
+        }
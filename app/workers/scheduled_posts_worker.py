@@ -1,36 +1,89 @@
 """
 Worker для публикации запланированных постов
-Проверяет таблицу scheduled_posts и публикует посты по расписанию
+Проверяет таблицу scheduled_posts и публикует посты по расписанию.
+Пачка наступивших постов подготавливается одним проходом по БД, затем
+публикуется конкурентно в общем event loop (с лимитами на Telegram и канал),
+а результаты записываются обратно одним commit. Instagram и Twitter пока
+публикуются заглушками при подготовке пачки и в конкурентную отправку не входят.
+Посты захватываются с арендой (claim-and-lease), поэтому worker может
+работать в нескольких процессах одновременно без повторных публикаций.
+Между проходами worker спит до ближайшего scheduled_time, а ScheduledPostService
+будит его при добавлении поста с более ранним временем.
 """
 
+import asyncio
+import json
 import logging
+import os
 import time
 import threading
 import re
-import asyncio
+from collections import defaultdict
+from dataclasses import dataclass
 from datetime import datetime
-from typing import Optional
+from typing import Any, Dict, List, Optional, Tuple, Union
 
-from app.database.connection import get_db_session
+from app.database.connection import get_db_session, worker_session
+from app.database.leases import DEFAULT_LEASE_SECONDS, make_worker_id
 from app.services.scheduled_post_service import ScheduledPostService
 from app.models.content import ContentPieceDB
 from app.models.scheduled_posts import ScheduledPostDB
+from app.utils.event_loop import run_coroutine
+from app.utils.metrics import Histogram
+from app.utils.rate_limiter import rate_limiter
+from app.utils.wakeup import SCHEDULED_POSTS, DeadlineWaiter
 
 logger = logging.getLogger(__name__)
 
 
+@dataclass
+class TelegramPublishJob:
+    """Подготовленная публикация в Telegram - все данные из БД уже загружены"""
+    post_id: int
+    scheduled_time: datetime
+    channel_id: int
+    channel_name: str
+    chat_id: str
+    text: str
+    image_url: Optional[str] = None
+
+
 class ScheduledPostsWorker:
     """Worker для автоматической публикации запланированных постов"""
     
-    def __init__(self, check_interval: int = 60):
+    def __init__(self, check_interval: int = 60, batch_size: int = None,
+                 telegram_concurrency: int = None, channel_concurrency: int = None,
+                 worker_id: str = None, lease_seconds: int = None):
         """
         Args:
-            check_interval: Интервал проверки в секундах (по умолчанию 60)
+            check_interval: Интервал опроса пустой очереди в секундах (по умолчанию 60),
+                            растет в простое до SCHEDULER_MAX_SLEEP_SECONDS
+            batch_size: Сколько наступивших постов брать за один проход
+            telegram_concurrency: Максимум одновременных публикаций в Telegram
+            channel_concurrency: Максимум одновременных публикаций в один канал
+            worker_id: Идентификатор для аренды постов (по умолчанию - хост и PID)
+            lease_seconds: Длительность аренды пачки, продлевается во время публикации
         """
         self.check_interval = check_interval
+        self.batch_size = batch_size or int(os.getenv('SCHEDULED_POSTS_BATCH_SIZE', '500'))
+        self.telegram_concurrency = telegram_concurrency or int(
+            os.getenv('SCHEDULED_POSTS_TELEGRAM_CONCURRENCY', '50')
+        )
+        # 1 сохраняет порядок постов внутри канала
+        self.channel_concurrency = channel_concurrency or int(os.getenv('SCHEDULED_POSTS_CHANNEL_CONCURRENCY', '1'))
+        self.worker_id = worker_id or make_worker_id('scheduled-posts')
+        self.lease_seconds = lease_seconds or DEFAULT_LEASE_SECONDS
         self.is_running = False
         self._thread: Optional[threading.Thread] = None
-        logger.info(f"ScheduledPostsWorker инициализирован с интервалом {check_interval}s")
+        self.wakeup = DeadlineWaiter(SCHEDULED_POSTS, base_interval=check_interval)
+        
+        # Метрики
+        self.lateness = Histogram()  # фактическое время публикации - scheduled_time, секунды
+        self.published_count = 0
+        self.failed_count = 0
+        self.batches_count = 0
+        
+        logger.info(f"ScheduledPostsWorker инициализирован с интервалом {check_interval}s, пачка {self.batch_size}")
     
     def start(self):
         """Запустить worker в отдельном потоке"""
@@ -39,6 +92,7 @@ class ScheduledPostsWorker:
             return
         
         self.is_running = True
+        self.wakeup.reset()
         self._thread = threading.Thread(target=self._run_loop, daemon=True, name="ScheduledPostsWorker")
         self._thread.start()
         logger.info("ScheduledPostsWorker запущен")
@@ -46,6 +100,7 @@ class ScheduledPostsWorker:
     def stop(self):
         """Остановить worker"""
         self.is_running = False
+        self.wakeup.stop()
         if self._thread:
             self._thread.join(timeout=5)
         logger.info("ScheduledPostsWorker остановлен")
@@ -55,262 +110,376 @@ class ScheduledPostsWorker:
         logger.info("ScheduledPostsWorker начал работу")
         
         while self.is_running:
+            processed = 0
+            next_deadline = None
             try:
-                self._process_scheduled_posts()
+                with worker_session():
+                    processed = self._process_scheduled_posts()
+                    
+                    # Полная пачка - вероятно, есть еще наступившие посты: берем следующую сразу
+                    if processed >= self.batch_size:
+                        continue
+                    
+                    next_deadline = self._get_next_deadline()
             except Exception as e:
                 logger.error(f"Ошибка в ScheduledPostsWorker: {e}", exc_info=True)
             
-            # Ждем до следующей проверки
-            time.sleep(self.check_interval)
+            # Спим до ближайшего поста (или до нового поста, добавленного раньше)
+            self.wakeup.wait(next_deadline)
         
         logger.info("ScheduledPostsWorker завершил работу")
     
-    def _process_scheduled_posts(self):
-        """Обработать запланированные посты"""
+    def _process_scheduled_posts(self) -> int:
+        """
+        Обработать пачку запланированных постов
+        
+        Returns:
+            Количество обработанных постов
+        """
         db = None
         try:
             db = get_db_session()
             service = ScheduledPostService(db)
             
-            # Получаем посты готовые к публикации
-            posts = service.get_posts_to_publish(limit=50)
+            # Захватываем наступившие посты - другие worker'ы их уже не получат
+            posts = service.claim_posts_to_publish(self.worker_id, limit=self.batch_size,
+                                                   lease_seconds=self.lease_seconds)
             
             if not posts:
                 logger.debug("Нет постов для публикации")
-                return
+                return 0
             
             logger.info(f"Найдено {len(posts)} постов для публикации")
+            started = time.monotonic()
             
+            # Один запрос на контент и каналы всей пачки вместо запросов на каждый пост
+            contents = self._load_contents(posts, db)
+            channels, default_channels = self._load_telegram_channels(posts, db)
+            telegram_service = None
+            
+            results: Dict[int, Dict[str, Any]] = {}
+            jobs: List[TelegramPublishJob] = []
             for post in posts:
                 try:
-                    self._publish_post(post, db, service)
+                    if post.platform.lower() == 'telegram' and telegram_service is None:
+                        from app.services.telegram_channel_service import TelegramChannelService
+                        telegram_service = TelegramChannelService(db)
+                    prepared = self._prepare_post(post, contents.get(post.content_id), channels, default_channels, db)
                 except Exception as e:
                     logger.error(f"Ошибка обработки поста {post.id}: {e}", exc_info=True)
-                    # Помечаем как failed
-                    try:
-                        service.mark_as_published(
-                            post.id,
-                            None,
-                            error_message=f"Критическая ошибка: {str(e)}"
-                        )
-                    except Exception as mark_error:
-                        logger.error(f"Не удалось пометить пост {post.id} как failed: {mark_error}")
+                    prepared = {'success': False, 'error': f"Критическая ошибка: {str(e)}"}
+                
+                if isinstance(prepared, TelegramPublishJob):
+                    jobs.append(prepared)
+                else:
+                    results[post.id] = prepared
+            
+            if jobs:
+                results.update(run_coroutine(self._with_lease_heartbeat(
+                    self._publish_telegram_jobs(jobs, telegram_service),
+                    [job.post_id for job in jobs]
+                )))
+            
+            self._write_results(posts, results, jobs, db, service, telegram_service)
+            
+            self.batches_count += 1
+            logger.info(
+                f"Пачка из {len(posts)} постов обработана за {time.monotonic() - started:.1f}s, "
+                f"опоздание p99={self.lateness.percentile(99)}s"
+            )
+            return len(posts)
             
         except Exception as e:
             logger.error(f"Критическая ошибка при обработке постов: {e}", exc_info=True)
+            return 0
         finally:
             if db:
                 db.close()
     
-    def _publish_post(self, post: ScheduledPostDB, db, service: ScheduledPostService):
+    def _get_next_deadline(self) -> Optional[datetime]:
+        db = get_db_session()
+        try:
+            return ScheduledPostService(db).get_next_deadline()
+        finally:
+            db.close()
+    
+    def _load_contents(self, posts: List[ScheduledPostDB], db) -> Dict[str, ContentPieceDB]:
+        """Загружает контент всех постов пачки одним запросом"""
+        content_ids = {post.content_id for post in posts}
+        contents = db.query(ContentPieceDB).filter(ContentPieceDB.id.in_(content_ids)).all()
+        return {content.id: content for content in contents}
+    
+    def _load_telegram_channels(self, posts: List[ScheduledPostDB], db) -> Tuple[Dict[int, Any], Dict[int, Any]]:
         """
-        Опубликовать один пост
+        Загружает Telegram каналы пачки: явно указанные и каналы по умолчанию
         
-        Args:
-            post: Запланированный пост
-            db: Сессия БД
-            service: ScheduledPostService
+        Returns:
+            (каналы по id, каналы по умолчанию по user_id)
         """
-        logger.info(f"Публикация поста {post.id} (content_id={post.content_id}, platform={post.platform})")
-        
-        # Получаем контент
-        content = db.query(ContentPieceDB).filter(
-            ContentPieceDB.id == post.content_id
-        ).first()
+        from app.models.telegram_channels import TelegramChannel
         
-        if not content:
-            logger.error(f"Контент {post.content_id} не найден для поста {post.id}")
-            service.mark_as_published(
-                post.id,
-                None,
-                error_message="Контент не найден"
-            )
-            return
+        telegram_posts = [post for post in posts if post.platform.lower() == 'telegram']
+        account_ids = {post.account_id for post in telegram_posts if post.account_id}
+        default_user_ids = {post.user_id for post in telegram_posts if not post.account_id}
         
-        # Проверяем что контент готов к публикации
-        if content.status != 'approved' and content.status != 'ready':
-            logger.warning(f"Контент {content.id} имеет статус {content.status}, но продолжаем публикацию")
+        channels = {}
+        if account_ids:
+            channels = {
+                channel.id: channel
+                for channel in db.query(TelegramChannel).filter(
+                    TelegramChannel.id.in_(account_ids),
+                    TelegramChannel.is_active == True
+                ).all()
+            }
         
-        # Публикуем через соответствующий сервис
-        try:
-            result = self._publish_to_platform(
-                post=post,
-                content=content,
-                db=db
-            )
-            
-            if result['success']:
-                logger.info(f"Пост {post.id} успешно опубликован: {result.get('platform_post_id', 'N/A')}")
-                service.mark_as_published(
-                    post.id,
-                    result.get('platform_post_id'),
-                    error_message=None
-                )
-            else:
-                error_msg = result.get('error', 'Неизвестная ошибка')
-                logger.error(f"Ошибка публикации поста {post.id}: {error_msg}")
-                service.mark_as_published(
-                    post.id,
-                    None,
-                    error_message=error_msg
-                )
+        default_channels = {}
+        if default_user_ids:
+            default_channels = {
+                channel.user_id: channel
+                for channel in db.query(TelegramChannel).filter(
+                    TelegramChannel.user_id.in_(default_user_ids),
+                    TelegramChannel.is_default == True,
+                    TelegramChannel.is_active == True
+                ).all()
+            }
         
-        except Exception as e:
-            logger.error(f"Исключение при публикации поста {post.id}: {e}", exc_info=True)
-            service.mark_as_published(
-                post.id,
-                None,
-                error_message=f"Исключение: {str(e)}"
-            )
+        return channels, default_channels
     
-    def _publish_to_platform(self, post: ScheduledPostDB, content: ContentPieceDB, db) -> dict:
+    def _prepare_post(self, post: ScheduledPostDB, content: Optional[ContentPieceDB],
+                      channels: Dict[int, Any], default_channels: Dict[int, Any],
+                      db) -> Union[TelegramPublishJob, Dict[str, Any]]:
         """
-        Публикация на платформу
+        Готовит пост к публикации
         
-        Args:
-            post: Запланированный пост
-            content: Контент для публикации
-            db: Сессия БД
-            
         Returns:
-            dict: {'success': bool, 'platform_post_id': str, 'error': str}
+            TelegramPublishJob для асинхронной отправки или готовый результат
+            {'success': bool, 'platform_post_id': str, 'error': str}
         """
+        logger.info(f"Публикация поста {post.id} (content_id={post.content_id}, platform={post.platform})")
+        
+        if not content:
+            logger.error(f"Контент {post.content_id} не найден для поста {post.id}")
+            return {'success': False, 'error': 'Контент не найден'}
+        
+        # Проверяем что контент готов к публикации
+        if content.status != 'approved' and content.status != 'ready':
+            logger.warning(f"Контент {content.id} имеет статус {content.status}, но продолжаем публикацию")
+        
         platform = post.platform.lower()
         
-        try:
-            if platform == 'telegram':
-                return self._publish_to_telegram(post, content, db)
-            elif platform == 'instagram':
-                return self._publish_to_instagram(post, content, db)
-            elif platform == 'twitter':
-                return self._publish_to_twitter(post, content, db)
+        if platform == 'telegram':
+            if post.account_id:
+                channel = channels.get(post.account_id)
+                if channel and channel.user_id != post.user_id:
+                    channel = None
             else:
-                return {
-                    'success': False,
-                    'error': f'Неподдерживаемая платформа: {platform}'
-                }
+                # Берем дефолтный канал пользователя
+                channel = default_channels.get(post.user_id)
+            return self._prepare_telegram(post, content, channel)
         
-        except Exception as e:
-            logger.error(f"Ошибка публикации на {platform}: {e}", exc_info=True)
+        if platform == 'instagram':
+            result = self._publish_to_instagram(post, content, db)
+        elif platform == 'twitter':
+            result = self._publish_to_twitter(post, content, db)
+        else:
             return {
                 'success': False,
-                'error': str(e)
+                'error': f'Неподдерживаемая платформа: {platform}'
             }
+        
+        if result.get('success'):
+            result['published_at'] = datetime.utcnow()
+        return result
     
-    def _publish_to_telegram(self, post: ScheduledPostDB, content: ContentPieceDB, db) -> dict:
-        """Публикация в Telegram"""
-        try:
-            import asyncio
-            from app.services.telegram_channel_service import TelegramChannelService
-            from app.models.telegram_channels import TelegramChannel
-            
-            # Получаем канал
-            if post.account_id:
-                channel = db.query(TelegramChannel).filter(
-                    TelegramChannel.id == post.account_id,
-                    TelegramChannel.user_id == post.user_id,
-                    TelegramChannel.is_active == True
-                ).first()
-            else:
-                # Берем дефолтный канал пользователя
-                service = TelegramChannelService(db)
-                channel = service.get_default_channel(post.user_id)
-            
-            if not channel:
-                return {
-                    'success': False,
-                    'error': 'Telegram канал не найден. Добавьте канал в настройках.'
-                }
-            
-            if not channel.is_verified:
-                return {
-                    'success': False,
-                    'error': f'Канал "{channel.channel_name}" не верифицирован. Добавьте бота @content4ubot в администраторы канала.'
-                }
-            
-            # Инициализируем сервис
-            service = TelegramChannelService(db)
-            
-            # Формируем текст сообщения через форматирование (как в publisher_agent)
-            # Убираем метаданные из текста
-            message_text = self._format_telegram_message(content)
-            
-            if not message_text or not message_text.strip():
-                # Fallback: если после форматирования ничего не осталось, используем базовый текст
-                logger.warning(f"Formatted message is empty for content {content.id}, using fallback")
-                message_text = content.text or content.title or ""
-            
-            # Проверяем наличие изображений
-            image_url = None
+    def _prepare_telegram(self, post: ScheduledPostDB, content: ContentPieceDB,
+                          channel) -> Union[TelegramPublishJob, Dict[str, Any]]:
+        """Проверяет канал и формирует сообщение для Telegram"""
+        if not channel:
+            return {
+                'success': False,
+                'error': 'Telegram канал не найден. Добавьте канал в настройках.'
+            }
+        
+        if not channel.is_verified:
+            return {
+                'success': False,
+                'error': f'Канал "{channel.channel_name}" не верифицирован. Добавьте бота @content4ubot в администраторы канала.'
+            }
+        
+        # Формируем текст сообщения через форматирование (как в publisher_agent)
+        # Убираем метаданные из текста
+        message_text = self._format_telegram_message(content)
+        
+        if not message_text or not message_text.strip():
+            # Fallback: если после форматирования ничего не осталось, используем базовый текст
+            logger.warning(f"Formatted message is empty for content {content.id}, using fallback")
+            message_text = content.text or content.title or ""
+        
+        return TelegramPublishJob(
+            post_id=post.id,
+            scheduled_time=post.scheduled_time,
+            channel_id=channel.id,
+            channel_name=channel.channel_name,
+            chat_id=channel.chat_id,
+            text=message_text,
+            image_url=self._extract_image_url(content)
+        )
+    
+    @staticmethod
+    def _extract_image_url(content: ContentPieceDB) -> Optional[str]:
+        """Возвращает первое изображение контента"""
+        if not content.media_urls:
+            logger.info(f"ℹ️ media_urls пуст для контента {content.id}")
+            return None
+        
+        if isinstance(content.media_urls, list):
             if content.media_urls:
-                if isinstance(content.media_urls, list) and len(content.media_urls) > 0:
-                    image_url = content.media_urls[0]  # Берем первое изображение
-                    logger.info(f"📸 Найдено изображение для публикации: {image_url}")
-                elif isinstance(content.media_urls, str):
-                    # Если media_urls - это строка (JSON)
-                    import json
-                    try:
-                        media_list = json.loads(content.media_urls)
-                        if isinstance(media_list, list) and len(media_list) > 0:
-                            image_url = media_list[0]
-                            logger.info(f"📸 Найдено изображение для публикации (из JSON строки): {image_url}")
-                    except:
-                        logger.warning(f"⚠️ Не удалось распарсить media_urls как JSON: {content.media_urls}")
-                else:
-                    logger.info(f"ℹ️ media_urls имеет неожиданный тип: {type(content.media_urls)}, значение: {content.media_urls}")
-            else:
-                logger.info(f"ℹ️ media_urls пуст для контента {content.id}")
-            
-            # Публикуем через TelegramChannelService (async метод)
-            logger.info(f"Публикация в канал '{channel.channel_name}' (chat_id={channel.chat_id})")
-            
-            # Если есть изображение - отправляем фото с подписью, иначе - просто текст
-            if image_url:
-                result = asyncio.run(service.send_photo(
-                    chat_id=channel.chat_id,
-                    photo_url=image_url,
-                    caption=message_text,
-                    parse_mode="HTML"
-                ))
-            else:
-                result = asyncio.run(service.send_message(
-                chat_id=channel.chat_id,
-                    text=message_text,
-                    parse_mode="HTML",
-                    disable_web_page_preview=False
-                ))
+                logger.info(f"📸 Найдено изображение для публикации: {content.media_urls[0]}")
+                return content.media_urls[0]
+            return None
+        
+        if isinstance(content.media_urls, str):
+            # Если media_urls - это строка (JSON)
+            try:
+                media_list = json.loads(content.media_urls)
+                if isinstance(media_list, list) and len(media_list) > 0:
+                    logger.info(f"📸 Найдено изображение для публикации (из JSON строки): {media_list[0]}")
+                    return media_list[0]
+            except ValueError:
+                logger.warning(f"⚠️ Не удалось распарсить media_urls как JSON: {content.media_urls}")
+            return None
+        
+        logger.info(f"ℹ️ media_urls имеет неожиданный тип: {type(content.media_urls)}, значение: {content.media_urls}")
+        return None
+    
+    async def _publish_telegram_jobs(self, jobs: List[TelegramPublishJob],
+                                     service) -> Dict[int, Dict[str, Any]]:
+        """
+        Конкурентно отправляет подготовленные посты в Telegram
+        
+        Одновременно не больше telegram_concurrency отправок всего и
+        channel_concurrency в один канал; общий лимит Bot API берется из
+        MCPConfig telegram (тот же ключ, что у TelegramMCP).
+        """
+        from app.mcp.config import get_mcp_config
+        
+        telegram_config = get_mcp_config('telegram')
+        bot_limit = telegram_config.get_rate_limit() if telegram_config else None
+        platform_semaphore = asyncio.Semaphore(self.telegram_concurrency)
+        channel_semaphores = defaultdict(lambda: asyncio.Semaphore(self.channel_concurrency))
+        
+        async def publish(job: TelegramPublishJob) -> Tuple[int, Dict[str, Any]]:
+            # Сначала слот канала, потом платформы: пост, ждущий свой канал, не занимает общий слот
+            async with channel_semaphores[job.chat_id], platform_semaphore:
+                if bot_limit:
+                    await rate_limiter.acquire('mcp:telegram', bot_limit)
+                
+                logger.info(f"Публикация в канал '{job.channel_name}' (chat_id={job.chat_id})")
+                try:
+                    # Если есть изображение - отправляем фото с подписью, иначе - просто текст
+                    if job.image_url:
+                        result = await service.send_photo(
+                            chat_id=job.chat_id,
+                            photo_url=job.image_url,
+                            caption=job.text,
+                            parse_mode="HTML"
+                        )
+                    else:
+                        result = await service.send_message(
+                            chat_id=job.chat_id,
+                            text=job.text,
+                            parse_mode="HTML",
+                            disable_web_page_preview=False
+                        )
+                except Exception as e:
+                    logger.error(f"Критическая ошибка публикации в Telegram: {e}", exc_info=True)
+                    result = {'success': False, 'error': str(e)}
             
             if result.get('success'):
-                message_data = result.get('data', {})
-                message_id = message_data.get('message_id')
-                
-                # Обновляем статистику канала
-                service.update_channel_stats(channel.id, post_success=True)
-                
-                logger.info(f"✅ Пост успешно опубликован в канал '{channel.channel_name}', message_id={message_id}")
-                
-                return {
+                message_id = (result.get('data') or {}).get('message_id')
+                logger.info(f"✅ Пост успешно опубликован в канал '{job.channel_name}', message_id={message_id}")
+                return job.post_id, {
                     'success': True,
-                    'platform_post_id': str(message_id) if message_id else None
+                    'platform_post_id': str(message_id) if message_id else None,
+                    'published_at': datetime.utcnow()
                 }
+            
+            error_msg = result.get('error') or 'Telegram API error'
+            logger.error(f"❌ Ошибка публикации в канал '{job.channel_name}': {error_msg}")
+            return job.post_id, {'success': False, 'error': error_msg}
+        
+        return dict(await asyncio.gather(*(publish(job) for job in jobs)))
+    
+    async def _with_lease_heartbeat(self, coro, post_ids: List[int]):
+        """Выполняет корутину, продлевая аренду постов каждую треть lease_seconds"""
+        async def heartbeat():
+            while True:
+                await asyncio.sleep(self.lease_seconds / 3)
+                try:
+                    await asyncio.to_thread(self._renew_leases, post_ids)
+                except Exception as e:
+                    logger.warning(f"Не удалось продлить аренду {len(post_ids)} постов: {e}")
+        
+        heartbeat_task = asyncio.create_task(heartbeat())
+        try:
+            return await coro
+        finally:
+            heartbeat_task.cancel()
+    
+    def _renew_leases(self, post_ids: List[int]):
+        db = get_db_session()
+        try:
+            ScheduledPostService(db).renew_leases(post_ids, self.worker_id, self.lease_seconds)
+        finally:
+            db.close()
+    
+    def _write_results(self, posts: List[ScheduledPostDB], results: Dict[int, Dict[str, Any]],
+                       jobs: List[TelegramPublishJob], db, service: ScheduledPostService, telegram_service):
+        """Пакетно записывает статусы постов и статистику каналов, обновляет метрики"""
+        for post in posts:
+            result = results.get(post.id)
+            if result is None:
+                continue
+            if result.get('success'):
+                self.published_count += 1
+                lateness = (result['published_at'] - post.scheduled_time).total_seconds()
+                self.lateness.observe(max(lateness, 0.0))
             else:
-                error_msg = result.get('error', 'Telegram API error')
-                logger.error(f"❌ Ошибка публикации в канал '{channel.channel_name}': {error_msg}")
-                
-                # Обновляем статистику канала с ошибкой
-                service.update_channel_stats(channel.id, post_success=False, error_message=error_msg)
-                
-                return {
-                    'success': False,
-                    'error': error_msg
-                }
+                self.failed_count += 1
         
+        try:
+            service.mark_many_as_published(results, worker_id=self.worker_id)
         except Exception as e:
-            logger.error(f"Критическая ошибка публикации в Telegram: {e}", exc_info=True)
-            return {
-                'success': False,
-                'error': str(e)
-            }
+            db.rollback()
+            logger.error(f"Не удалось записать результаты публикации {len(results)} постов: {e}", exc_info=True)
+            return
+        
+        if jobs and telegram_service:
+            outcomes = defaultdict(lambda: {'published': 0, 'last_error': None})
+            for job in jobs:
+                result = results.get(job.post_id, {})
+                if result.get('success'):
+                    outcomes[job.channel_id]['published'] += 1
+                else:
+                    outcomes[job.channel_id]['last_error'] = result.get('error')
+            try:
+                telegram_service.update_channels_stats(dict(outcomes))
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Не удалось обновить статистику каналов: {e}")
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика worker'а: счетчики и гистограмма опоздания публикаций"""
+        return {
+            "is_running": self.is_running,
+            "worker_id": self.worker_id,
+            "batch_size": self.batch_size,
+            "batches": self.batches_count,
+            "published": self.published_count,
+            "failed": self.failed_count,
+            "lateness_seconds": self.lateness.to_dict(),
+            "wakeup": self.wakeup.get_stats()
+        }
     
     def _format_telegram_message(self, content: ContentPieceDB) -> str:
         """Форматирует сообщение для Telegram (как в publisher_agent)"""
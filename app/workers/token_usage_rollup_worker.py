@@ -0,0 +1,80 @@
+"""
+Worker для построения дневных агрегатов token_usage
+Раз в сутки, вскоре после полуночи UTC, агрегирует закрытые дни в
+token_usage_daily (при первом запуске - всю историю). Пересчет идемпотентен,
+поэтому worker можно запускать в нескольких процессах.
+"""
+
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Optional
+
+from app.billing.services.token_usage_rollup import TokenUsageRollupService, day_start
+from app.database.connection import get_db_session
+from app.utils.wakeup import DeadlineWaiter
+
+logger = logging.getLogger(__name__)
+
+
+class TokenUsageRollupWorker:
+    """Worker для периодического пересчета token_usage_daily"""
+
+    def __init__(self, delay_seconds: Optional[int] = None, lookback_days: Optional[int] = None):
+        """
+        Args:
+            delay_seconds: задержка после полуночи UTC - время дописать записи
+                           прошедших суток из буфера TokenUsageRecorder
+            lookback_days: сколько последних дней пересчитывать повторно
+        """
+        self.delay_seconds = delay_seconds if delay_seconds is not None else int(
+            os.getenv("TOKEN_USAGE_ROLLUP_DELAY_SECONDS", "600")
+        )
+        self.lookback_days = lookback_days
+        self.is_running = False
+        self._thread: Optional[threading.Thread] = None
+        self.wakeup = DeadlineWaiter("token_usage_rollup", base_interval=3600, max_interval=86400)
+        logger.info("TokenUsageRollupWorker инициализирован")
+
+    def start(self):
+        """Запустить worker в отдельном потоке"""
+        if self.is_running:
+            logger.warning("TokenUsageRollupWorker уже запущен")
+            return
+
+        self.is_running = True
+        self.wakeup.reset()
+        self._thread = threading.Thread(target=self._run_loop, daemon=True, name="TokenUsageRollupWorker")
+        self._thread.start()
+        logger.info("TokenUsageRollupWorker запущен")
+
+    def stop(self):
+        """Остановить worker"""
+        self.is_running = False
+        self.wakeup.stop()
+        if self._thread:
+            self._thread.join(timeout=5)
+        logger.info("TokenUsageRollupWorker остановлен")
+
+    def _run_loop(self):
+        """Основной цикл worker'а"""
+        while self.is_running:
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Ошибка в TokenUsageRollupWorker: {e}", exc_info=True)
+
+            self.wakeup.wait(self._next_run_at())
+
+    def run_once(self):
+        """Агрегировать закрытые дни"""
+        db = get_db_session()
+        try:
+            return TokenUsageRollupService(db).compact(lookback_days=self.lookback_days)
+        finally:
+            db.close()
+
+    def _next_run_at(self) -> datetime:
+        tomorrow = datetime.utcnow().date() + timedelta(days=1)
+        return day_start(tomorrow) + timedelta(seconds=self.delay_seconds)
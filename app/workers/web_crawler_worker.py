@@ -2,22 +2,28 @@
 Web Crawler Worker для мониторинга источников контента
 """
 
+import asyncio
 import logging
 import threading
 import time
-import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, List, Optional, Any
-import requests
+from typing import Dict, List, Optional, Any, Set, Tuple
+import httpx
 from openai import AsyncOpenAI
 import os
 
 from app.services.content_source_service import ContentSourceService, MonitoredItemService, SourceCheckHistoryService
-from app.services.content_extractor import ContentExtractor, ChangeDetector, RSSParser
+from app.services.content_extractor import ContentExtractor, ChangeDetector, RSSParser, get_discovery_cache
+from app.services.feed_parser import aiter_feed_items
 from app.services.scheduled_post_service import ScheduledPostService
 from app.services.production_calendar_service import ProductionCalendarService
-from app.database.connection import get_db_session
+from app.database.connection import get_db_session, worker_session
 from app.models.content_sources import ContentSource
+from app.utils.event_loop import BackgroundEventLoop
+from app.utils.http_clients import get_http_clients
+from app.utils.wakeup import WEB_CRAWLER, DeadlineWaiter
+from app.workers.crawl_engine import CrawlEngine, FetchStats, conditional_headers, fetch_result
 
 logger = logging.getLogger(__name__)
 
@@ -28,11 +34,15 @@ class WebCrawlerWorker:
     def __init__(self, check_interval: int = 60):
         """
         Args:
-            check_interval: Интервал проверки в секундах (по умолчанию 60)
+            check_interval: Интервал опроса без активных источников в секундах (по умолчанию 60),
+                            растет в простое до SCHEDULER_MAX_SLEEP_SECONDS
         """
         self.check_interval = check_interval
         self.running = False
         self.thread = None
+        # Ближайшая проверка - next_check_at; минимальный сон больше, чем у публикаций,
+        # чтобы источник с постоянно падающей проверкой не крутил цикл
+        self.wakeup = DeadlineWaiter(WEB_CRAWLER, base_interval=check_interval, min_interval=5.0)
         self.openai_client = None
         
         # Инициализируем OpenAI клиент
@@ -45,6 +55,26 @@ class WebCrawlerWorker:
         self.content_extractor = ContentExtractor(self.openai_client)
         self.change_detector = ChangeDetector()
         
+        # Сколько последних элементов ленты обрабатывается за проверку
+        self.max_items_per_feed = int(os.getenv('WEB_CRAWLER_MAX_ITEMS_PER_FEED', '20'))
+        
+        # Наступившие источники проверяются конкурентно с лимитами по хостам
+        self.engine = CrawlEngine(
+            self._check_source,
+            lambda limit, exclude_ids: ContentSourceService.get_sources_to_check(
+                limit=limit, exclude_ids=exclude_ids
+            )
+        )
+        self.fetch_stats = FetchStats()
+        # Свой event loop: проверки не задерживают Flask views, ожидающие общий
+        # loop процесса (run_coroutine)
+        self.loop = BackgroundEventLoop(name=f"web-crawler-loop-{os.getpid()}")
+        # Синхронные обращения к БД идут в отдельных потоках, а не в потоке loop:
+        # их число ограничено, чтобы проверки не выбирали весь пул соединений
+        self.db_threads = int(os.getenv('WEB_CRAWLER_DB_THREADS', '4'))
+        self._db_executor: Optional[ThreadPoolExecutor] = None
+        self._db_executor_lock = threading.Lock()
+        
         logger.info(f"WebCrawlerWorker initialized with check_interval={check_interval}s")
     
     def start(self):
@@ -54,6 +84,8 @@ class WebCrawlerWorker:
             return
         
         self.running = True
+        self.wakeup.reset()
+        self.engine.resume()
         self.thread = threading.Thread(target=self._run, daemon=True)
         self.thread.start()
         logger.info("WebCrawlerWorker started")
@@ -61,35 +93,105 @@ class WebCrawlerWorker:
     def stop(self):
         """Остановка worker"""
         self.running = False
+        self.engine.stop()
+        self.wakeup.stop()
         if self.thread:
             self.thread.join(timeout=10)
+        self.loop.stop()
+        with self._db_executor_lock:
+            if self._db_executor is not None:
+                self._db_executor.shutdown(wait=False)
+                self._db_executor = None
         logger.info("WebCrawlerWorker stopped")
     
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики обхода: пропускная способность, очередь, хосты"""
+        return {
+            'is_running': self.running,
+            'engine': self.engine.get_stats(),
+            'http_cache': {
+                **self.fetch_stats.get_stats(),
+                'discovery_cache': get_discovery_cache().get_stats()
+            },
+            'wakeup': self.wakeup.get_stats(),
+            'event_loop': self.loop.get_stats()
+        }
+    
     def _run(self):
         """Основной цикл worker"""
         logger.info("WebCrawlerWorker main loop started")
         
         while self.running:
+            next_check_at = None
             try:
-                # Получаем источники для проверки
-                sources = ContentSourceService.get_sources_to_check(limit=10)
-                
-                if sources:
-                    logger.info(f"Found {len(sources)} sources to check")
-                    
-                    for source in sources:
-                        if not self.running:
-                            break
-                        
-                        # Проверяем источник
-                        asyncio.run(self._check_source(source))
+                # Проверяем все наступившие источники (конкурентно, в event loop краулера)
+                self.loop.submit(self.engine.run_once())
                 
-                # Ждем перед следующей итерацией
-                time.sleep(self.check_interval)
+                next_check_at = ContentSourceService.get_next_check_at()
                 
             except Exception as e:
                 logger.error(f"Error in WebCrawlerWorker main loop: {e}", exc_info=True)
-                time.sleep(self.check_interval)
+            
+            # Спим до ближайшей проверки (или до добавления источника)
+            self.wakeup.wait(next_check_at)
+    
+    def _get_db_executor(self) -> ThreadPoolExecutor:
+        with self._db_executor_lock:
+            if self._db_executor is None:
+                self._db_executor = ThreadPoolExecutor(
+                    max_workers=self.db_threads, thread_name_prefix="web-crawler-db"
+                )
+            return self._db_executor
+    
+    async def _db(self, func, *args, **kwargs):
+        """Синхронный вызов сервисов БД в потоке пула: все get_db_session() внутри делят одну сессию"""
+        def run():
+            with worker_session():
+                return func(*args, **kwargs)
+        
+        return await asyncio.get_running_loop().run_in_executor(self._get_db_executor(), run)
+    
+    async def _fetch(self, method: str, url: str, timeout: float = 30, **kwargs) -> httpx.Response:
+        """HTTP запрос краулера: общий клиент, лимит одновременных запросов и пауза на хост"""
+        async with self.engine.hosts.slot(url):
+            async with get_http_clients().async_client(timeout=timeout) as client:
+                return await client.request(method, url, follow_redirects=True, **kwargs)
+    
+    async def _fetch_conditional(self, source, url: str, headers: Optional[Dict[str, str]] = None,
+                                 timeout: float = 30) -> Tuple[httpx.Response, Dict[str, Any]]:
+        """GET с If-None-Match / If-Modified-Since по сохраненным валидаторам источника"""
+        conditional = conditional_headers(source.http_validators, url)
+        response = await self._fetch('GET', url, timeout=timeout, headers={**(headers or {}), **conditional})
+        result = fetch_result(url, response, source.http_validators)
+        self.fetch_stats.record(bool(conditional), result)
+        return response, result
+    
+    async def _stream_feed(self, source, url: str, known_ids: Set[str],
+                           timeout: float = 30) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Условный GET ленты с разбором по мере загрузки
+        
+        Загрузка прекращается после max_items_per_feed элементов или на уже
+        сохраненных элементах - остаток большой ленты не скачивается.
+        """
+        conditional = conditional_headers(source.http_validators, url)
+        feed_items = []
+        async with self.engine.hosts.slot(url):
+            async with get_http_clients().async_client(timeout=timeout) as client:
+                async with client.stream('GET', url, headers=conditional, follow_redirects=True) as response:
+                    if response.status_code != 304:
+                        response.raise_for_status()
+                        async for feed_item in aiter_feed_items(
+                            response.aiter_bytes(),
+                            limit=self.max_items_per_feed,
+                            known_ids=known_ids,
+                            encoding=response.encoding
+                        ):
+                            feed_items.append(feed_item)
+        
+        result = fetch_result(url, response, source.http_validators)
+        self.fetch_stats.record(bool(conditional), result)
+        return feed_items, result
     
     async def _check_source(self, source):
         """Проверка одного источника контента"""
@@ -119,23 +221,31 @@ class WebCrawlerWorker:
             items_posted = result.get('items_posted', 0)
             
             # Обновляем статус источника
-            ContentSourceService.update_check_status(
+            await self._db(
+                ContentSourceService.update_check_status,
                 source.id,
                 status='success',
                 items_found=items_found,
-                items_new=items_new
+                items_new=items_new,
+                http_validators=result.get('http_validators'),
+                changed=result.get('changed')
             )
             
             # Сохраняем историю проверки
             execution_time = int((time.time() - start_time) * 1000)
-            SourceCheckHistoryService.create_history(
+            await self._db(
+                SourceCheckHistoryService.create_history,
                 source_id=source.id,
                 items_found=items_found,
                 items_new=items_new,
                 items_duplicate=items_duplicate,
                 items_posted=items_posted,
                 status='success',
-                execution_time_ms=execution_time
+                execution_time_ms=execution_time,
+                http_status=result.get('http_status'),
+                not_modified=result.get('not_modified', False),
+                bytes_downloaded=result.get('bytes_downloaded', 0),
+                bytes_saved=result.get('bytes_saved', 0)
             )
             
             logger.info(f"Source {source.id} checked successfully: {items_new} new items, {items_posted} posts created")
@@ -153,7 +263,8 @@ class WebCrawlerWorker:
             # Обновляем статус, но не показываем технические ошибки пользователю
             # Вместо этого просто отмечаем как "нет новых новостей"
             try:
-                ContentSourceService.update_check_status(
+                await self._db(
+                    ContentSourceService.update_check_status,
                     source.id,
                     status='success',  # Показываем как успех, чтобы не пугать пользователя
                     items_found=0,
@@ -162,7 +273,8 @@ class WebCrawlerWorker:
             
                 # Сохраняем историю
                 execution_time = int((time.time() - start_time) * 1000)
-                SourceCheckHistoryService.create_history(
+                await self._db(
+                    SourceCheckHistoryService.create_history,
                     source_id=source.id,
                     items_found=0,
                     items_new=0,
@@ -182,7 +294,7 @@ class WebCrawlerWorker:
                 'items_posted': 0
             }
     
-    async def _check_rss_source(self, source) -> Dict[str, int]:
+    async def _check_rss_source(self, source) -> Dict[str, Any]:
         """Проверка RSS источника"""
         items_found = 0
         items_new = 0
@@ -190,67 +302,69 @@ class WebCrawlerWorker:
         items_posted = 0
         
         try:
-            # Загружаем RSS ленту
-            response = requests.get(source.url, timeout=30)
-            response.raise_for_status()
-            
-            # Парсим RSS
-            feed_items = RSSParser.parse_feed(response.text)
+            # Загружаем и разбираем RSS ленту потоком (условно: без изменений сервер ответит 304 без тела)
+            known_ids = await self._db(MonitoredItemService.get_recent_external_ids, source.id)
+            feed_items, fetch = await self._stream_feed(source, source.url, known_ids)
+            if fetch['not_modified']:
+                logger.info(f"RSS source {source.id}: not modified (304)")
+                return {
+                    'items_found': 0,
+                    'items_new': 0,
+                    'items_duplicate': 0,
+                    'items_posted': 0,
+                    **fetch
+                }
             items_found = len(feed_items)
             
             logger.info(f"RSS source {source.id}: found {items_found} items")
             
-            # Обрабатываем каждый элемент
-            for feed_item in feed_items[:20]:  # Берем максимум 20 последних
-                # Проверяем на дубликат
-                external_id = feed_item.get('external_id')
-                url = feed_item.get('url')
-                
-                duplicate = MonitoredItemService.check_duplicate(source.id, external_id, url)
-                if duplicate:
-                    items_duplicate += 1
-                    continue
-                
-                # Применяем фильтры по ключевым словам
-                if not self._matches_filters(feed_item, source):
-                    continue
-                
-                # Создаем новый элемент
-                monitored_item = MonitoredItemService.create_item(
-                    source_id=source.id,
-                    user_id=source.user_id,
-                    title=feed_item.get('title', 'Untitled'),
-                    content=feed_item.get('content', ''),
-                    summary=feed_item.get('summary', ''),
-                    url=url,
-                    author=feed_item.get('author'),
-                    external_id=external_id,
-                    status='new',
-                    raw_data=feed_item,
-                    relevance_score=0.7  # Базовая релевантность для RSS
-                )
-                
-                if monitored_item:
-                    items_new += 1
-                    
-                    # Если включен автопостинг, создаем отложенный пост
-                    if source.auto_post_enabled:
-                        posted = await self._create_scheduled_post(source, monitored_item, feed_item)
-                        if posted:
-                            items_posted += 1
+            # Дубликаты ищем одним запросом на всю пачку, новые элементы вставляем одним батчем
+            new_items, items_duplicate = await self._db(MonitoredItemService.split_duplicates, source.id, feed_items)
+            
+            rows = [
+                {
+                    'title': feed_item.get('title', 'Untitled'),
+                    'content': feed_item.get('content', ''),
+                    'summary': feed_item.get('summary', ''),
+                    'url': feed_item.get('url'),
+                    'author': feed_item.get('author'),
+                    'external_id': feed_item.get('external_id'),
+                    'status': 'new',
+                    'raw_data': feed_item,
+                    'relevance_score': 0.7  # Базовая релевантность для RSS
+                }
+                for feed_item in new_items
+                if self._matches_filters(feed_item, source)
+            ]
+            # Ошибка вставки пробрасывается: валидаторы ответа не сохраняются, и следующая
+            # проверка загрузит ленту заново, а не получит 304 с потерянными элементами
+            created, skipped = await self._db(MonitoredItemService.bulk_create_items, source.id, source.user_id, rows)
+            items_new = len(created)
+            items_duplicate += skipped
+            # Для расписания лента изменилась, если в ней есть новые элементы (даже не прошедшие фильтры)
+            changed = len(new_items) > skipped
+            
+            # Если включен автопостинг, создаем отложенные посты
+            if source.auto_post_enabled:
+                for monitored_item in created:
+                    posted = await self._create_scheduled_post(source, monitored_item, monitored_item.raw_data)
+                    if posted:
+                        items_posted += 1
             
             return {
                 'items_found': items_found,
                 'items_new': items_new,
                 'items_duplicate': items_duplicate,
-                'items_posted': items_posted
+                'items_posted': items_posted,
+                'changed': changed,
+                **fetch
             }
             
         except Exception as e:
             logger.error(f"Error checking RSS source {source.id}: {e}")
             raise
     
-    async def _check_source_smart(self, source) -> Dict[str, int]:
+    async def _check_source_smart(self, source) -> Dict[str, Any]:
         """
         Умная проверка источника: автоматически определяет RSS или использует краулер
         Не показывает ошибки пользователю, пробует все варианты
@@ -263,9 +377,8 @@ class WebCrawlerWorker:
         try:
             # 1. Пробуем найти RSS на странице
             logger.info(f"Smart check for source {source.id}: trying to discover RSS feed...")
-            # discover_rss_feed может работать синхронно, но оборачиваем в try-except для безопасности
             try:
-                rss_url = RSSParser.discover_rss_feed(source.url)
+                rss_url = await RSSParser.discover_rss_feed_async(source.url, self._fetch)
             except Exception as e:
                 logger.warning(f"Error discovering RSS feed: {e}, will use crawler")
                 rss_url = None
@@ -284,26 +397,14 @@ class WebCrawlerWorker:
                     
                     # Если RSS сработал - обновляем тип источника для будущих проверок
                     if items_new > 0:
-                        db = get_db_session()
-                        try:
-                            source_obj = db.query(ContentSource).filter(ContentSource.id == source.id).first()
-                            if source_obj:
-                                source_obj.source_type = 'rss'
-                                source_obj.url = rss_url
-                                db.commit()
-                                logger.info(f"Updated source {source.id} to RSS type with URL {rss_url}")
-                        finally:
-                            db.close()
+                        await self._db(self._switch_to_rss, source.id, rss_url)
                     
-                    return {
-                        'items_found': items_found,
-                        'items_new': items_new,
-                        'items_duplicate': items_duplicate,
-                        'items_posted': items_posted
-                    }
+                    return result
                 except Exception as e:
                     logger.warning(f"RSS method failed for {rss_url}, trying crawler: {e}")
                     source.url = original_url
+                    # Найденная лента (возможно, из кеша) не работает - при следующей проверке ищем заново
+                    RSSParser.forget_discovered_feed(original_url)
                     # Продолжаем с краулером
             
             # 2. Если RSS не найден или не сработал - используем краулер
@@ -321,7 +422,21 @@ class WebCrawlerWorker:
                 'items_posted': 0
             }
     
-    async def _check_website_source(self, source) -> Dict[str, int]:
+    @staticmethod
+    def _switch_to_rss(source_id: int, rss_url: str):
+        """Переводит источник на найденную RSS ленту"""
+        db = get_db_session()
+        try:
+            source_obj = db.query(ContentSource).filter(ContentSource.id == source_id).first()
+            if source_obj:
+                source_obj.source_type = 'rss'
+                source_obj.url = rss_url
+                db.commit()
+                logger.info(f"Updated source {source_id} to RSS type with URL {rss_url}")
+        finally:
+            db.close()
+    
+    async def _check_website_source(self, source) -> Dict[str, Any]:
         """Проверка website источника с помощью crawler"""
         items_found = 0
         items_new = 0
@@ -338,13 +453,14 @@ class WebCrawlerWorker:
             ]
             
             html = None
+            fetch = None
             last_error = None
             
             for user_agent in user_agents:
                 try:
-                    response = requests.get(
-                        source.url, 
-                        timeout=30, 
+                    response, fetch = await self._fetch_conditional(
+                        source,
+                        source.url,
                         headers={
                             'User-Agent': user_agent,
                             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
@@ -352,14 +468,23 @@ class WebCrawlerWorker:
                             'Accept-Encoding': 'gzip, deflate, br',
                             'Connection': 'keep-alive',
                             'Upgrade-Insecure-Requests': '1'
-                        },
-                        allow_redirects=True
+                        }
                     )
+                    if fetch['not_modified']:
+                        # Страница не менялась - ни разбора, ни AI извлечения
+                        logger.info(f"📄 Источник {source.id} ({source.name}): не изменился (304)")
+                        return {
+                            'items_found': 0,
+                            'items_new': 0,
+                            'items_duplicate': 0,
+                            'items_posted': 0,
+                            **fetch
+                        }
                     response.raise_for_status()
                     html = response.text
                     logger.info(f"Successfully loaded {source.url} with User-Agent: {user_agent[:50]}...")
                     break
-                except requests.exceptions.HTTPError as e:
+                except httpx.HTTPStatusError as e:
                     if e.response.status_code == 403:
                         last_error = f"403 Forbidden (попытка с User-Agent: {user_agent[:30]}...)"
                         logger.warning(f"403 Forbidden for {source.url} with User-Agent: {user_agent[:50]}..., пробуем следующий...")
@@ -376,39 +501,45 @@ class WebCrawlerWorker:
             if not html:
                 raise Exception(f"Не удалось загрузить страницу после всех попыток. Последняя ошибка: {last_error}")
             
-            # Проверяем изменения
-            changes = self.change_detector.detect_changes(
+            # Проверяем изменения (разбор страницы на блоки - CPU, вне event loop)
+            changes = await asyncio.to_thread(
+                self.change_detector.detect_changes,
                 html,
                 source.last_snapshot_data
             )
             
+            if changes.get('snapshot_updated'):
+                # Снимок сохраняется и без новых блоков: отпечатки слегка измененных блоков обновляются
+                await self._db(
+                    ContentSourceService.save_snapshot, source.id, changes.get('new_hash'), changes.get('snapshot')
+                )
+            
             if not changes.get('has_changes'):
-                logger.info(f"📄 Источник {source.id} ({source.name}): изменений не обнаружено (первая проверка или контент не изменился)")
-                logger.info(f"💡 Подсказка: При первой проверке система сохраняет снимок страницы. Новости будут найдены при следующей проверке, если контент изменится")
+                logger.info(f"📄 Источник {source.id} ({source.name}): новых блоков не обнаружено "
+                            f"(блоков на странице: {changes.get('blocks_total', 0)})")
                 return {
                     'items_found': 0,
                     'items_new': 0,
                     'items_duplicate': 0,
-                    'items_posted': 0
+                    'items_posted': 0,
+                    'changed': False,
+                    **fetch
                 }
             
-            logger.info(f"✅ Источник {source.id} ({source.name}): обнаружены изменения, извлекаем контент...")
-            
-            # Сохраняем новый снимок
-            ContentSourceService.save_snapshot(
-                source.id,
-                changes.get('new_hash'),
-                {'hash': changes.get('new_hash'), 'timestamp': datetime.utcnow().isoformat()}
+            new_html = changes.get('new_html')
+            logger.info(
+                f"✅ Источник {source.id} ({source.name}): новых блоков "
+                f"{len(changes.get('new_blocks', []))} из {changes.get('blocks_total', 0)}, извлекаем контент..."
             )
             
-            # Извлекаем контент с помощью AI
+            # Извлекаем контент с помощью AI - только из новых блоков страницы
             extraction_hints = {
                 'keywords': source.keywords,
                 'categories': source.categories
             }
             
             extracted_data = await self.content_extractor.extract_from_html(
-                html,
+                new_html or html,
                 source.url,
                 extraction_hints
             )
@@ -423,10 +554,11 @@ class WebCrawlerWorker:
             items_found = 1
             
             # Проверяем на дубликат по URL
-            duplicate = MonitoredItemService.check_duplicate(source.id, None, source.url)
+            duplicate = await self._db(MonitoredItemService.check_duplicate, source.id, None, source.url)
             if duplicate:
                 # Обновляем существующий элемент если контент изменился
-                MonitoredItemService.update_item_status(
+                await self._db(
+                    MonitoredItemService.update_item_status,
                     duplicate.id,
                     status='new',
                     content=extracted_data.get('content', ''),
@@ -437,7 +569,8 @@ class WebCrawlerWorker:
                 items_duplicate += 1
             else:
                 # Создаем новый элемент
-                monitored_item = MonitoredItemService.create_item(
+                monitored_item = await self._db(
+                    MonitoredItemService.create_item,
                     source_id=source.id,
                     user_id=source.user_id,
                     title=extracted_data.get('title', 'Untitled'),
@@ -477,7 +610,9 @@ class WebCrawlerWorker:
                 'items_found': items_found,
                 'items_new': items_new,
                 'items_duplicate': items_duplicate,
-                'items_posted': items_posted
+                'items_posted': items_posted,
+                'changed': True,
+                **fetch
             }
             
         except Exception as e:
@@ -523,6 +658,15 @@ class WebCrawlerWorker:
             logger.debug(f"Автопостинг выключен для источника {source.id}, пропускаем создание поста")
             return False
         
+        return await self._db(self._save_scheduled_post, source, monitored_item, extracted_data)
+    
+    def _save_scheduled_post(
+        self,
+        source,
+        monitored_item,
+        extracted_data: Dict[str, Any]
+    ) -> bool:
+        """Сохранение контента и отложенного поста (в потоке БД)"""
         db = get_db_session()
         try:
             # Сначала создаем контент из новости
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк AuthService.verify_token при росте таблицы user_sessions
+Сравнивает прежнюю проверку (чтение всех сессий + поиск по jti + commit
+last_used на каждый запрос) с кэшированной: промах кэша (один индексный
+запрос) и попадание (без БД).
+
+Запуск:
+    python benchmarks/bench_auth_verify.py [--sizes 1000,100000,1000000] [--db bench_auth.db]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import jwt
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from app.auth.models.user import User, UserSession, UserStatus
+from app.auth.services.auth_service import AuthService
+from app.auth.services.token_cache import LastUsedBuffer, LocalTokenCache, TokenCache
+from app.database.connection import Base, import_all_models
+
+SECRET = "bench-secret-key-for-auth-verify-benchmark"
+USERS = 1000
+LOOKUPS = 200
+# Прежняя проверка читает всю таблицу - на больших размерах меряем несколько вызовов
+LEGACY_LOOKUPS = {1000: 50, 100000: 5}
+
+
+def legacy_verify(db, token: str) -> bool:
+    """Копия прежней проверки: все сессии в память, поиск по jti, commit last_used"""
+    payload = jwt.decode(token, SECRET, algorithms=["HS256"])
+    db.query(UserSession).all()
+    session = db.query(UserSession).filter(
+        UserSession.token_jti == payload["jti"],
+        UserSession.is_active == True
+    ).first()
+    user = session.user
+    if not user.is_active:
+        return False
+    session.update_last_used()
+    db.commit()
+    return True
+
+
+def fill_sessions(engine, total: int, start: int) -> List[str]:
+    """Дописывает сессии до total; возвращает jti для замеров"""
+    now = datetime.utcnow()
+    expires = now + timedelta(days=30)
+    batch = []
+    for index in range(start, total):
+        batch.append({
+            "user_id": index % USERS + 1,
+            "token_jti": f"jti-{index}",
+            "refresh_token": f"refresh-{index}",
+            "is_active": True,
+            "expires_at": expires,
+            "created_at": now,
+            "last_used": now
+        })
+        if len(batch) == 50000:
+            with engine.begin() as conn:
+                conn.execute(insert(UserSession.__table__), batch)
+            batch = []
+    if batch:
+        with engine.begin() as conn:
+            conn.execute(insert(UserSession.__table__), batch)
+    return [f"jti-{index}" for index in range(0, total, max(total // LOOKUPS, 1))][:LOOKUPS]
+
+
+def make_token(jti: str, user_id: int) -> str:
+    now = datetime.utcnow()
+    return jwt.encode({
+        "user_id": user_id, "email": f"user{user_id}@example.com", "role": "user",
+        "jti": jti, "type": "access", "iat": now, "exp": now + timedelta(minutes=30)
+    }, SECRET, algorithm="HS256")
+
+
+def measure(fn, tokens: List[str]) -> Dict[str, float]:
+    timings = []
+    for token in tokens:
+        started = time.perf_counter()
+        assert fn(token)
+        timings.append((time.perf_counter() - started) * 1e6)
+    timings.sort()
+    return {
+        "p50": statistics.median(timings),
+        "p99": timings[min(int(len(timings) * 0.99), len(timings) - 1)]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="1000,100000,1000000")
+    parser.add_argument("--db", default=None, help="путь к SQLite файлу (по умолчанию временный)")
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.CRITICAL)
+
+    path = args.db or os.path.join(tempfile.mkdtemp(), "bench_auth.db")
+    engine = create_engine(f"sqlite:///{path}")
+    import_all_models()
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+
+    db = Session()
+    db.add_all([
+        User(id=i, email=f"user{i}@example.com", username=f"user{i}",
+             password_hash="x", status=UserStatus.ACTIVE)
+        for i in range(1, USERS + 1)
+    ])
+    db.commit()
+
+    print(f"{'sessions':>9} | {'legacy p50':>11} | {'miss p50':>9} | {'miss p99':>9} | "
+          f"{'hit p50':>8} | {'hit p99':>8}")
+    print("-" * 70)
+
+    filled = 0
+    for size in (int(s) for s in args.sizes.split(",")):
+        jtis = fill_sessions(engine, size, filled)
+        filled = size
+        tokens = [make_token(jti, int(jti.split("-")[1]) % USERS + 1) for jti in jtis]
+
+        legacy_count = LEGACY_LOOKUPS.get(size, 0)
+        legacy = "skipped"
+        if legacy_count:
+            legacy_db = Session()
+            legacy = f"{measure(lambda t: legacy_verify(legacy_db, t), tokens[:legacy_count])['p50']:.0f}us"
+            legacy_db.close()
+
+        service = AuthService(
+            Session(), SECRET, email_service=None,
+            session_cache=TokenCache(LocalTokenCache(ttl=600, max_entries=100000)),
+            last_used=LastUsedBuffer(flush_interval=60)
+        )
+        verify = lambda t: service.verify_token(t)[0]
+        miss = measure(verify, tokens)
+        hit = measure(verify, tokens)
+        service.db.close()
+
+        print(f"{size:>9} | {legacy:>11} | {miss['p50']:>7.0f}us | {miss['p99']:>7.0f}us | "
+              f"{hit['p50']:>6.0f}us | {hit['p99']:>6.0f}us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк определения изменений на website источниках (WebCrawlerWorker._check_website_source)
+Симуляция проверок новостной страницы: на каждой проверке меняются время
+обновления, счетчики просмотров и рекламный баннер, изредка сверху
+появляется новая статья. Сравнивается прежний MD5 всей страницы (любое
+изменение - AI извлечение 15 КБ очищенного HTML) с поблочным ChangeDetector
+(извлечение только новых блоков): число вызовов LLM и размер промптов.
+
+Запуск:
+    python benchmarks/bench_change_detection.py [--checks 200] [--new-every 10] [--articles 30]
+"""
+
+import argparse
+import hashlib
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.services.content_extractor import ChangeDetector, ContentExtractor
+
+SUBJECTS = ["мэрия", "правительство", "школа", "больница", "театр", "стадион", "университет", "музей", "завод", "парк"]
+PLACES = ["в центре", "на окраине", "в Заречном районе", "у вокзала", "на набережной", "в новом микрорайоне",
+          "в Северном округе", "в пригороде"]
+EVENTS = ["объявила о запуске программы", "подвела итоги года", "открыла новый корпус", "получила грант",
+          "провела конкурс", "изменила режим работы", "начала ремонт", "пригласила волонтеров"]
+ADS = ["Кредит под 0% на первый месяц", "Новые квартиры у метро", "Скидки на шины до 40%", "Курсы английского онлайн"]
+TEXT = "Как сообщили в пресс-службе, решение принято после обсуждения с жителями и экспертами. "
+
+
+def make_article(rng: random.Random):
+    title = f"{rng.choice(SUBJECTS).capitalize()} {rng.choice(PLACES)} {rng.choice(EVENTS)}"
+    return title, f"{title}. " + TEXT * rng.randint(2, 5)
+
+
+def render(articles, check: int, rng: random.Random) -> str:
+    stamp = f"{8 + check // 60 % 12:02d}:{check % 60:02d}"
+    cards = "".join(
+        f'<article class="news-card" data-id="{n}"><h2 class="title"><a href="/news/{n}" class="link">{title}</a></h2>'
+        f'<div class="meta"><time datetime="2026-10-16">16 октября 2026, {stamp}</time> '
+        f'<span class="views">{rng.randint(10, 5000)} просмотров</span></div>'
+        f'<img src="/img/{n}.jpg" class="thumb" loading="lazy"><p class="lead">{body}</p></article>'
+        for n, (title, body) in articles
+    )
+    return f"""<!DOCTYPE html><html><head><title>Новости города</title>
+<style>{'.card{margin:0;padding:4px}' * 200}</style><script>{'window.dataLayer.push({});' * 200}</script></head><body>
+<header class="site-header"><a href="/">Городской портал</a><span>Обновлено в {stamp}</span></header>
+<nav><ul>{''.join(f'<li><a href="/r/{i}">Раздел {i}</a></li>' for i in range(20))}</ul></nav>
+<div class="banner-top"><a href="/ad">{rng.choice(ADS)}</a></div>
+<main class="content"><div class="news-list">{cards}</div>
+<aside><h3>Популярное</h3><ul>{''.join(f'<li>Материал {rng.randint(1, 999)}</li>' for _ in range(5))}</ul></aside></main>
+<footer><p>© 2026 Городской портал. Все права защищены. Возрастное ограничение 16+</p></footer></body></html>"""
+
+
+def prompt_chars(extractor: ContentExtractor, html: str) -> int:
+    """Размер промпта extract_from_html"""
+    clean = extractor._clean_html(html)
+    if len(clean) > 15000:
+        clean = clean[:15000] + "..."
+    return len(extractor._build_extraction_prompt(clean, "https://news.example.com/", None))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--checks", type=int, default=200)
+    parser.add_argument("--new-every", type=int, default=10, help="в среднем проверок между новыми статьями")
+    parser.add_argument("--articles", type=int, default=30, help="статей на странице")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    extractor = ContentExtractor()
+    detector = ChangeDetector()
+    articles = [(n, make_article(rng)) for n in range(args.articles)]
+    next_id = args.articles
+
+    old_hash, snapshot = None, None
+    stats = {"md5": [0, 0, 0.0], "blocks": [0, 0, 0.0]}  # вызовов LLM, символов промптов, время
+    published = 0
+    for check in range(args.checks):
+        if check and rng.random() < 1 / args.new_every:
+            articles = [(next_id, make_article(rng))] + articles[:-1]
+            next_id += 1
+            published += 1
+        html = render(articles, check, rng)
+
+        started = time.perf_counter()
+        text = extractor.extract_text_from_html(html)
+        new_hash = hashlib.md5(text.encode("utf-8")).hexdigest()
+        stats["md5"][2] += time.perf_counter() - started
+        if new_hash != old_hash:
+            stats["md5"][0] += 1
+            stats["md5"][1] += prompt_chars(extractor, html)
+        old_hash = new_hash
+
+        started = time.perf_counter()
+        changes = detector.detect_changes(html, snapshot)
+        stats["blocks"][2] += time.perf_counter() - started
+        snapshot = changes["snapshot"]
+        if changes["has_changes"]:
+            stats["blocks"][0] += 1
+            stats["blocks"][1] += prompt_chars(extractor, changes["new_html"] or html)
+
+    print(f"{args.checks} checks, {args.articles} articles on page, {published} new articles published")
+    print(f"{'detector':<10} | {'LLM calls':>9} | {'prompt chars':>12} | {'~tokens':>8} | {'detect ms/check':>15}")
+    print("-" * 66)
+    for name, (calls, chars, elapsed) in stats.items():
+        print(f"{name:<10} | {calls:>9} | {chars:>12} | {chars // 4:>8} | {elapsed * 1000 / args.checks:>15.2f}")
+    md5, blocks = stats["md5"], stats["blocks"]
+    print(f"LLM calls: {md5[0]} -> {blocks[0]} ({md5[0] / max(blocks[0], 1):.0f}x fewer), "
+          f"prompt chars: {md5[1]} -> {blocks[1]} ({md5[1] / max(blocks[1], 1):.0f}x fewer)")
+
+
+if __name__ == "__main__":
+    main()
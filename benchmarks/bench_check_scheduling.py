@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Симуляция расписания проверок источников
+Источники меняются пуассоновским потоком с разной частотой (срочные новости,
+активный блог, ежедневные и еженедельные обновления). Сравнивается
+фиксированный интервал check_interval_minutes с AdaptiveCheckScheduler:
+число проверок, доля проверок без изменений и средняя задержка обнаружения
+изменения.
+
+Запуск:
+    python benchmarks/bench_check_scheduling.py [--days 28] [--seed 1]
+"""
+
+import argparse
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.services.check_scheduler import AdaptiveCheckScheduler
+
+# (название, среднее минут между изменениями, автопостинг, источников в наборе)
+PROFILES = [
+    ("breaking news", 15, True, 2),
+    ("active blog", 120, True, 8),
+    ("daily digest", 1440, False, 30),
+    ("weekly column", 10080, False, 40),
+    ("dormant site", 10 ** 9, False, 20),
+]
+
+
+def change_times(mean_minutes: float, days: int, rng: random.Random):
+    times, t = [], 0.0
+    while True:
+        t += rng.expovariate(1 / mean_minutes)
+        if t > days * 1440:
+            return times
+        times.append(t)
+
+
+def simulate(changes, days: int, auto_post: bool, scheduler=None, interval: float = 60):
+    """Возвращает (проверок, проверок без изменений, средняя задержка обнаружения в минутах)"""
+    start = datetime(2025, 1, 1)
+    source = SimpleNamespace(
+        check_interval_minutes=interval, min_check_interval_minutes=None, max_check_interval_minutes=None,
+        change_interval_minutes=None, last_change_at=None, created_at=start, auto_post_enabled=auto_post
+    )
+    t, checks, wasted, lags, pending = interval, 0, 0, [], 0
+    end = days * 1440
+    while t <= end:
+        checks += 1
+        # Изменения, произошедшие с прошлой проверки, обнаруживаются сейчас
+        detected = []
+        while pending < len(changes) and changes[pending] <= t:
+            detected.append(changes[pending])
+            pending += 1
+        lags.extend(t - change for change in detected)
+        wasted += not detected
+
+        now = start + timedelta(minutes=t)
+        if scheduler is None:
+            t += interval
+        else:
+            t += (scheduler.schedule(source, bool(detected), now) - now).total_seconds() / 60
+    return checks, wasted, (sum(lags) / len(lags) if lags else 0.0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--days", type=int, default=28)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--interval", type=float, default=60, help="фиксированный check_interval_minutes")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    scheduler = AdaptiveCheckScheduler(enabled=True, alpha=0.3, fraction=0.5, auto_post_factor=0.5,
+                                       min_minutes=10, max_minutes=1440)
+
+    print(f"{args.days} days, fixed interval {args.interval:.0f}m; checks and wasted (no change) per profile")
+    print(f"{'source':<18} | {'changes':>7} | {'fixed checks':>12} | {'wasted':>6} | {'lag':>6} | "
+          f"{'adaptive':>8} | {'wasted':>6} | {'lag':>6}")
+    print("-" * 92)
+    totals = [0, 0, 0, 0]
+    for name, mean, auto_post, count in PROFILES:
+        row = [0, 0, 0.0, 0, 0, 0.0, 0]
+        for _ in range(count):
+            changes = change_times(mean, args.days, rng)
+            fixed = simulate(changes, args.days, auto_post, interval=args.interval)
+            adaptive = simulate(changes, args.days, auto_post, scheduler, interval=args.interval)
+            row = [row[0] + fixed[0], row[1] + fixed[1], row[2] + fixed[2] / count,
+                   row[3] + adaptive[0], row[4] + adaptive[1], row[5] + adaptive[2] / count, row[6] + len(changes)]
+        totals = [totals[0] + row[0], totals[1] + row[1], totals[2] + row[3], totals[3] + row[4]]
+        print(f"{count:>2} x {name:<13} | {row[6]:>7} | {row[0]:>12} | {row[1] / row[0]:>5.0%} | {row[2]:>5.0f}m | "
+              f"{row[3]:>8} | {row[4] / row[3]:>5.0%} | {row[5]:>5.0f}m")
+    print("-" * 92)
+    print(f"{'total':<18} | {'':>7} | {totals[0]:>12} | {totals[1] / totals[0]:>5.0%} | {'':>6} | "
+          f"{totals[2]:>8} | {totals[3] / totals[2]:>5.0%} |")
+    print(f"fetches: {totals[0]} -> {totals[2]} ({1 - totals[2] / totals[0]:.0%} fewer), "
+          f"wasted: {totals[1]} -> {totals[3]} ({1 - totals[3] / totals[1]:.0%} fewer)")
+
+
+if __name__ == "__main__":
+    main()
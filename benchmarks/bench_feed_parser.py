@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк разбора RSS лент (WebCrawlerWorker._check_rss_source)
+Сравнивает прежний regex парсер (весь ответ в памяти, разбор всех элементов,
+затем первые 20) с потоковым (куски ответа по 64 КБ, остановка после 20
+элементов) и полный потоковый разбор. Лента по форме как у новостных сайтов:
+content:encoded с HTML в CDATA, media:*, dc:creator, HTML в description.
+
+Запуск:
+    python benchmarks/bench_feed_parser.py [--sizes 100,1000,5000] [--limit 20]
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.services.feed_parser import iter_feed_items, parse_feed_regex
+
+CHUNK_SIZE = 64 * 1024
+
+PARAGRAPH = ("Правительство обсудило меры поддержки малого бизнеса и изменения в налоговом "
+             "кодексе, которые вступят в силу со следующего года. ") * 6
+
+
+def make_feed(size: int) -> bytes:
+    items = []
+    for i in range(size):
+        body = "".join(f"<p>{PARAGRAPH}</p><img src=\"https://cdn.example.com/{i}/{j}.jpg\"/>" for j in range(4))
+        items.append(f"""<item>
+  <title><![CDATA[Новость {i}: решение принято]]></title>
+  <link>https://news.example.com/articles/{i}</link>
+  <description><![CDATA[<p>{PARAGRAPH[:300]}</p>]]></description>
+  <content:encoded><![CDATA[<div class="article">{body}</div>]]></content:encoded>
+  <media:content url="https://cdn.example.com/{i}.jpg" medium="image"><media:title>Фото</media:title></media:content>
+  <category>Экономика</category>
+  <dc:creator>Редакция</dc:creator>
+  <pubDate>Mon, 06 Jan 2025 10:{i % 60:02d}:00 +0300</pubDate>
+  <guid isPermaLink="false">news-{i}</guid>
+</item>""")
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0" xmlns:content="http://purl.org/rss/1.0/modules/content/"
+     xmlns:dc="http://purl.org/dc/elements/1.1/" xmlns:media="http://search.yahoo.com/mrss/">
+<channel><title>Новости</title><link>https://news.example.com/</link>
+{"".join(items)}
+</channel></rss>""".encode("utf-8")
+
+
+def chunks(data: bytes, read: list):
+    for start in range(0, len(data), CHUNK_SIZE):
+        read.append(CHUNK_SIZE)
+        yield data[start:start + CHUNK_SIZE]
+
+
+def regex(data: bytes, limit: int):
+    """Прежний путь: response.text целиком, разбор всех элементов, затем [:limit]"""
+    read = []
+    body = b"".join(chunks(data, read)).decode("utf-8")
+    return parse_feed_regex(body)[:limit], sum(read)
+
+
+def stream(data: bytes, limit: int):
+    read = []
+    return list(iter_feed_items(chunks(data, read), limit=limit)), sum(read)
+
+
+def stream_full(data: bytes, limit: int):
+    read = []
+    return list(iter_feed_items(chunks(data, read))), sum(read)
+
+
+def measure(fn, data: bytes, limit: int):
+    tracemalloc.start()
+    started = time.perf_counter()
+    items, read = fn(data, limit)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, read, items
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="100,1000,5000")
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'items':>6} | {'feed':>7} | {'regex':>9} | {'peak':>7} | {'stream':>8} | {'peak':>6} | "
+          f"{'read':>7} | {'full stream':>11} | {'speedup':>7}")
+    print("-" * 96)
+    for size in (int(s) for s in args.sizes.split(",")):
+        data = make_feed(size)
+        regex_time, regex_peak, _, regex_items = measure(regex, data, args.limit)
+        stream_time, stream_peak, stream_read, stream_items = measure(stream, data, args.limit)
+        full_time, _, _, full_items = measure(stream_full, data, args.limit)
+        assert stream_items == regex_items and len(full_items) == size
+
+        mb = 1024 * 1024
+        print(f"{size:>6} | {len(data) / mb:>5.1f}MB | {regex_time * 1000:>7.1f}ms | {regex_peak / mb:>5.1f}MB | "
+              f"{stream_time * 1000:>6.1f}ms | {stream_peak / mb:>4.1f}MB | {stream_read / mb:>5.2f}MB | "
+              f"{full_time * 1000:>9.1f}ms | {regex_time / stream_time:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
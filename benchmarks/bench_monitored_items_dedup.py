@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк дедупликации и вставки элементов ленты (WebCrawlerWorker)
+Сравнивает прежний путь (check_duplicate + create_item на каждый элемент:
+две сессии и два запроса на элемент) с пакетным (split_duplicates одним IN
+запросом + bulk_create_items с ON CONFLICT DO NOTHING) на синтетической
+ленте, половина которой уже сохранена.
+
+Запуск:
+    python benchmarks/bench_monitored_items_dedup.py [--sizes 100,10000] [--db bench_items.db]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import create_engine, event, insert
+from sqlalchemy.orm import sessionmaker
+
+from app.database import connection
+from app.database.connection import Base, import_all_models
+from app.models.content_sources import MonitoredItem
+from app.services.content_source_service import MonitoredItemService
+
+# Прежний путь делает commit на каждый элемент - на больших лентах меряем выборку
+LEGACY_SAMPLE = 1000
+
+
+def make_feed(source_id: int, size: int):
+    return [{
+        "title": f"Item {i}",
+        "summary": f"Summary {i}",
+        "url": f"https://example.com/{source_id}/{i}",
+        "external_id": f"guid-{source_id}-{i}",
+    } for i in range(size)]
+
+
+def seed_existing(engine, source_id: int, feed):
+    """Каждый второй элемент ленты уже сохранен"""
+    rows = [{
+        "source_id": source_id, "user_id": 1, "title": item["title"], "url": item["url"],
+        "url_hash": MonitoredItem.hash_url(item["url"]), "external_id": item["external_id"],
+        "status": "new", "relevance_score": 0.7
+    } for item in feed[::2]]
+    with engine.begin() as conn:
+        conn.execute(insert(MonitoredItem.__table__), rows)
+
+
+def legacy(source_id: int, feed):
+    """Копия прежнего цикла WebCrawlerWorker._check_rss_source"""
+    new = 0
+    for item in feed:
+        if MonitoredItemService.check_duplicate(source_id, item.get("external_id"), item.get("url")):
+            continue
+        if MonitoredItemService.create_item(
+            source_id=source_id, user_id=1, title=item["title"], summary=item["summary"],
+            url=item["url"], external_id=item["external_id"], status="new", raw_data=item,
+            relevance_score=0.7
+        ):
+            new += 1
+    return new
+
+
+def bulk(source_id: int, feed):
+    new_items, _ = MonitoredItemService.split_duplicates(source_id, feed)
+    created, _ = MonitoredItemService.bulk_create_items(source_id, 1, [
+        {**item, "status": "new", "raw_data": item, "relevance_score": 0.7} for item in new_items
+    ])
+    return len(created)
+
+
+def measure(engine, fn, source_id: int, feed):
+    statements = []
+    listener = lambda *args: statements.append(1)
+    event.listen(engine, "before_cursor_execute", listener)
+    started = time.perf_counter()
+    created = fn(source_id, feed)
+    elapsed = time.perf_counter() - started
+    event.remove(engine, "before_cursor_execute", listener)
+    return elapsed, len(statements), created
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="100,10000")
+    parser.add_argument("--db", default=None, help="путь к SQLite файлу (по умолчанию временный)")
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.CRITICAL)
+
+    path = args.db or os.path.join(tempfile.mkdtemp(), "bench_items.db")
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    import_all_models()
+    Base.metadata.create_all(engine)
+    connection.engine = engine
+    connection.SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+
+    print(f"{'items':>8} | {'legacy':>10} | {'legacy SQL':>10} | {'bulk':>9} | {'bulk SQL':>8} | {'speedup':>8}")
+    print("-" * 70)
+    source_id = 0
+    for size in (int(s) for s in args.sizes.split(",")):
+        source_id += 2
+        legacy_feed = make_feed(source_id, size)[:LEGACY_SAMPLE]
+        bulk_feed = make_feed(source_id + 1, size)
+        seed_existing(engine, source_id, legacy_feed)
+        seed_existing(engine, source_id + 1, bulk_feed)
+
+        legacy_time, legacy_sql, legacy_new = measure(engine, legacy, source_id, legacy_feed)
+        bulk_time, bulk_sql, bulk_new = measure(engine, bulk, source_id + 1, bulk_feed)
+        assert legacy_new == len(legacy_feed) // 2 and bulk_new == size // 2
+
+        # Прежний путь линеен по числу элементов - экстраполируем выборку
+        scale = size / len(legacy_feed)
+        legacy_time *= scale
+        legacy_sql = int(legacy_sql * scale)
+        print(f"{size:>8} | {legacy_time * 1000:>8.0f}ms | {legacy_sql:>10} | "
+              f"{bulk_time * 1000:>7.0f}ms | {bulk_sql:>8} | {legacy_time / bulk_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
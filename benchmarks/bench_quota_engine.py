@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк проверки квоты на пути запроса
+Меряет QuotaEngine.reserve() после прогрева лимитов: локальные счетчики
+процесса или Redis (--redis redis://localhost:6379/0).
+
+Запуск:
+    python benchmarks/bench_quota_engine.py [--users 1000] [--calls 100000] [--redis URL]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from app.billing.models.subscription import Subscription
+from app.billing.services.quota_engine import LocalQuotaStore, QuotaEngine, RedisQuotaStore
+from app.database.connection import Base, import_all_models
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--calls", type=int, default=100000)
+    parser.add_argument("--redis", default=None, help="URL Redis (по умолчанию - локальные счетчики)")
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.CRITICAL)
+
+    engine = create_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_quota.db')}")
+    import_all_models()
+    Base.metadata.create_all(engine)
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(insert(Subscription.__table__), [
+            {"user_id": user_id, "plan_id": "pro", "status": "active", "starts_at": now,
+             "expires_at": now + timedelta(days=30), "created_at": now}
+            for user_id in range(1, args.users + 1)
+        ])
+
+    store = RedisQuotaStore(args.redis) if args.redis else LocalQuotaStore()
+    quotas = QuotaEngine(store, session_factory=sessionmaker(bind=engine),
+                         flush_interval=3600, reconcile_interval=3600)
+
+    started = time.perf_counter()
+    for user_id in range(1, args.users + 1):
+        quotas.get_quota(user_id)
+    warmup = (time.perf_counter() - started) / args.users * 1e6
+
+    timings = []
+    for call in range(args.calls):
+        user_id = call % args.users + 1
+        started = time.perf_counter()
+        quotas.reserve(user_id, "api_calls")
+        timings.append((time.perf_counter() - started) * 1e6)
+    timings.sort()
+
+    print(f"backend: {store.name}, users: {args.users}, calls: {args.calls}")
+    print(f"первая загрузка лимитов (БД): {warmup:.0f}us на пользователя")
+    print(f"reserve(): p50 {statistics.median(timings):.1f}us, "
+          f"p99 {timings[int(len(timings) * 0.99)]:.1f}us, max {timings[-1]:.0f}us")
+    quotas.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест rate_limit_by_user: справедливость между пользователями
+Несколько "тяжелых" пользователей шлют запросы к LLM-эндпоинту без пауз во
+много потоков, обычные - с умеренной частотой. Без ограничителя тяжелые
+пользователи забирают почти всю пропускную способность upstream (здесь -
+общий семафор, имитирующий квоту Vertex AI); с ограничителем каждый
+получает не больше своего лимита, а обычные пользователи обслуживаются
+полностью.
+
+Запуск:
+    python benchmarks/load_user_rate_limit.py [--duration 5] [--heavy 2] [--threads 16] [--light 10] [--redis URL]
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from flask import Flask, g, request
+
+from app.auth.middleware import jwt as jwt_middleware
+from app.utils.rate_limiter import RateLimit, RateLimiter, RedisRateLimitBackend
+
+# Имитация LLM вызова и общей квоты upstream
+LLM_LATENCY = 0.02
+UPSTREAM_CONCURRENCY = 4
+
+
+def build_app(limited: bool) -> Flask:
+    app = Flask(__name__)
+    upstream = threading.Semaphore(UPSTREAM_CONCURRENCY)
+
+    @app.before_request
+    def authenticate():
+        g.current_user_id = int(request.headers["X-Test-User"])
+
+    def generate():
+        with upstream:
+            time.sleep(LLM_LATENCY)
+        return {"success": True}, 200
+
+    if limited:
+        generate = jwt_middleware.rate_limit_by_user(endpoint_class="llm")(generate)
+    app.add_url_rule("/ai/generate", "generate", generate, methods=["POST"])
+    return app
+
+
+def run(app: Flask, duration: float, heavy_users: int, threads_per_heavy: int,
+        light_users: int, light_pause: float):
+    client = app.test_client()
+    stats = defaultdict(lambda: defaultdict(int))
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def send(user_id: int, pause: float):
+        while time.monotonic() < deadline:
+            status = client.post("/ai/generate", headers={"X-Test-User": str(user_id)}).status_code
+            with lock:
+                stats[user_id][status] += 1
+            if pause:
+                time.sleep(pause)
+
+    threads = []
+    for user_id in range(1, heavy_users + 1):
+        threads += [threading.Thread(target=send, args=(user_id, 0)) for _ in range(threads_per_heavy)]
+    for user_id in range(heavy_users + 1, heavy_users + light_users + 1):
+        threads.append(threading.Thread(target=send, args=(user_id, light_pause)))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return stats
+
+
+def jain_index(values):
+    """Индекс справедливости Джейна: 1.0 - поровну, 1/n - все у одного"""
+    values = [value for value in values if value]
+    if not values:
+        return 0.0
+    return sum(values) ** 2 / (len(values) * sum(value * value for value in values))
+
+
+def report(title: str, stats, heavy_users: int, duration: float):
+    print(f"\n{title}")
+    print(f"{'user':>6} | {'type':>5} | {'200/s':>7} | {'429':>6} | {'served':>7}")
+    print("-" * 44)
+    served = []
+    for user_id in sorted(stats):
+        ok, rejected = stats[user_id][200], stats[user_id][429]
+        served.append(ok)
+        kind = "heavy" if user_id <= heavy_users else "light"
+        share = ok / (ok + rejected) * 100 if ok + rejected else 0
+        print(f"{user_id:>6} | {kind:>5} | {ok / duration:>7.1f} | {rejected:>6} | {share:>6.0f}%")
+    light_ok = sum(stats[user_id][200] for user_id in stats if user_id > heavy_users)
+    total_ok = sum(served)
+    print(f"доля upstream у обычных пользователей: {light_ok / total_ok * 100:.0f}%, "
+          f"индекс Джейна: {jain_index(served):.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--heavy", type=int, default=2, help="тяжелых пользователей")
+    parser.add_argument("--threads", type=int, default=16, help="потоков на тяжелого пользователя")
+    parser.add_argument("--light", type=int, default=10, help="обычных пользователей")
+    parser.add_argument("--light-pause", type=float, default=0.5, help="пауза обычного пользователя, с")
+    parser.add_argument("--redis", default=None, help="URL Redis (по умолчанию - лимиты в процессе)")
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.CRITICAL)
+
+    backend = RedisRateLimitBackend(args.redis) if args.redis else None
+    jwt_middleware.rate_limiter = RateLimiter(backend)
+    limit = jwt_middleware.USER_RATE_LIMITS["llm"]
+    print(f"лимит llm: {limit.rate} за {limit.period:.0f} с, burst {limit.burst}, "
+          f"backend {jwt_middleware.rate_limiter.backend.name}")
+
+    for title, limited in (("без ограничителя", False), ("rate_limit_by_user(endpoint_class='llm')", True)):
+        stats = run(build_app(limited), args.duration, args.heavy, args.threads, args.light, args.light_pause)
+        report(title, stats, args.heavy, args.duration)
+
+
+if __name__ == "__main__":
+    main()
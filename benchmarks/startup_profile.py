@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Профиль времени старта: разбивка импорта по модулям (python -X importtime)
+Импортирует целевой модуль (по умолчанию main - то, что грузит gunicorn
+worker) в отдельном процессе с -X importtime и печатает самые долгие
+модули по накопленному времени и сводку по пакетам верхнего уровня.
+Отчет можно сохранить в JSON и сравнивать с ним следующие запуски, чтобы
+ловить регрессии холодного старта.
+
+Запуск:
+    python benchmarks/startup_profile.py [--module main] [--top 25] [--runs 3]
+    python benchmarks/startup_profile.py --save startup_baseline.json
+    python benchmarks/startup_profile.py --baseline startup_baseline.json [--max-regression 0.2]
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+LINE_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$")
+
+
+def profile_once(module: str):
+    """Импортирует модуль в отдельном процессе, возвращает {модуль: (self_us, cumulative_us, depth)}"""
+    env = dict(os.environ)
+    # Фоновая инициализация и workers не относятся ко времени импорта
+    env.setdefault("DISABLE_AGENTS", "true")
+    env.setdefault("DISABLE_WORKERS", "true")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise SystemExit(f"import {module} завершился с кодом {result.returncode}:\n{result.stderr[-2000:]}")
+
+    modules = {}
+    for line in result.stderr.splitlines():
+        match = LINE_RE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        # Модуль может встретиться дважды (повторные попытки импорта) - берем максимум
+        previous = modules.get(name, (0, 0, 0))
+        modules[name] = (max(previous[0], int(self_us)), max(previous[1], int(cumulative_us)),
+                         (len(indent) - 1) // 2)
+    return modules
+
+
+def profile(module: str, runs: int):
+    """Медиана по нескольким запускам: первый прогон греет кеш .pyc и файловой системы"""
+    samples = [profile_once(module) for _ in range(runs)]
+    names = set().union(*samples)
+    merged = {}
+    for name in names:
+        values = [sample[name] for sample in samples if name in sample]
+        merged[name] = {
+            "self_ms": statistics.median(value[0] for value in values) / 1000,
+            "cumulative_ms": statistics.median(value[1] for value in values) / 1000,
+            "depth": values[0][2],
+        }
+    return merged
+
+
+def package_of(name: str) -> str:
+    """Группа для сводки: app.<подпакет> для своего кода, верхний пакет для библиотек"""
+    parts = name.split(".")
+    if parts[0] == "app" and len(parts) > 1:
+        return ".".join(parts[:2])
+    return parts[0]
+
+
+def build_report(module: str, modules):
+    packages = defaultdict(float)
+    for name, timing in modules.items():
+        packages[package_of(name)] += timing["self_ms"]
+    top_level = [timing["cumulative_ms"] for timing in modules.values() if timing["depth"] == 0]
+    return {
+        "module": module,
+        "total_ms": sum(top_level),
+        "packages": dict(packages),
+        "modules": modules,
+    }
+
+
+def print_report(report, top: int):
+    modules = report["modules"]
+    print(f"\nimport {report['module']}: {report['total_ms']:.0f} мс, модулей: {len(modules)}")
+
+    print(f"\n{'cumulative, мс':>15} | {'self, мс':>9} | модуль")
+    print("-" * 60)
+    for name, timing in sorted(modules.items(), key=lambda item: -item[1]["cumulative_ms"])[:top]:
+        print(f"{timing['cumulative_ms']:>15.1f} | {timing['self_ms']:>9.1f} | {'  ' * timing['depth']}{name}")
+
+    print(f"\n{'self, мс':>9} | {'доля':>5} | пакет")
+    print("-" * 40)
+    total_self = sum(report["packages"].values()) or 1
+    for name, self_ms in sorted(report["packages"].items(), key=lambda item: -item[1])[:top]:
+        print(f"{self_ms:>9.1f} | {self_ms / total_self * 100:>4.0f}% | {name}")
+
+
+def compare(report, baseline, max_regression: float) -> bool:
+    """Сравнивает с сохраненным отчетом, возвращает False при регрессии сверх порога"""
+    print(f"\nсравнение с базовым профилем ({baseline['total_ms']:.0f} мс):")
+    regressions = []
+    for name, self_ms in sorted(report["packages"].items(), key=lambda item: -item[1]):
+        before = baseline["packages"].get(name, 0.0)
+        # Мелкие пакеты шумят - смотрим только заметные изменения
+        if self_ms - before > 20 and (not before or self_ms > before * (1 + max_regression)):
+            regressions.append((name, before, self_ms))
+    for name, before, after in regressions:
+        print(f"  {name}: {before:.1f} -> {after:.1f} мс")
+
+    total_ok = report["total_ms"] <= baseline["total_ms"] * (1 + max_regression)
+    print(f"  итого: {baseline['total_ms']:.0f} -> {report['total_ms']:.0f} мс "
+          f"({'ok' if total_ok else 'РЕГРЕССИЯ'})")
+    return total_ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main", help="импортируемый модуль")
+    parser.add_argument("--top", type=int, default=25)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--save", help="сохранить отчет в JSON")
+    parser.add_argument("--baseline", help="JSON отчет для сравнения")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="допустимый рост общего времени")
+    args = parser.parse_args()
+
+    report = build_report(args.module, profile(args.module, args.runs))
+    print_report(report, args.top)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nотчет сохранен: {args.save}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if not compare(report, baseline, args.max_regression):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
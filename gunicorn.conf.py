@@ -9,9 +9,14 @@ import multiprocessing
 bind = f"0.0.0.0:{os.environ.get('PORT', '8080')}"
 
 # Worker configuration
-# Use sync workers for better compatibility with blocking operations
+# gthread: потоки обрабатывают запросы и передают корутины в общий
+# фоновый event loop процесса (app/utils/event_loop.py)
 workers = int(os.environ.get('GUNICORN_WORKERS', '2'))
-worker_class = 'sync'
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+# Каждый открытый SSE-поток /workflow/<id>/events держит поток до конца
+# workflow; их число ограничено CONTENT_JOBS_MAX_STREAMS (по умолчанию
+# половина threads), остальные потоки обслуживают обычные запросы
+threads = int(os.environ.get('GUNICORN_THREADS', '8'))
 worker_connections = 1000
 max_requests = 1000
 max_requests_jitter = 100
@@ -6,6 +6,10 @@ AI Content Orchestrator - Flask Application
 
 import os
 import sys
+import time
+
+# Время загрузки модуля - для отслеживания регрессий холодного старта
+_startup_started = time.perf_counter()
 
 # Ранний вывод для отладки - должен быть виден в логах gunicorn
 print("=" * 80, file=sys.stderr, flush=True)
@@ -60,16 +64,8 @@ print("🔵 Loading app modules...", file=sys.stderr, flush=True)
 _modules_imported = False
 try:
     from app.orchestrator.main_orchestrator import orchestrator  # Singleton для старых эндпоинтов
-    from app.agents.chief_agent import ChiefContentAgent
-    from app.agents.drafting_agent import DraftingAgent
-    from app.agents.publisher_agent import PublisherAgent
-    from app.agents.research_factcheck_agent import ResearchFactCheckAgent
-    from app.agents.trends_scout_agent import TrendsScoutAgent
-    from app.agents.multimedia_producer_agent import MultimediaProducerAgent
-    from app.agents.legal_guard_agent import LegalGuardAgent
-    from app.agents.repurpose_agent import RepurposeAgent
-    from app.agents.community_concierge_agent import CommunityConciergeAgent
-    from app.agents.paid_creative_agent import PaidCreativeAgent
+    # Агенты не импортируются при старте: их загружает AgentPool при первом
+    # использовании (app/orchestrator/agent_registry.py)
     from app.billing.api.billing_routes import billing_bp
     from app.billing.webhooks.yookassa_webhook import webhook_bp
     from app.billing.middleware.usage_middleware import UsageMiddleware
@@ -79,7 +75,7 @@ try:
     from app.routes.social_media_accounts import bp as social_media_accounts_bp
     # from app.auth.routes.auth import init_auth_routes, auth_bp  # Не используем Flask Blueprint
     from app.auth.models.user import User, UserSession
-    from app.database.connection import init_database, get_db_session
+    from app.database.connection import init_database, get_db_session, init_request_sessions
     from app.api.schemas import (
         ContentRequestSchema, 
         ContentResponseSchema,
@@ -201,6 +197,9 @@ def create_app():
         }
     })
     
+    # Одна сессия БД на запрос: вложенные get_db_session() используют ее, закрывается в teardown
+    init_request_sessions(app)
+    
     # Глобальный обработчик OPTIONS запросов для CORS preflight
     # Обрабатываем до того, как запрос попадет в Flask-RESTX или JWT middleware
     @app.before_request
@@ -338,59 +337,31 @@ def create_app():
     return app
 
 async def initialize_orchestrator():
-    """Инициализирует оркестратор и регистрирует агентов"""
+    """Инициализирует оркестратор на ленивом пуле агентов"""
     try:
         logger.info("Инициализация оркестратора...")
         
-        # ИСПРАВЛЕНИЕ: импортируем агентов внутри функции, если они не были импортированы ранее
-        # Это необходимо, т.к. глобальный импорт может не выполниться из-за ошибок в других модулях
-        try:
-            # Пробуем использовать уже импортированные классы
-            _ = ChiefContentAgent
-        except NameError:
-            # Если не импортированы, импортируем здесь
-            logger.info("Импорт агентов внутри initialize_orchestrator (глобальный импорт не выполнился)")
-            from app.agents.chief_agent import ChiefContentAgent
-            from app.agents.drafting_agent import DraftingAgent
-            from app.agents.publisher_agent import PublisherAgent
-            from app.agents.research_factcheck_agent import ResearchFactCheckAgent
-            from app.agents.trends_scout_agent import TrendsScoutAgent
-            from app.agents.multimedia_producer_agent import MultimediaProducerAgent
-            from app.agents.legal_guard_agent import LegalGuardAgent
-            from app.agents.repurpose_agent import RepurposeAgent
-            from app.agents.community_concierge_agent import CommunityConciergeAgent
-            from app.agents.paid_creative_agent import PaidCreativeAgent
-            from app.orchestrator.main_orchestrator import orchestrator
-        
-        # Создаем агентов
-        chief_agent = ChiefContentAgent("chief_001")
-        drafting_agent = DraftingAgent("drafting_001")
-        publisher_agent = PublisherAgent("publisher_001")
-        factcheck_agent = ResearchFactCheckAgent("research_factcheck_agent")
-        trends_scout_agent = TrendsScoutAgent("trends_scout_001")
-        multimedia_agent = MultimediaProducerAgent("multimedia_producer_001")
-        legal_agent = LegalGuardAgent("legal_guard_001")
-        repurpose_agent = RepurposeAgent("repurpose_001")
-        community_agent = CommunityConciergeAgent("community_concierge_001")
-        paid_creative_agent = PaidCreativeAgent("paid_creative_001")
+        from app.orchestrator.main_orchestrator import orchestrator
+        from app.orchestrator.agent_pool import get_agent_pool
+        from app.orchestrator.agent_registry import AGENT_REGISTRY, get_warmup_agent_ids
         
-        # Регистрируем агентов
-        orchestrator.register_agent(chief_agent)
-        orchestrator.register_agent(drafting_agent)
-        orchestrator.register_agent(publisher_agent)
-        orchestrator.register_agent(factcheck_agent)
-        orchestrator.register_agent(trends_scout_agent)
-        orchestrator.register_agent(multimedia_agent)
-        orchestrator.register_agent(legal_agent)
-        orchestrator.register_agent(repurpose_agent)
-        orchestrator.register_agent(community_agent)
-        orchestrator.register_agent(paid_creative_agent)
+        # Агенты и их зависимости импортируются и создаются при первой задаче
+        pool = get_agent_pool(AGENT_REGISTRY)
+        orchestrator.attach_agent_pool(pool)
         
         # Запускаем оркестратор
         await orchestrator.start()
         
         logger.info("Оркестратор успешно инициализирован")
-        logger.info(f"Зарегистрировано агентов: {len(orchestrator.agent_manager.agents)}")
+        logger.info(f"Доступно агентов: {len(AGENT_REGISTRY)} (создаются при первом использовании)")
+        
+        # Прогрев выбранных агентов в пуле потоков, не блокируя event loop
+        warmup = get_warmup_agent_ids()
+        if warmup:
+            started = time.perf_counter()
+            loop = asyncio.get_running_loop()
+            created = await loop.run_in_executor(None, pool.warm_up, warmup)
+            logger.info(f"Прогрето агентов: {created}/{len(warmup)} за {time.perf_counter() - started:.2f} с")
         
     except Exception as e:
         logger.error(f"Ошибка инициализации оркестратора: {e}", exc_info=True)
@@ -399,15 +370,16 @@ async def initialize_orchestrator():
 def run_initialization():
     """Запускает инициализацию в отдельном потоке"""
     try:
-        # Создаем новый event loop для инициализации
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(initialize_orchestrator())
+        # Оркестратор живет в общем фоновом loop процесса: в нем же потом
+        # выполняются корутины из Flask views и workers
+        from app.utils.event_loop import get_background_loop
+        background_loop = get_background_loop()
+        background_loop.submit(initialize_orchestrator())
         
         # Запускаем фоновую задачу очистки неактивных оркестраторов
         from app.orchestrator.user_orchestrator_factory import orchestrator_cleanup_task
         logger.info("Запуск фоновой задачи очистки оркестраторов...")
-        loop.create_task(orchestrator_cleanup_task())
+        background_loop.submit_nowait(orchestrator_cleanup_task())
         
     except Exception as e:
         logger.error(f"Ошибка при запуске инициализации: {e}")
@@ -422,10 +394,11 @@ DISABLE_WORKERS = os.getenv('DISABLE_WORKERS', 'false').lower() == 'true'
 scheduled_posts_worker = None
 auto_posting_worker = None
 web_crawler_worker = None
+token_usage_rollup_worker = None
 
 def start_workers():
     """Запуск background workers"""
-    global scheduled_posts_worker, auto_posting_worker, web_crawler_worker
+    global scheduled_posts_worker, auto_posting_worker, web_crawler_worker, token_usage_rollup_worker
     
     if DISABLE_WORKERS:
         logger.warning("⚠️ WORKERS DISABLED: Background workers отключены (DISABLE_WORKERS=true)")
@@ -438,6 +411,7 @@ def start_workers():
         try:
             from app.workers import ScheduledPostsWorker, AutoPostingWorker
             from app.workers.web_crawler_worker import WebCrawlerWorker
+            from app.workers.token_usage_rollup_worker import TokenUsageRollupWorker
         except ImportError as e:
             logger.warning(f"⚠️ Workers не импортированы: {e}. Пропускаем запуск workers.")
             return
@@ -458,6 +432,11 @@ def start_workers():
         web_crawler_worker.start()
         logger.info("✅ WebCrawlerWorker запущен (интервал: 60s)")
         
+        # Token Usage Rollup Worker - дневные агрегаты расхода токенов, раз в сутки
+        token_usage_rollup_worker = TokenUsageRollupWorker()
+        token_usage_rollup_worker.start()
+        logger.info("✅ TokenUsageRollupWorker запущен (раз в сутки)")
+        
         logger.info("🚀 Все background workers успешно запущены")
         
     except NameError as e:
@@ -518,6 +497,9 @@ else:
         
         print(f"✅ Final app variable type: {type(app)} (minimal with error)", file=sys.stderr, flush=True)
 
+print(f"⏱️ main.py loaded in {time.perf_counter() - _startup_started:.2f}s "
+      f"(profile: python benchmarks/startup_profile.py)", file=sys.stderr, flush=True)
+
 # Инициализируем оркестратор при запуске
 if __name__ == '__main__':
     # База данных уже инициализирована выше на уровне модуля
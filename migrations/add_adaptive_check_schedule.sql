@@ -0,0 +1,8 @@
+-- Адаптивное расписание проверок источников (AdaptiveCheckScheduler):
+-- границы интервала, заданные пользователем, и оценка частоты изменений
+
+ALTER TABLE content_sources ADD COLUMN IF NOT EXISTS min_check_interval_minutes INTEGER;
+ALTER TABLE content_sources ADD COLUMN IF NOT EXISTS max_check_interval_minutes INTEGER;
+ALTER TABLE content_sources ADD COLUMN IF NOT EXISTS change_interval_minutes DOUBLE PRECISION;
+ALTER TABLE content_sources ADD COLUMN IF NOT EXISTS last_change_at TIMESTAMP;
+
@@ -0,0 +1,10 @@
+-- Условная загрузка источников (WebCrawlerWorker): ETag/Last-Modified
+-- последнего ответа хранятся в источнике, история проверок учитывает
+-- ответы 304 Not Modified и сэкономленный трафик
+
+ALTER TABLE content_sources ADD COLUMN IF NOT EXISTS http_validators JSONB;
+
+ALTER TABLE source_check_history ADD COLUMN IF NOT EXISTS http_status INTEGER;
+ALTER TABLE source_check_history ADD COLUMN IF NOT EXISTS not_modified BOOLEAN NOT NULL DEFAULT FALSE;
+ALTER TABLE source_check_history ADD COLUMN IF NOT EXISTS bytes_downloaded INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE source_check_history ADD COLUMN IF NOT EXISTS bytes_saved INTEGER NOT NULL DEFAULT 0;
@@ -0,0 +1,41 @@
+-- Дедупликация найденных элементов (MonitoredItemService.split_duplicates /
+-- bulk_create_items): ключи ленты ищутся одним IN запросом, новые элементы
+-- вставляются пачкой с ON CONFLICT DO NOTHING
+
+ALTER TABLE monitored_items ADD COLUMN IF NOT EXISTS url_hash VARCHAR(32);
+
+-- MD5 url - то же значение, что MonitoredItem.hash_url()
+UPDATE monitored_items SET url_hash = md5(url) WHERE url IS NOT NULL AND url_hash IS NULL;
+
+-- Повторы, которые успели сохранить параллельные проверки, не удаляем, а
+-- помечаем дубликатами первого элемента и убираем из ключей дедупликации
+WITH ranked AS (
+    SELECT id,
+           MIN(id) OVER (PARTITION BY source_id, external_id) AS first_id
+    FROM monitored_items
+    WHERE external_id IS NOT NULL
+)
+UPDATE monitored_items m
+SET status = 'duplicate', duplicate_of = ranked.first_id, external_id = NULL, url_hash = NULL
+FROM ranked
+WHERE m.id = ranked.id AND ranked.id <> ranked.first_id;
+
+WITH ranked AS (
+    SELECT id,
+           MIN(id) OVER (PARTITION BY source_id, url_hash) AS first_id
+    FROM monitored_items
+    WHERE external_id IS NULL AND url_hash IS NOT NULL
+)
+UPDATE monitored_items m
+SET status = 'duplicate', duplicate_of = ranked.first_id, url_hash = NULL
+FROM ranked
+WHERE m.id = ranked.id AND ranked.id <> ranked.first_id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_monitored_items_source_external
+ON monitored_items(source_id, external_id) WHERE external_id IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS ix_monitored_items_source_url_hash
+ON monitored_items(source_id, url_hash);
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_monitored_items_source_url_hash
+ON monitored_items(source_id, url_hash) WHERE external_id IS NULL AND url_hash IS NOT NULL;
@@ -0,0 +1,13 @@
+-- Migration: Claim-and-lease columns for scheduled posts and auto-posting rules
+-- Description: Позволяет запускать ScheduledPostsWorker и AutoPostingWorker в
+-- нескольких процессах: строка захватывается одним worker'ом (claimed_by) до
+-- истечения аренды (lease_expires_at). Для SQLite уберите IF NOT EXISTS у ADD COLUMN.
+
+ALTER TABLE scheduled_posts ADD COLUMN IF NOT EXISTS claimed_by VARCHAR(255);
+ALTER TABLE scheduled_posts ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMP;
+
+ALTER TABLE auto_posting_rules ADD COLUMN IF NOT EXISTS claimed_by VARCHAR(255);
+ALTER TABLE auto_posting_rules ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMP;
+
+-- Поиск постов с истекшей арендой (status = 'publishing')
+CREATE INDEX IF NOT EXISTS ix_scheduled_status_lease ON scheduled_posts(status, lease_expires_at);
@@ -0,0 +1,31 @@
+-- Дневные агрегаты расхода AI токенов для дашбордов ЛК
+-- Заполняется TokenUsageRollupService.compact() (TokenUsageRollupWorker):
+-- закрытые дни читаются отсюда, текущие сутки - из token_usage
+
+CREATE TABLE IF NOT EXISTS token_usage_daily (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    usage_date DATE NOT NULL,
+    agent_id VARCHAR(100) NOT NULL,
+    ai_provider VARCHAR(50) NOT NULL,
+    ai_model VARCHAR(100) NOT NULL,
+
+    requests_count INTEGER NOT NULL DEFAULT 0,
+    prompt_tokens BIGINT NOT NULL DEFAULT 0,
+    completion_tokens BIGINT NOT NULL DEFAULT 0,
+    total_tokens BIGINT NOT NULL DEFAULT 0,
+    cost_usd DOUBLE PRECISION NOT NULL DEFAULT 0,
+    cost_rub DOUBLE PRECISION NOT NULL DEFAULT 0,
+
+    execution_time_ms_sum BIGINT NOT NULL DEFAULT 0,
+    execution_time_count INTEGER NOT NULL DEFAULT 0,
+
+    updated_at TIMESTAMP DEFAULT NOW(),
+
+    CONSTRAINT uq_token_usage_daily_key UNIQUE (user_id, usage_date, agent_id, ai_provider, ai_model)
+);
+
+CREATE INDEX IF NOT EXISTS ix_token_usage_daily_user_date ON token_usage_daily(user_id, usage_date);
+CREATE INDEX IF NOT EXISTS ix_token_usage_daily_usage_date ON token_usage_daily(usage_date);
+
+COMMENT ON TABLE token_usage_daily IS 'Дневные агрегаты token_usage: пользователь x день x агент x модель';
@@ -0,0 +1,51 @@
+-- Состояние workflow и задач оркестратора (WorkflowStore)
+-- Пишется SQLAlchemyWorkflowStore пакетами; завершенные workflow старше
+-- WORKFLOW_STORE_TTL_SECONDS удаляются вместе с задачами
+
+CREATE TABLE IF NOT EXISTS workflow_instances (
+    id VARCHAR(36) PRIMARY KEY,
+    definition_id VARCHAR(36) DEFAULT '',
+    name VARCHAR(500) NOT NULL DEFAULT '',
+    status VARCHAR(20) NOT NULL,
+
+    context JSON,
+    output_data JSON,
+
+    created_at TIMESTAMP NOT NULL,
+    started_at TIMESTAMP,
+    completed_at TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT NOW(),
+
+    created_by VARCHAR(100) DEFAULT '',
+    error_message TEXT,
+    retry_count INTEGER DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS ix_workflow_instances_status_completed ON workflow_instances(status, completed_at);
+
+CREATE TABLE IF NOT EXISTS workflow_tasks (
+    id VARCHAR(36) PRIMARY KEY,
+    workflow_instance_id VARCHAR(36) NOT NULL,
+    name VARCHAR(500) NOT NULL DEFAULT '',
+
+    status VARCHAR(20) NOT NULL,
+    priority INTEGER NOT NULL,
+    task_type VARCHAR(20) NOT NULL,
+
+    assigned_agent_id VARCHAR(100),
+    dependencies JSON,
+
+    input_data JSON,
+    output_data JSON,
+    error_message TEXT,
+
+    created_at TIMESTAMP NOT NULL,
+    deadline TIMESTAMP,
+    completed_at TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS ix_workflow_tasks_workflow_status ON workflow_tasks(workflow_instance_id, status);
+
+COMMENT ON TABLE workflow_instances IS 'Состояние workflow оркестратора, общее для всех процессов';
+COMMENT ON TABLE workflow_tasks IS 'Состояние задач workflow оркестратора';
@@ -0,0 +1,57 @@
+"""
+Общие фикстуры тестов
+"""
+
+import os
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.database import connection
+from app.database.connection import Base, import_all_models
+
+# Тесты не пишут workflow в БД приложения: хранилище процесса - в памяти
+os.environ.setdefault("WORKFLOW_STORE_BACKEND", "memory")
+
+
+@pytest.fixture
+def db_session_factory():
+    """sessionmaker на временной SQLite БД в памяти со всеми таблицами"""
+    import_all_models()
+    engine = create_engine(
+        'sqlite://',
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    Base.metadata.create_all(engine)
+
+    yield sessionmaker(bind=engine, autocommit=False, autoflush=False)
+
+    engine.dispose()
+
+
+@pytest.fixture
+def db(db_session_factory, monkeypatch):
+    """Сессия временной БД; сервисы работают с ней же через get_db_session()"""
+    monkeypatch.setattr(connection, "engine", db_session_factory.kw["bind"])
+    monkeypatch.setattr(connection, "SessionLocal", db_session_factory)
+    session = db_session_factory()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def file_db_session_factory(tmp_path):
+    """sessionmaker на файловой SQLite БД: у каждой сессии свое соединение (как у разных процессов)"""
+    import_all_models()
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'test.db'}",
+        connect_args={"check_same_thread": False, "timeout": 30}
+    )
+    Base.metadata.create_all(engine)
+
+    yield sessionmaker(bind=engine, autocommit=False, autoflush=False)
+
+    engine.dispose()
@@ -0,0 +1,218 @@
+"""
+Тесты общего пула агентов и оркестраторов пользователей
+"""
+
+import ast
+import asyncio
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.billing.models.agent_subscription import AgentSubscription
+from app.orchestrator import user_orchestrator_factory
+from app.orchestrator.agent_manager import AgentCapability, BaseAgent
+from app.orchestrator.agent_pool import AgentPool
+from app.orchestrator.agent_registry import AGENT_REGISTRY, get_warmup_agent_ids
+from app.orchestrator.user_orchestrator_factory import UserOrchestratorFactory
+from app.orchestrator.workflow_engine import TaskStatus, TaskType
+
+CREATED = []
+
+
+def make_agent_class(agent_id: str, handles: str, max_concurrent_tasks: int = 2):
+    class FakeAgent(BaseAgent):
+        def __init__(self):
+            super().__init__(agent_id, agent_id, AgentCapability(
+                task_types=[TaskType.PLANNED], max_concurrent_tasks=max_concurrent_tasks
+            ))
+            # Имитация тяжелого конструктора (шаблоны, правила, клиенты)
+            self.templates = [bytearray(1000) for _ in range(100)]
+            CREATED.append(agent_id)
+
+        def can_handle_task(self, task) -> bool:
+            return super().can_handle_task(task) and handles in task.name
+
+        async def execute_task(self, task):
+            await asyncio.sleep(0.01)
+            return {"agent": agent_id}
+
+    return FakeAgent
+
+
+AGENT_CLASSES = {
+    "drafting_agent": make_agent_class("drafting_agent", "Create"),
+    "publisher_agent": make_agent_class("publisher_agent", "Publish"),
+    "paid_creative_agent": make_agent_class("paid_creative_agent", "Create"),
+}
+
+
+@pytest.fixture
+def factory(monkeypatch):
+    CREATED.clear()
+    pool = AgentPool(AGENT_CLASSES, max_size=3)
+    monkeypatch.setattr(UserOrchestratorFactory, "_user_orchestrators", {})
+    monkeypatch.setattr(UserOrchestratorFactory, "_get_agent_classes", classmethod(lambda cls: AGENT_CLASSES))
+    monkeypatch.setattr(user_orchestrator_factory, "get_agent_pool", lambda agent_classes=None: pool)
+    return UserOrchestratorFactory
+
+
+def subscribe(db, user_id: int, agent_id: str, expires_in_days: int = 30):
+    db.add(AgentSubscription(user_id=user_id, agent_id=agent_id, agent_name=agent_id, status="active",
+                             price_monthly=0, expires_at=datetime.utcnow() + timedelta(days=expires_in_days)))
+    db.commit()
+
+
+def run_workflow(orchestrator, task_name: str):
+    engine = orchestrator.workflow_engine
+    workflow = engine.create_workflow("test", TaskType.PLANNED)
+    engine.add_task(workflow.id, task_name, TaskType.PLANNED)
+    return asyncio.run(orchestrator.execute_workflow(workflow.id))
+
+
+class TestAgentPool:
+    """Тесты для AgentPool и UserOrchestratorFactory"""
+
+    def test_lru_eviction_and_stats(self):
+        """Тест: пул создает агентов лениво, вытесняет самого давнего и отдает метрики"""
+        CREATED.clear()
+        pool = AgentPool(AGENT_CLASSES, max_size=2, track_memory=True)
+
+        drafting = pool.get("drafting_agent")
+        pool.get("publisher_agent")
+        assert pool.get("drafting_agent") is drafting
+        pool.get("paid_creative_agent")
+
+        stats = pool.get_stats()
+        assert set(stats["agents"]) == {"drafting_agent", "paid_creative_agent"}
+        assert (stats["instantiations"], stats["hits"], stats["evictions"]) == (3, 1, 1)
+        assert stats["agents"]["drafting_agent"]["instantiation_ms"] >= 0
+        assert stats["agents"]["drafting_agent"]["memory_bytes"] > 100 * 1000
+        assert stats["memory_bytes"] >= stats["agents"]["drafting_agent"]["memory_bytes"]
+        assert pool.get("unknown_agent") is None
+
+        pool.get("publisher_agent")
+        assert CREATED.count("publisher_agent") == 2
+
+    def test_memory_tracking_off_by_default(self):
+        """Тест: без AGENT_POOL_TRACK_MEMORY память агентов не замеряется (tracemalloc не включается)"""
+        pool = AgentPool(AGENT_CLASSES)
+        pool.get("drafting_agent")
+
+        stats = pool.get_stats()
+        assert stats["memory_bytes"] is None
+        assert stats["agents"]["drafting_agent"]["memory_bytes"] is None
+
+    def test_agents_shared_between_users(self, factory, db_session_factory):
+        """Тест: пользователи используют одни и те же экземпляры агентов"""
+        db = db_session_factory()
+        results = [run_workflow(factory.get_orchestrator(user_id, db), "Create post")
+                   for user_id in range(1, 51)]
+
+        assert all(result["status"] == TaskStatus.COMPLETED.value for result in results)
+        assert CREATED.count("drafting_agent") == 1
+        stats = factory.get_stats()
+        assert stats["active_users"] == 50
+        assert stats["agent_pool"]["instantiations"] <= len(AGENT_CLASSES)
+        db.close()
+
+    def test_entitlements_checked_at_dispatch(self, factory, db_session_factory):
+        """Тест: задача назначается только агентам по подписке, отмена подписки действует сразу"""
+        db = db_session_factory()
+        subscribe(db, 1, "publisher_agent")
+        orchestrator = factory.get_orchestrator(1, db)
+
+        assert factory.get_user_agents(1) == ["publisher_agent"]
+        assert run_workflow(orchestrator, "Create post")["status"] == TaskStatus.FAILED.value
+        assert run_workflow(orchestrator, "Publish post")["status"] == TaskStatus.COMPLETED.value
+        assert "drafting_agent" not in CREATED
+
+        db.query(AgentSubscription).delete()
+        subscribe(db, 1, "drafting_agent")
+        factory.refresh_user_agents(1, db)
+
+        assert factory.get_orchestrator(1, db) is orchestrator
+        assert run_workflow(orchestrator, "Publish post")["status"] == TaskStatus.FAILED.value
+        assert run_workflow(orchestrator, "Create post")["status"] == TaskStatus.COMPLETED.value
+        db.close()
+
+    def test_load_tracked_per_user(self, factory, db_session_factory):
+        """Тест: задачи одного пользователя не занимают общий агент для другого"""
+        db = db_session_factory()
+        first = factory.get_orchestrator(1, db).agent_manager
+        second = factory.get_orchestrator(2, db).agent_manager
+
+        def add_task(manager):
+            workflow = manager.workflow_engine.create_workflow("test", TaskType.PLANNED)
+            return manager.workflow_engine.add_task(workflow.id, "Publish post", TaskType.PLANNED)
+
+        # max_concurrent_tasks=2 у каждого пользователя отдельно
+        assert first.assign_task_to_agent(add_task(first)) == "publisher_agent"
+        assert first.assign_task_to_agent(add_task(first)) == "publisher_agent"
+        assert first.assign_task_to_agent(add_task(first)) is None
+        assert second.assign_task_to_agent(add_task(second)) == "publisher_agent"
+        assert first.get_system_status()["active_tasks"] == 2
+        db.close()
+
+    def test_lazy_import_on_first_use(self, tmp_path, monkeypatch):
+        """Тест: модуль агента импортируется только при первом обращении, время импорта в статистике"""
+        (tmp_path / "lazy_fake_agent.py").write_text(
+            "from app.orchestrator.agent_manager import AgentCapability, BaseAgent\n"
+            "from app.orchestrator.workflow_engine import TaskType\n"
+            "class LazyAgent(BaseAgent):\n"
+            "    def __init__(self):\n"
+            "        super().__init__('lazy_agent', 'Lazy', AgentCapability(task_types=[TaskType.PLANNED]))\n"
+            "    async def execute_task(self, task):\n"
+            "        return {}\n"
+        )
+        monkeypatch.syspath_prepend(str(tmp_path))
+        monkeypatch.delitem(sys.modules, "lazy_fake_agent", raising=False)
+        pool = AgentPool({"lazy_agent": "lazy_fake_agent:LazyAgent"})
+
+        assert "lazy_fake_agent" not in sys.modules
+        assert pool.warm_up(["lazy_agent", "unknown_agent"]) == 1
+        assert "lazy_fake_agent" in sys.modules
+        assert pool.get_stats()["agents"]["lazy_agent"]["import_ms"] > 0
+
+    def test_registry_paths_exist(self, monkeypatch):
+        """Тест: пути реестра указывают на существующие классы (без импорта тяжелых модулей)"""
+        root = os.path.join(os.path.dirname(__file__), "..")
+        for agent_id, import_path in AGENT_REGISTRY.items():
+            module_name, _, class_name = import_path.partition(":")
+            with open(os.path.join(root, *module_name.split(".")) + ".py", encoding="utf-8") as f:
+                tree = ast.parse(f.read())
+            classes = {node.name for node in tree.body if isinstance(node, ast.ClassDef)}
+            assert class_name in classes, agent_id
+
+        monkeypatch.setenv("AGENT_WARMUP", "drafting_agent, publisher_agent")
+        assert get_warmup_agent_ids() == ["drafting_agent", "publisher_agent"]
+        monkeypatch.setenv("AGENT_WARMUP", "all")
+        assert get_warmup_agent_ids() == list(AGENT_REGISTRY)
+
+    @pytest.mark.asyncio
+    async def test_agents_created_off_event_loop(self, factory, db_session_factory, monkeypatch):
+        """Тест: перед выполнением workflow агенты создаются в пуле потоков, а не в event loop"""
+        created_in = []
+
+        class SlowAgent(AGENT_CLASSES["drafting_agent"]):
+            def __init__(self):
+                time.sleep(0.05)
+                created_in.append(threading.current_thread())
+                super().__init__()
+
+        pool = AgentPool({"drafting_agent": SlowAgent})
+        monkeypatch.setattr(user_orchestrator_factory, "get_agent_pool", lambda agent_classes=None: pool)
+        db = db_session_factory()
+        orchestrator = factory.get_orchestrator(1, db)
+        workflow = orchestrator.workflow_engine.create_workflow("test", TaskType.PLANNED)
+        orchestrator.workflow_engine.add_task(workflow.id, "Create post", TaskType.PLANNED)
+
+        result = await orchestrator.execute_workflow(workflow.id)
+
+        assert result["status"] == TaskStatus.COMPLETED.value
+        assert created_in == [created_in[0]] and created_in[0] is not threading.current_thread()
+        assert pool.get_stats()["instantiations"] == 1
+        db.close()
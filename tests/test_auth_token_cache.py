@@ -0,0 +1,143 @@
+"""
+Тесты кэшированной проверки access-токенов
+"""
+
+import pytest
+from sqlalchemy import event
+
+from app.auth.models.user import User, UserSession, UserStatus
+from app.auth.services.auth_service import AuthService
+from app.auth.services.token_cache import LastUsedBuffer, LocalTokenCache, TokenCache
+
+
+class QueryCounter:
+    """Считает SQL-запросы к engine"""
+
+    def __init__(self, engine):
+        self.statements = []
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def reset(self):
+        self.statements.clear()
+
+
+@pytest.fixture
+def auth(db_session_factory):
+    """AuthService с отдельным кэшем и буфером, пользователь и его токен"""
+    db = db_session_factory()
+    user = User(email="user@example.com", username="user", password_hash="x",
+                status=UserStatus.ACTIVE)
+    db.add(user)
+    db.commit()
+
+    service = AuthService(
+        db, "test-secret-key-for-token-cache-tests", email_service=None,
+        session_cache=TokenCache(LocalTokenCache(ttl=60, max_entries=1000)),
+        last_used=LastUsedBuffer(flush_interval=3600)
+    )
+    tokens = service._create_tokens(user)
+    db.commit()
+    db.refresh(user)
+
+    counter = QueryCounter(db_session_factory.kw["bind"])
+    return service, user, tokens["access_token"], counter, db
+
+
+class TestVerifyToken:
+    """Тесты для AuthService.verify_token"""
+
+    def test_cached_verification_skips_database(self, auth):
+        """Тест: повторная проверка токена не обращается к БД"""
+        service, user, token, counter, _ = auth
+
+        assert service.verify_token(token)[1]["user_id"] == user.id
+        assert len(counter.statements) == 1  # сессия и пользователь одним запросом
+
+        counter.reset()
+        for _ in range(100):
+            is_valid, payload = service.verify_token(token)
+            assert is_valid and payload["email"] == "user@example.com"
+
+        assert counter.statements == []
+        assert service.session_cache.get_stats()["hits"] == 100
+
+    def test_logout_invalidates_cache(self, auth):
+        """Тест: после logout токен сразу перестает проходить проверку"""
+        service, _, token, _, _ = auth
+        jti = service.verify_token(token)[1]["jti"]
+
+        service.logout_user(jti)
+
+        assert service.verify_token(token) == (False, None)
+
+    def test_logout_all_sessions_invalidates_user(self, auth):
+        """Тест: выход из всех сессий инвалидирует кэш всех токенов пользователя"""
+        service, user, token, _, db = auth
+        second_token = service._create_tokens(user)["access_token"]
+        db.commit()
+        assert service.verify_token(token)[0] and service.verify_token(second_token)[0]
+
+        service.logout_all_sessions(user.id)
+
+        assert service.verify_token(token)[0] is False
+        assert service.verify_token(second_token)[0] is False
+
+    def test_revoked_session_rejected_immediately(self, auth):
+        """Тест: отозванная сессия сразу перестает проходить проверку, остальные работают"""
+        service, user, token, _, db = auth
+        second_token = service._create_tokens(user)["access_token"]
+        db.commit()
+        jti = service.verify_token(token)[1]["jti"]
+        assert service.verify_token(second_token)[0]
+
+        session = db.query(UserSession).filter(UserSession.token_jti == jti).one()
+        service.revoke_session(session)
+
+        assert service.verify_token(token) == (False, None)
+        assert service.verify_token(second_token)[0] is True
+
+    def test_last_used_coalesced_and_flushed(self, auth):
+        """Тест: last_used копится в памяти и пишется одним пакетом"""
+        service, _, token, counter, db = auth
+        for _ in range(50):
+            service.verify_token(token)
+        assert not any(s.lstrip().upper().startswith("UPDATE") for s in counter.statements)
+
+        assert service.last_used.flush(db) == 1
+
+        updates = [s for s in counter.statements if s.lstrip().upper().startswith("UPDATE")]
+        assert len(updates) == 1
+        assert service.last_used.get_stats()["coalesced"] == 49
+        session = db.query(UserSession).one()
+        db.refresh(session)
+        assert session.last_used >= session.created_at
+
+    def test_invalid_tokens_rejected(self, auth):
+        """Тест: чужая подпись и refresh-тип токена отклоняются"""
+        service, _, token, _, _ = auth
+        other = AuthService(service.db, "other-secret-key-for-token-cache-tests", email_service=None)
+
+        assert other.verify_token(token) == (False, None)
+        assert service.verify_token("not-a-jwt") == (False, None)
+
+
+class TestLocalTokenCache:
+    """Тесты для LocalTokenCache"""
+
+    def test_lru_eviction_keeps_user_index_consistent(self):
+        """Тест: вытеснение старых записей чистит индекс по пользователю"""
+        from app.auth.services.token_cache import CachedSession
+        cache = LocalTokenCache(ttl=60, max_entries=2)
+        entry = CachedSession(user_id=1, email="a", role="user", status="active",
+                              is_active=True, expires_at=0)
+
+        for jti in ("a", "b", "c"):
+            cache.set(jti, entry)
+
+        assert cache.get("a") is None
+        assert len(cache) == 2
+        cache.invalidate_user(1)
+        assert len(cache) == 0
@@ -0,0 +1,69 @@
+"""
+Тесты захвата правил автопостинга несколькими worker'ами
+"""
+
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+
+from app.models.auto_posting_rules import AutoPostingRuleDB
+from app.services.auto_posting_service import AutoPostingService
+
+
+def seed_rules(db, count: int):
+    """Создает наступившие правила"""
+    for index in range(count):
+        db.add(AutoPostingRuleDB(
+            user_id=1, name=f"rule {index}", schedule_type="daily",
+            schedule_config={"times": ["10:00"]}, content_config={}, platforms=["telegram"],
+            next_execution_at=datetime.utcnow() - timedelta(minutes=1)
+        ))
+    db.commit()
+
+
+class TestClaimRulesToExecute:
+    """Тесты для AutoPostingService.claim_rules_to_execute"""
+
+    def test_concurrent_workers_claim_disjoint_rules(self, file_db_session_factory):
+        """Тест: параллельные worker'ы получают непересекающиеся наборы правил"""
+        seed_rules(file_db_session_factory(), 40)
+        claimed = Counter()
+        lock = threading.Lock()
+
+        def claim(worker_id):
+            db = file_db_session_factory()
+            try:
+                while True:
+                    rules = AutoPostingService(db).claim_rules_to_execute(worker_id, limit=3)
+                    if not rules:
+                        break
+                    with lock:
+                        claimed.update(rule.id for rule in rules)
+            finally:
+                db.close()
+
+        threads = [threading.Thread(target=claim, args=(f"worker-{i}",)) for i in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=30)
+
+        assert len(claimed) == 40
+        assert set(claimed.values()) == {1}
+
+    def test_mark_execution_releases_lease(self, db_session_factory):
+        """Тест: после выполнения аренда снимается, правило ждет следующего запуска"""
+        db = db_session_factory()
+        seed_rules(db, 1)
+        service = AutoPostingService(db)
+
+        rule = service.claim_rules_to_execute("worker-1")[0]
+        assert rule.claimed_by == "worker-1"
+        assert service.claim_rules_to_execute("worker-2") == []
+
+        service.mark_execution(rule.id, success=True)
+        db.refresh(rule)
+
+        assert rule.claimed_by is None and rule.lease_expires_at is None
+        assert rule.next_execution_at > datetime.utcnow()
+        assert service.claim_rules_to_execute("worker-2") == []
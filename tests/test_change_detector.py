@@ -0,0 +1,130 @@
+"""
+Тесты поблочного определения изменений на страницах
+"""
+
+from app.services.content_extractor import ChangeDetector
+from app.services.page_blocks import FingerprintIndex, normalize_text, segment_blocks, simhash
+
+TITLES = ["Открылся новый парк в центре города", "Мэрия утвердила план ремонта дорог",
+          "В музее открылась выставка современного искусства", "Школьники победили на олимпиаде по физике",
+          "Стартовал прием заявок на городские гранты"]
+
+
+def page(articles, stamp="10:00", views=5, ad="Купите слона со скидкой сегодня"):
+    """Страница новостей с шумом: время обновления, счетчики, реклама, меню"""
+    cards = "".join(
+        f'<article class="card"><h2><a href="/news/{i}">{title}</a></h2>'
+        f'<p>Подробности: {title.lower()}, рассказали в пресс-службе. '
+        f'<span class="views">{views + i} просмотров</span> <time>16 октября 2026, {stamp}</time></p></article>'
+        for i, title in articles
+    )
+    return f"""<html><head><title>Новости</title><script>var updated = "{stamp}";</script></head><body>
+<header><a href="/">Городской портал</a> Обновлено в {stamp}</header>
+<nav><ul><li>Главная</li><li>Новости</li><li>Контакты</li></ul></nav>
+<div class="ad-top">{ad}</div>
+<main><div class="news">{cards}</div>
+<p>Подписывайтесь на наш канал, чтобы не пропустить важное</main>
+<footer>© 2026 Городской портал. Все права защищены</footer></body></html>"""
+
+
+def articles(*indexes):
+    return [(i, TITLES[i]) for i in indexes]
+
+
+class TestPageBlocks:
+    """Тесты для segment_blocks / simhash"""
+
+    def test_segments_content_and_skips_boilerplate(self):
+        """Тест: блоки - статьи и текст страницы; скрипты, меню, шапка, подвал и реклама пропускаются"""
+        blocks = segment_blocks(page(articles(0, 1)))
+
+        assert [block.tag for block in blocks] == ["article", "article", "p"]
+        assert blocks[0].text.startswith("Открылся новый парк в центре города Подробности")
+        assert '<a href="/news/0">' in blocks[0].html and 'class=' not in blocks[0].html
+        text = " ".join(block.text for block in blocks)
+        for noise in ("Главная", "слона", "Все права", "updated"):
+            assert noise not in text
+
+    def test_volatile_text_normalized(self):
+        """Тест: даты, время и счетчики не влияют на отпечаток"""
+        assert normalize_text("5 минут назад, 16 октября 2026 в 10:35 - 120 просмотров") == \
+            normalize_text("вчера, 17 октября 2026 в 09:05 - 7 просмотров")
+        assert simhash(normalize_text("Курс доллара на 16.10.2026")) == simhash(normalize_text("Курс доллара на 17.10.2026"))
+
+    def test_fingerprint_index_distance(self):
+        """Тест: поиск отпечатков в пределах расстояния Хэмминга"""
+        base = simhash("открылся новый парк в центре города")
+        index = FingerprintIndex([base], max_distance=3)
+        assert index.find(base ^ 0b1011) == base
+        assert index.find(base ^ (1 << 63) ^ (1 << 40) ^ (1 << 20) ^ 1) is None
+
+
+class TestChangeDetector:
+    """Тесты для ChangeDetector.detect_changes"""
+
+    def test_first_check_takes_all_blocks(self):
+        """Тест: без снимка все блоки новые, снимок хранит отпечатки блоков и хеш страницы"""
+        changes = ChangeDetector().detect_changes(page(articles(0, 1)), None)
+
+        assert changes["change_type"] == "new_content"
+        assert len(changes["new_blocks"]) == 3
+        assert len(changes["snapshot"]["blocks"]) == 3
+        assert changes["snapshot"]["hash"] == changes["new_hash"]
+        assert changes["snapshot_updated"]
+
+    def test_noise_is_not_a_change(self):
+        """Тест: смена времени, счетчиков и рекламы не вызывает извлечения"""
+        detector = ChangeDetector()
+        first = detector.detect_changes(page(articles(0, 1, 2)), None)
+        changes = detector.detect_changes(page(articles(0, 1, 2), stamp="11:45", views=90, ad="Лучшие кредиты"),
+                                          first["snapshot"])
+
+        assert not changes["has_changes"]
+        assert changes["change_type"] == "no_changes"
+        assert changes["new_hash"] != first["new_hash"]
+
+    def test_only_new_blocks_extracted(self):
+        """Тест: новая статья сверху - в new_html только она"""
+        detector = ChangeDetector()
+        first = detector.detect_changes(page(articles(0, 1, 2)), None)
+        changes = detector.detect_changes(page(articles(3, 0, 1, 2), stamp="12:00"), first["snapshot"])
+
+        assert changes["change_type"] == "updated_content"
+        assert [block.tag for block in changes["new_blocks"]] == ["article"]
+        assert TITLES[3] in changes["new_html"]
+        assert all(TITLES[i] not in changes["new_html"] for i in (0, 1, 2))
+
+    def test_rotating_blocks_remembered(self):
+        """Тест: исчезнувшие блоки помнятся - вернувшийся блок карусели не считается новым"""
+        detector = ChangeDetector(max_snapshot_blocks=10)
+        snapshot = detector.detect_changes(page(articles(0, 1)), None)["snapshot"]
+        snapshot = detector.detect_changes(page(articles(2, 3)), snapshot)["snapshot"]
+        changes = detector.detect_changes(page(articles(0, 1)), snapshot)
+
+        assert not changes["has_changes"]
+        # Текущие блоки первыми, затем запомненные
+        assert len(changes["snapshot"]["blocks"]) == 5
+        capped = ChangeDetector(max_snapshot_blocks=3).detect_changes(page(articles(0, 1)), snapshot)
+        assert capped["snapshot"]["blocks"] == changes["snapshot"]["blocks"][:3]
+
+    def test_legacy_hash_snapshot(self):
+        """Тест: снимок старого формата (только хеш) переводится на блоки без лишнего извлечения"""
+        detector = ChangeDetector()
+        html = page(articles(0, 1))
+        legacy = {"hash": detector.detect_changes(html, None)["new_hash"], "timestamp": "2025-01-01T00:00:00"}
+
+        same = detector.detect_changes(html, legacy)
+        assert not same["has_changes"] and same["snapshot_updated"]
+        assert len(same["snapshot"]["blocks"]) == 3
+
+        changed = detector.detect_changes(page(articles(0, 1, 2)), legacy)
+        assert changed["change_type"] == "updated_content" and len(changed["new_blocks"]) == 4
+
+    def test_page_without_blocks_compares_hash(self):
+        """Тест: страница без текстовых блоков сравнивается по хешу, извлекается целиком"""
+        detector = ChangeDetector()
+        first = detector.detect_changes("<html><body><img src='/a.png'></body></html>", None)
+        assert first["has_changes"] and first["new_html"] is None
+
+        same = detector.detect_changes("<html><body><img src='/a.png'></body></html>", first["snapshot"])
+        assert not same["has_changes"] and not same["snapshot_updated"]
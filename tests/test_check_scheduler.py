@@ -0,0 +1,137 @@
+"""
+Тесты адаптивного расписания проверок источников
+"""
+
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from app.models.content_sources import ContentSource, SourceCheckHistory
+from app.services import check_scheduler
+from app.services.check_scheduler import AdaptiveCheckScheduler
+from app.services.content_source_service import ContentSourceService
+
+START = datetime(2025, 1, 1)
+
+
+def make_source(**overrides):
+    fields = dict(check_interval_minutes=60, min_check_interval_minutes=None, max_check_interval_minutes=None,
+                  change_interval_minutes=None, last_change_at=None, created_at=START, auto_post_enabled=False)
+    fields.update(overrides)
+    return SimpleNamespace(**fields)
+
+
+@pytest.fixture
+def scheduler():
+    return AdaptiveCheckScheduler(enabled=True, alpha=0.5, fraction=0.5, auto_post_factor=0.5,
+                                  min_minutes=10, max_minutes=1440)
+
+
+@pytest.fixture
+def db(db, monkeypatch, scheduler):
+    """Общая временная БД (conftest); сервисы используют тестовый планировщик"""
+    monkeypatch.setattr(check_scheduler, "_check_scheduler", scheduler)
+    return db
+
+
+def check_at(scheduler, source, minutes: float, changed: bool) -> float:
+    """Проверка в момент START + minutes; возвращает интервал до следующей"""
+    now = START + timedelta(minutes=minutes)
+    return (scheduler.schedule(source, changed, now) - now).total_seconds() / 60
+
+
+class TestAdaptiveCheckScheduler:
+    """Тесты для AdaptiveCheckScheduler"""
+
+    def test_unknown_rate_uses_user_interval(self, scheduler):
+        """Тест: пока частота изменений неизвестна, используется check_interval_minutes"""
+        source = make_source(check_interval_minutes=45)
+        assert check_at(scheduler, source, 45, changed=True) == 45
+        assert source.last_change_at == START + timedelta(minutes=45)
+
+    def test_learns_change_interval(self, scheduler):
+        """Тест: оценка - скользящее среднее интервалов между изменениями, проверка через ее долю"""
+        source = make_source(last_change_at=START)
+        check_at(scheduler, source, 100, changed=True)
+        assert source.change_interval_minutes == 100
+        interval = check_at(scheduler, source, 300, changed=True)
+        assert source.change_interval_minutes == 150  # 0.5 * 200 + 0.5 * 100
+        assert interval == 75
+
+    def test_quiet_source_backs_off_to_max(self, scheduler):
+        """Тест: источник без изменений проверяется все реже, но не реже max границы"""
+        source = make_source()
+        t, intervals = 60.0, []
+        for _ in range(40):
+            interval = check_at(scheduler, source, t, changed=False)
+            intervals.append(interval)
+            t += interval
+        assert intervals == sorted(intervals)
+        assert intervals[-1] == 1440
+        assert source.change_interval_minutes == 2880
+        # Изменение снова сокращает интервал
+        check_at(scheduler, source, t, changed=True)
+        assert check_at(scheduler, source, t + 30, changed=True) < 1440
+
+    def test_bounds_and_auto_post_priority(self, scheduler):
+        """Тест: границы источника ограничивают интервал, автопостинг сокращает его"""
+        source = make_source(change_interval_minutes=200)
+        assert scheduler.next_interval_minutes(source) == 100
+        source.auto_post_enabled = True
+        assert scheduler.next_interval_minutes(source) == 50
+        source.min_check_interval_minutes = 90
+        assert scheduler.next_interval_minutes(source) == 90
+        source.change_interval_minutes = 100000
+        source.max_check_interval_minutes = 720
+        assert scheduler.next_interval_minutes(source) == 720
+        # min больше max - побеждает min
+        source.max_check_interval_minutes = 30
+        assert scheduler.bounds(source) == (90, 90)
+
+    def test_disabled_uses_fixed_interval(self):
+        """Тест: CHECK_SCHEDULE_ADAPTIVE=false - прежний фиксированный интервал"""
+        scheduler = AdaptiveCheckScheduler(enabled=False)
+        source = make_source(change_interval_minutes=10)
+        assert check_at(scheduler, source, 60, changed=True) == 60
+        assert source.last_change_at is None
+
+
+class TestCheckScheduling:
+    """Тесты расписания в ContentSourceService"""
+
+    def add_source(self, db, name: str, **fields) -> ContentSource:
+        source = ContentSource(user_id=1, name=name, source_type="rss", url=f"https://{name}.example.com/rss",
+                               next_check_at=datetime.utcnow() - timedelta(minutes=1), **fields)
+        db.add(source)
+        db.commit()
+        return source
+
+    def test_estimate_bootstrapped_from_history(self, db):
+        """Тест: первая адаптивная проверка берет оценку из истории проверок"""
+        source = self.add_source(db, "news", auto_post_enabled=False)
+        now = datetime.utcnow()
+        for minutes_ago, items_new in ((300, 2), (240, 0), (200, 1), (100, 3)):
+            db.add(SourceCheckHistory(source_id=source.id, status="success", items_new=items_new,
+                                      checked_at=now - timedelta(minutes=minutes_ago)))
+        db.commit()
+
+        assert ContentSourceService.update_check_status(source.id, "success", items_new=0)
+        db.expire_all()
+        source = db.get(ContentSource, source.id)
+        # Интервалы между изменениями 100 и 100 минут, изменений нет 100 минут - оценка 100
+        assert source.change_interval_minutes == pytest.approx(100, abs=0.1)
+        assert (source.next_check_at - source.last_check_at).total_seconds() / 60 == pytest.approx(50, abs=0.1)
+
+    def test_changed_flag_overrides_items_new(self, db):
+        """Тест: changed из проверки имеет приоритет над items_new"""
+        source = self.add_source(db, "blog", last_change_at=datetime.utcnow() - timedelta(minutes=120))
+        ContentSourceService.update_check_status(source.id, "success", items_new=0, changed=True)
+        db.expire_all()
+        assert db.get(ContentSource, source.id).change_interval_minutes == pytest.approx(120, abs=0.1)
+
+    def test_auto_post_sources_checked_first(self, db):
+        """Тест: среди наступивших источников первыми выдаются источники с автопостингом"""
+        self.add_source(db, "plain", auto_post_enabled=False)
+        self.add_source(db, "autopost", auto_post_enabled=True)
+        assert [source.name for source in ContentSourceService.get_sources_to_check()] == ["autopost", "plain"]
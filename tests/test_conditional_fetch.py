@@ -0,0 +1,161 @@
+"""
+Тесты условной загрузки источников и кеша поиска RSS
+"""
+
+import asyncio
+from datetime import datetime
+
+import httpx
+import pytest
+
+from app.models.content_sources import ContentSource, SourceCheckHistory
+from app.services import content_extractor
+from app.services.content_extractor import RSSParser
+from app.services.content_source_service import ContentSourceService, SourceCheckHistoryService
+from app.utils.disk_cache import MISS, DiskCache
+from app.workers.crawl_engine import FetchStats, conditional_headers, fetch_result
+
+FEED_URL = "https://news.example.com/rss.xml"
+PAGE_HTML = '<html><head><link rel="alternate" type="application/rss+xml" href="/rss.xml"></head></html>'
+
+
+def response(status: int, body: bytes = b"", headers=None) -> httpx.Response:
+    """Ответ, прочитанный как после запроса (num_bytes_downloaded = размер тела)"""
+    result = httpx.Response(status, headers=headers, stream=httpx.ByteStream(body),
+                            request=httpx.Request("GET", FEED_URL))
+    result.read()
+    return result
+
+
+@pytest.fixture
+def discovery_cache(tmp_path, monkeypatch):
+    cache = DiskCache(str(tmp_path / "discovery"))
+    monkeypatch.setattr(content_extractor, "_discovery_cache", cache)
+    return cache
+
+
+class TestConditionalFetch:
+    """Тесты для conditional_headers / fetch_result / FetchStats"""
+
+    def test_validators_roundtrip(self):
+        """Тест: валидаторы ответа 200 отправляются в следующем запросе к тому же url"""
+        body = b"<rss>" + b"x" * 995 + b"</rss>"
+        first = fetch_result(FEED_URL, response(200, body, {
+            "ETag": '"v1"', "Last-Modified": "Wed, 01 Jan 2025 00:00:00 GMT"
+        }), None)
+        validators = first["http_validators"]
+
+        assert validators == {"url": FEED_URL, "etag": '"v1"',
+                              "last_modified": "Wed, 01 Jan 2025 00:00:00 GMT", "content_length": 1006}
+        assert (first["not_modified"], first["bytes_downloaded"], first["bytes_saved"]) == (False, 1006, 0)
+        assert conditional_headers(validators, FEED_URL) == {
+            "If-None-Match": '"v1"', "If-Modified-Since": "Wed, 01 Jan 2025 00:00:00 GMT"
+        }
+        # Валидаторы другого url (например, найденного RSS) не применяются
+        assert conditional_headers(validators, "https://news.example.com/") == {}
+
+    def test_not_modified_keeps_validators(self):
+        """Тест: 304 считается экономией размера прошлого ответа и не меняет валидаторы"""
+        validators = {"url": FEED_URL, "etag": '"v1"', "last_modified": None, "content_length": 5000}
+        result = fetch_result(FEED_URL, response(304), validators)
+        assert result == {"http_status": 304, "not_modified": True, "bytes_downloaded": 0,
+                          "bytes_saved": 5000, "http_validators": None}
+
+        # Ответ без валидаторов очищает сохраненные, ошибка - оставляет
+        assert fetch_result(FEED_URL, response(200, b"body"), validators)["http_validators"] == {}
+        assert fetch_result(FEED_URL, response(500), validators)["http_validators"] is None
+
+        stats = FetchStats()
+        stats.record(True, result)
+        stats.record(False, fetch_result(FEED_URL, response(200, b"body"), None))
+        assert stats.get_stats() == {"requests": 2, "conditional": 1, "not_modified": 1, "not_modified_rate": 0.5,
+                                     "bytes_downloaded": 4, "bytes_saved": 5000}
+
+    def test_validators_and_history_persisted(self, db):
+        """Тест: валидаторы сохраняются в источнике, 304 и трафик - в истории проверок"""
+        source = ContentSource(user_id=1, name="news", source_type="rss", url=FEED_URL)
+        db.add(source)
+        db.commit()
+        validators = {"url": FEED_URL, "etag": '"v1"', "last_modified": None, "content_length": 5000}
+
+        ContentSourceService.update_check_status(source.id, "success", http_validators=validators)
+        ContentSourceService.update_check_status(source.id, "success")
+        db.expire_all()
+        assert db.get(ContentSource, source.id).http_validators == validators
+
+        SourceCheckHistoryService.create_history(source.id, 3, 3, 0, 0, "success", http_status=200,
+                                                 bytes_downloaded=5000)
+        for _ in range(3):
+            SourceCheckHistoryService.create_history(source.id, 0, 0, 0, 0, "success", http_status=304,
+                                                     not_modified=True, bytes_saved=5000)
+        db.add(SourceCheckHistory(source_id=source.id + 1, status="success", not_modified=True, bytes_saved=1))
+        db.commit()
+
+        assert SourceCheckHistoryService.get_fetch_stats(source.id) == {
+            "checks": 4, "not_modified": 3, "not_modified_rate": 0.75,
+            "bytes_downloaded": 5000, "bytes_saved": 15000
+        }
+        assert SourceCheckHistoryService.get_fetch_stats()["checks"] == 5
+        assert SourceCheckHistoryService.get_source_history(source.id)[0].to_dict()["not_modified"] is True
+
+
+class TestDiscoveryCache:
+    """Тесты кеша поиска RSS на диске"""
+
+    def test_disk_cache_ttl_and_none(self, tmp_path):
+        """Тест: закешированный None отличается от промаха, устаревшие записи не возвращаются"""
+        cache = DiskCache(str(tmp_path / "cache"), ttl_seconds=60)
+        assert cache.get("feed:a") is MISS
+        cache.set("feed:a", None)
+        cache.set("feed:b", "https://b/rss", ttl_seconds=-1)
+        assert cache.get("feed:a") is None
+        assert cache.get("feed:b") is MISS
+
+        # Другой экземпляр (процесс) видит те же записи
+        assert DiskCache(str(tmp_path / "cache")).get("feed:a") is None
+        assert cache.get_stats()["hits"] == 1
+
+    def test_disk_cache_prunes_oldest(self, tmp_path):
+        """Тест: при переполнении удаляются самые старые записи"""
+        cache = DiskCache(str(tmp_path / "cache"), max_entries=10)
+        for i in range(25):
+            cache.set(f"k{i}", i)
+        cache.prune()
+        assert len(list((tmp_path / "cache").glob("*.json"))) == 10
+        assert cache.get("k24") == 24
+
+    def test_discovery_result_cached(self, discovery_cache):
+        """Тест: повторный поиск RSS страницы не делает запросов, пробы кешируются по url"""
+        calls = []
+
+        async def fetch(method, url, **kwargs):
+            calls.append((method, url))
+            if method == "GET":
+                return response(200, PAGE_HTML.encode())
+            return response(404)
+
+        async def scenario():
+            first = await RSSParser.discover_rss_feed_async("https://news.example.com/", fetch)
+            second = await RSSParser.discover_rss_feed_async("https://news.example.com/", fetch)
+            return first, second
+
+        assert asyncio.run(scenario()) == (FEED_URL, FEED_URL)
+        assert calls == [("GET", "https://news.example.com/")]
+
+        RSSParser.forget_discovered_feed("https://news.example.com/")
+        calls.clear()
+
+        # Страница без <link>: стандартные пути проверяются HEAD, ответы кешируются
+        async def no_link(method, url, **kwargs):
+            calls.append((method, url))
+            return response(200, b"<html></html>", {"Content-Type": "text/html"})
+
+        async def probes():
+            await RSSParser.discover_rss_feed_async("https://blog.example.com/a", no_link)
+            await RSSParser.discover_rss_feed_async("https://blog.example.com/b", no_link)
+
+        asyncio.run(probes())
+        heads = [url for method, url in calls if method == "HEAD"]
+        # /rss, /feed и т.д. общие для страниц сайта - проверяются один раз
+        assert heads.count("https://blog.example.com/rss") == 1
+        assert RSSParser._cached_feed("https://blog.example.com/a") is None
@@ -0,0 +1,231 @@
+"""
+Тесты фонового выполнения создания контента (ContentJobManager)
+"""
+
+import asyncio
+import json
+import time
+
+import pytest
+
+from app.billing.middleware import agent_access_middleware
+from app.billing.services import token_usage_recorder
+from app.billing.services.token_usage_recorder import TokenUsageRecorder
+from app.billing.services.quota_engine import LocalQuotaStore, QuotaEngine
+from app.orchestrator.main_orchestrator import ContentOrchestrator
+from app.orchestrator.agent_manager import BaseAgent, AgentCapability
+from app.models.content import TokenUsageDB
+from app.orchestrator.content_jobs import ContentJobManager, JobStatus, JobQueueFullError, StreamLimitError
+from app.orchestrator.workflow_engine import TaskType
+
+
+class SlowDraftingAgent(BaseAgent):
+    """Агент, создающий контент с задержкой"""
+
+    def __init__(self):
+        capability = AgentCapability(task_types=[TaskType.PLANNED], max_concurrent_tasks=10)
+        super().__init__("drafting", "Drafting", capability)
+
+    async def execute_task(self, task):
+        await asyncio.sleep(0.2)
+        return {"content": {"text": f"Пост для {task.context.get('platform')}"}, "tokens_used": 120}
+
+
+REQUEST = {
+    "title": "Запуск продукта",
+    "description": "Рассказываем о запуске нового продукта",
+    "platforms": ["telegram", "vk"],
+    "publish_immediately": False,
+    "user_id": 7
+}
+
+
+@pytest.fixture
+def quota(db_session_factory, monkeypatch):
+    """Движок квот теста: учет использования агентов не уходит в общий движок процесса"""
+    engine = QuotaEngine(LocalQuotaStore(), session_factory=db_session_factory,
+                         flush_interval=3600, reconcile_interval=3600)
+    engine._ensure_started = lambda: None
+    monkeypatch.setattr(agent_access_middleware, "get_quota_engine", lambda: engine)
+    return engine
+
+
+@pytest.fixture
+def recorder(db_session_factory, monkeypatch, tmp_path):
+    """Recorder расхода токенов теста (сброс - только вручную)"""
+    recorder = TokenUsageRecorder(session_factory=db_session_factory, flush_interval=3600,
+                                  spill_path=str(tmp_path / "spill.jsonl"))
+    monkeypatch.setattr(token_usage_recorder, "get_token_usage_recorder", lambda: recorder)
+    yield recorder
+    recorder.close()
+
+
+@pytest.fixture
+def orchestrator(quota, recorder):
+    """Оркестратор с агентом черновиков"""
+    orchestrator = ContentOrchestrator()
+    orchestrator.register_agent(SlowDraftingAgent())
+    return orchestrator
+
+
+@pytest.fixture
+def manager():
+    """Отдельный менеджер задач для теста"""
+    return ContentJobManager(max_concurrent_jobs=5, max_queued_jobs=2)
+
+
+def parse_sse(chunks):
+    """Разбирает SSE-поток в список (event, data)"""
+    events = []
+    for chunk in chunks:
+        if chunk.startswith(":"):
+            continue
+        fields = dict(line.split(": ", 1) for line in chunk.strip().split("\n"))
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+class TestContentJobManager:
+    """Тесты для ContentJobManager"""
+
+    def test_submit_returns_before_workflow_finishes(self, manager, orchestrator):
+        """Тест: submit сразу возвращает workflow_id, статус доступен во время выполнения"""
+        started = time.monotonic()
+        job = manager.submit(orchestrator, dict(REQUEST))
+
+        assert time.monotonic() - started < 0.15
+        assert job.status in (JobStatus.QUEUED, JobStatus.RUNNING)
+        assert orchestrator.get_workflow_status(job.workflow_id)["total_tasks"] == 2
+
+        events = parse_sse(manager.stream_events(job.workflow_id, heartbeat_seconds=0.05))
+
+        assert [name for name, _ in events] == ["queued", "started", "task", "task", "completed"]
+        assert {data["platform"] for name, data in events if name == "task"} == {"telegram", "vk"}
+        assert events[-1][1]["result"]["completed_tasks"] == 2
+        assert manager.get_job(job.workflow_id).status == JobStatus.COMPLETED
+
+    def test_agent_usage_recorded(self, manager, orchestrator, quota):
+        """Тест: каждая выполненная задача учитывается в счетчиках агента пользователя"""
+        job = manager.submit(orchestrator, dict(REQUEST))
+        list(manager.stream_events(job.workflow_id, heartbeat_seconds=0.05))
+
+        assert quota.agent_within_limits(7, "drafting", max_requests=3)
+        assert not quota.agent_within_limits(7, "drafting", max_requests=2)
+
+    def test_token_usage_recorded(self, manager, orchestrator, recorder, db_session_factory):
+        """Тест: каждая выполненная задача workflow дает строку token_usage"""
+        job = manager.submit(orchestrator, dict(REQUEST))
+        list(manager.stream_events(job.workflow_id, heartbeat_seconds=0.05))
+        recorder.flush()
+
+        db = db_session_factory()
+        rows = db.query(TokenUsageDB).all()
+        db.close()
+
+        assert {row.platform for row in rows} == {"telegram", "vk"}
+        assert {(row.user_id, row.agent_id, row.workflow_id) for row in rows} == {(7, "drafting", job.workflow_id)}
+        assert all(row.total_tokens == 120 and row.ai_provider == "" and row.cost_rub == 0 for row in rows)
+
+    def test_stream_resumes_from_last_event_id(self, manager, orchestrator):
+        """Тест: переподключение по Last-Event-ID отдает только новые события"""
+        job = manager.submit(orchestrator, dict(REQUEST))
+        list(manager.stream_events(job.workflow_id, heartbeat_seconds=0.05))
+
+        resumed = parse_sse(manager.stream_events(job.workflow_id, last_event_id=4))
+
+        assert [name for name, _ in resumed] == ["completed"]
+
+    def test_queue_limit(self, manager, orchestrator):
+        """Тест: при переполнении очереди новые задачи отклоняются"""
+        manager.submit(orchestrator, dict(REQUEST))
+        manager.submit(orchestrator, dict(REQUEST))
+
+        with pytest.raises(JobQueueFullError):
+            manager.submit(orchestrator, dict(REQUEST))
+
+    def test_failed_preparation_raises(self, manager, orchestrator):
+        """Тест: ошибка подготовки workflow возвращается вызывающему"""
+        with pytest.raises(ValueError):
+            manager.submit(orchestrator, {**REQUEST, "platforms": ["myspace"]})
+
+        assert manager.jobs == {}
+
+    def test_result_available_to_other_process(self, manager, orchestrator):
+        """Тест: задача другого процесса читается из WorkflowStore (статус, владелец, результат)"""
+        job = manager.submit(orchestrator, dict(REQUEST))
+        list(manager.stream_events(job.workflow_id, heartbeat_seconds=0.05))
+
+        # Менеджер другого gunicorn worker: в памяти задачи нет
+        other = ContentJobManager(store=orchestrator.workflow_engine.store)
+        assert other.get_job(job.workflow_id) is None
+
+        stored = other.find_job(job.workflow_id)
+        assert stored.status == JobStatus.COMPLETED
+        assert stored.user_id == 7
+        assert stored.brief_id == job.brief_id
+        assert stored.result["completed_tasks"] == 2
+        assert stored.events == []
+        assert other.find_job("missing") is None
+
+    def test_other_process_replays_stored_events(self, manager, orchestrator):
+        """Тест: другой процесс восстанавливает поток событий из WorkflowStore с той же нумерацией"""
+        job = manager.submit(orchestrator, dict(REQUEST))
+        local = parse_sse(manager.stream_events(job.workflow_id, heartbeat_seconds=0.05))
+
+        other = ContentJobManager(store=orchestrator.workflow_engine.store, stored_poll_seconds=0.05)
+        replayed = parse_sse(other.open_stream(job.workflow_id, heartbeat_seconds=0.05))
+
+        assert [name for name, _ in replayed] == [name for name, _ in local]
+        assert {data["platform"] for name, data in replayed if name == "task"} == {"telegram", "vk"}
+        assert replayed[-1][1]["result"]["completed_tasks"] == 2
+
+        resumed = parse_sse(other.open_stream(job.workflow_id, last_event_id=4))
+        assert [name for name, _ in resumed] == ["completed"]
+
+    def test_stream_limit(self, manager, orchestrator):
+        """Тест: сверх max_streams потоки отклоняются, закрытый или завершенный поток освобождает слот"""
+        manager.max_streams = 1
+        job = manager.submit(orchestrator, dict(REQUEST))
+
+        stream = manager.open_stream(job.workflow_id, heartbeat_seconds=0.05)
+        with pytest.raises(StreamLimitError):
+            manager.open_stream(job.workflow_id)
+
+        stream.close()
+        list(manager.open_stream(job.workflow_id, heartbeat_seconds=0.05))
+
+        assert manager.get_stats()["open_streams"] == 0
+
+    def test_events_endpoint(self, orchestrator, monkeypatch):
+        """Тест: /workflow/<id>/events отдает события задачи другого процесса и 503 сверх лимита потоков"""
+        import jwt
+        from flask import Flask
+        from flask_restx import Api
+
+        from app.api import routes
+        from app.auth.middleware import jwt as jwt_middleware
+        from app.utils.rate_limiter import RateLimiter
+
+        owner = ContentJobManager()
+        job = owner.submit(orchestrator, dict(REQUEST))
+        list(owner.stream_events(job.workflow_id, heartbeat_seconds=0.05))
+
+        other = ContentJobManager(store=orchestrator.workflow_engine.store, max_streams=1)
+        monkeypatch.setattr(routes, "content_job_manager", other)
+        monkeypatch.setattr(jwt_middleware, "rate_limiter", RateLimiter())
+        app = Flask(__name__)
+        app.config["SECRET_KEY"] = "test-secret-key-for-events-endpoint-tests"
+        Api(app).add_namespace(routes.api, path="/")
+        client = app.test_client()
+        headers = {"Authorization": f"Bearer {jwt.encode({'user_id': 7}, app.config['SECRET_KEY'], algorithm='HS256')}"}
+
+        response = client.get(f"/workflow/{job.workflow_id}/events", headers=headers)
+        assert response.status_code == 200
+        assert "event: completed" in response.get_data(as_text=True)
+
+        held = other.open_stream(job.workflow_id)
+        response = client.get(f"/workflow/{job.workflow_id}/events", headers=headers)
+        held.close()
+
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "5"
@@ -0,0 +1,212 @@
+"""
+Тесты конкурентного обхода источников (CrawlEngine, HostLimiter)
+"""
+
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app.workers.crawl_engine import CrawlEngine, HostLimiter
+
+
+class FakeSources:
+    """Источники с next_check_at: проверенный источник перестает быть наступившим"""
+
+    def __init__(self, urls):
+        self.sources = [SimpleNamespace(id=i, url=url) for i, url in enumerate(urls)]
+        self.due = {source.id for source in self.sources}
+        self.calls = []
+
+    def fetch_due(self, limit, exclude_ids):
+        self.calls.append(set(exclude_ids))
+        return [source for source in self.sources
+                if source.id in self.due and source.id not in exclude_ids][:limit]
+
+
+class Recorder:
+    """check(source): идет через HostLimiter и считает одновременные проверки"""
+
+    def __init__(self, sources: FakeSources, hosts: HostLimiter, duration: float = 0.05):
+        self.sources = sources
+        self.hosts = hosts
+        self.duration = duration
+        self.active = 0
+        self.max_active = 0
+        self.per_host_active = {}
+        self.max_per_host = 0
+        self.starts = {}
+
+    async def check(self, source):
+        host = HostLimiter.host_of(source.url)
+        async with self.hosts.slot(source.url):
+            self.active += 1
+            self.per_host_active[host] = self.per_host_active.get(host, 0) + 1
+            self.max_active = max(self.max_active, self.active)
+            self.max_per_host = max(self.max_per_host, self.per_host_active[host])
+            self.starts.setdefault(host, []).append(asyncio.get_running_loop().time())
+            await asyncio.sleep(self.duration)
+            self.per_host_active[host] -= 1
+            self.active -= 1
+        self.sources.due.discard(source.id)
+
+
+def run_engine(urls, concurrency, per_host=100, delay=0.0, queue_size=5, duration=0.05):
+    sources = FakeSources(urls)
+    hosts = HostLimiter(per_host=per_host, delay=delay)
+    recorder = Recorder(sources, hosts, duration)
+    engine = CrawlEngine(recorder.check, sources.fetch_due,
+                         concurrency=concurrency, queue_size=queue_size, hosts=hosts)
+    started = time.monotonic()
+    checked = asyncio.run(engine.run_once())
+    return engine, sources, recorder, checked, time.monotonic() - started
+
+
+class TestCrawlEngine:
+    """Тесты для CrawlEngine"""
+
+    def test_checks_each_due_source_once(self):
+        """Тест: каждый наступивший источник проверяется один раз, источники в работе исключаются из выборки"""
+        urls = [f"https://site{i}.example.com/feed" for i in range(23)]
+        engine, sources, recorder, checked, _ = run_engine(urls, concurrency=4, queue_size=5)
+
+        assert checked == 23
+        assert not sources.due
+        assert engine.get_stats()["checked"] == 23
+        # Каждая следующая выборка исключает уже выданные источники
+        assert all(len(a) <= len(b) for a, b in zip(sources.calls, sources.calls[1:]))
+        assert len(sources.calls[-1]) == 23
+
+    def test_global_concurrency_limit(self):
+        """Тест: одновременно проверяется не больше concurrency источников"""
+        urls = [f"https://site{i}.example.com/" for i in range(30)]
+        _, _, recorder, _, _ = run_engine(urls, concurrency=5)
+        assert recorder.max_active == 5
+
+    def test_throughput_scales_with_concurrency(self):
+        """Тест: медленные источники не блокируют обход - время падает с ростом concurrency"""
+        urls = [f"https://site{i}.example.com/" for i in range(20)]
+        *_, sequential = run_engine(urls, concurrency=1, duration=0.02)
+        *_, concurrent = run_engine(urls, concurrency=10, duration=0.02)
+        assert sequential >= 0.4
+        assert concurrent < sequential / 3
+
+    def test_failing_source_does_not_stop_run(self):
+        """Тест: ошибка проверки одного источника учитывается в метриках и не прерывает обход"""
+        sources = FakeSources([f"https://site{i}.example.com/" for i in range(5)])
+
+        async def check(source):
+            sources.due.discard(source.id)
+            if source.id == 2:
+                raise RuntimeError("boom")
+
+        engine = CrawlEngine(check, sources.fetch_due, concurrency=2, queue_size=2, hosts=HostLimiter())
+        assert asyncio.run(engine.run_once()) == 5
+        stats = engine.get_stats()
+        assert (stats["checked"], stats["errors"], stats["in_flight"], stats["queued"]) == (5, 1, 0, 0)
+        assert stats["sources_per_minute"] == 5
+        assert set(stats) >= {"concurrency", "queue_size", "runs", "last_run_seconds", "source_seconds", "hosts"}
+
+    def test_stop_skips_queued_sources(self):
+        """Тест: после stop() новые источники не берутся, run_once завершается"""
+        sources = FakeSources([f"https://site{i}.example.com/" for i in range(10)])
+        engine = None
+
+        async def check(source):
+            sources.due.discard(source.id)
+            if len(sources.due) == 9:
+                engine.stop()
+
+        engine = CrawlEngine(check, sources.fetch_due, concurrency=1, queue_size=5, hosts=HostLimiter())
+        assert asyncio.run(engine.run_once()) == 1
+        engine.resume()
+        assert asyncio.run(engine.run_once()) == 9
+
+
+class TestHostLimiter:
+    """Тесты для HostLimiter"""
+
+    def test_per_host_concurrency(self):
+        """Тест: к одному хосту не больше per_host одновременных запросов, другие хосты не ждут"""
+        urls = [f"https://news.example.com/{i}" for i in range(8)] + \
+               [f"https://other{i}.example.com/" for i in range(8)]
+        _, _, recorder, _, _ = run_engine(urls, concurrency=16, per_host=2)
+        assert recorder.max_per_host == 2
+        assert recorder.max_active > 2
+
+    def test_politeness_delay(self):
+        """Тест: начала запросов к одному хосту разнесены не меньше чем на delay"""
+        urls = [f"https://news.example.com/{i}" for i in range(4)] + ["https://other.example.com/"]
+        engine, _, recorder, _, _ = run_engine(urls, concurrency=5, per_host=4, delay=0.05, duration=0.0)
+
+        starts = recorder.starts["news.example.com"]
+        gaps = [b - a for a, b in zip(starts, starts[1:])]
+        assert len(starts) == 4
+        assert min(gaps) >= 0.045
+        stats = engine.hosts.get_stats()
+        assert stats["politeness_wait_seconds"] > 0
+        assert stats["top_hosts"]["news.example.com"]["requests"] == 4
+
+    def test_errors_counted_and_hosts_evicted(self):
+        """Тест: ошибки запросов считаются по хосту, состояние хранится для max_hosts хостов"""
+        hosts = HostLimiter(per_host=1, delay=0.0, max_hosts=2)
+
+        async def scenario():
+            for host in ("b", "c"):
+                async with hosts.slot(f"https://{host}.example.com/"):
+                    pass
+
+        async def fail():
+            with pytest.raises(ValueError):
+                async with hosts.slot("https://a.example.com/"):
+                    raise ValueError("timeout")
+
+        asyncio.run(fail())
+        assert hosts.get_stats()["top_hosts"]["a.example.com"]["errors"] == 1
+
+        asyncio.run(scenario())
+        stats = hosts.get_stats()
+        assert stats["hosts"] == 2
+        assert "a.example.com" not in stats["top_hosts"]
+        assert stats["top_hosts"]["b.example.com"]["errors"] == 0
+
+
+class TestWebCrawlerWorker:
+    """Тесты для WebCrawlerWorker"""
+
+    def test_db_calls_run_off_crawler_loop(self, monkeypatch):
+        """Тест: обращения проверки к БД выполняются в потоках пула БД, а не в потоке event loop"""
+        from app.workers import web_crawler_worker
+        from app.workers.web_crawler_worker import WebCrawlerWorker
+
+        worker = WebCrawlerWorker()
+        threads = {}
+
+        def recording(name, result):
+            def call(*args, **kwargs):
+                threads[name] = threading.current_thread().name
+                return result
+            return call
+
+        service = web_crawler_worker.MonitoredItemService
+        monkeypatch.setattr(service, "get_recent_external_ids", recording("known_ids", set()))
+        monkeypatch.setattr(service, "split_duplicates", recording("split", ([{"title": "Новость"}], 0)))
+        monkeypatch.setattr(service, "bulk_create_items", recording("save", ([SimpleNamespace(id=1)], 0)))
+
+        async def stream_feed(source, url, known_ids):
+            threads["fetch"] = threading.current_thread().name
+            return [{"title": "Новость"}], {"not_modified": False}
+
+        monkeypatch.setattr(worker, "_stream_feed", stream_feed)
+        source = SimpleNamespace(id=1, user_id=1, url="https://example.com/feed", keywords=None,
+                                 exclude_keywords=None, auto_post_enabled=False)
+        try:
+            result = worker.loop.submit(worker._check_rss_source(source))
+        finally:
+            worker.stop()
+
+        assert result["items_new"] == 1
+        assert threads["fetch"].startswith("web-crawler-loop")
+        assert all(threads[name].startswith("web-crawler-db") for name in ("known_ids", "split", "save"))
@@ -0,0 +1,218 @@
+"""
+Тесты пула соединений и сессий запроса / воркера
+"""
+
+import threading
+
+import pytest
+from flask import Flask
+from sqlalchemy import create_engine, exc, text
+
+from app.database import connection
+from app.database.connection import (
+    Base, InstrumentedQueuePool, ScopedSession, get_db_session, get_pool_settings,
+    import_all_models, init_request_sessions, instrument_engine, pool_metrics, worker_session
+)
+from app.models.project import Project
+
+
+@pytest.fixture
+def pooled_engine(tmp_path, monkeypatch):
+    """Файловая SQLite БД за InstrumentedQueuePool: 1 соединение + 1 overflow"""
+    import_all_models()
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}",
+        connect_args={"check_same_thread": False},
+        poolclass=InstrumentedQueuePool, pool_size=1, max_overflow=1, pool_timeout=0.2
+    )
+    instrument_engine(engine)
+    Base.metadata.create_all(engine)
+    pool_metrics.reset()
+    monkeypatch.setattr(connection, "engine", engine)
+    monkeypatch.setattr(connection, "SessionLocal", connection.sessionmaker(bind=engine))
+    yield engine
+    engine.dispose()
+
+
+def add_project(db, name: str) -> Project:
+    project = Project(user_id=1, name=name)
+    db.add(project)
+    return project
+
+
+class TestDatabasePool:
+    """Тесты для настройки пула и scoped сессий"""
+
+    def test_pool_settings_from_gunicorn_and_budget(self, monkeypatch):
+        """Тест: размер пула считается от потоков gunicorn и ограничивается бюджетом инстанса"""
+        monkeypatch.setenv("GUNICORN_THREADS", "16")
+        monkeypatch.setenv("GUNICORN_WORKERS", "2")
+        monkeypatch.setenv("DB_POOL_BACKGROUND_CONNECTIONS", "4")
+        monkeypatch.setenv("DB_MAX_CONNECTIONS_PER_INSTANCE", "0")
+        assert (get_pool_settings()["pool_size"], get_pool_settings()["max_overflow"]) == (20, 10)
+
+        monkeypatch.setenv("DB_MAX_CONNECTIONS_PER_INSTANCE", "24")
+        settings = get_pool_settings()
+        assert (settings["pool_size"], settings["max_overflow"]) == (12, 0)
+
+    def test_default_instance_total_below_sqlalchemy_default(self, monkeypatch):
+        """Тест: по умолчанию все workers инстанса держат не больше соединений, чем пул SQLAlchemy по умолчанию"""
+        for name in ("GUNICORN_THREADS", "GUNICORN_WORKERS", "DB_POOL_BACKGROUND_CONNECTIONS",
+                     "DB_POOL_SIZE", "DB_MAX_OVERFLOW", "DB_MAX_CONNECTIONS_PER_INSTANCE"):
+            monkeypatch.delenv(name, raising=False)
+        settings = get_pool_settings()
+        assert 2 * (settings["pool_size"] + settings["max_overflow"]) == 20
+
+        # Больше workers - тот же бюджет инстанса
+        monkeypatch.setenv("GUNICORN_WORKERS", "4")
+        settings = get_pool_settings()
+        assert (settings["pool_size"], settings["max_overflow"]) == (5, 0)
+
+    def test_checkout_metrics(self, pooled_engine):
+        """Тест: метрики пула считают ожидание, overflow и таймауты"""
+        first = pooled_engine.connect()
+        second = pooled_engine.connect()
+        with pytest.raises(exc.TimeoutError):
+            pooled_engine.connect()
+
+        stats = connection.get_pool_stats()
+        assert (stats["checkouts"], stats["in_use"], stats["overflow_events"], stats["timeouts"]) == (2, 2, 1, 1)
+        assert stats["max_wait_ms"] >= 200
+        assert stats["checked_out"] == 2
+
+        first.close()
+        second.close()
+        assert connection.get_pool_stats()["in_use"] == 0
+
+    def test_request_session_opt_out(self, pooled_engine, monkeypatch):
+        """Тест: с DB_REQUEST_SCOPED_SESSION=false каждый get_db_session() в запросе - отдельная сессия"""
+        monkeypatch.setattr(connection, "_request_scope_enabled", False)
+        monkeypatch.setenv("DB_REQUEST_SCOPED_SESSION", "false")
+        app = Flask(__name__)
+        init_request_sessions(app)
+
+        with app.test_request_context():
+            first = get_db_session()
+            second = get_db_session()
+            assert first is not second
+            first.close()
+            second.close()
+
+    def test_worker_session_shared_by_nested_helpers(self, pooled_engine):
+        """Тест: вложенные get_db_session() используют сессию воркера и не теряют изменения владельца"""
+        with worker_session() as db:
+            project = add_project(db, "outer")
+
+            helper = get_db_session()
+            assert helper is db
+            helper.query(Project).count()
+            helper.close()
+
+            # Изменения владельца остаются в его незакоммиченной транзакции
+            assert project in db and db.in_transaction()
+            db.commit()
+
+            helper = get_db_session()
+            loaded = helper.query(Project).one()
+            helper.close()
+            # Чтение завершено - соединение вернулось в пул, объект не expired
+            assert pooled_engine.pool.checkedout() == 0
+            assert "name" in loaded.__dict__
+
+        assert pool_metrics.get_stats()["in_use"] == 0
+        assert get_db_session() is not db
+
+    def test_outermost_borrower_discards_uncommitted(self, pooled_engine, monkeypatch):
+        """Тест: close() внешнего пользователя сессии запроса откатывает незакоммиченное"""
+        monkeypatch.setattr(connection, "_request_scope_enabled", False)
+        monkeypatch.setenv("DB_REQUEST_SCOPED_SESSION", "true")
+        app = Flask(__name__)
+        init_request_sessions(app)
+
+        with app.test_request_context():
+            outer = get_db_session()
+            add_project(outer, "dropped")
+            inner = get_db_session()
+            inner.close()
+            assert outer.in_transaction() and outer.query(Project).count() == 1
+            outer.close()
+            assert not outer.new
+            assert get_db_session().query(Project).count() == 0
+            app.do_teardown_request()
+
+    def test_request_session_closed_on_teardown(self, pooled_engine, monkeypatch):
+        """Тест: одна сессия на запрос (по умолчанию), закрывается в teardown; из других потоков не используется"""
+        monkeypatch.setattr(connection, "_request_scope_enabled", False)
+        monkeypatch.delenv("DB_REQUEST_SCOPED_SESSION", raising=False)
+        app = Flask(__name__)
+        init_request_sessions(app)
+        seen = {}
+
+        @app.route("/projects")
+        def projects():
+            first = get_db_session()
+            add_project(first, "request")
+            first.commit()
+            first.close()
+            second = get_db_session()
+            seen["same"] = second is first
+            seen["scoped"] = isinstance(second, ScopedSession)
+            seen["count"] = second.query(Project).count()
+            # Поток без своего scope получает обычную сессию
+            other = []
+            thread = threading.Thread(target=lambda: other.append(get_db_session()))
+            thread.start()
+            thread.join()
+            seen["other_thread"] = other[0] is not first
+            other[0].close()
+            return {"ok": True}
+
+        assert app.test_client().get("/projects").status_code == 200
+        assert seen == {"same": True, "scoped": True, "count": 1, "other_thread": True}
+        assert pooled_engine.pool.checkedout() == 0
+        with pooled_engine.connect() as conn:
+            assert conn.execute(text("SELECT COUNT(*) FROM projects")).scalar() == 1
+
+    def test_nested_helper_rollback_keeps_outer_work(self, pooled_engine, monkeypatch):
+        """Тест: rollback() вложенного помощника откатывает только его работу, внешняя коммитится"""
+        monkeypatch.setattr(connection, "_request_scope_enabled", False)
+        app = Flask(__name__)
+        init_request_sessions(app)
+
+        with app.test_request_context():
+            outer = get_db_session()
+            add_project(outer, "outer")
+
+            helper = get_db_session()
+            add_project(helper, "failed helper")
+            helper.flush()
+            helper.rollback()
+            helper.close()
+
+            helper = get_db_session()
+            add_project(helper, "helper")
+            helper.commit()
+            helper.close()
+            # commit() помощника не коммитит транзакцию внешнего пользователя
+            with pooled_engine.connect() as conn:
+                assert conn.execute(text("SELECT COUNT(*) FROM projects")).scalar() == 0
+
+            outer.commit()
+            outer.close()
+            app.do_teardown_request()
+
+        with pooled_engine.connect() as conn:
+            names = conn.execute(text("SELECT name FROM projects ORDER BY id")).scalars().all()
+        assert names == ["outer", "helper"]
+        assert pooled_engine.pool.checkedout() == 0
+
+    def test_worker_helper_commit_over_clean_scope(self, pooled_engine):
+        """Тест: без изменений владельца commit() помощника в воркере сразу фиксирует данные"""
+        with worker_session():
+            helper = get_db_session()
+            add_project(helper, "helper")
+            helper.commit()
+            helper.close()
+
+            with pooled_engine.connect() as conn:
+                assert conn.execute(text("SELECT COUNT(*) FROM projects")).scalar() == 1
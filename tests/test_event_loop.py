@@ -0,0 +1,125 @@
+"""
+Тесты общего фонового event loop процесса
+"""
+
+import asyncio
+import threading
+
+import pytest
+
+from app.utils import event_loop
+from app.utils.event_loop import BackgroundEventLoop, get_background_loop, run_coroutine
+
+
+@pytest.fixture
+def background_loop():
+    """Отдельный loop на тест, останавливается после теста"""
+    loop = BackgroundEventLoop(name="test-loop")
+    yield loop
+    loop.stop()
+
+
+class TestBackgroundEventLoop:
+    """Тесты для BackgroundEventLoop"""
+
+    def test_submit_returns_result(self, background_loop):
+        """Тест: submit возвращает результат корутины"""
+        async def add(a, b):
+            await asyncio.sleep(0)
+            return a + b
+
+        assert background_loop.submit(add(2, 3)) == 5
+        assert background_loop.get_stats()["completed"] == 1
+
+    def test_same_loop_reused_across_calls(self, background_loop):
+        """Тест: все вызовы выполняются в одном loop (keep-alive клиенты переживают запрос)"""
+        async def current_loop():
+            return asyncio.get_running_loop()
+
+        first = background_loop.submit(current_loop())
+        second = background_loop.submit(current_loop())
+
+        assert first is second is background_loop.loop
+
+    def test_concurrent_submits_from_threads(self, background_loop):
+        """Тест: корутины из разных потоков выполняются конкурентно"""
+        async def sleepy():
+            await asyncio.sleep(0.2)
+            return threading.current_thread().name
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(background_loop.submit(sleepy())))
+            for _ in range(10)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=1.5)
+
+        assert results == ["test-loop"] * 10
+
+    def test_timeout_cancels_coroutine(self, background_loop):
+        """Тест: по таймауту корутина отменяется и поднимается TimeoutError"""
+        cancelled = threading.Event()
+
+        async def hang():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        with pytest.raises(TimeoutError):
+            background_loop.submit(hang(), timeout=0.1)
+
+        assert cancelled.wait(timeout=1)
+        assert background_loop.get_stats()["timeouts"] == 1
+
+    def test_exception_propagates(self, background_loop):
+        """Тест: исключение корутины пробрасывается вызывающему"""
+        async def boom():
+            raise ValueError("boom")
+
+        with pytest.raises(ValueError):
+            background_loop.submit(boom())
+
+        assert background_loop.get_stats()["errors"] == 1
+
+    def test_submit_from_loop_thread_is_rejected(self, background_loop):
+        """Тест: блокирующий submit из потока loop запрещен (иначе дедлок)"""
+        async def noop():
+            return None
+
+        async def nested():
+            background_loop.submit(noop())
+
+        with pytest.raises(RuntimeError):
+            background_loop.submit(nested())
+
+
+class TestProcessBackgroundLoop:
+    """Тесты для общего loop процесса"""
+
+    def test_singleton_per_process(self):
+        """Тест: в одном процессе возвращается один и тот же loop"""
+        assert get_background_loop() is get_background_loop()
+
+    def test_recreated_after_fork(self, monkeypatch):
+        """Тест: после fork (другой PID) создается новый loop"""
+        parent = get_background_loop()
+        monkeypatch.setattr(event_loop.os, "getpid", lambda: -1)
+
+        child = get_background_loop()
+
+        assert child is not parent
+        monkeypatch.undo()
+        event_loop._background_loop = parent
+        event_loop._background_loop_pid = event_loop.os.getpid()
+
+    def test_run_coroutine(self):
+        """Тест удобной функции run_coroutine"""
+        async def answer():
+            return 42
+
+        assert run_coroutine(answer(), timeout=1) == 42
@@ -0,0 +1,172 @@
+"""
+Тесты потокового парсера RSS/Atom лент
+"""
+
+import asyncio
+
+from app.services.content_extractor import RSSParser
+from app.services.feed_parser import FeedStreamParser, aiter_feed_items, iter_feed_items, parse_feed_regex
+
+RSS = """<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0" xmlns:content="http://purl.org/rss/1.0/modules/content/"
+     xmlns:dc="http://purl.org/dc/elements/1.1/" xmlns:media="http://search.yahoo.com/mrss/">
+<channel>
+  <title>Новости</title>
+  <link>https://news.example.com/</link>
+  {items}
+</channel>
+</rss>"""
+
+ITEM = """<item>
+    <media:content url="https://cdn.example.com/{i}.jpg"><media:title>Фото {i}</media:title></media:content>
+    <title><![CDATA[Новость {i} & <подробности>]]></title>
+    <link>https://news.example.com/{i}</link>
+    <description><![CDATA[<p>Кратко о новости {i}</p>]]></description>
+    <content:encoded><![CDATA[<div><p>Полный текст {i}</p></div>]]></content:encoded>
+    <dc:creator>Автор {i}</dc:creator>
+    <pubDate>Mon, 0{d} Jan 2025 10:00:00 GMT</pubDate>
+    <guid isPermaLink="false">guid-{i}</guid>
+  </item>"""
+
+ATOM = """<?xml version="1.0" encoding="utf-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom">
+  <title>Blog</title>
+  <entry>
+    <title>Post</title>
+    <link rel="self" href="https://blog.example.com/api/1"/>
+    <link rel="alternate" href="https://blog.example.com/1"/>
+    <id>tag:blog.example.com,2025:1</id>
+    <updated>2025-01-01T00:00:00Z</updated>
+    <summary type="html">&lt;b&gt;Summary&lt;/b&gt;</summary>
+    <author><name>Bob</name></author>
+  </entry>
+</feed>"""
+
+
+def rss(count: int) -> str:
+    return RSS.format(items="\n  ".join(ITEM.format(i=i, d=i % 9 + 1) for i in range(count)))
+
+
+def chunked(data: bytes, size: int):
+    """Поток ответа кусками по size байт, с подсчетом прочитанных кусков"""
+    read = []
+
+    def chunks():
+        for start in range(0, len(data), size):
+            read.append(start)
+            yield data[start:start + size]
+
+    return chunks(), read
+
+
+class TestFeedParser:
+    """Тесты для FeedStreamParser / iter_feed_items"""
+
+    def test_rss_fields_cdata_and_namespaces(self):
+        """Тест: CDATA, content:encoded, dc:creator разбираются, media:title не путается с title"""
+        items = RSSParser.parse_feed(rss(2))
+
+        assert items[0] == {
+            "title": "Новость 0 & <подробности>",
+            "url": "https://news.example.com/0",
+            "summary": "Кратко о новости 0",
+            "content": "Полный текст 0",
+            "author": "Автор 0",
+            "published_date": "Mon, 01 Jan 2025 10:00:00 GMT",
+            "external_id": "guid-0",
+        }
+        assert len(items) == 2
+
+    def test_matches_regex_parser(self):
+        """Тест: результат совпадает с прежним regex парсером (ключи дедупликации не меняются)"""
+        assert RSSParser.parse_feed(rss(5)) == parse_feed_regex(rss(5))
+
+    def test_atom_entry(self):
+        """Тест: Atom - ссылка rel=alternate, автор из <name>, external_id по url как раньше"""
+        [item] = RSSParser.parse_feed(ATOM)
+        assert item["url"] == "https://blog.example.com/1"
+        assert item["external_id"] == "https://blog.example.com/1"
+        assert (item["author"], item["summary"]) == ("Bob", "Summary")
+
+    def test_chunk_boundaries(self):
+        """Тест: куски режут теги и многобайтовые символы - результат тот же"""
+        data = rss(3).encode("utf-8")
+        chunks, _ = chunked(data, 7)
+        assert list(iter_feed_items(chunks)) == RSSParser.parse_feed(rss(3))
+
+        cp1251 = rss(1).replace('encoding="UTF-8"', 'encoding="windows-1251"').encode("cp1251")
+        chunks, _ = chunked(cp1251, 5)
+        assert [item["title"] for item in iter_feed_items(chunks)] == ["Новость 0 & <подробности>"]
+
+    def test_stops_at_limit_without_reading_rest(self):
+        """Тест: после limit элементов остаток ленты не читается"""
+        data = rss(500).encode("utf-8")
+        chunks, read = chunked(data, 4096)
+        items = list(iter_feed_items(chunks, limit=20))
+
+        assert [item["external_id"] for item in items] == [f"guid-{i}" for i in range(20)]
+        assert len(read) < len(data) // 4096 // 10
+
+    def test_stops_at_known_items(self):
+        """Тест: разбор останавливается на нескольких уже сохраненных элементах подряд"""
+        known = {f"guid-{i}" for i in range(5, 100)} | {"guid-1"}
+        items = list(iter_feed_items([rss(100)], known_ids=known, known_run=3))
+        # guid-1 - одиночный известный (например, закрепленный) - разбор продолжается
+        assert [item["external_id"] for item in items] == [f"guid-{i}" for i in range(8)]
+
+    def test_invalid_xml_falls_back_to_regex(self):
+        """Тест: HTML сущности в ленте - разбор прежним regex парсером"""
+        feed = rss(3).replace("<title><![CDATA[Новость 1 & <подробности>]]></title>", "<title>Новость&nbsp;1</title>")
+        items = list(iter_feed_items([feed.encode("utf-8")], limit=2))
+        assert [item["title"] for item in items] == ["Новость 0 & <подробности>", "Новость&nbsp;1"]
+
+    def test_invalid_xml_mid_feed_reparsed_with_regex(self):
+        """Тест: ошибка XML после уже отданных элементов - остальные берутся из regex разбора"""
+        feed = rss(8).replace("<title><![CDATA[Новость 3 & <подробности>]]></title>", "<title>&laquo;Новость 3&raquo;</title>")
+        chunks, _ = chunked(feed.encode("utf-8"), 512)
+        items = list(iter_feed_items(chunks))
+
+        assert [item["external_id"] for item in items] == [f"guid-{i}" for i in range(8)]
+        assert items[3]["title"] == "&laquo;Новость 3&raquo;"
+        assert len(items) == len(RSSParser.parse_feed(feed))
+
+    def test_invalid_xml_mid_feed_async(self):
+        """Тест: то же для асинхронного потока, limit учитывает уже отданные элементы"""
+        data = rss(8).replace("<title><![CDATA[Новость 3 & <подробности>]]></title>", "<title>&laquo;Новость 3&raquo;</title>").encode("utf-8")
+
+        async def stream():
+            for start in range(0, len(data), 512):
+                yield data[start:start + 512]
+
+        async def collect():
+            return [item async for item in aiter_feed_items(stream(), limit=6)]
+
+        items = asyncio.run(collect())
+        assert [item["external_id"] for item in items] == [f"guid-{i}" for i in range(6)]
+
+    def test_parsed_items_released(self):
+        """Тест: разобранные элементы удаляются из дерева - память не растет с размером ленты"""
+        feed = rss(200)
+        parser = FeedStreamParser()
+        parsed = 0
+        for start in range(0, len(feed) * 3 // 4, 1000):
+            parsed += len(parser.feed(feed[start:start + 1000]))
+        channel = parser._stack[1]
+        assert parsed > 100
+        # В дереве остается только элемент, который сейчас разбирается
+        assert len([child for child in channel if child.tag == "item"]) <= 1
+
+    def test_async_stream(self):
+        """Тест: асинхронный поток байтов (response.aiter_bytes())"""
+        data = rss(50).encode("utf-8")
+
+        async def stream():
+            for start in range(0, len(data), 1024):
+                await asyncio.sleep(0)
+                yield data[start:start + 1024]
+
+        async def collect():
+            return [item async for item in aiter_feed_items(stream(), limit=10)]
+
+        items = asyncio.run(collect())
+        assert [item["external_id"] for item in items] == [f"guid-{i}" for i in range(10)]
@@ -0,0 +1,100 @@
+"""
+Тесты реестра общих HTTP клиентов
+"""
+
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.utils.http_clients import HTTPClientRegistry
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    """Отвечает JSON с Content-Length, чтобы соединение оставалось открытым"""
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = b'{"ok": true}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server_url():
+    """Локальный HTTP сервер с keep-alive"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def registry():
+    return HTTPClientRegistry(http2=False)
+
+
+class TestHTTPClientRegistry:
+    """Тесты для HTTPClientRegistry"""
+
+    @pytest.mark.asyncio
+    async def test_async_connection_reused(self, registry, server_url):
+        """Тест: последовательные запросы идут через одно соединение"""
+        for _ in range(5):
+            async with registry.async_client(timeout=5) as client:
+                response = await client.get(f"{server_url}/getMe")
+                assert response.json() == {"ok": True}
+
+        stats = registry.get_stats()
+        host = stats["async_hosts"]["127.0.0.1"]
+        assert stats["clients_created"] == 1
+        assert stats["pool_hits"] == 4
+        assert host["requests"] == 5
+        assert host["new_connections"] == 1
+        assert host["reused_connections"] == 4
+        await registry.aclose()
+
+    @pytest.mark.asyncio
+    async def test_default_timeout_applied(self, registry, server_url):
+        """Тест: таймаут вызывающей стороны передается в запрос"""
+        async with registry.async_client(timeout=0.5) as client:
+            request = client.build_request("GET", server_url)
+            response = await client.get(server_url)
+
+        assert request.extensions["timeout"]["read"] == registry.timeout
+        assert response.request.extensions["timeout"]["read"] == 0.5
+        await registry.aclose()
+
+    def test_client_per_event_loop(self, registry, server_url):
+        """Тест: для каждого event loop создается свой async клиент"""
+        async def fetch():
+            async with registry.async_client() as client:
+                await client.get(server_url)
+                return client._client
+
+        first = asyncio.run(fetch())
+        second = asyncio.run(fetch())
+
+        assert first is not second
+        assert registry.get_stats()["clients_created"] == 2
+
+    def test_sync_session_pool_stats(self, registry, server_url):
+        """Тест: общая requests.Session переиспользует соединение"""
+        for _ in range(3):
+            assert registry.session.get(server_url, timeout=5).status_code == 200
+
+        stats = registry.get_stats()
+        host = stats["sync_hosts"]["127.0.0.1"]
+        assert stats["pool_hits"] == 2
+        assert host["requests"] == 3
+        assert host["new_connections"] == 1
+        assert host["reused_connections"] == 2
@@ -0,0 +1,103 @@
+"""
+Тесты пакетной дедупликации и вставки найденных элементов
+"""
+
+import pytest
+from sqlalchemy import event
+
+from app.database import connection
+from app.models.content_sources import MonitoredItem
+from app.services.content_source_service import MonitoredItemService
+
+
+@pytest.fixture
+def statements(db):
+    """Счетчик SQL запросов"""
+    executed = []
+    engine = connection.engine
+    listener = lambda *args: executed.append(args[2])
+    event.listen(engine, "before_cursor_execute", listener)
+    yield executed
+    event.remove(engine, "before_cursor_execute", listener)
+
+
+def feed(count: int, start: int = 0):
+    return [{"title": f"Item {i}", "url": f"https://example.com/{i}", "external_id": f"guid-{i}"}
+            for i in range(start, start + count)]
+
+
+def rows(items):
+    return [{**item, "raw_data": item, "relevance_score": 0.7} for item in items]
+
+
+class TestMonitoredItemsDedup:
+    """Тесты для MonitoredItemService.split_duplicates / bulk_create_items"""
+
+    def test_split_duplicates_single_query(self, db, statements):
+        """Тест: существующие ключи ищутся одним запросом, повторы внутри ленты отбрасываются"""
+        db.add(MonitoredItem(source_id=1, user_id=1, title="old", external_id="guid-1"))
+        db.add(MonitoredItem(source_id=1, user_id=1, title="page", url="https://example.com/page"))
+        db.add(MonitoredItem(source_id=2, user_id=1, title="other source", external_id="guid-2"))
+        db.commit()
+        items = feed(3) + [{"title": "page", "url": "https://example.com/page"}, feed(1)[0]]
+        statements.clear()
+
+        new_items, duplicates = MonitoredItemService.split_duplicates(1, items)
+
+        assert [item["title"] for item in new_items] == ["Item 0", "Item 2"]
+        assert duplicates == 3
+        assert len([sql for sql in statements if sql.lstrip().upper().startswith("SELECT")]) == 2
+
+    def test_bulk_create_skips_conflicts(self, db):
+        """Тест: пакетная вставка возвращает созданные элементы, повторная - пропускает по конфликту"""
+        created, skipped = MonitoredItemService.bulk_create_items(1, 7, rows(feed(3)))
+
+        assert skipped == 0
+        assert [item.title for item in created] == ["Item 0", "Item 1", "Item 2"]
+        assert created[0].raw_data["external_id"] == "guid-0"
+        assert created[0].url_hash == MonitoredItem.hash_url("https://example.com/0")
+        assert (created[0].user_id, created[0].status, created[0].relevance_score) == (7, "new", 0.7)
+
+        # Другой worker успел вставить часть ленты
+        created, skipped = MonitoredItemService.bulk_create_items(1, 7, rows(feed(4)))
+        assert [item.title for item in created] == ["Item 3"]
+        assert skipped == 3
+        assert db.query(MonitoredItem).count() == 4
+
+    def test_bulk_create_large_feed(self, db):
+        """Тест: большая лента вставляется пачками, url_hash ставится и при обычном создании"""
+        created, skipped = MonitoredItemService.bulk_create_items(1, 1, rows(feed(1200)))
+        assert (len(created), skipped) == (1200, 0)
+
+        new_items, duplicates = MonitoredItemService.split_duplicates(1, feed(1300))
+        assert (len(new_items), duplicates) == (100, 1200)
+
+        item = MonitoredItemService.create_item(source_id=3, user_id=1, title="page", url="https://example.com/x")
+        assert item.url_hash == MonitoredItem.hash_url("https://example.com/x")
+
+    def test_update_keeps_duplicate_out_of_unique_key(self, db):
+        """Тест: обновление дубликата (url_hash очищен миграцией) не пересчитывает url_hash"""
+        first = MonitoredItem(source_id=1, user_id=1, title="page", url="https://example.com/page")
+        db.add(first)
+        db.commit()
+        duplicate = MonitoredItem(source_id=1, user_id=1, title="page", url="https://example.com/page",
+                                  status="duplicate", duplicate_of=first.id)
+        db.add(duplicate)
+        db.commit()
+        assert duplicate.url_hash is None
+
+        assert MonitoredItemService.update_item_status(duplicate.id, status="ignored")
+        first.status = "ignored"
+        db.commit()
+        db.expire_all()
+        assert db.get(MonitoredItem, duplicate.id).url_hash is None
+
+        first.url = "https://example.com/moved"
+        db.commit()
+        assert first.url_hash == MonitoredItem.hash_url("https://example.com/moved")
+
+    def test_bulk_create_error_raised(self, db):
+        """Тест: ошибка вставки пробрасывается, а не выглядит как пустая успешная пачка"""
+        with pytest.raises(Exception):
+            MonitoredItemService.bulk_create_items(1, 1, rows(feed(2)) + [{"title": None, "external_id": "x"}])
+        assert db.query(MonitoredItem).count() == 0
@@ -0,0 +1,229 @@
+"""
+Тесты квот тарифного плана
+"""
+
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Flask, jsonify
+
+from app.billing.middleware import usage_middleware
+from app.billing.models.agent_subscription import AgentSubscription
+from app.billing.models.subscription import Subscription, UsageRecord
+from app.billing.services.quota_engine import LocalQuotaStore, QuotaEngine
+
+
+def add_subscription(db, user_id: int, plan_id: str = "free"):
+    now = datetime.utcnow()
+    db.add(Subscription(user_id=user_id, plan_id=plan_id, status="active",
+                        starts_at=now - timedelta(days=1), expires_at=now + timedelta(days=30)))
+    db.commit()
+
+
+@pytest.fixture
+def engine(db_session_factory):
+    db = db_session_factory()
+    add_subscription(db, 1)
+    db.close()
+    engine = QuotaEngine(LocalQuotaStore(), session_factory=db_session_factory,
+                         flush_interval=3600, reconcile_interval=3600)
+    engine._ensure_started = lambda: None
+    return engine
+
+
+class TestQuotaEngine:
+    """Тесты для QuotaEngine"""
+
+    def test_concurrent_reservations_respect_limit(self, engine):
+        """Тест: параллельные запросы не превышают дневной лимит API вызовов (free - 100)"""
+        allowed = []
+        lock = threading.Lock()
+
+        def worker():
+            results = [engine.reserve(1, "api_calls").allowed for _ in range(25)]
+            with lock:
+                allowed.extend(results)
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert allowed.count(True) == 100
+        decision = engine.reserve(1, "api_calls")
+        assert not decision.allowed
+        assert decision.reason == "limit_exceeded"
+        assert (decision.used, decision.limit) == (100, 100)
+
+    def test_release_returns_reservation(self, engine):
+        """Тест: отмененный резерв снова доступен"""
+        for _ in range(100):
+            engine.reserve(1, "api_calls")
+        engine.release(1, "api_calls")
+
+        assert engine.reserve(1, "api_calls").allowed
+        assert not engine.reserve(1, "api_calls").allowed
+
+    def test_no_subscription_gets_free_limits(self, engine):
+        """Тест: без активной подписки действуют лимиты плана free, использование не пишется в БД"""
+        decision = engine.reserve(2, "posts")
+        engine.commit(2, "posts", resource_id="create_content")
+
+        assert decision.allowed
+        assert (decision.plan_id, decision.limit) == ("free", 50)
+        assert engine.get_quota(2).limits["api_calls"] == 100
+        assert not engine.get_quota(2).has_subscription
+        assert engine.flush() == 0
+
+    def test_usage_flushed_in_batches_and_restored_after_restart(self, engine, db_session_factory):
+        """Тест: использование пишется сводными строками, новый процесс продолжает счет из БД"""
+        for _ in range(30):
+            assert engine.reserve(1, "posts").allowed
+            engine.commit(1, "posts", resource_id="create_content")
+        engine.record(1, "posts", 5, resource_id="import")
+
+        assert engine.flush() == 2
+
+        db = db_session_factory()
+        rows = db.query(UsageRecord).order_by(UsageRecord.quantity).all()
+        assert [(row.resource_id, row.quantity) for row in rows] == [("import", 5), ("create_content", 30)]
+        db.close()
+
+        # Новый процесс: счетчики в памяти пусты, лимиты загружаются вместе с использованием
+        restarted = QuotaEngine(LocalQuotaStore(), session_factory=db_session_factory)
+        restarted._ensure_started = lambda: None
+        assert restarted.get_usage(1)["posts"] == 35
+        allowed = [restarted.reserve(1, "posts").allowed for _ in range(20)]
+        assert allowed.count(True) == 15  # free - 50 постов в месяц
+
+    def test_agent_usage_batched_update(self, engine, db_session_factory):
+        """Тест: счетчики AgentSubscription обновляются одним пакетом, лимит виден сразу"""
+        db = db_session_factory()
+        db.add(AgentSubscription(user_id=1, agent_id="drafting_agent", agent_name="Drafting Agent",
+                                 status="active", price_monthly=99000,
+                                 expires_at=datetime.utcnow() + timedelta(days=30),
+                                 max_tokens_per_month=1000))
+        db.commit()
+        db.close()
+
+        for _ in range(4):
+            engine.record_agent_usage(1, "drafting_agent", tokens_used=300, cost_kopeks=50)
+
+        assert not engine.agent_within_limits(1, "drafting_agent", max_tokens=1000)
+        assert engine.flush() == 1
+
+        db = db_session_factory()
+        subscription = db.query(AgentSubscription).one()
+        assert (subscription.requests_this_month, subscription.tokens_this_month,
+                subscription.cost_this_month) == (4, 1200, 200)
+        assert subscription.last_used_at is not None
+        db.close()
+
+        engine.invalidate_user(1)
+        assert engine.get_usage(1)["agents"] == 1
+
+    def test_decorator_enforces_limit_and_refunds_failures(self, engine, monkeypatch):
+        """Тест: декоратор отвечает 429 при превышении и не списывает неуспешные запросы"""
+        monkeypatch.setattr(usage_middleware, "get_quota_engine", lambda: engine)
+        app = Flask(__name__)
+        calls = {"fail": False}
+
+        @app.route("/posts", methods=["POST"])
+        @usage_middleware.check_usage_limit("posts")
+        def create_post():
+            if calls["fail"]:
+                return jsonify({"success": False}), 500
+            return jsonify({"success": True}), 201
+
+        client = app.test_client()
+        headers = {"X-User-ID": "1"}
+
+        calls["fail"] = True
+        assert client.post("/posts", headers=headers).status_code == 500
+        calls["fail"] = False
+        statuses = [client.post("/posts", headers=headers).status_code for _ in range(51)]
+
+        assert statuses.count(201) == 50
+        response = client.post("/posts", headers=headers)
+        assert response.status_code == 429
+        assert response.get_json()["usage"] == {"used": 50, "limit": 50}
+        assert client.post("/posts", headers={"X-User-ID": "2"}).status_code == 201
+
+    def test_required_plan_rejects_other_plans(self, engine, monkeypatch):
+        """Тест: required_plan отвечает 403 пользователю другого плана и без подписки"""
+        monkeypatch.setattr(usage_middleware, "get_quota_engine", lambda: engine)
+        app = Flask(__name__)
+
+        @app.route("/reports", methods=["POST"])
+        @usage_middleware.check_usage_limit("api_calls", required_plan="pro")
+        def create_report():
+            return jsonify({"success": True}), 201
+
+        client = app.test_client()
+        for user_id in ("1", "2"):
+            response = client.post("/reports", headers={"X-User-ID": user_id})
+            assert response.status_code == 403
+            assert response.get_json()["current_plan"] == "free"
+
+    def test_content_create_rejected_when_posts_exhausted(self, engine, monkeypatch):
+        """Тест: /content/create отвечает 429, когда посты плана за месяц израсходованы"""
+        create, created = content_create_client(engine, monkeypatch, user_id=1)
+        for _ in range(49):
+            engine.reserve(1, "posts")
+            engine.commit(1, "posts", resource_id="create_content")
+
+        assert create().status_code == 201
+        response = create()
+
+        assert response.status_code == 429
+        assert response.get_json()["usage"] == {"used": 50, "limit": 50}
+        assert created == [1]
+        assert engine.get_usage(1)["api_calls"] == 1
+
+    def test_content_create_without_subscription_uses_free_limits(self, engine, monkeypatch):
+        """Тест: пользователь без подписки создает контент в пределах лимитов плана free"""
+        create, created = content_create_client(engine, monkeypatch, user_id=2)
+        for _ in range(48):
+            engine.reserve(2, "posts")
+
+        assert [create().status_code for _ in range(2)] == [201, 201]
+        response = create()
+
+        assert response.status_code == 429
+        assert response.get_json()["usage"] == {"used": 50, "limit": 50}
+        assert created == [2, 2]
+
+
+def content_create_client(engine, monkeypatch, user_id: int):
+    """POST /content/create от имени user_id: функция запроса и список созданных workflow"""
+    import jwt
+    from flask_restx import Api
+
+    from app.api import routes
+    from app.auth.middleware import jwt as jwt_middleware
+    from app.utils.rate_limiter import RateLimiter
+
+    monkeypatch.setattr(usage_middleware, "get_quota_engine", lambda: engine)
+    monkeypatch.setattr(jwt_middleware, "rate_limiter", RateLimiter())
+    created = []
+
+    async def process_content_request(request_data):
+        created.append(request_data["user_id"])
+        return {"success": True, "workflow_id": f"wf-{len(created)}", "brief_id": "brief", "result": {}}
+
+    monkeypatch.setattr(routes.orchestrator, "process_content_request", process_content_request)
+    app = Flask(__name__)
+    app.config["SECRET_KEY"] = "test-secret-key-for-quota-endpoint-tests"
+    Api(app).add_namespace(routes.api, path="/")
+    client = app.test_client()
+
+    token = jwt.encode({"user_id": user_id}, app.config["SECRET_KEY"], algorithm="HS256")
+    payload = {"title": "Новый пост", "description": "Описание нового поста",
+               "target_audience": "Все", "business_goals": ["Охват"]}
+
+    def create():
+        return client.post("/content/create", json=payload, headers={"Authorization": f"Bearer {token}"})
+
+    return create, created
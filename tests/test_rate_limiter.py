@@ -0,0 +1,142 @@
+"""
+Тесты ограничителя частоты вызовов (GCRA)
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from app.mcp.integrations.base import BaseMCPIntegration, MCPResponse, MCPStatus
+from app.utils.rate_limiter import RateLimit, RateLimitExceeded, RateLimiter
+
+
+class EchoMCP(BaseMCPIntegration):
+    """Интеграция без сети: операция echo возвращает аргумент"""
+
+    def __init__(self, rate_limit: RateLimit, limiter: RateLimiter, max_wait: float = 5.0):
+        super().__init__("echo", {
+            "rate_limit": rate_limit,
+            "rate_limit_max_wait": max_wait,
+            "fallback_enabled": False
+        }, rate_limiter=limiter)
+        self.calls = []
+
+    async def connect(self) -> MCPResponse:
+        self.status = MCPStatus.CONNECTED
+        return MCPResponse.success_response(data={})
+
+    async def disconnect(self) -> MCPResponse:
+        return MCPResponse.success_response(data={})
+
+    async def health_check(self) -> MCPResponse:
+        return MCPResponse.success_response(data={})
+
+    async def echo(self, value):
+        self.calls.append(time.monotonic())
+        return MCPResponse.success_response(data=value)
+
+
+@pytest.fixture
+def limiter():
+    return RateLimiter()
+
+
+class TestRateLimiter:
+    """Тесты для RateLimiter с локальным backend"""
+
+    @pytest.mark.asyncio
+    async def test_burst_then_paced(self, limiter):
+        """Тест: burst вызовов проходит сразу, остальные выравниваются по интервалу"""
+        limit = RateLimit(rate=10, period=1.0, burst=3)
+
+        started = time.monotonic()
+        waits = [await limiter.acquire("api", limit) for _ in range(5)]
+        elapsed = time.monotonic() - started
+
+        assert waits[:3] == [0.0, 0.0, 0.0]
+        assert waits[3] == pytest.approx(0.1, abs=0.03)
+        assert elapsed == pytest.approx(0.2, abs=0.06)
+
+        stats = limiter.get_stats("api")
+        assert stats["calls"] == 5
+        assert stats["throttled"] == 2
+
+    @pytest.mark.asyncio
+    async def test_concurrent_callers_queue(self, limiter):
+        """Тест: конкурентные вызовы не превышают лимит, а ждут своей очереди"""
+        limit = RateLimit(rate=20, period=1.0, burst=1)
+
+        started = time.monotonic()
+        await asyncio.gather(*(limiter.acquire("api", limit) for _ in range(6)))
+
+        assert time.monotonic() - started == pytest.approx(0.25, abs=0.06)
+
+    @pytest.mark.asyncio
+    async def test_max_wait_rejects_without_reserving(self, limiter):
+        """Тест: при слишком долгом ожидании поднимается RateLimitExceeded, слот не занимается"""
+        limit = RateLimit(rate=1, period=60.0)
+        await limiter.acquire("posts", limit)
+
+        with pytest.raises(RateLimitExceeded) as exc_info:
+            await limiter.acquire("posts", limit, max_wait=1.0)
+
+        assert exc_info.value.retry_after == pytest.approx(60.0, abs=0.5)
+        assert limiter.get_stats("posts")["rejected"] == 1
+        assert limiter.get_stats("posts")["calls"] == 1
+
+    @pytest.mark.asyncio
+    async def test_keys_are_independent(self, limiter):
+        """Тест: лимиты разных ключей не влияют друг на друга"""
+        limit = RateLimit(rate=1, period=60.0)
+        assert await limiter.acquire("telegram", limit) == 0.0
+        assert await limiter.acquire("vk", limit) == 0.0
+
+    @pytest.mark.asyncio
+    async def test_acquire_all_releases_on_reject(self, limiter):
+        """Тест: отказ одного из лимитов возвращает слоты остальных"""
+        rps, posts = RateLimit(rate=1, period=1.0), RateLimit(rate=1, period=3600.0)
+        await limiter.acquire_all({"posts": posts, "rps": rps}, max_wait=0.5)
+
+        with pytest.raises(RateLimitExceeded):
+            await limiter.acquire_all({"rps": rps, "posts": posts}, max_wait=1.5)
+        # Слот rps, зарезервированный перед отказом posts, возвращен
+        assert await limiter.acquire("rps", rps, max_wait=1.5) == pytest.approx(1.0, abs=0.05)
+
+    @pytest.mark.asyncio
+    async def test_acquire_all_waits_for_latest_slot(self, limiter):
+        """Тест: ожидание - до самого позднего слота, а не сумма ожиданий; статистика по stats_keys"""
+        fast, slow = RateLimit(rate=10, period=1.0, burst=1), RateLimit(rate=5, period=1.0, burst=1)
+        await limiter.acquire_all({"a:1": fast, "b:1": slow})
+        wait = await limiter.acquire_all({"a:1": fast, "b:1": slow}, stats_keys={"a:1": "a", "b:1": "b"})
+
+        assert wait == pytest.approx(0.2, abs=0.03)
+        assert limiter.get_stats("b")["throttled"] == 1
+
+
+class TestMCPRateLimiting:
+    """Тесты ограничения вызовов в BaseMCPIntegration.execute_with_retry"""
+
+    @pytest.mark.asyncio
+    async def test_calls_paced_by_config_limit(self, limiter):
+        """Тест: вызовы интеграции идут не чаще rate_limit"""
+        mcp = EchoMCP(RateLimit(rate=10, period=1.0, burst=1), limiter)
+
+        results = await asyncio.gather(*(mcp.execute_with_retry("echo", i) for i in range(4)))
+
+        assert all(result.success for result in results)
+        assert mcp.calls[-1] - mcp.calls[0] == pytest.approx(0.3, abs=0.06)
+        assert mcp.get_metrics()["rate_limit"]["throttled"] == 3
+
+    @pytest.mark.asyncio
+    async def test_rate_limited_response(self, limiter):
+        """Тест: если слот слишком далеко, возвращается ошибка rate_limited без ретраев"""
+        mcp = EchoMCP(RateLimit(rate=1, period=60.0), limiter, max_wait=0.5)
+        await mcp.execute_with_retry("echo", 1)
+
+        result = await mcp.execute_with_retry("echo", 2)
+
+        assert not result.success
+        assert result.error.error_type == "rate_limited"
+        assert mcp.status == MCPStatus.RATE_LIMITED
+        assert len(mcp.calls) == 1
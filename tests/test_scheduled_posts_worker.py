@@ -0,0 +1,216 @@
+"""
+Тесты пакетной конкурентной публикации в ScheduledPostsWorker
+"""
+
+import asyncio
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models.content import ContentPieceDB
+from app.models.scheduled_posts import ScheduledPostDB
+from app.models.telegram_channels import TelegramChannel
+from app.services.telegram_channel_service import TelegramChannelService
+from app.utils.rate_limiter import RateLimiter
+from app.workers import scheduled_posts_worker as worker_module
+from app.workers.scheduled_posts_worker import ScheduledPostsWorker
+
+
+class FakeTelegramAPI:
+    """Подменяет отправку в Bot API: фиксированная задержка и учет параллелизма"""
+
+    def __init__(self, delay: float = 0.05, fail_chat: str = None):
+        self.delay = delay
+        self.fail_chat = fail_chat
+        self.in_flight = defaultdict(int)
+        self.peak_per_chat = defaultdict(int)
+        self.sent = []
+
+    async def send_message(self, chat_id, text, parse_mode="HTML", disable_web_page_preview=True):
+        self.in_flight[chat_id] += 1
+        self.peak_per_chat[chat_id] = max(self.peak_per_chat[chat_id], self.in_flight[chat_id])
+        await asyncio.sleep(self.delay)
+        self.in_flight[chat_id] -= 1
+        if chat_id == self.fail_chat:
+            return {"success": False, "data": None, "error": "Forbidden: bot is not a member"}
+        self.sent.append((chat_id, text))
+        return {"success": True, "data": {"message_id": len(self.sent)}, "error": None}
+
+
+@pytest.fixture
+def fake_api(monkeypatch, db_session_factory):
+    """Worker работает с тестовой БД и фейковым Telegram"""
+    api = FakeTelegramAPI()
+    monkeypatch.setenv("TELEGRAM_BOT_TOKEN", "test_token")
+    monkeypatch.setattr(worker_module, "get_db_session", db_session_factory)
+    monkeypatch.setattr(worker_module, "rate_limiter", RateLimiter())
+    monkeypatch.setattr(TelegramChannelService, "send_message", api.send_message)
+    return api
+
+
+def seed_posts(db, channels: int, posts_per_channel: int, late_by: float = 1.0):
+    """Создает проверенные каналы и наступившие посты"""
+    scheduled_time = datetime.utcnow() - timedelta(seconds=late_by)
+    for channel_index in range(channels):
+        channel = TelegramChannel(
+            user_id=1, channel_name=f"channel {channel_index}",
+            chat_id=f"@channel{channel_index}", is_verified=True
+        )
+        db.add(channel)
+        db.flush()
+        for post_index in range(posts_per_channel):
+            content = ContentPieceDB(
+                id=str(uuid.uuid4()), user_id=1, title=f"Пост {post_index}",
+                text=f"Текст {post_index}", content_type="post", platform="telegram",
+                status="approved"
+            )
+            db.add(content)
+            db.add(ScheduledPostDB(
+                user_id=1, content_id=content.id, platform="telegram",
+                account_id=channel.id, scheduled_time=scheduled_time
+            ))
+    db.commit()
+
+
+class TestScheduledPostsWorkerBatching:
+    """Тесты конвейера публикации"""
+
+    def test_batch_published_concurrently(self, fake_api, db_session_factory):
+        """Тест: пачка публикуется параллельно по каналам, статусы пишутся пакетом"""
+        db = db_session_factory()
+        seed_posts(db, channels=8, posts_per_channel=5)
+        worker = ScheduledPostsWorker(batch_size=100)
+
+        started = time.monotonic()
+        processed = worker._process_scheduled_posts()
+        elapsed = time.monotonic() - started
+
+        assert processed == 40
+        assert elapsed < 1.0  # последовательно было бы 40 * 0.05 = 2 с
+        assert db.query(ScheduledPostDB).filter(ScheduledPostDB.status == "published").count() == 40
+        assert all(count == 5 for count in
+                   (channel.posts_count for channel in db.query(TelegramChannel).all()))
+
+        stats = worker.get_stats()
+        assert stats["published"] == 40
+        assert stats["lateness_seconds"]["count"] == 40
+        assert stats["lateness_seconds"]["p99"] <= 5
+
+    def test_channel_concurrency_cap(self, fake_api, db_session_factory):
+        """Тест: в один канал не больше channel_concurrency отправок одновременно, порядок сохраняется"""
+        db = db_session_factory()
+        seed_posts(db, channels=2, posts_per_channel=6)
+        worker = ScheduledPostsWorker(batch_size=100, channel_concurrency=1)
+
+        worker._process_scheduled_posts()
+
+        assert max(fake_api.peak_per_chat.values()) == 1
+        channel0 = [text for chat_id, text in fake_api.sent if chat_id == "@channel0"]
+        assert channel0 == [f"<b>Пост {i}</b>\n\nТекст {i}" for i in range(6)]
+
+    def test_failures_recorded_per_post(self, fake_api, db_session_factory):
+        """Тест: ошибка одного канала не мешает остальным и пишется в пост и канал"""
+        fake_api.fail_chat = "@channel1"
+        db = db_session_factory()
+        seed_posts(db, channels=2, posts_per_channel=2)
+        unverified = TelegramChannel(user_id=1, channel_name="new", chat_id="@new", is_verified=False)
+        db.add(unverified)
+        db.flush()
+        db.add(ScheduledPostDB(user_id=1, content_id=db.query(ContentPieceDB).first().id,
+                               platform="telegram", account_id=unverified.id,
+                               scheduled_time=datetime.utcnow()))
+        db.commit()
+
+        ScheduledPostsWorker(batch_size=100)._process_scheduled_posts()
+
+        statuses = {post.account_id: post.status for post in db.query(ScheduledPostDB).all()}
+        failed_channel = db.query(TelegramChannel).filter(TelegramChannel.chat_id == "@channel1").one()
+        assert statuses[unverified.id] == "failed"
+        assert statuses[failed_channel.id] == "failed"
+        assert failed_channel.last_error == "Forbidden: bot is not a member"
+        assert db.query(ScheduledPostDB).filter(ScheduledPostDB.status == "published").count() == 2
+
+    def test_full_batch_drains_backlog(self, fake_api, db_session_factory):
+        """Тест: полная пачка сигнализирует, что нужно сразу брать следующую"""
+        db = db_session_factory()
+        seed_posts(db, channels=3, posts_per_channel=3)
+        worker = ScheduledPostsWorker(batch_size=4)
+
+        batches = []
+        while True:
+            processed = worker._process_scheduled_posts()
+            batches.append(processed)
+            if processed < worker.batch_size:
+                break
+
+        assert batches == [4, 4, 1]
+        assert db.query(ScheduledPostDB).filter(ScheduledPostDB.status == "scheduled").count() == 0
+
+
+class TestScheduledPostsWorkerMultiInstance:
+    """Тесты нескольких worker'ов над одной БД (claim-and-lease)"""
+
+    def test_each_post_published_exactly_once(self, fake_api, file_db_session_factory, monkeypatch):
+        """Тест: 4 worker'а параллельно разбирают очередь, каждый пост публикуется ровно один раз"""
+        monkeypatch.setattr(worker_module, "get_db_session", file_db_session_factory)
+        fake_api.delay = 0.01
+        db = file_db_session_factory()
+        seed_posts(db, channels=6, posts_per_channel=10)
+
+        workers = [ScheduledPostsWorker(batch_size=7, worker_id=f"worker-{i}") for i in range(4)]
+        claimed = Counter()
+        # Все worker'ы начинают разбор одновременно - claim'ы пересекаются
+        start = threading.Barrier(len(workers))
+
+        def drain(worker):
+            start.wait(timeout=5)
+            while True:
+                processed = worker._process_scheduled_posts()
+                claimed[worker.worker_id] += processed
+                if processed == 0:
+                    break
+
+        threads = [threading.Thread(target=drain, args=(worker,)) for worker in workers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=30)
+
+        sends = Counter(fake_api.sent)
+        assert len(sends) == 60
+        assert set(sends.values()) == {1}
+        assert sum(claimed.values()) == 60
+
+        db.expire_all()
+        posts = db.query(ScheduledPostDB).all()
+        assert {post.status for post in posts} == {"published"}
+        assert all(post.claimed_by is None and post.lease_expires_at is None for post in posts)
+
+    def test_expired_lease_is_reclaimed(self, fake_api, db_session_factory):
+        """Тест: посты упавшего worker'а (аренда истекла) публикует другой"""
+        db = db_session_factory()
+        seed_posts(db, channels=1, posts_per_channel=3)
+        crashed = ScheduledPostsWorker(worker_id="crashed")
+        from app.services.scheduled_post_service import ScheduledPostService
+
+        claimed = ScheduledPostService(db).claim_posts_to_publish("crashed", limit=10, lease_seconds=60)
+        assert len(claimed) == 3
+
+        survivor = ScheduledPostsWorker(batch_size=10, worker_id="survivor")
+        assert survivor._process_scheduled_posts() == 0  # аренда еще действует
+
+        db.query(ScheduledPostDB).update({"lease_expires_at": datetime.utcnow() - timedelta(seconds=1)})
+        db.commit()
+        assert survivor._process_scheduled_posts() == 3
+
+        # Опоздавший worker не перезаписывает результаты нового владельца
+        assert ScheduledPostService(db).mark_many_as_published(
+            {post.id: {"success": False, "error": "late"} for post in claimed},
+            worker_id=crashed.worker_id
+        ) == 0
+        db.expire_all()
+        assert {post.status for post in db.query(ScheduledPostDB).all()} == {"published"}
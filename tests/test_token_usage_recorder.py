@@ -0,0 +1,136 @@
+"""
+Тесты буферизованной записи расхода токенов
+"""
+
+import os
+import threading
+
+import pytest
+
+from app.billing.services.token_usage_recorder import TokenUsageRecorder, _file_lock
+from app.models.content import TokenUsageDB
+
+
+_SPILLED_ROW = {
+    "user_id": 1, "agent_id": "a", "ai_provider": "openai", "ai_model": "m",
+    "prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2, "cost_usd": 0.0,
+    "cost_rub": 0.0, "request_id": "req-1", "request_metadata": {}, "response_metadata": {},
+    "content_id": None, "workflow_id": None, "endpoint": None, "platform": None,
+    "content_type": None, "task_type": None, "execution_time_ms": None,
+    "created_at": "2026-01-01T00:00:00"
+}
+
+
+def usage(recorder: TokenUsageRecorder, user_id: int = 1, **fields) -> str:
+    return recorder.record(
+        user_id=user_id, agent_id="drafting_agent", ai_provider="openai", ai_model="gpt-5-mini",
+        prompt_tokens=100, completion_tokens=50, cost_usd=0.001, cost_rub=0.1, **fields
+    )
+
+
+@pytest.fixture
+def recorder(file_db_session_factory, tmp_path):
+    recorder = TokenUsageRecorder(
+        session_factory=file_db_session_factory, capacity=1000, batch_size=100,
+        flush_interval=0.05, block_timeout=0.5, spill_path=str(tmp_path / "spill.jsonl")
+    )
+    yield recorder
+    recorder.close()
+
+
+class TestTokenUsageRecorder:
+    """Тесты для TokenUsageRecorder"""
+
+    def test_concurrent_records_written_in_batches(self, recorder, file_db_session_factory):
+        """Тест: записи из многих потоков пишутся пачками, request_id уникальны"""
+        request_ids = []
+        lock = threading.Lock()
+
+        def worker():
+            ids = [usage(recorder, endpoint="/content/create") for _ in range(250)]
+            with lock:
+                request_ids.extend(ids)
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        recorder.close()
+
+        db = file_db_session_factory()
+        assert db.query(TokenUsageDB).count() == 2000
+        assert len(set(request_ids)) == 2000
+        assert recorder.get_stats()["batches"] < 2000 / 10
+        assert recorder.get_stats()["spilled"] == 0
+        row = db.query(TokenUsageDB).first()
+        assert row.total_tokens == 150 and row.endpoint == "/content/create"
+
+    def test_spill_and_replay_when_database_unavailable(self, file_db_session_factory, tmp_path):
+        """Тест: при недоступной БД записи уходят в файл и дописываются позже без дублей"""
+        available = {"value": False}
+
+        def session_factory():
+            if not available["value"]:
+                raise ConnectionError("database is down")
+            return file_db_session_factory()
+
+        recorder = TokenUsageRecorder(session_factory=session_factory, batch_size=10,
+                                      flush_interval=3600, spill_path=str(tmp_path / "spill.jsonl"))
+        recorder._ensure_started = lambda: None
+        for _ in range(25):
+            usage(recorder, request_metadata={"topic": "кофе"})
+        recorder.flush()
+        assert recorder.get_stats()["spilled"] == 25
+
+        available["value"] = True
+        assert recorder.flush() == 25
+        assert recorder.flush() == 0
+        recorder.close()
+
+        db = file_db_session_factory()
+        assert db.query(TokenUsageDB).count() == 25
+        assert db.query(TokenUsageDB).first().request_metadata == {"topic": "кофе"}
+        assert not (tmp_path / "spill.jsonl").exists()
+
+    def test_replay_is_idempotent(self, recorder, file_db_session_factory):
+        """Тест: повтор уже записанной пачки (падение после commit) не создает дублей"""
+        usage(recorder, request_id="req-1")
+        recorder.flush()
+        recorder._spill([_SPILLED_ROW])
+
+        recorder.flush()
+
+        assert file_db_session_factory().query(TokenUsageDB).count() == 1
+
+    def test_replay_skipped_while_other_process_replays(self, recorder, file_db_session_factory):
+        """Тест: spill-файл общий для процессов - пока другой процесс его отправляет, сброс его не трогает"""
+        recorder._spill([{**_SPILLED_ROW, "request_id": "req-2"}])
+        with _file_lock(recorder.spill_path + ".replay.lock") as locked:
+            assert locked
+            # Отдельный open() - отдельная блокировка flock, как у другого процесса
+            assert recorder.flush() == 0
+            assert os.path.exists(recorder.spill_path)
+
+        assert recorder.flush() == 1
+        assert not os.path.exists(recorder.spill_path)
+
+    def test_backpressure_spills_overflow(self, file_db_session_factory, tmp_path):
+        """Тест: при переполненной очереди record() не блокируется дольше block_timeout"""
+        recorder = TokenUsageRecorder(session_factory=file_db_session_factory, capacity=5,
+                                      batch_size=100, flush_interval=3600, block_timeout=0.01,
+                                      spill_path=str(tmp_path / "spill.jsonl"))
+        recorder._ensure_started = lambda: None  # фоновый сброс "не успевает"
+        for _ in range(8):
+            usage(recorder)
+
+        assert recorder.get_stats()["queue_depth"] == 5
+        assert recorder.get_stats()["spilled"] == 3
+
+        assert recorder.flush() == 8
+        assert file_db_session_factory().query(TokenUsageDB).count() == 8
+
+    def test_unknown_fields_rejected(self, recorder):
+        """Тест: опечатка в имени поля - ошибка, а не потерянная пачка"""
+        with pytest.raises(TypeError):
+            usage(recorder, platfrom="telegram")
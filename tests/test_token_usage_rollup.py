@@ -0,0 +1,140 @@
+"""
+Тесты дневных агрегатов расхода токенов
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.billing.services.token_usage_recorder import new_request_id
+from app.billing.services.token_usage_rollup import TokenUsageRollupService
+from app.billing.services.token_usage_service import TokenUsageService
+from app.models.content import TokenUsageDB, TokenUsageDailyDB
+
+AGENTS = ("drafting_agent", "research_agent")
+MODELS = (("openai", "gpt-5-mini"), ("anthropic", "claude"))
+
+
+def add_usage(db, created_at: datetime, user_id: int = 1, agent_id: str = "drafting_agent",
+              model=("openai", "gpt-5-mini"), tokens: int = 100, execution_time_ms=None):
+    db.add(TokenUsageDB(
+        user_id=user_id, agent_id=agent_id, ai_provider=model[0], ai_model=model[1],
+        request_id=new_request_id(),
+        prompt_tokens=tokens, completion_tokens=tokens // 2, total_tokens=tokens + tokens // 2,
+        cost_usd=tokens / 1000, cost_rub=tokens / 10, execution_time_ms=execution_time_ms,
+        created_at=created_at
+    ))
+
+
+@pytest.fixture
+def db(db_session_factory):
+    session = db_session_factory()
+    now = datetime.utcnow()
+    # 40 дней истории у двух пользователей, включая текущие сутки
+    for days_ago in range(40):
+        for hour in (1, 13):
+            created_at = (now - timedelta(days=days_ago)).replace(hour=hour, minute=0)
+            if created_at > now:
+                created_at = now - timedelta(minutes=1)
+            for index, agent_id in enumerate(AGENTS):
+                add_usage(session, created_at, agent_id=agent_id, model=MODELS[index],
+                          tokens=100 + days_ago, execution_time_ms=1000 + 10 * days_ago)
+            add_usage(session, created_at, user_id=2, tokens=7)
+    session.commit()
+    yield session
+    session.close()
+
+
+def rounded(value):
+    """Суммы float зависят от порядка сложения - сравниваем с округлением"""
+    if isinstance(value, float):
+        return round(value, 6)
+    if isinstance(value, dict):
+        return {key: rounded(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [rounded(item) for item in value]
+    return value
+
+
+def results(service: TokenUsageService, user_id: int = 1):
+    return rounded((
+        service.get_user_token_summary(user_id),
+        service.get_token_history(user_id, days=30),
+        service.get_token_history(user_id, days=30, agent_id="research_agent"),
+        service.get_usage_by_agent(user_id, period_days=7),
+        service.get_usage_by_model(user_id, period_days=60)
+    ))
+
+
+class TestTokenUsageRollup:
+    """Тесты для TokenUsageRollupService и чтения TokenUsageService"""
+
+    def test_rollups_match_raw_aggregates(self, db):
+        """Тест: после агрегации дашборды возвращают те же цифры, что по сырым записям"""
+        service = TokenUsageService(db)
+        before = results(service)
+        before_other = results(service, user_id=2)
+        assert before[0]["today"]["requests_count"] > 0
+
+        stats = TokenUsageRollupService(db).compact()
+
+        assert stats["days"] == 39  # все закрытые дни, текущие сутки не агрегируются
+        assert TokenUsageRollupService(db).rolled_up_through() == datetime.utcnow().date() - timedelta(days=1)
+        assert db.query(TokenUsageDailyDB).count() == 39 * 3
+        assert results(service) == before
+        assert results(service, user_id=2) == before_other
+
+    def test_current_day_read_from_raw_rows(self, db):
+        """Тест: новые записи текущих суток видны сразу, без пересчета агрегатов"""
+        TokenUsageRollupService(db).compact()
+        service = TokenUsageService(db)
+        summary = service.get_user_token_summary(1)
+
+        add_usage(db, datetime.utcnow(), tokens=1000)
+        db.commit()
+
+        updated = service.get_user_token_summary(1)
+        assert updated["today"]["total_tokens"] == summary["today"]["total_tokens"] + 1500
+        assert updated["all_time"]["requests_count"] == summary["all_time"]["requests_count"] + 1
+        assert service.get_token_history(1, days=1)[-1]["date"] == datetime.utcnow().date().isoformat()
+
+    def test_late_records_picked_up_by_lookback(self, db):
+        """Тест: запись за вчера, дошедшая после агрегации, учитывается при следующем пересчете"""
+        rollups = TokenUsageRollupService(db)
+        rollups.compact()
+        service = TokenUsageService(db)
+        summary = service.get_user_token_summary(1)
+
+        add_usage(db, datetime.utcnow() - timedelta(days=1), tokens=1000)
+        db.commit()
+        # Пока день не пересчитан, он читается из агрегата
+        assert service.get_user_token_summary(1)["all_time"] == summary["all_time"]
+
+        stats = rollups.compact(lookback_days=2)
+
+        assert stats["days"] == 2
+        assert service.get_user_token_summary(1)["all_time"]["total_tokens"] == \
+            summary["all_time"]["total_tokens"] + 1500
+
+    def test_compact_is_idempotent(self, db):
+        """Тест: повторный пересчет не дублирует строки агрегатов"""
+        rollups = TokenUsageRollupService(db)
+        rollups.compact()
+        rows = db.query(TokenUsageDailyDB).count()
+
+        rollups.compact(lookback_days=5)
+        rollups.compact(lookback_days=5)
+
+        assert db.query(TokenUsageDailyDB).count() == rows
+
+    def test_dashboard_queries_do_not_scan_closed_days(self, db):
+        """Тест: после агрегации сырые записи читаются только за текущие сутки"""
+        TokenUsageRollupService(db).compact()
+        today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        # Удаляем сырые записи закрытых дней - ответы не должны измениться
+        service = TokenUsageService(db)
+        before = results(service)
+        db.query(TokenUsageDB).filter(TokenUsageDB.created_at < today_start).delete()
+        db.commit()
+
+        assert results(service) == before
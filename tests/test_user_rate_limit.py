@@ -0,0 +1,104 @@
+"""
+Тесты ограничения запросов по пользователю
+"""
+
+import threading
+import time
+
+import pytest
+from flask import Flask, g, request
+
+from app.auth.middleware import jwt as jwt_middleware
+from app.utils.rate_limiter import RateLimit, RateLimiter
+
+
+@pytest.fixture
+def make_client(monkeypatch):
+    """Flask-приложение с эндпоинтом, ограниченным лимитом класса test"""
+    monkeypatch.setattr(jwt_middleware, "rate_limiter", RateLimiter())
+
+    def factory(limit: RateLimit):
+        monkeypatch.setitem(jwt_middleware.USER_RATE_LIMITS, "test", limit)
+        app = Flask(__name__)
+
+        @app.before_request
+        def authenticate():
+            g.current_user_id = int(request.headers["X-Test-User"])
+
+        @app.route("/generate", methods=["POST"])
+        @jwt_middleware.rate_limit_by_user(endpoint_class="test")
+        def generate():
+            return {"success": True}, 200
+
+        @app.route("/analyze", methods=["POST"])
+        @jwt_middleware.rate_limit_by_user(endpoint_class="test")
+        def analyze():
+            return {"success": True}, 200
+
+        return app.test_client()
+
+    return factory
+
+
+class TestUserRateLimit:
+    """Тесты для rate_limit_by_user"""
+
+    def test_headers_and_retry_after(self, make_client):
+        """Тест: ответы содержат X-RateLimit-*, отказ - 429 с Retry-After"""
+        client = make_client(RateLimit(rate=2, period=60, burst=2))
+        headers = {"X-Test-User": "1"}
+
+        first = client.post("/generate", headers=headers)
+        second = client.post("/generate", headers=headers)
+        rejected = client.post("/generate", headers=headers)
+
+        assert first.status_code == 200
+        assert first.headers["X-RateLimit-Limit"] == "2"
+        assert first.headers["X-RateLimit-Remaining"] == "1"
+        assert second.headers["X-RateLimit-Remaining"] == "0"
+        assert rejected.status_code == 429
+        assert rejected.get_json()["code"] == "RATE_LIMITED"
+        assert rejected.headers["Retry-After"] == "30"
+        assert rejected.headers["X-RateLimit-Remaining"] == "0"
+        assert int(rejected.headers["X-RateLimit-Reset"]) == 60
+
+    def test_endpoint_class_shared_and_users_isolated(self, make_client):
+        """Тест: эндпоинты класса делят бюджет пользователя, другие пользователи не затронуты"""
+        client = make_client(RateLimit(rate=2, period=60, burst=2))
+
+        assert client.post("/generate", headers={"X-Test-User": "1"}).status_code == 200
+        assert client.post("/analyze", headers={"X-Test-User": "1"}).status_code == 200
+        assert client.post("/analyze", headers={"X-Test-User": "1"}).status_code == 429
+        assert client.post("/analyze", headers={"X-Test-User": "2"}).status_code == 200
+
+    def test_fairness_under_contention(self, make_client):
+        """Тест: пользователь, который шлет запросы в 8 потоков, не вытесняет остальных"""
+        limit = RateLimit(rate=20, period=1.0, burst=5)
+        client = make_client(limit)
+        duration = 1.0
+        results = {}
+        lock = threading.Lock()
+
+        def send(user_id: int, pause: float):
+            deadline = time.monotonic() + duration
+            while time.monotonic() < deadline:
+                status = client.post("/generate", headers={"X-Test-User": str(user_id)}).status_code
+                with lock:
+                    results.setdefault(user_id, []).append(status)
+                time.sleep(pause)
+
+        started = time.monotonic()
+        threads = [threading.Thread(target=send, args=(1, 0)) for _ in range(8)]
+        # Обычные пользователи - 10 запросов в секунду, в пределах лимита
+        threads += [threading.Thread(target=send, args=(user_id, 0.1)) for user_id in range(2, 6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        heavy = results[1]
+        assert heavy.count(429) > heavy.count(200)
+        assert heavy.count(200) <= limit.burst + limit.rate * elapsed + 1
+        for user_id in range(2, 6):
+            assert set(results[user_id]) == {200}
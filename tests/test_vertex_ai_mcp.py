@@ -0,0 +1,147 @@
+"""
+Тесты неблокирующего клиента VertexAIMCP
+"""
+
+import asyncio
+import threading
+import time
+import weakref
+
+import pytest
+
+from app.mcp.integrations import vertex_ai
+
+
+class FakeResponse:
+    """Ответ Gemini с текстом"""
+
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGenerativeModel:
+    """Заглушка GenerativeModel с async API"""
+
+    instances = 0
+
+    def __init__(self, model_name):
+        FakeGenerativeModel.instances += 1
+        self.model_name = model_name
+
+    async def generate_content_async(self, prompt, generation_config=None):
+        await asyncio.sleep(0.1)
+        return FakeResponse(f"{self.model_name}: ответ на '{prompt}'")
+
+
+class FakeImage:
+    """Изображение Imagen"""
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(b'png-bytes')
+
+
+class FakeImageGenerationModel:
+    """Заглушка Imagen: синхронный блокирующий вызов"""
+
+    load_seconds = 0.0
+
+    @classmethod
+    def from_pretrained(cls, model_name):
+        time.sleep(cls.load_seconds)
+        return cls()
+
+    def generate_images(self, **kwargs):
+        time.sleep(0.1)
+        return [FakeImage()]
+
+
+@pytest.fixture
+def vertex(monkeypatch):
+    """VertexAIMCP с подмененным SDK"""
+    monkeypatch.setattr(vertex_ai, 'VERTEX_AI_AVAILABLE', True)
+    monkeypatch.setattr(vertex_ai, 'GenerativeModel', FakeGenerativeModel, raising=False)
+    monkeypatch.setattr(vertex_ai, 'ImageGenerationModel', FakeImageGenerationModel, raising=False)
+    monkeypatch.setattr(vertex_ai, '_model_cache', {})
+    monkeypatch.setattr(vertex_ai, '_gemini_models', weakref.WeakKeyDictionary())
+    FakeGenerativeModel.instances = 0
+    FakeImageGenerationModel.load_seconds = 0.0
+    return vertex_ai.VertexAIMCP()
+
+
+class TestVertexAIMCP:
+    """Тесты для VertexAIMCP"""
+
+    @pytest.mark.asyncio
+    async def test_text_calls_overlap_and_reuse_model(self, vertex):
+        """Тест: параллельные вызовы Gemini не блокируют друг друга, модель создается один раз"""
+        started = time.monotonic()
+        results = await asyncio.gather(*[vertex.generate_content(f"prompt {i}") for i in range(4)])
+        elapsed = time.monotonic() - started
+
+        assert all(r.success for r in results)
+        assert elapsed < 0.3
+        assert FakeGenerativeModel.instances == 1
+
+        stats = vertex.get_metrics()["calls"][vertex.gemini_model]
+        assert stats["calls"] == 4
+        assert stats["peak_in_flight"] == 4
+        assert stats["in_flight"] == 0
+
+    def test_gemini_model_per_event_loop(self, vertex):
+        """Тест: у каждого event loop свой хэндл Gemini (async канал привязан к loop)"""
+        models = []
+
+        async def get_model():
+            models.append(vertex._get_gemini_model(vertex.gemini_model))
+            models.append(vertex._get_gemini_model(vertex.gemini_model))
+
+        asyncio.run(get_model())
+        thread = threading.Thread(target=lambda: asyncio.run(get_model()))
+        thread.start()
+        thread.join()
+
+        assert models[0] is models[1]
+        assert models[2] is models[3]
+        assert models[0] is not models[2]
+        assert FakeGenerativeModel.instances == 2
+
+    @pytest.mark.asyncio
+    async def test_image_generation_runs_off_event_loop(self, vertex):
+        """Тест: блокирующий Imagen выполняется в пуле потоков"""
+        started = time.monotonic()
+        ticker_finished = None
+
+        async def ticker():
+            nonlocal ticker_finished
+            for _ in range(5):
+                await asyncio.sleep(0.01)
+            ticker_finished = time.monotonic() - started
+
+        result, _ = await asyncio.gather(vertex.generate_image("кот"), ticker())
+
+        assert result.success
+        assert result.data["count"] == 1
+        # Event loop не блокировался на 0.1 с вызова Imagen
+        assert ticker_finished < 0.09
+        assert vertex.get_metrics()["calls"][vertex.imagen_model]["calls"] == 1
+
+    def test_cold_imagen_load_does_not_block_gemini(self, vertex):
+        """Тест: загрузка Imagen в пуле потоков не держит lock, который Gemini берет в event loop"""
+        FakeImageGenerationModel.load_seconds = 0.3
+
+        async def scenario():
+            loading = asyncio.ensure_future(vertex._run_blocking(vertex._get_imagen_model, vertex.imagen_model))
+            await asyncio.sleep(0.05)
+            started = time.monotonic()
+            vertex._get_gemini_model(vertex.gemini_model)
+            waited = time.monotonic() - started
+            await loading
+            return waited
+
+        assert asyncio.run(scenario()) < 0.05
+
+    def test_executor_per_pool_size(self):
+        """Тест: пул потоков выбирается по размеру из конфигурации, а не по первому вызову"""
+        assert vertex_ai._get_executor(2) is vertex_ai._get_executor(2)
+        assert vertex_ai._get_executor(3)._max_workers == 3
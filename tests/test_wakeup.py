@@ -0,0 +1,121 @@
+"""
+Тесты пробуждения workers по дедлайнам
+"""
+
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models.content import ContentPieceDB
+from app.services.scheduled_post_service import ScheduledPostService
+from app.utils.wakeup import SCHEDULED_POSTS, DeadlineWaiter, notify_workers
+
+
+def wait_in_thread(waiter: DeadlineWaiter, deadline=None):
+    """Запускает wait() в потоке, возвращает (поток, результат)"""
+    result = {}
+
+    def run():
+        started = time.monotonic()
+        result["woken"] = waiter.wait(deadline)
+        result["elapsed"] = time.monotonic() - started
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    time.sleep(0.05)
+    return thread, result
+
+
+class TestDeadlineWaiter:
+    """Тесты для DeadlineWaiter"""
+
+    def test_sleeps_until_deadline(self):
+        """Тест: без уведомлений worker спит до дедлайна"""
+        waiter = DeadlineWaiter("test", base_interval=10, min_interval=0.01)
+
+        started = time.monotonic()
+        woken = waiter.wait(datetime.utcnow() + timedelta(seconds=0.2))
+
+        assert woken is False
+        assert 0.15 <= time.monotonic() - started < 1
+
+    def test_earlier_deadline_wakes_worker(self):
+        """Тест: новая строка с более ранним временем будит worker'а"""
+        waiter = DeadlineWaiter("test-early", base_interval=10)
+        thread, result = wait_in_thread(waiter, datetime.utcnow() + timedelta(seconds=5))
+
+        notify_workers("test-early", datetime.utcnow() + timedelta(seconds=1))
+        thread.join(timeout=1)
+
+        assert result["woken"] is True
+        assert result["elapsed"] < 0.5
+        assert waiter.get_stats()["early_wakeups"] == 1
+
+    def test_later_deadline_does_not_wake(self):
+        """Тест: строка позже запланированного пробуждения не будит worker'а"""
+        waiter = DeadlineWaiter("test-late", base_interval=10, min_interval=0.01)
+        thread, result = wait_in_thread(waiter, datetime.utcnow() + timedelta(seconds=0.3))
+
+        waiter.notify(datetime.utcnow() + timedelta(hours=1))
+        thread.join(timeout=2)
+
+        assert result["woken"] is False
+        assert waiter.get_stats()["notifications"] == 0
+
+    def test_notify_while_busy_skips_next_sleep(self):
+        """Тест: уведомление во время обработки пачки не теряется"""
+        waiter = DeadlineWaiter("test-busy", base_interval=10)
+        waiter.notify(datetime.utcnow())
+
+        started = time.monotonic()
+        assert waiter.wait(None) is True
+        assert time.monotonic() - started < 0.1
+
+    def test_idle_backoff(self):
+        """Тест: в простое интервал опроса растет до max_interval"""
+        waiter = DeadlineWaiter("test-idle", base_interval=60, max_interval=300)
+
+        timeouts = [waiter.timeout_for(None) for _ in range(5)]
+
+        assert timeouts == [60, 120, 240, 300, 300]
+        # Появился дедлайн - backoff сбрасывается, сон ограничен max_interval
+        assert waiter.timeout_for(datetime.utcnow() + timedelta(days=1)) == 300
+        assert waiter.timeout_for(None) == 60
+
+    def test_stop_wakes_worker(self):
+        """Тест: stop() прерывает сон"""
+        waiter = DeadlineWaiter("test-stop", base_interval=10)
+        thread, result = wait_in_thread(waiter)
+
+        waiter.stop()
+        thread.join(timeout=1)
+
+        assert result["woken"] is True
+
+
+class TestServiceWakeups:
+    """Тесты уведомлений из сервисов"""
+
+    def test_new_post_wakes_scheduled_posts_worker(self, db_session_factory):
+        """Тест: создание поста будит worker'а и сдвигает ближайший дедлайн"""
+        db = db_session_factory()
+        content = ContentPieceDB(id=str(uuid.uuid4()), user_id=1, title="t", text="t",
+                                 content_type="post", platform="telegram")
+        db.add(content)
+        db.commit()
+        service = ScheduledPostService(db)
+        waiter = DeadlineWaiter(SCHEDULED_POSTS, base_interval=60)
+        assert service.get_next_deadline() is None
+
+        thread, result = wait_in_thread(waiter, service.get_next_deadline())
+        scheduled_time = datetime.utcnow() + timedelta(seconds=30)
+        service.create_scheduled_post(user_id=1, content_id=content.id, platform="telegram",
+                                      scheduled_time=scheduled_time)
+        thread.join(timeout=1)
+
+        assert result["woken"] is True
+        assert service.get_next_deadline() == scheduled_time
+        assert waiter.timeout_for(service.get_next_deadline()) == pytest.approx(30, abs=1)
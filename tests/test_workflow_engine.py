@@ -0,0 +1,112 @@
+"""
+Тесты для индексированного планировщика WorkflowEngine
+"""
+
+import pytest
+
+from app.orchestrator.workflow_engine import (
+    WorkflowEngine, TaskType, TaskPriority, TaskStatus
+)
+
+
+@pytest.fixture
+def engine():
+    """Создает пустой WorkflowEngine"""
+    return WorkflowEngine()
+
+
+@pytest.fixture
+def workflow(engine):
+    """Создает workflow для задач"""
+    return engine.create_workflow("test", TaskType.PLANNED)
+
+
+class TestWorkflowEngineScheduler:
+    """Тесты для очереди задач WorkflowEngine"""
+
+    def test_next_task_respects_priority_and_type_weight(self, engine, workflow):
+        """Тест порядка: priority x weight типа задачи"""
+        low = engine.add_task(workflow.id, "low", TaskType.COMPLEX, TaskPriority.LOW)
+        planned = engine.add_task(workflow.id, "planned", TaskType.PLANNED, TaskPriority.HIGH)
+        urgent = engine.add_task(workflow.id, "urgent", TaskType.REAL_TIME, TaskPriority.MEDIUM)
+
+        assert engine.get_next_task("agent") is urgent
+        assert [t.id for t in engine.task_queue] == [urgent.id, planned.id, low.id]
+
+    def test_equal_score_ordered_by_deadline(self, engine, workflow):
+        """Тест: при равном приоритете раньше идет задача с ближайшим дедлайном"""
+        first = engine.add_task(workflow.id, "first", TaskType.PLANNED)
+        second = engine.add_task(workflow.id, "second", TaskType.PLANNED)
+        second.deadline = first.deadline.replace(year=first.deadline.year - 1)
+        engine.requeue_task(second)
+
+        assert engine.get_next_task("agent") is second
+
+    def test_task_ready_only_after_last_dependency(self, engine, workflow):
+        """Тест: задача становится готовой только после всех зависимостей"""
+        dep_a = engine.add_task(workflow.id, "a", TaskType.PLANNED)
+        dep_b = engine.add_task(workflow.id, "b", TaskType.PLANNED)
+        child = engine.add_task(workflow.id, "child", TaskType.REAL_TIME, TaskPriority.CRITICAL,
+                                dependencies=[dep_a.id, dep_b.id])
+
+        assert child not in engine.get_ready_tasks()
+
+        engine.assign_task(dep_a.id, "agent")
+        engine.complete_task(dep_a.id)
+        assert engine.get_next_task("agent") is dep_b
+
+        engine.assign_task(dep_b.id, "agent")
+        engine.complete_task(dep_b.id)
+        assert engine.get_next_task("agent") is child
+
+    def test_dependency_already_completed(self, engine, workflow):
+        """Тест: зависимость, выполненная до добавления задачи, не блокирует ее"""
+        dep = engine.add_task(workflow.id, "dep", TaskType.PLANNED)
+        engine.assign_task(dep.id, "agent")
+        engine.complete_task(dep.id)
+
+        child = engine.add_task(workflow.id, "child", TaskType.PLANNED, dependencies=[dep.id])
+        assert engine.get_next_task("agent") is child
+
+    def test_failed_dependency_blocks_dependents(self, engine, workflow):
+        """Тест: задачи, зависящие от проваленной, не выдаются"""
+        dep = engine.add_task(workflow.id, "dep", TaskType.PLANNED)
+        engine.add_task(workflow.id, "child", TaskType.PLANNED, dependencies=[dep.id])
+
+        engine.assign_task(dep.id, "agent")
+        engine.fail_task(dep.id, "boom")
+
+        assert engine.get_next_task("agent") is None
+        assert engine.get_queue_status()["pending_tasks"] == 1
+
+    def test_task_pinned_to_other_agent_is_skipped(self, engine, workflow):
+        """Тест: задача, закрепленная за другим агентом, не выдается"""
+        pinned = engine.add_task(workflow.id, "pinned", TaskType.REAL_TIME, TaskPriority.CRITICAL)
+        pinned.assigned_agent = "agent_b"
+        other = engine.add_task(workflow.id, "other", TaskType.PLANNED)
+
+        assert engine.get_next_task("agent_a") is other
+        assert engine.get_next_task("agent_b") is pinned
+
+    def test_requeue_running_task(self, engine, workflow):
+        """Тест возврата выполняемой задачи в очередь"""
+        task = engine.add_task(workflow.id, "task", TaskType.PLANNED)
+        engine.assign_task(task.id, "agent")
+        assert engine.get_next_task("agent") is None
+
+        engine.requeue_task(task)
+
+        assert task.status == TaskStatus.PENDING
+        assert task.id not in engine.running_tasks
+        assert engine.get_next_task("agent") is task
+
+    def test_find_task_by_id(self, engine, workflow):
+        """Тест поиска задачи по ID в любом состоянии"""
+        task = engine.add_task(workflow.id, "task", TaskType.PLANNED)
+        assert engine._find_task(task.id) is task
+
+        engine.assign_task(task.id, "agent")
+        engine.complete_task(task.id, {"ok": True})
+
+        assert engine._find_task(task.id).result == {"ok": True}
+        assert engine._find_task("missing") is None
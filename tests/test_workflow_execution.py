@@ -0,0 +1,162 @@
+"""
+Тесты параллельного (DAG) выполнения workflow в ContentOrchestrator
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from app.orchestrator.main_orchestrator import ContentOrchestrator
+from app.orchestrator.agent_manager import BaseAgent, AgentCapability
+from app.orchestrator.workflow_engine import TaskType, TaskPriority, TaskStatus
+
+
+class SleepyAgent(BaseAgent):
+    """Агент, который выполняет задачу за фиксированное время"""
+
+    def __init__(self, agent_id: str, handles: str, max_concurrent_tasks: int, delay: float = 0.1):
+        capability = AgentCapability(
+            task_types=[TaskType.PLANNED],
+            max_concurrent_tasks=max_concurrent_tasks
+        )
+        super().__init__(agent_id, agent_id, capability)
+        self.handles = handles
+        self.delay = delay
+        self.peak_concurrency = 0
+        self.seen_context = {}
+
+    def can_handle_task(self, task) -> bool:
+        return super().can_handle_task(task) and self.handles in task.name
+
+    async def execute_task(self, task):
+        self.peak_concurrency = max(self.peak_concurrency, len(self.current_tasks))
+        self.seen_context[task.id] = dict(task.context)
+        await asyncio.sleep(self.delay)
+        return {"content": {"text": f"result of {task.name}"}}
+
+
+def build_brief_workflow(orchestrator, platforms):
+    """Создает workflow: Create -> Publish для каждой платформы"""
+    engine = orchestrator.workflow_engine
+    workflow = engine.create_workflow("brief", TaskType.PLANNED)
+    for platform in platforms:
+        create = engine.add_task(workflow.id, f"Create post for {platform}", TaskType.PLANNED,
+                                 context={"platform": platform})
+        engine.add_task(workflow.id, f"Publish {platform} content", TaskType.PLANNED,
+                        priority=TaskPriority.HIGH,
+                        context={"platform": platform, "parent_task_id": create.id},
+                        dependencies=[create.id])
+    return workflow
+
+
+@pytest.fixture
+def orchestrator():
+    """Оркестратор с агентами черновиков и публикации"""
+    orchestrator = ContentOrchestrator()
+    orchestrator.drafter = SleepyAgent("drafter", "Create", max_concurrent_tasks=4)
+    orchestrator.publisher = SleepyAgent("publisher", "Publish", max_concurrent_tasks=4)
+    orchestrator.register_agent(orchestrator.drafter)
+    orchestrator.register_agent(orchestrator.publisher)
+    return orchestrator
+
+
+class TestParallelWorkflowExecution:
+    """Тесты DAG-исполнителя"""
+
+    @pytest.mark.asyncio
+    async def test_independent_platforms_run_concurrently(self, orchestrator):
+        """Тест: платформы выполняются параллельно, время ~ критическому пути"""
+        workflow = build_brief_workflow(orchestrator, ["telegram", "vk", "instagram", "twitter"])
+
+        started = time.monotonic()
+        result = await orchestrator.execute_workflow(workflow.id)
+        elapsed = time.monotonic() - started
+
+        assert result["status"] == TaskStatus.COMPLETED.value
+        assert result["completed_tasks"] == 8
+        assert elapsed < 0.4  # последовательно было бы ~0.8 с
+        assert orchestrator.drafter.peak_concurrency == 4
+        assert len(result["timing"]["critical_path"]) == 2
+        assert result["timing"]["parallelism"] > 2
+
+    @pytest.mark.asyncio
+    async def test_parent_result_propagated_to_publish(self, orchestrator):
+        """Тест: контент родительской задачи попадает в контекст публикации"""
+        workflow = build_brief_workflow(orchestrator, ["telegram"])
+        publish_task = workflow.tasks[1]
+
+        await orchestrator.execute_workflow(workflow.id)
+
+        context = orchestrator.publisher.seen_context[publish_task.id]
+        assert context["content"] == {"text": "result of Create post for telegram"}
+
+    @pytest.mark.asyncio
+    async def test_agent_concurrency_limit(self, orchestrator):
+        """Тест: агент не получает больше max_concurrent_tasks задач"""
+        orchestrator.drafter.capabilities.max_concurrent_tasks = 2
+        workflow = build_brief_workflow(orchestrator, ["a", "b", "c", "d", "e"])
+
+        result = await orchestrator.execute_workflow(workflow.id)
+
+        assert result["status"] == TaskStatus.COMPLETED.value
+        assert orchestrator.drafter.peak_concurrency == 2
+
+    @pytest.mark.asyncio
+    async def test_workflow_parallel_limit(self, orchestrator):
+        """Тест: ограничение числа одновременных задач workflow"""
+        orchestrator.max_parallel_tasks = 1
+        workflow = build_brief_workflow(orchestrator, ["telegram", "vk"])
+
+        result = await orchestrator.execute_workflow(workflow.id)
+
+        assert result["completed_tasks"] == 4
+        assert orchestrator.drafter.peak_concurrency == 1
+        assert result["timing"]["parallelism"] <= 1.05
+
+    @pytest.mark.asyncio
+    async def test_task_error_fails_workflow(self, orchestrator):
+        """Тест: исключение агента проваливает workflow, зависимые задачи не запускаются"""
+        async def boom(task):
+            raise RuntimeError("LLM недоступна")
+
+        orchestrator.drafter.execute_task = boom
+        workflow = build_brief_workflow(orchestrator, ["telegram"])
+
+        with pytest.raises(RuntimeError):
+            await orchestrator.execute_workflow(workflow.id)
+
+        assert workflow.status == TaskStatus.FAILED
+        assert workflow.tasks[1].status == TaskStatus.PENDING
+
+    @pytest.mark.asyncio
+    async def test_dependency_cycle_fails_tasks(self, orchestrator):
+        """Тест: задачи на цикле зависимостей и зависящие от них проваливаются, workflow - FAILED"""
+        engine = orchestrator.workflow_engine
+        workflow = engine.create_workflow("cycle", TaskType.PLANNED)
+        first = engine.add_task(workflow.id, "Create post for telegram", TaskType.PLANNED)
+        second = engine.add_task(workflow.id, "Create post for vk", TaskType.PLANNED, dependencies=[first.id])
+        first.dependencies.append(second.id)
+        publish = engine.add_task(workflow.id, "Publish vk content", TaskType.PLANNED, dependencies=[second.id])
+        independent = engine.add_task(workflow.id, "Create post for x", TaskType.PLANNED)
+        done = []
+
+        result = await orchestrator.execute_workflow(
+            workflow.id, on_task_done=lambda task, _: done.append(task.id)
+        )
+
+        assert workflow.status == TaskStatus.FAILED
+        assert result["failed_tasks"] == 3 and result["completed_tasks"] == 1
+        for task in (first, second, publish):
+            assert task.status == TaskStatus.FAILED
+            assert task.error_message == "Циклическая зависимость задач"
+        assert independent.status == TaskStatus.COMPLETED
+        assert sorted(done) == sorted([first.id, second.id, publish.id, independent.id])
+        assert result["timing"]["critical_path"] == [independent.id]
+
+    def test_critical_path_ignores_cycle(self):
+        """Тест: критический путь считается без рекурсии и пропускает задачи цикла"""
+        graph = {"a": [], "b": ["a"], "c": ["b", "d"], "d": ["c"]}
+        timings = {"a": {"duration": 1.0}, "b": {"duration": 2.0}}
+
+        assert ContentOrchestrator._critical_path(graph, timings) == (3.0, ["a", "b"])
@@ -0,0 +1,97 @@
+"""
+Тесты хранилища состояния workflow (WorkflowStore)
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models.workflow import WorkflowStatus
+from app.orchestrator.workflow_engine import WorkflowEngine, TaskStatus, TaskType
+from app.orchestrator.workflow_store import InMemoryWorkflowStore, SQLAlchemyWorkflowStore
+
+
+@pytest.fixture(params=["memory", "sqlalchemy"])
+def store(request, db_session_factory):
+    """Хранилище каждого типа"""
+    if request.param == "memory":
+        store = InMemoryWorkflowStore(ttl_seconds=3600)
+    else:
+        store = SQLAlchemyWorkflowStore(db_session_factory, flush_interval=60, ttl_seconds=3600)
+    yield store
+    store.close()
+
+
+def run_workflow(engine: WorkflowEngine, tasks: int = 3, fail: bool = False):
+    workflow = engine.create_workflow("test", TaskType.PLANNED, {"topic": "AI"})
+    engine.set_workflow_status(workflow.id, TaskStatus.IN_PROGRESS)
+    for i in range(tasks):
+        task = engine.add_task(workflow.id, f"task {i}", TaskType.PLANNED)
+        engine.assign_task(task.id, "agent")
+        if fail and i == 0:
+            engine.fail_task(task.id, "boom")
+        else:
+            engine.complete_task(task.id, {"text": f"result {i}"})
+    engine.set_workflow_status(workflow.id, TaskStatus.FAILED if fail else TaskStatus.COMPLETED)
+    return workflow
+
+
+class TestWorkflowStore:
+    """Тесты для WorkflowStore и его интеграции с WorkflowEngine"""
+
+    def test_status_visible_to_other_engine(self, store):
+        """Тест: статус workflow доступен другому процессу (движку) через хранилище"""
+        workflow = run_workflow(WorkflowEngine(store=store), fail=True)
+
+        status = WorkflowEngine(store=store).get_workflow_status(workflow.id)
+
+        assert status["status"] == TaskStatus.FAILED.value
+        assert (status["total_tasks"], status["completed_tasks"], status["failed_tasks"]) == (3, 2, 1)
+        tasks = {task.name: task for task in store.get_tasks(workflow.id)}
+        assert tasks["task 1"].output_data == {"text": "result 1"}
+        assert tasks["task 0"].error_message == "boom"
+
+    def test_write_behind_batches_and_coalesces(self, db_session_factory):
+        """Тест: изменения одной задачи схлопываются и пишутся одним пакетом"""
+        store = SQLAlchemyWorkflowStore(db_session_factory, flush_interval=60)
+        workflow = run_workflow(WorkflowEngine(store=store), tasks=10)
+
+        stats = store.get_stats()
+        assert (stats["saved"], stats["pending_workflows"], stats["pending_tasks"]) == (3 + 10 * 3, 1, 10)
+        assert store.flush() == 11
+
+        reader = SQLAlchemyWorkflowStore(db_session_factory)
+        assert reader.get_workflow(workflow.id).status == WorkflowStatus.COMPLETED
+        assert len(reader.get_tasks(workflow.id)) == 10
+        assert [w.id for w in reader.list_by_status(WorkflowStatus.COMPLETED)] == [workflow.id]
+        store.close()
+        reader.close()
+
+    def test_ttl_compaction(self, store):
+        """Тест: завершенные workflow старше TTL удаляются вместе с задачами, активные остаются"""
+        engine = WorkflowEngine(store=store)
+        finished = run_workflow(engine)
+        active = engine.create_workflow("active", TaskType.PLANNED)
+        engine.set_workflow_status(active.id, TaskStatus.IN_PROGRESS)
+
+        assert store.compact() == 0
+        assert store.compact(older_than=datetime.now() + timedelta(seconds=1)) == 1
+
+        assert store.get_workflow(finished.id) is None
+        assert store.get_tasks(finished.id) == []
+        assert store.get_workflow(active.id).status == WorkflowStatus.RUNNING
+
+    def test_engine_drops_finished_workflows_from_memory(self, store):
+        """Тест: движок выгружает завершенные workflow, статус читается из хранилища"""
+        engine = WorkflowEngine(store=store, retention_seconds=60)
+        finished = run_workflow(engine)
+        active = engine.create_workflow("active", TaskType.PLANNED)
+        pending = engine.add_task(active.id, "pending", TaskType.PLANNED)
+
+        assert engine.compact() == 0
+        assert engine.compact(now=datetime.now() + timedelta(minutes=2)) == 1
+
+        assert finished.id not in engine.workflows
+        assert len(engine.tasks) == 1 and len(engine.completed_tasks) == 0
+        assert engine.get_workflow_status(finished.id)["completed_tasks"] == 3
+        assert engine.get_next_task("agent") is pending